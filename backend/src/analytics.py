@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Análises agregadas de maturidade (painéis administrativos).
+
+As respostas das avaliações finalizadas mais recentes de cada (órgão, nível)
+são carregadas em matrizes NumPy densas, indexadas pelo modelo compilado:
+- respostas[órgão, atividade, camada], camada 0 = instituído e
+  1 = institucionalizado (bool);
+- respondidas[órgão, atividade] (bool);
+- avaliado[órgão, nível]: existe avaliação finalizada do nível (bool).
+
+As colunas de atividade seguem ModeloCompilado.atividades (nível -> KPA ->
+atividade), a mesma ordem dos bits das máscaras (mascaras.py). Por isso as
+matrizes são montadas direto das máscaras, sem ler a tabela respostas. Cada
+atividade só conta na avaliação do seu próprio nível.
+
+Rankings, percentis por KPA, mapa de calor, distribuição de níveis e
+lacunas são reduções vetorizadas sobre essas matrizes.
+"""
+
+import numpy as np
+
+from model_registry import modelo_atual
+from maturity import NIVEIS_CERTIFICAVEIS, ultimas_avaliacoes_finalizadas
+from paginacao import ParametroInvalido
+
+INSTITUIDO = 0
+INSTITUCIONALIZADO = 1
+
+CAMADAS = {
+    'instituido': INSTITUIDO,
+    'institucionalizado': INSTITUCIONALIZADO
+}
+
+PERCENTIS_PADRAO = (25, 50, 75, 90)
+
+
+def ler_camada(args, nome='camada'):
+    """Camada da query string (padrão: institucionalizado)"""
+    valor = (args.get(nome) or 'institucionalizado').strip().lower()
+    if valor not in CAMADAS:
+        raise ParametroInvalido(f"{nome} deve ser {' ou '.join(CAMADAS)}")
+    return CAMADAS[valor]
+
+
+def ler_percentis(args, nome='p'):
+    """Lista de percentis da query string (ex.: p=10,50,90)"""
+    valor = args.get(nome)
+    if not valor:
+        return PERCENTIS_PADRAO
+
+    try:
+        percentis = tuple(float(p) for p in valor.split(',') if p.strip())
+    except ValueError:
+        raise ParametroInvalido(f'{nome} deve ser uma lista de números separados por vírgula')
+    if not percentis or any(p < 0 or p > 100 for p in percentis):
+        raise ParametroInvalido(f'{nome} deve ter valores entre 0 e 100')
+    return percentis
+
+
+def _bits(mascara, tamanho):
+    """Máscara (int) -> vetor bool com `tamanho` posições"""
+    dados = mascara.to_bytes((tamanho + 7) // 8, 'little')
+    return np.unpackbits(np.frombuffer(dados, dtype=np.uint8), count=tamanho, bitorder='little').astype(bool)
+
+
+def _arredondar(valor):
+    """float NumPy -> float JSON (None para NaN)"""
+    return None if np.isnan(valor) else round(float(valor), 1)
+
+
+class BaseAnalitica:
+    """Matrizes de respostas de todos os órgãos e as análises sobre elas"""
+
+    def __init__(self, modelo, orgaos):
+        self.modelo = modelo
+        # Ordem das linhas: nome do órgão
+        self.orgaos = orgaos
+        self.indice_orgao = {orgao['id']: i for i, orgao in enumerate(orgaos)}
+
+        n_orgaos = len(orgaos)
+        n_atividades = len(modelo.atividades)
+        self.niveis = NIVEIS_CERTIFICAVEIS
+
+        self.respostas = np.zeros((n_orgaos, n_atividades, 2), dtype=bool)
+        self.respondidas = np.zeros((n_orgaos, n_atividades), dtype=bool)
+        self.avaliado = np.zeros((n_orgaos, len(self.niveis)), dtype=bool)
+
+        # Atividades de cada nível formam um intervalo contínuo de colunas
+        self.fatia_por_nivel = {}
+        inicio = 0
+        for nivel in modelo.niveis:
+            fim = inicio + modelo.total_por_nivel[nivel]
+            self.fatia_por_nivel[nivel] = slice(inicio, fim)
+            inicio = fim
+
+        # Pertinência atividade x nível e atividade x KPA
+        self.nivel_da_atividade = np.array([modelo.nivel_por_atividade[a] for a in modelo.atividades], dtype=np.int64)
+        self.pertence_nivel = self.nivel_da_atividade[None, :] == np.array(self.niveis)[:, None]
+
+        self.kpas = [kpa for nivel in modelo.niveis for kpa in modelo.kpas_por_nivel[nivel]]
+        self.nivel_da_kpa = np.array([int(kpa.split('.')[0]) for kpa in self.kpas], dtype=np.int64)
+        self.pertence_kpa = np.zeros((len(self.kpas), n_atividades), dtype=bool)
+        for k, kpa in enumerate(self.kpas):
+            for atividade_id in modelo.atividades_por_kpa[kpa]:
+                self.pertence_kpa[k, modelo.posicao_por_atividade[atividade_id]] = True
+
+        self.total_por_nivel = self.pertence_nivel.sum(axis=1)
+        self.total_por_kpa = self.pertence_kpa.sum(axis=1)
+
+    @classmethod
+    def carregar(cls, conn, orgao_ids=None):
+        """
+        Monta as matrizes com as máscaras das últimas avaliações finalizadas
+        de todos os órgãos ou só dos informados (sem commit).
+        """
+        modelo = modelo_atual()
+        cursor = conn.cursor()
+        if orgao_ids is None:
+            cursor.execute('SELECT id, nome, sigla FROM orgaos ORDER BY nome, id')
+        elif not orgao_ids:
+            return cls(modelo, [])
+        else:
+            orgao_ids = list(orgao_ids)
+            cursor.execute(f'''
+                SELECT id, nome, sigla FROM orgaos
+                WHERE id IN ({', '.join(['?'] * len(orgao_ids))})
+                ORDER BY nome, id
+            ''', orgao_ids)
+        orgaos = [{'id': row[0], 'nome': row[1], 'sigla': row[2]} for row in cursor.fetchall()]
+
+        base = cls(modelo, orgaos)
+        n_atividades = len(modelo.atividades)
+        indice_nivel = {nivel: j for j, nivel in enumerate(base.niveis)}
+
+        for orgao_id, nivel, _, _, _, mascaras in ultimas_avaliacoes_finalizadas(conn, orgao_ids):
+            i = base.indice_orgao.get(orgao_id)
+            fatia = base.fatia_por_nivel.get(nivel)
+            if i is None or fatia is None:
+                continue
+            base.avaliado[i, indice_nivel[nivel]] = True
+            base.respondidas[i, fatia] = _bits(mascaras.respondidas, n_atividades)[fatia]
+            base.respostas[i, fatia, INSTITUIDO] = _bits(mascaras.instituidas, n_atividades)[fatia]
+            base.respostas[i, fatia, INSTITUCIONALIZADO] = _bits(mascaras.institucionalizadas, n_atividades)[fatia]
+
+        return base
+
+    # ===== REDUÇÕES BÁSICAS =====
+
+    def avaliado_por_kpa(self):
+        """(órgão, KPA): existe avaliação finalizada do nível da KPA"""
+        colunas = np.searchsorted(np.array(self.niveis), self.nivel_da_kpa)
+        return self.avaliado[:, colunas]
+
+    def avaliada_por_atividade(self):
+        """(órgão, atividade): existe avaliação finalizada do nível da atividade"""
+        return self.avaliado @ self.pertence_nivel
+
+    def contagem_por_nivel(self, camada=INSTITUCIONALIZADO):
+        """(órgão, nível) com o número de atividades marcadas na camada"""
+        return self.respostas[:, :, camada].astype(np.int64) @ self.pertence_nivel.T.astype(np.int64)
+
+    def contagem_por_kpa(self, camada=INSTITUCIONALIZADO):
+        """(órgão, KPA) com o número de atividades marcadas na camada"""
+        return self.respostas[:, :, camada].astype(np.int64) @ self.pertence_kpa.T.astype(np.int64)
+
+    def percentual_por_kpa(self, camada=INSTITUCIONALIZADO):
+        """(órgão, KPA) em %, NaN onde o nível da KPA não foi avaliado ou a KPA não tem atividades"""
+        percentual = self.contagem_por_kpa(camada) * 100.0 / np.maximum(self.total_por_kpa, 1)
+        return np.where(self.avaliado_por_kpa() & (self.total_por_kpa > 0), percentual, np.nan)
+
+    def nivel_completo(self):
+        """(órgão, nível): avaliado e com todas as atividades institucionalizadas"""
+        completas = self.contagem_por_nivel(INSTITUCIONALIZADO) == self.total_por_nivel
+        return self.avaliado & completas & (self.total_por_nivel > 0)
+
+    def nivel_certificado(self):
+        """Maior nível N com os níveis 2 a N completos (1 se nenhum), por órgão"""
+        consecutivos = np.cumprod(self.nivel_completo(), axis=1).sum(axis=1)
+        return np.where(consecutivos > 0, np.array(self.niveis)[np.maximum(consecutivos - 1, 0)], 1)
+
+    def percentual_geral(self, camada=INSTITUCIONALIZADO):
+        """% das atividades dos níveis avaliados marcadas na camada, por órgão (NaN sem avaliação)"""
+        esperadas = self.avaliada_por_atividade().sum(axis=1)
+        marcadas = self.respostas[:, :, camada].sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(esperadas > 0, marcadas * 100.0 / esperadas, np.nan)
+
+    def _kpa_info(self, k):
+        kpa = self.kpas[k]
+        return {
+            'kpa_codigo': kpa,
+            'area_modelo': self.modelo.area_kpa(kpa),
+            'nivel': int(self.nivel_da_kpa[k]),
+            'total_atividades': int(self.total_por_kpa[k])
+        }
+
+    # ===== ANÁLISES =====
+
+    def ranking(self, limite=None):
+        """Órgãos por nível certificado e % de institucionalização (desc), depois nome"""
+        nivel = self.nivel_certificado()
+        institucionalizacao = self.percentual_geral(INSTITUCIONALIZADO)
+        instituicao = self.percentual_geral(INSTITUIDO)
+        niveis_avaliados = self.avaliado.sum(axis=1)
+
+        # lexsort usa a última chave como principal; NaN (sem avaliação) vai para o fim
+        ordem = np.lexsort((
+            np.arange(len(self.orgaos)),
+            -np.nan_to_num(institucionalizacao, nan=-1.0),
+            -nivel
+        ))
+        if limite is not None:
+            ordem = ordem[:limite]
+
+        ranking = []
+        for posicao, i in enumerate(ordem, start=1):
+            orgao = self.orgaos[i]
+            ranking.append({
+                'posicao': posicao,
+                'orgao_id': orgao['id'],
+                'orgao_nome': orgao['nome'],
+                'orgao_sigla': orgao['sigla'],
+                'nivel_maturidade': int(nivel[i]),
+                'niveis_avaliados': [n for j, n in enumerate(self.niveis) if self.avaliado[i, j]],
+                'total_niveis_avaliados': int(niveis_avaliados[i]),
+                'percentual_instituicao': _arredondar(instituicao[i]),
+                'percentual_institucionalizacao': _arredondar(institucionalizacao[i])
+            })
+        return ranking
+
+    def percentis_kpa(self, percentis=PERCENTIS_PADRAO, camada=INSTITUCIONALIZADO):
+        """Distribuição entre os órgãos avaliados do % de cada KPA"""
+        percentual = self.percentual_por_kpa(camada)
+        avaliados = (~np.isnan(percentual)).sum(axis=0)
+
+        # nanpercentile só nas KPAs com algum órgão avaliado (evita aviso de fatia vazia)
+        com_dados = avaliados > 0
+        valores = np.full((len(percentis), len(self.kpas)), np.nan)
+        medias = np.full(len(self.kpas), np.nan)
+        if com_dados.any():
+            valores[:, com_dados] = np.nanpercentile(percentual[:, com_dados], percentis, axis=0)
+            medias[com_dados] = np.nanmean(percentual[:, com_dados], axis=0)
+
+        resultado = []
+        for k in range(len(self.kpas)):
+            item = self._kpa_info(k)
+            item.update({
+                'orgaos_avaliados': int(avaliados[k]),
+                'media': _arredondar(medias[k]),
+                'percentis': {f'p{p:g}': _arredondar(valores[j, k]) for j, p in enumerate(percentis)}
+            })
+            resultado.append(item)
+        return resultado
+
+    def mapa_calor(self, camada=INSTITUCIONALIZADO, somente_avaliados=True):
+        """Matriz órgão x KPA com o % da camada (None onde o nível não foi avaliado)"""
+        percentual = self.percentual_por_kpa(camada)
+        linhas = np.flatnonzero(self.avaliado.any(axis=1)) if somente_avaliados else np.arange(len(self.orgaos))
+
+        return {
+            'kpas': [self._kpa_info(k) for k in range(len(self.kpas))],
+            'orgaos': [{
+                'orgao_id': self.orgaos[i]['id'],
+                'orgao_nome': self.orgaos[i]['nome'],
+                'orgao_sigla': self.orgaos[i]['sigla']
+            } for i in linhas],
+            'valores': [[_arredondar(v) for v in percentual[i]] for i in linhas]
+        }
+
+    def distribuicao_niveis(self):
+        """Órgãos por nível certificado e, por nível, quantos foram avaliados e estão completos"""
+        nivel = self.nivel_certificado()
+        contagem = np.bincount(nivel, minlength=max(self.niveis) + 1)
+        completos = self.nivel_completo().sum(axis=0)
+        avaliados = self.avaliado.sum(axis=0)
+
+        return {
+            'total_orgaos': len(self.orgaos),
+            'por_nivel_certificado': {str(n): int(contagem[n]) for n in (1,) + tuple(self.niveis)},
+            'por_nivel_avaliado': [{
+                'nivel': n,
+                'total_atividades': int(self.total_por_nivel[j]),
+                'orgaos_avaliados': int(avaliados[j]),
+                'orgaos_completos': int(completos[j])
+            } for j, n in enumerate(self.niveis)]
+        }
+
+    def lacunas(self):
+        """
+        Atividades não institucionalizadas nas avaliações finalizadas:
+        por nível, por KPA e por atividade (órgãos com a lacuna).
+        """
+        faltantes = self.avaliada_por_atividade() & ~self.respostas[:, :, INSTITUCIONALIZADO]
+        faltantes_int = faltantes.astype(np.int64)
+
+        # (órgão, nível) e (órgão, KPA) com a quantidade de atividades faltantes
+        por_orgao_nivel = faltantes_int @ self.pertence_nivel.T.astype(np.int64)
+        por_orgao_kpa = faltantes_int @ self.pertence_kpa.T.astype(np.int64)
+        orgaos_por_atividade = faltantes.sum(axis=0)
+        nao_respondidas = (self.avaliada_por_atividade() & ~self.respondidas).sum(axis=0)
+
+        avaliados_nivel = self.avaliado.sum(axis=0)
+        avaliados_kpa = self.avaliado_por_kpa().sum(axis=0)
+
+        por_nivel = [{
+            'nivel': n,
+            'orgaos_avaliados': int(avaliados_nivel[j]),
+            'orgaos_com_lacuna': int((por_orgao_nivel[:, j] > 0).sum()),
+            'atividades_faltantes': int(por_orgao_nivel[:, j].sum())
+        } for j, n in enumerate(self.niveis)]
+
+        por_kpa = []
+        for k in range(len(self.kpas)):
+            item = self._kpa_info(k)
+            item.update({
+                'orgaos_avaliados': int(avaliados_kpa[k]),
+                'orgaos_com_lacuna': int((por_orgao_kpa[:, k] > 0).sum()),
+                'atividades_faltantes': int(por_orgao_kpa[:, k].sum())
+            })
+            por_kpa.append(item)
+
+        # Atividades com lacuna, das mais frequentes para as menos
+        ordem = np.lexsort((np.arange(len(self.modelo.atividades)), -orgaos_por_atividade))
+        por_atividade = [{
+            'atividade_id': self.modelo.atividades[a],
+            'nivel': int(self.nivel_da_atividade[a]),
+            'orgaos_com_lacuna': int(orgaos_por_atividade[a]),
+            'orgaos_sem_resposta': int(nao_respondidas[a])
+        } for a in ordem if orgaos_por_atividade[a] > 0]
+
+        return {
+            'por_nivel': por_nivel,
+            'por_kpa': por_kpa,
+            'por_atividade': por_atividade
+        }
+
+    def consolidado(self, limite_kpas=5):
+        """
+        Visão agregada de todos os órgãos da base (ex.: uma subárvore):
+        distribuição de níveis, média de institucionalização e as KPAs com
+        menor média entre os órgãos avaliados.
+        """
+        institucionalizacao = self.percentual_geral(INSTITUCIONALIZADO)
+        instituicao = self.percentual_geral(INSTITUIDO)
+        avaliados = ~np.isnan(institucionalizacao)
+
+        percentual_kpa = self.percentual_por_kpa(INSTITUCIONALIZADO)
+        avaliados_kpa = (~np.isnan(percentual_kpa)).sum(axis=0)
+        incompletos_kpa = (percentual_kpa < 100).sum(axis=0)
+        medias_kpa = np.full(len(self.kpas), np.nan)
+        com_dados = avaliados_kpa > 0
+        if com_dados.any():
+            medias_kpa[com_dados] = np.nanmean(percentual_kpa[:, com_dados], axis=0)
+
+        # KPAs com dados, da menor média para a maior
+        ordem = [k for k in np.lexsort((np.arange(len(self.kpas)), medias_kpa)) if com_dados[k]]
+        kpas = []
+        for k in ordem:
+            item = self._kpa_info(k)
+            item.update({
+                'orgaos_avaliados': int(avaliados_kpa[k]),
+                'orgaos_incompletos': int(incompletos_kpa[k]),
+                'media_institucionalizacao': _arredondar(medias_kpa[k])
+            })
+            kpas.append(item)
+
+        return {
+            'total_orgaos': len(self.orgaos),
+            'orgaos_avaliados': int(avaliados.sum()),
+            'distribuicao_niveis': self.distribuicao_niveis()['por_nivel_certificado'],
+            'media_institucionalizacao': _arredondar(np.mean(institucionalizacao[avaliados])) if avaliados.any() else None,
+            'media_instituicao': _arredondar(np.mean(instituicao[avaliados])) if avaliados.any() else None,
+            'kpas_defasadas': [k for k in kpas if k['media_institucionalizacao'] < 100][:limite_kpas],
+            'kpas': kpas
+        }
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Anexos (arquivos de evidência) das respostas.
+
+Cada arquivo enviado para uma resposta é uma linha da tabela anexos, com o
+tipo da evidência (instituído ou institucionalizado) e os metadados do
+arquivo. Antes eles ficavam como JSON nas colunas arquivos_instituido e
+arquivos_institucionalizado de respostas.
+"""
+
+import os
+import hashlib
+import mimetypes
+import logging
+
+logger = logging.getLogger(__name__)
+
+TIPOS_ANEXO = ('instituido', 'institucionalizado')
+
+# Campo do JSON da resposta correspondente a cada tipo
+CAMPO_POR_TIPO = {tipo: f'arquivos_{tipo}' for tipo in TIPOS_ANEXO}
+
+
+def nome_arquivo_valido(filename):
+    """O nome vem do cliente: só vale o nome de um arquivo, sem diretórios"""
+    return (isinstance(filename, str) and filename not in ('', '.', '..') and
+            os.path.basename(filename) == filename and not any(c in filename for c in '/\\\0'))
+
+
+def caminho_upload(filename, pasta):
+    """Caminho real do arquivo dentro de pasta (None se o nome apontar para fora dela)"""
+    if not nome_arquivo_valido(filename):
+        return None
+    raiz = os.path.realpath(pasta)
+    caminho = os.path.realpath(os.path.join(raiz, filename))
+    if os.path.dirname(caminho) != raiz:
+        return None  # ex.: link simbólico para fora da pasta
+    return caminho
+
+
+def metadados_arquivo(filename, pasta):
+    """
+    (size, sha256, mime) do arquivo enviado; size e sha256 são None se ele
+    não existir ou se o nome não for de um arquivo da pasta de uploads
+    """
+    caminho = caminho_upload(filename, pasta)
+    mime = mimetypes.guess_type(filename)[0] if caminho else None
+    if caminho is None or not os.path.isfile(caminho):
+        return None, None, mime
+
+    sha256 = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(64 * 1024), b''):
+            sha256.update(bloco)
+    return os.path.getsize(caminho), sha256.hexdigest(), mime
+
+
+def normalizar_item(item):
+    """
+    Item do JSON enviado pelo frontend -> (nome, filename). filename é None
+    se não for um nome de arquivo válido (ex.: '../prisma.db', '/etc/passwd')
+    """
+    if isinstance(item, str):
+        nome, filename = item, item
+    elif isinstance(item, dict):
+        filename = item.get('filename') or os.path.basename(item.get('url') or '') or None
+        nome = item.get('nome') or filename
+    else:
+        return None, None
+
+    if filename is not None and not nome_arquivo_valido(filename):
+        logger.warning(f"Anexo com nome de arquivo inválido ignorado: {filename!r}")
+        return nome, None
+    return nome, filename
+
+
+def anexo_para_dict(nome, filename, size, sha256, mime, created_at):
+    """Formato de um anexo na API (mesmas chaves do JSON antigo + metadados)"""
+    return {
+        'nome': nome,
+        'filename': filename,
+        'url': f'/uploads/{filename}' if filename else None,
+        'size': size,
+        'sha256': sha256,
+        'mime': mime,
+        'created_at': created_at
+    }
+
+
+def sincronizar_anexos(conn, avaliacao_id, respostas, pasta):
+    """
+    Faz os anexos das respostas refletirem as listas recebidas.
+
+    respostas é uma lista de dicts no formato do salvamento (atividade_id e,
+    opcionalmente, arquivos_instituido / arquivos_institucionalizado). Só os
+    tipos presentes no dict são sincronizados. Anexos que saíram da lista são
+    removidos e os novos são inseridos; os demais ficam como estão. Não faz
+    commit.
+    """
+    listas = {}
+    for resposta in respostas:
+        for tipo, campo in CAMPO_POR_TIPO.items():
+            if campo in resposta and isinstance(resposta[campo], list):
+                listas[(resposta['atividade_id'], tipo)] = resposta[campo]
+    if not listas:
+        return
+
+    atividade_ids = sorted({atividade_id for atividade_id, _ in listas})
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT id, atividade_id FROM respostas
+        WHERE avaliacao_id = ? AND atividade_id IN ({', '.join(['?'] * len(atividade_ids))})
+    ''', [avaliacao_id] + atividade_ids)
+    resposta_por_atividade = {atividade_id: resposta_id for resposta_id, atividade_id in cursor.fetchall()}
+    if not resposta_por_atividade:
+        return
+
+    cursor.execute(f'''
+        SELECT id, resposta_id, tipo, filename FROM anexos
+        WHERE resposta_id IN ({', '.join(['?'] * len(resposta_por_atividade))})
+    ''', list(resposta_por_atividade.values()))
+    existentes = {}
+    for anexo_id, resposta_id, tipo, filename in cursor.fetchall():
+        existentes.setdefault((resposta_id, tipo), {})[filename] = anexo_id
+
+    remover = []
+    inserir = []
+    for (atividade_id, tipo), itens in listas.items():
+        resposta_id = resposta_por_atividade.get(atividade_id)
+        if resposta_id is None:
+            continue
+
+        atuais = existentes.get((resposta_id, tipo), {})
+        recebidos = set()
+        for item in itens:
+            nome, filename = normalizar_item(item)
+            if not filename or filename in recebidos:
+                continue
+            recebidos.add(filename)
+            if filename not in atuais:
+                inserir.append((resposta_id, tipo, nome, filename) + metadados_arquivo(filename, pasta))
+
+        remover.extend(anexo_id for filename, anexo_id in atuais.items() if filename not in recebidos)
+
+    if remover:
+        cursor.executemany('DELETE FROM anexos WHERE id = ?', [(anexo_id,) for anexo_id in remover])
+    if inserir:
+        cursor.executemany('''
+            INSERT INTO anexos (resposta_id, tipo, nome, filename, size, sha256, mime)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', inserir)
+
+
+def anexos_da_avaliacao(conn, avaliacao_id):
+    """Anexos de todas as respostas da avaliação: {atividade_id: {tipo: [anexo, ...]}}"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT r.atividade_id, x.tipo, x.nome, x.filename, x.size, x.sha256, x.mime, x.created_at
+        FROM respostas r
+        JOIN anexos x ON x.resposta_id = r.id
+        WHERE r.avaliacao_id = ?
+        ORDER BY x.id
+    ''', (avaliacao_id,))
+
+    anexos = {}
+    for atividade_id, tipo, *dados in cursor.fetchall():
+        anexos.setdefault(atividade_id, {}).setdefault(tipo, []).append(anexo_para_dict(*dados))
+    return anexos
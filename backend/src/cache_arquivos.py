@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache em disco dos relatórios exportados (PDF, XLSX e CSV).
+
+O arquivo de um relatório é endereçado pelo hash de (tipo, órgão, formato,
+versão dos dados, assinatura do modelo e parâmetros extras). A versão dos
+dados é a de orgao_versao_dados (migração 13) para relatórios de um órgão e
+a geração global (geracao_dados) para os consolidados; as duas são
+incrementadas por triggers a cada escrita, então uma escrita muda o hash e
+o arquivo antigo nunca mais é servido.
+
+Os arquivos ficam em um diretório com nome
+"<tipo>-<órgão>[-<hash dos extras>]-<hash>.<formato>". Ao gravar uma versão
+nova, as versões anteriores do mesmo relatório (mesmo tipo, órgão e extras,
+por exemplo o usuário do PDF individual) são apagadas; as de outros extras
+continuam valendo; além disso, o total é limitado a max_bytes, removendo os menos
+acessados recentemente (mtime, atualizado a cada acerto). O estado é o
+próprio diretório, compartilhado por todos os processos.
+"""
+
+import os
+import json
+import glob
+import hashlib
+import threading
+
+from model_registry import modelo_atual
+
+MAX_BYTES_PADRAO = 256 * 1024 * 1024
+
+
+def versao_dados_orgao(conn, orgao_id):
+    """Versão atual dos dados do órgão (0 se nunca houve escrita)"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT versao FROM orgao_versao_dados WHERE orgao_id = ?', (orgao_id,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+class CacheArquivosRelatorio:
+    """Relatórios renderizados em disco, com remoção LRU por tamanho total"""
+
+    def __init__(self, diretorio, max_bytes=MAX_BYTES_PADRAO):
+        self.diretorio = os.path.abspath(diretorio)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {'acertos': 0, 'falhas': 0, 'gravados': 0, 'removidos': 0}
+
+    def _prefixo(self, tipo, orgao_id, extras=None):
+        prefixo = f"{tipo}-{orgao_id if orgao_id is not None else 'todos'}"
+        if extras is not None:
+            # Variantes (extras) diferentes do mesmo relatório não se substituem
+            chave_extras = json.dumps(extras, sort_keys=True, default=str)
+            prefixo += '-' + hashlib.sha256(chave_extras.encode('utf-8')).hexdigest()[:12]
+        return prefixo
+
+    def caminho(self, tipo, orgao_id, formato, versao, extras=None):
+        """Caminho endereçado pelo conteúdo das chaves"""
+        chave = json.dumps([tipo, orgao_id, formato, versao, modelo_atual().assinatura, extras],
+                           sort_keys=True, default=str)
+        hash_chave = hashlib.sha256(chave.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.diretorio, f'{self._prefixo(tipo, orgao_id, extras)}-{hash_chave}.{formato}')
+
+    def obter(self, tipo, orgao_id, formato, versao, extras=None):
+        """Arquivo aberto (rb) do relatório em cache, ou None"""
+        caminho = self.caminho(tipo, orgao_id, formato, versao, extras)
+        try:
+            # Aberto já aqui: continua legível mesmo se outro processo o remover
+            arquivo = open(caminho, 'rb')
+        except FileNotFoundError:
+            with self._lock:
+                self._stats['falhas'] += 1
+            return None
+
+        try:
+            os.utime(caminho)  # uso recente para o LRU
+        except OSError:
+            pass
+        with self._lock:
+            self._stats['acertos'] += 1
+        return arquivo
+
+    def guardar(self, tipo, orgao_id, formato, versao, corpo, extras=None):
+        """Grava o relatório (substituindo versões anteriores) e retorna o arquivo aberto"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho = self.caminho(tipo, orgao_id, formato, versao, extras)
+
+        temporario = f'{caminho}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporario, 'wb') as arquivo:
+            arquivo.write(corpo)
+        os.replace(temporario, caminho)
+        arquivo = open(caminho, 'rb')
+
+        # Versões anteriores do mesmo relatório não serão mais pedidas
+        removidos = 0
+        prefixo = self._prefixo(tipo, orgao_id, extras)
+        for antigo in glob.glob(os.path.join(self.diretorio, f'{prefixo}-*.{formato}')):
+            # Só o hash final varia entre versões ("-*" também pegaria as variantes)
+            if antigo != caminho and os.path.basename(antigo).count('-') == prefixo.count('-') + 1 \
+                    and self._remover(antigo):
+                removidos += 1
+        removidos += self._limitar_tamanho()
+
+        with self._lock:
+            self._stats['gravados'] += 1
+            self._stats['removidos'] += removidos
+        return arquivo
+
+    def _remover(self, caminho):
+        try:
+            os.remove(caminho)
+            return True
+        except OSError:
+            return False
+
+    def _entradas(self):
+        entradas = []
+        try:
+            with os.scandir(self.diretorio) as itens:
+                for item in itens:
+                    if item.is_file() and not item.name.endswith('.tmp'):
+                        info = item.stat()
+                        entradas.append((info.st_mtime, info.st_size, item.path))
+        except FileNotFoundError:
+            pass
+        return entradas
+
+    def _limitar_tamanho(self):
+        """Remove os arquivos menos usados até o total caber em max_bytes"""
+        entradas = self._entradas()
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        removidos = 0
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            if self._remover(caminho):
+                removidos += 1
+            total -= tamanho
+        return removidos
+
+    def estatisticas(self):
+        entradas = self._entradas()
+        with self._lock:
+            stats = dict(self._stats)
+        stats['arquivos'] = len(entradas)
+        stats['bytes'] = sum(tamanho for _, tamanho, _ in entradas)
+        stats['max_bytes'] = self.max_bytes
+        stats['diretorio'] = self.diretorio
+        return stats
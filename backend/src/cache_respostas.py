@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache de respostas JSON dos relatórios administrativos.
+
+A tabela geracao_dados (migração 11) tem um contador global incrementado por
+triggers a cada escrita em avaliacoes, respostas, orgaos e no histórico de
+maturidade. Uma resposta calculada fica guardada com a geração em que foi
+calculada e é reaproveitada enquanto o contador não muda; ler o contador é
+uma consulta pela chave primária, válida também entre processos.
+
+Cada resposta guardada tem um ETag (hash do corpo). O cliente que reenvia o
+ETag em If-None-Match recebe 304 sem corpo.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+MAX_ENTRADAS_CACHE = 64
+
+RespostaGuardada = namedtuple('RespostaGuardada', 'geracao corpo etag')
+
+
+def geracao_dados(conn):
+    """Valor atual do contador global de escritas"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT geracao FROM geracao_dados WHERE id = 1')
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def calcular_etag(corpo):
+    return hashlib.sha1(corpo).hexdigest()
+
+
+class CacheRespostas:
+    """Corpos JSON por chave, válidos enquanto a geração dos dados não muda"""
+
+    def __init__(self, max_entradas=MAX_ENTRADAS_CACHE):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()  # chave -> RespostaGuardada
+        self._lock = threading.Lock()
+        self._stats = {'acertos': 0, 'falhas': 0}
+
+    def obter(self, chave, geracao):
+        """Resposta guardada para a chave na geração informada, ou None"""
+        with self._lock:
+            guardada = self._entradas.get(chave)
+            if guardada is not None and guardada.geracao == geracao:
+                self._entradas.move_to_end(chave)
+                self._stats['acertos'] += 1
+                return guardada
+            self._stats['falhas'] += 1
+            return None
+
+    def guardar(self, chave, geracao, corpo):
+        guardada = RespostaGuardada(geracao, corpo, calcular_etag(corpo))
+        with self._lock:
+            self._entradas[chave] = guardada
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return guardada
+
+    def estatisticas(self):
+        with self._lock:
+            return dict(self._stats, entradas=len(self._entradas), max_entradas=self.max_entradas)
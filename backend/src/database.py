@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool de conexões SQLite com escopo de requisição.
+
+Cada requisição Flask recebe uma única conexão (guardada em flask.g), que é
+devolvida ao pool no teardown. As PRAGMAs de desempenho são aplicadas uma
+única vez, quando a conexão física é criada.
+"""
+
+import sqlite3
+import threading
+import logging
+
+from flask import g, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs aplicadas em toda conexão nova
+PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),              # ms esperando o lock antes de falhar
+    ('mmap_size', 256 * 1024 * 1024),    # 256MB mapeados em memória
+    ('cache_size', -20000),              # valor negativo = KiB (~20MB)
+]
+
+# Máximo de conexões ociosas mantidas no pool
+MAX_OCIOSAS = 8
+
+
+class ConexaoPool:
+    """
+    Proxy para sqlite3.Connection entregue pelo pool.
+
+    O close() não fecha a conexão física: dentro de uma requisição ela só é
+    liberada no teardown; fora dela volta imediatamente para o pool.
+    """
+
+    def __init__(self, conn, pool, escopo_requisicao):
+        self._conn = conn
+        self._pool = pool
+        self._escopo_requisicao = escopo_requisicao
+
+    def __getattr__(self, nome):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Conexão já devolvida ao pool')
+        return getattr(self._conn, nome)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *args):
+        return self._conn.__exit__(*args)
+
+    def close(self):
+        if self._escopo_requisicao or self._conn is None:
+            return
+        self._pool.devolver(self._conn)
+        self._conn = None
+
+
+class PoolConexoes:
+    """Pool thread-safe de conexões SQLite para um arquivo de banco"""
+
+    def __init__(self, caminho, max_ociosas=MAX_OCIOSAS):
+        self.caminho = caminho
+        self.max_ociosas = max_ociosas
+        self._ociosas = []
+        self._lock = threading.Lock()
+        self._stats = {
+            'criadas': 0,
+            'reutilizadas': 0,
+            'devolvidas': 0,
+            'descartadas': 0,
+            'em_uso': 0
+        }
+
+    def _criar_conexao(self):
+        conn = sqlite3.connect(self.caminho, check_same_thread=False)
+        for nome, valor in PRAGMAS:
+            conn.execute(f'PRAGMA {nome} = {valor}')
+        return conn
+
+    def adquirir(self):
+        """Retorna uma conexão física (reutilizada ou nova)"""
+        with self._lock:
+            conn = self._ociosas.pop() if self._ociosas else None
+            self._stats['em_uso'] += 1
+            if conn is not None:
+                self._stats['reutilizadas'] += 1
+
+        if conn is None:
+            try:
+                conn = self._criar_conexao()
+            except Exception:
+                with self._lock:
+                    self._stats['em_uso'] -= 1
+                raise
+            with self._lock:
+                self._stats['criadas'] += 1
+
+        return conn
+
+    def devolver(self, conn):
+        """Devolve uma conexão ao pool, descartando transações pendentes"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"Conexão descartada ao devolver ao pool: {str(e)}")
+            conn = None
+
+        with self._lock:
+            self._stats['em_uso'] -= 1
+            if conn is not None and len(self._ociosas) < self.max_ociosas:
+                self._ociosas.append(conn)
+                self._stats['devolvidas'] += 1
+                return
+            self._stats['descartadas'] += 1
+
+        if conn is not None:
+            conn.close()
+
+    def conexao(self):
+        """
+        Conexão para o contexto atual: a mesma durante toda a requisição ou,
+        fora do contexto Flask, uma conexão que volta ao pool no close().
+        """
+        if has_app_context():
+            if '_conexao_db' not in g:
+                g._conexao_db = self.adquirir()
+            return ConexaoPool(g._conexao_db, self, escopo_requisicao=True)
+
+        return ConexaoPool(self.adquirir(), self, escopo_requisicao=False)
+
+    def liberar_requisicao(self, exc=None):
+        """Teardown: devolve ao pool a conexão da requisição, se houver"""
+        conn = g.pop('_conexao_db', None)
+        if conn is not None:
+            self.devolver(conn)
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['ociosas'] = len(self._ociosas)
+        stats['max_ociosas'] = self.max_ociosas
+        stats['caminho'] = self.caminho
+        return stats
+
+    def fechar_todas(self):
+        """Fecha as conexões ociosas (ex.: antes de apagar o arquivo do banco)"""
+        with self._lock:
+            ociosas, self._ociosas = self._ociosas, []
+        for conn in ociosas:
+            conn.close()
+
+    def init_app(self, app):
+        app.teardown_appcontext(self.liberar_requisicao)
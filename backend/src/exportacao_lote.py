@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exportação em lote dos relatórios individuais de todos os órgãos.
+
+Cada órgão vira uma chamada a pdf_orgao() no pool de processos das
+exportações (FilaExportacoes.submeter): o processo abre a própria conexão,
+coleta os dados (carregar_dados_pdf_simples) e devolve o PDF. O processo web
+escreve cada PDF no ZIP assim que ele termina e entrega os bytes ao cliente
+na hora; o ZIP é gravado em um fluxo sem seek (zipfile usa descritores de
+dados), então nada acumula em memória além dos PDFs em andamento, limitados
+a JANELA_POR_PROCESSO por processo do pool.
+
+O progresso de cada lote fica na tabela lotes_exportacao (migração 15),
+gravado pelo processo que faz o streaming a cada PDF, e é consultado pelo
+id devolvido no cabeçalho X-Exportacao-Lote em qualquer processo do
+servidor (gunicorn -w N). Lotes iniciados há mais de EXPIRACAO_HORAS são
+apagados ao criar um novo.
+"""
+
+import json
+import uuid
+import sqlite3
+import logging
+import zipfile
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
+
+from relatorio_orgao import carregar_dados_pdf_simples
+from relatorio_pdf import gerar_pdf_simples
+
+logger = logging.getLogger(__name__)
+
+PROCESSANDO = 'processando'
+CONCLUIDA = 'concluida'
+CANCELADA = 'cancelada'
+
+# PDFs em andamento por processo do pool (limita a memória do streaming)
+JANELA_POR_PROCESSO = 2
+
+EXPIRACAO_HORAS = 24
+
+
+def pdf_orgao(banco, orgao_id, dados_basicos):
+    """Executado em um processo do pool: bytes do PDF individual do órgão"""
+    conn = sqlite3.connect(banco, timeout=5)
+    try:
+        dados = carregar_dados_pdf_simples(conn, orgao_id, dados_basicos)
+    finally:
+        conn.close()
+    return gerar_pdf_simples(dados).getvalue()
+
+
+class _FluxoZip:
+    """Arquivo só de escrita: o zipfile escreve nele e o gerador retira os bytes"""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+class LotesExportacao:
+    """ZIPs com os PDFs individuais de vários órgãos, renderizados em paralelo"""
+
+    def __init__(self, pool, fila):
+        self.pool = pool
+        self.fila = fila
+
+    def criar(self, usuario_email, total):
+        """Registra o lote (com commit) e retorna o id"""
+        lote_id = uuid.uuid4().hex
+        limite = (datetime.now(timezone.utc) - timedelta(hours=EXPIRACAO_HORAS)).strftime('%Y-%m-%d %H:%M:%S')
+        conn = self.pool.conexao()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM lotes_exportacao WHERE data_inicio < ?', (limite,))
+            cursor.execute('''
+                INSERT INTO lotes_exportacao (id, usuario_email, status, total)
+                VALUES (?, ?, ?, ?)
+            ''', (lote_id, usuario_email, PROCESSANDO, total))
+            conn.commit()
+        finally:
+            conn.close()
+        return lote_id
+
+    def _gravar(self, lote_id, sql, parametros):
+        """UPDATE do progresso do lote; uma falha não interrompe o ZIP"""
+        conn = self.pool.conexao()
+        try:
+            conn.execute(f'UPDATE lotes_exportacao SET {sql} WHERE id = ?', (*parametros, lote_id))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Não foi possível gravar o progresso do lote {lote_id}: {str(e)}")
+        finally:
+            conn.close()
+
+    def gerar_zip(self, lote_id, orgaos, banco):
+        """
+        Gerador dos bytes do ZIP. orgaos: [(orgao_id, nome do arquivo, dados
+        básicos do PDF)]. Os PDFs entram no ZIP na ordem em que terminam.
+        """
+        fluxo = _FluxoZip()
+        janela = self.fila.max_processos * JANELA_POR_PROCESSO
+        pendentes = {}
+        restantes = iter(orgaos)
+        concluidos = 0
+        erros = []
+        concluido = False
+
+        def enviar_proximos():
+            for orgao in restantes:
+                orgao_id, _, dados_basicos = orgao
+                pendentes[self.fila.submeter(pdf_orgao, banco, orgao_id, dados_basicos)] = orgao
+                if len(pendentes) >= janela:
+                    break
+
+        try:
+            with zipfile.ZipFile(fluxo, 'w', zipfile.ZIP_STORED) as arquivo_zip:
+                enviar_proximos()
+                while pendentes:
+                    prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                    for futuro in prontos:
+                        orgao_id, nome_arquivo, dados_basicos = pendentes.pop(futuro)
+                        try:
+                            # PDFs já são comprimidos: entram no ZIP sem compressão
+                            arquivo_zip.writestr(nome_arquivo, futuro.result())
+                        except Exception as e:
+                            logger.error(f"Erro no PDF do órgão {orgao_id} (lote {lote_id}): {str(e)}")
+                            erros.append({
+                                'orgao_id': orgao_id,
+                                'orgao_nome': dados_basicos.get('orgao_nome'),
+                                'mensagem': str(e) or e.__class__.__name__
+                            })
+                        concluidos += 1
+                    self._gravar(lote_id, 'concluidos = ?, erros = ?', (concluidos, json.dumps(erros)))
+                    enviar_proximos()
+                    yield fluxo.retirar()
+
+                if erros:
+                    arquivo_zip.writestr('erros.txt', '\n'.join(
+                        f"{erro['orgao_id']} - {erro['orgao_nome']}: {erro['mensagem']}" for erro in erros))
+            yield fluxo.retirar()
+            concluido = True
+        finally:
+            # Cliente desconectado (GeneratorExit) ou erro: descarta o que não começou
+            for futuro in pendentes:
+                futuro.cancel()
+            self._gravar(lote_id, 'status = ?, data_conclusao = CURRENT_TIMESTAMP',
+                         (CONCLUIDA if concluido else CANCELADA,))
+
+    def obter(self, lote_id, usuario_email):
+        """Progresso do lote (None se não existir ou for de outro usuário)"""
+        conn = self.pool.conexao()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, usuario_email, status, total, concluidos, erros, data_inicio, data_conclusao
+                FROM lotes_exportacao WHERE id = ?
+            ''', (lote_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        if not row or row[1] != usuario_email:
+            return None
+
+        progresso = {
+            'id': row[0],
+            'status': row[2],
+            'total': row[3],
+            'concluidos': row[4],
+            'erros': json.loads(row[5] or '[]'),
+            'data_inicio': row[6],
+            'data_conclusao': row[7]
+        }
+        total = progresso['total']
+        progresso['percentual'] = round(progresso['concluidos'] / total * 100, 1) if total else 100.0
+        return progresso
+
+    def estatisticas(self):
+        conn = self.pool.conexao()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT status, COUNT(*) FROM lotes_exportacao GROUP BY status')
+            por_status = dict(cursor.fetchall())
+        finally:
+            conn.close()
+        return {'lotes': sum(por_status.values()), 'por_status': por_status,
+                'expiracao_horas': EXPIRACAO_HORAS}
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exportações de relatórios em segundo plano.
+
+A requisição de exportação só coleta os dados do relatório (consultas
+rápidas), grava o job na tabela exportacoes (migração 12) e o envia para um
+ProcessPoolExecutor; a resposta sai na hora com o id do job. A montagem do
+PDF com o ReportLab roda nos processos do pool, fora do processo web, então
+as requisições interativas não esperam por ela nem disputam o GIL com ela.
+
+Estados: pendente -> processando -> concluida | erro; arquivos concluídos
+expiram depois de EXPIRACAO_HORAS (expirada). Os dados coletados ficam
+gravados no job, de modo que os jobs não terminados de um processo que
+morreu são reenviados ao pool por outro (retomar()).
+
+Cada job tem um dono (coluna dono, migração 14): o processo web que o
+enviou ao pool. O dono mantém uma trava (flock) em .donos/<dono>.lock
+enquanto vive; se a trava puder ser obtida por outro processo, o dono
+morreu. O job só troca de dono com um UPDATE condicionado ao dono antigo,
+então, com vários processos (gunicorn -w N), cada job interrompido é
+retomado por um único processo e os jobs de processos vivos ficam com eles.
+"""
+
+import os
+import json
+import uuid
+import sqlite3
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+from pdf_generator import gerar_pdf_completo
+from relatorio_pdf import gerar_pdf_simples, montar_pdf_relatorio
+from tema_pdf import aquecer_tema
+
+logger = logging.getLogger(__name__)
+
+PENDENTE = 'pendente'
+PROCESSANDO = 'processando'
+CONCLUIDA = 'concluida'
+ERRO = 'erro'
+EXPIRADA = 'expirada'
+
+EXPIRACAO_HORAS = 24
+
+
+# ===== RENDERIZAÇÃO (processos do pool) =====
+
+def _pdf_consolidado(dados):
+    return montar_pdf_relatorio(dados['total_avaliacoes'], dados['avaliacoes_finalizadas'],
+                                dados['orgaos_participantes'], dados['dados_orgaos'])
+
+
+# tipo -> função que recebe os dados coletados e retorna um BytesIO com o PDF
+RENDERIZADORES = {
+    'individual': gerar_pdf_simples,
+    'individual_completo': gerar_pdf_completo,
+    'consolidado': _pdf_consolidado
+}
+
+
+def renderizar(banco, exportacao_id, tipo, dados, caminho):
+    """
+    Executado em um processo do pool: marca o job como processando, gera o
+    arquivo (gravação atômica) e retorna o tamanho em bytes.
+    """
+    conn = sqlite3.connect(banco, timeout=5)
+    try:
+        with conn:
+            conn.execute('''
+                UPDATE exportacoes SET status = ?, data_inicio = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = ?
+            ''', (PROCESSANDO, exportacao_id, PENDENTE))
+    finally:
+        conn.close()
+
+    buffer = RENDERIZADORES[tipo](dados)
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'wb') as arquivo:
+        arquivo.write(buffer.getvalue())
+    os.replace(temporario, caminho)
+    return os.path.getsize(caminho)
+
+
+# ===== JOBS (processo web) =====
+
+def exportacao_para_dict(row):
+    """Linha de SQL_EXPORTACAO -> JSON da API"""
+    exportacao = {
+        'id': row[0],
+        'tipo': row[1],
+        'formato': row[2],
+        'status': row[3],
+        'nome_arquivo': row[4],
+        'tamanho': row[5],
+        'mensagem': row[6],
+        'data_criacao': row[7],
+        'data_inicio': row[8],
+        'data_conclusao': row[9]
+    }
+    if exportacao['status'] == CONCLUIDA:
+        exportacao['url_download'] = f"/api/exportacoes/{exportacao['id']}/arquivo"
+    return exportacao
+
+
+SQL_EXPORTACAO = '''
+    SELECT id, tipo, formato, status, nome_arquivo, tamanho, mensagem,
+           data_criacao, data_inicio, data_conclusao, usuario_email, arquivo
+    FROM exportacoes
+'''
+
+
+def _descartar_executor(executor, futuros):
+    """Cancela o que ainda não começou e encerra o pool sem esperar"""
+    # shutdown(cancel_futures=True) só existe a partir do Python 3.9
+    for futuro in list(futuros):
+        futuro.cancel()
+    executor.shutdown(wait=False)
+
+
+class FilaExportacoes:
+    """Jobs de exportação gravados no banco e renderizados em um pool de processos"""
+
+    def __init__(self, pool, diretorio, max_processos=None):
+        self.pool = pool
+        self.diretorio = os.path.abspath(diretorio)
+        self.max_processos = max_processos or min(4, os.cpu_count() or 1)
+
+        self.dono = None
+        self._trava_dono = None
+        self._pid_dono = None
+        self._executor = None
+        self._futuros = set()
+        self._retomada = False
+        self._lock = threading.Lock()
+        self._stats = {'enviadas': 0, 'concluidas': 0, 'erros': 0, 'retomadas': 0}
+
+    def _executor_ativo(self, recriar=False):
+        """(executor, futuros pendentes do executor), criando o pool se preciso"""
+        anterior = None
+        with self._lock:
+            if self._executor is None or recriar:
+                if self._executor is not None:
+                    anterior = (self._executor, self._futuros)
+                    self._futuros = set()
+                os.makedirs(self.diretorio, exist_ok=True)
+                # spawn: os processos não herdam conexões nem threads do servidor;
+                # cada processo já nasce com o tema dos PDFs montado
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_processos,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=aquecer_tema
+                )
+            atual = (self._executor, self._futuros)
+        if anterior is not None:
+            _descartar_executor(*anterior)
+        return atual
+
+    def _registrar_dono(self):
+        """Identificador deste processo como dono de jobs e a trava que o mantém (com _lock)"""
+        if self._pid_dono == os.getpid():
+            return
+        # Depois de um fork o processo filho precisa de um dono e de uma trava próprios
+        self.dono = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._pid_dono = os.getpid()
+        self._trava_dono = None
+        if fcntl is None:
+            return
+        os.makedirs(os.path.join(self.diretorio, '.donos'), exist_ok=True)
+        trava = open(self._arquivo_dono(self.dono), 'a')
+        fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._trava_dono = trava
+
+    def _arquivo_dono(self, dono):
+        return os.path.join(self.diretorio, '.donos', f'{dono}.lock')
+
+    def _dono_ativo(self, dono):
+        """O processo dono do job ainda está vivo (segura a trava)?"""
+        if dono == self.dono:
+            return True
+        if dono is None or fcntl is None:
+            # Sem flock (Windows) não há como saber; lá o servidor roda em um processo só
+            return False
+        caminho = self._arquivo_dono(dono)
+        try:
+            trava = open(caminho, 'r')
+        except OSError:
+            return False
+        try:
+            fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        finally:
+            trava.close()
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+        return False
+
+    def iniciar(self):
+        """Cria o pool e reenvia os jobs interrompidos (uma vez por processo)"""
+        self._executor_ativo()
+        with self._lock:
+            self._registrar_dono()
+            if self._retomada:
+                return
+            self._retomada = True
+        self.retomar()
+
+    def encerrar(self):
+        """Encerra o pool sem esperar; jobs não terminados são retomados por outro processo"""
+        with self._lock:
+            executor, futuros = self._executor, self._futuros
+            self._executor, self._futuros = None, set()
+            trava, self._trava_dono = self._trava_dono, None
+            self._pid_dono = None
+        if executor is not None:
+            _descartar_executor(executor, futuros)
+        if trava is not None:
+            try:
+                os.remove(trava.name)
+            except OSError:
+                pass
+            trava.close()
+
+    def caminho(self, exportacao_id, formato):
+        return os.path.join(self.diretorio, f'{exportacao_id}.{formato}')
+
+    def criar(self, conn, tipo, usuario_email, dados, nome_arquivo, orgao_id=None, formato='pdf',
+              ao_concluir=None):
+        """
+        Grava o job (com commit), envia ao pool e retorna o JSON do job.
+        ao_concluir(caminho) é chamado neste processo quando o arquivo fica pronto.
+        """
+        if tipo not in RENDERIZADORES:
+            raise ValueError(f'Tipo de exportação desconhecido: {tipo}')
+
+        self.iniciar()
+        self.expirar(conn)
+
+        exportacao_id = uuid.uuid4().hex
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO exportacoes (
+                id, tipo, formato, status, usuario_email, orgao_id, dados, nome_arquivo, dono
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (exportacao_id, tipo, formato, PENDENTE, usuario_email, orgao_id,
+              json.dumps(dados, default=str), nome_arquivo, self.dono))
+        conn.commit()
+
+        self._enviar(exportacao_id, tipo, dados, formato, ao_concluir)
+        return self.obter(conn, exportacao_id)
+
+    def submeter(self, funcao, *argumentos):
+        """Envia uma chamada ao pool de processos e retorna o Future"""
+        executor, futuros = self._executor_ativo()
+        try:
+            futuro = executor.submit(funcao, *argumentos)
+        except BrokenProcessPool:
+            # Um processo do pool morreu: recria o pool e tenta de novo
+            logger.warning("Pool de exportação quebrado, recriando")
+            executor, futuros = self._executor_ativo(recriar=True)
+            futuro = executor.submit(funcao, *argumentos)
+        futuros.add(futuro)
+        futuro.add_done_callback(futuros.discard)
+        return futuro
+
+    def _enviar(self, exportacao_id, tipo, dados, formato, ao_concluir=None):
+        caminho = self.caminho(exportacao_id, formato)
+        futuro = self.submeter(renderizar, self.pool.caminho, exportacao_id, tipo, dados, caminho)
+
+        with self._lock:
+            self._stats['enviadas'] += 1
+        futuro.add_done_callback(lambda f: self._concluir(exportacao_id, caminho, f, ao_concluir))
+
+    def _concluir(self, exportacao_id, caminho, futuro, ao_concluir=None):
+        """Callback do pool: grava o resultado do job"""
+        if futuro.cancelled():
+            return  # pool encerrado; o job continua pendente e será retomado
+
+        conn = self.pool.conexao()
+        try:
+            try:
+                tamanho = futuro.result()
+                conn.execute('''
+                    UPDATE exportacoes
+                    SET status = ?, arquivo = ?, tamanho = ?, data_conclusao = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (CONCLUIDA, os.path.basename(caminho), tamanho, exportacao_id))
+                chave = 'concluidas'
+            except Exception as e:
+                logger.error(f"Erro na exportação {exportacao_id}: {str(e)}")
+                conn.execute('''
+                    UPDATE exportacoes
+                    SET status = ?, mensagem = ?, data_conclusao = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (ERRO, str(e) or e.__class__.__name__, exportacao_id))
+                chave = 'erros'
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Não foi possível gravar o resultado da exportação {exportacao_id}: {str(e)}")
+            return
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._stats[chave] += 1
+
+        if chave == 'concluidas' and ao_concluir is not None:
+            try:
+                ao_concluir(caminho)
+            except Exception as e:
+                logger.warning(f"Exportação {exportacao_id} concluída, mas o pós-processamento falhou: {str(e)}")
+
+    def retomar(self):
+        """Assume e reenvia os jobs não terminados cujo processo dono morreu"""
+        conn = self.pool.conexao()
+        retomadas = []
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, dono, tipo, formato, dados FROM exportacoes WHERE status IN (?, ?)
+            ''', (PENDENTE, PROCESSANDO))
+            ativos = {}
+            for exportacao_id, dono, tipo, formato, dados in cursor.fetchall():
+                if dono not in ativos:
+                    ativos[dono] = self._dono_ativo(dono)
+                if ativos[dono]:
+                    continue
+                # Só o primeiro processo a trocar o dono fica com o job
+                cursor.execute('''
+                    UPDATE exportacoes SET dono = ?, status = ?
+                    WHERE id = ? AND dono IS ? AND status IN (?, ?)
+                ''', (self.dono, PENDENTE, exportacao_id, dono, PENDENTE, PROCESSANDO))
+                if cursor.rowcount == 1:
+                    retomadas.append((exportacao_id, tipo, formato, dados))
+            conn.commit()
+        finally:
+            conn.close()
+
+        for exportacao_id, tipo, formato, dados in retomadas:
+            logger.info(f"🔁 Retomando exportação {exportacao_id} ({tipo})")
+            self._enviar(exportacao_id, tipo, json.loads(dados), formato)
+        with self._lock:
+            self._stats['retomadas'] += len(retomadas)
+        return len(retomadas)
+
+    def expirar(self, conn):
+        """Remove os arquivos concluídos há mais de EXPIRACAO_HORAS (com commit)"""
+        limite = (datetime.now(timezone.utc) - timedelta(hours=EXPIRACAO_HORAS)).strftime('%Y-%m-%d %H:%M:%S')
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, arquivo FROM exportacoes WHERE status = ? AND data_conclusao < ?
+        ''', (CONCLUIDA, limite))
+        expiradas = cursor.fetchall()
+        if not expiradas:
+            return 0
+
+        for _, arquivo in expiradas:
+            try:
+                os.remove(os.path.join(self.diretorio, arquivo))
+            except (OSError, TypeError):
+                pass
+        cursor.executemany('UPDATE exportacoes SET status = ?, arquivo = NULL WHERE id = ?',
+                           [(EXPIRADA, row[0]) for row in expiradas])
+        conn.commit()
+        return len(expiradas)
+
+    def obter(self, conn, exportacao_id, usuario_email=None):
+        """JSON do job (None se não existir ou, com usuario_email, for de outro usuário)"""
+        cursor = conn.cursor()
+        cursor.execute(SQL_EXPORTACAO + ' WHERE id = ?', (exportacao_id,))
+        row = cursor.fetchone()
+        if not row or (usuario_email is not None and row[10] != usuario_email):
+            return None
+        return exportacao_para_dict(row)
+
+    def arquivo(self, conn, exportacao_id, usuario_email):
+        """(caminho, nome para download, json do job) ou (None, None, json/None)"""
+        cursor = conn.cursor()
+        cursor.execute(SQL_EXPORTACAO + ' WHERE id = ?', (exportacao_id,))
+        row = cursor.fetchone()
+        if not row or row[10] != usuario_email:
+            return None, None, None
+        exportacao = exportacao_para_dict(row)
+        if exportacao['status'] != CONCLUIDA or not row[11]:
+            return None, None, exportacao
+        return os.path.join(self.diretorio, row[11]), row[4], exportacao
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['ativa'] = self._executor is not None
+            stats['dono'] = self.dono
+        stats['max_processos'] = self.max_processos
+        stats['diretorio'] = self.diretorio
+        return stats
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fila de escrita adiada (write-behind) para o salvamento automático.
+
+Com a fila ativa, as respostas salvas pelo formulário não são gravadas na
+requisição. Elas entram em uma fila limitada em memória e uma única thread
+as grava em lotes: gravações repetidas da mesma (avaliacao_id, atividade_id)
+são combinadas, e cada lote é gravado em uma só transação a cada
+INTERVALO_PADRAO segundos ou quando acumula MAX_LOTE_PADRAO respostas.
+
+Quem precisa ver todas as gravações de uma avaliação (finalização, leitura
+das respostas, salvamento em lote) chama descarregar() antes. A fila e a
+barreira valem só para o processo: com a fila ativa o servidor deve rodar
+em um único processo. Para garantir isso, o processo que usa a fila trava o
+arquivo arquivo_trava; em outro processo, enfileirar() e descarregar()
+levantam FilaEscritaIndisponivel.
+
+Um lote que falha é regravado por avaliação e, se ainda falhar, resposta a
+resposta, de modo que uma resposta inválida não descarta as vizinhas. Só
+"database is locked"/"busy" devolve respostas à fila; os demais erros
+descartam a resposta (registrado no log e em 'descartadas').
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_PADRAO = 0.25      # segundos entre gravações
+MAX_LOTE_PADRAO = 200        # respostas que disparam a gravação imediata
+MAX_PENDENTES_PADRAO = 5000  # limite da fila (respostas distintas)
+TIMEOUT_PADRAO = 10          # segundos esperando espaço na fila ou a gravação
+
+
+class FilaEscritaIndisponivel(RuntimeError):
+    """A fila de escrita já está em uso por outro processo do servidor"""
+
+
+def banco_ocupado(erro):
+    """Erro transitório de concorrência (vale tentar de novo)"""
+    mensagem = str(erro).lower()
+    return isinstance(erro, sqlite3.OperationalError) and ('locked' in mensagem or 'busy' in mensagem)
+
+
+class FilaEscrita:
+    """
+    Fila de respostas pendentes com uma thread gravadora.
+
+    gravar(conn, respostas_por_avaliacao) grava {avaliacao_id: [resposta, ...]}
+    na conexão recebida, sem commit; a fila faz o commit do lote.
+    """
+
+    def __init__(self, pool, gravar, intervalo=INTERVALO_PADRAO,
+                 max_lote=MAX_LOTE_PADRAO, max_pendentes=MAX_PENDENTES_PADRAO, arquivo_trava=None):
+        self.pool = pool
+        self.gravar = gravar
+        self.arquivo_trava = arquivo_trava
+        self.intervalo = intervalo
+        self.max_lote = max_lote
+        self.max_pendentes = max_pendentes
+
+        self._pendentes = {}          # (avaliacao_id, atividade_id) -> resposta
+        self._em_gravacao = set()     # avaliações do lote sendo gravado
+        self._urgente = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._trava = None            # arquivo travado
+        self._pid_trava = None        # processo dono da trava
+        self._stats = {
+            'recebidas': 0,
+            'combinadas': 0,
+            'gravadas': 0,
+            'lotes': 0,
+            'erros': 0,
+            'descartadas': 0
+        }
+
+    def _garantir_exclusividade(self):
+        """Trava arquivo_trava para este processo (chamado com _cond adquirido)"""
+        if self.arquivo_trava is None or fcntl is None or self._pid_trava == os.getpid():
+            return
+        # Aberto de novo depois de um fork: a trava do processo pai não vale aqui
+        trava = open(self.arquivo_trava, 'a')
+        try:
+            fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            trava.close()
+            raise FilaEscritaIndisponivel(
+                'A fila de escrita está ativa em outro processo; com PRISMA_ESCRITA_ADIADA=1 '
+                'o servidor deve rodar com um único processo')
+        self._trava = trava
+        self._pid_trava = os.getpid()
+
+    # ===== PRODUTORES =====
+
+    def enfileirar(self, avaliacao_id, resposta, timeout=TIMEOUT_PADRAO):
+        """
+        Coloca a resposta na fila. Retorna False se a fila continuar cheia
+        após o timeout (quem chamou deve então gravar diretamente).
+        """
+        chave = (avaliacao_id, resposta['atividade_id'])
+        limite = time.monotonic() + timeout
+
+        with self._cond:
+            self._garantir_exclusividade()
+            self._iniciar()
+            while chave not in self._pendentes and len(self._pendentes) >= self.max_pendentes:
+                self._urgente = True
+                self._cond.notify_all()
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                self._cond.wait(restante)
+
+            anterior = self._pendentes.get(chave)
+            if anterior is not None:
+                # Campos ausentes na gravação nova continuam valendo
+                resposta = {**anterior, **resposta}
+                self._stats['combinadas'] += 1
+            self._pendentes[chave] = resposta
+            self._stats['recebidas'] += 1
+
+            if len(self._pendentes) >= self.max_lote:
+                self._urgente = True
+            self._cond.notify_all()
+        return True
+
+    def descarregar(self, avaliacao_id=None, timeout=TIMEOUT_PADRAO):
+        """
+        Barreira: espera até que as respostas pendentes da avaliação (ou de
+        todas, sem avaliacao_id) estejam gravadas. Retorna False no timeout.
+        """
+        limite = time.monotonic() + timeout
+
+        with self._cond:
+            self._garantir_exclusividade()
+            while self._tem_pendencias(avaliacao_id):
+                self._urgente = True
+                self._cond.notify_all()
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    def _tem_pendencias(self, avaliacao_id):
+        if avaliacao_id is None:
+            return bool(self._pendentes or self._em_gravacao)
+        return (avaliacao_id in self._em_gravacao or
+                any(chave[0] == avaliacao_id for chave in self._pendentes))
+
+    # ===== THREAD GRAVADORA =====
+
+    def _iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._executar, name='fila-escrita', daemon=True)
+            self._thread.start()
+
+    def _executar(self):
+        while True:
+            with self._cond:
+                while not self._pendentes:
+                    self._cond.wait()
+
+                # Espera o intervalo para juntar mais gravações, salvo urgência
+                limite = time.monotonic() + self.intervalo
+                while not self._urgente:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+
+                lote, self._pendentes = self._pendentes, {}
+                self._em_gravacao = {avaliacao_id for avaliacao_id, _ in lote}
+                self._urgente = False
+                self._cond.notify_all()  # libera espaço para os produtores
+
+            respostas_por_avaliacao = {}
+            for (avaliacao_id, _), resposta in lote.items():
+                respostas_por_avaliacao.setdefault(avaliacao_id, []).append(resposta)
+
+            repetir = self._gravar_lote(respostas_por_avaliacao)
+
+            with self._cond:
+                # Devolve à fila o que falhou; gravações mais novas da mesma
+                # atividade prevalecem sobre os campos do lote antigo
+                for avaliacao_id, respostas in repetir.items():
+                    for resposta in respostas:
+                        chave = (avaliacao_id, resposta['atividade_id'])
+                        self._pendentes[chave] = {**resposta, **self._pendentes.get(chave, {})}
+                self._em_gravacao = set()
+                self._cond.notify_all()
+
+            if repetir:
+                time.sleep(self.intervalo)
+
+    def _gravar_lote(self, respostas_por_avaliacao):
+        """
+        Grava o lote em uma transação. Se ela falhar, grava cada avaliação
+        separadamente e, se a avaliação ainda falhar, cada resposta, para
+        isolar o erro. Retorna {avaliacao_id: [resposta, ...]} com o que deve
+        voltar para a fila (banco ocupado); respostas que falham por outro
+        motivo são descartadas e registradas no log.
+        """
+        try:
+            self._gravar_transacao(respostas_por_avaliacao)
+            return {}
+        except Exception as e:
+            if banco_ocupado(e):
+                logger.warning(f"Banco ocupado ao gravar o lote da fila de escrita, nova tentativa: {str(e)}")
+                return respostas_por_avaliacao
+            logger.warning(f"Lote da fila de escrita falhou, gravando por avaliação: {str(e)}")
+
+        repetir = {}
+        for avaliacao_id, respostas in respostas_por_avaliacao.items():
+            try:
+                self._gravar_transacao({avaliacao_id: respostas})
+                continue
+            except Exception as e:
+                if banco_ocupado(e):
+                    logger.warning(f"Banco ocupado ao gravar a avaliação {avaliacao_id}, nova tentativa: {str(e)}")
+                    repetir[avaliacao_id] = respostas
+                    continue
+                if len(respostas) > 1:
+                    logger.warning(f"Respostas da avaliação {avaliacao_id} falharam, gravando uma a uma: {str(e)}")
+                else:
+                    self._descartar(avaliacao_id, respostas[0], e)
+                    continue
+
+            for resposta in respostas:
+                try:
+                    self._gravar_transacao({avaliacao_id: [resposta]})
+                except Exception as e:
+                    if banco_ocupado(e):
+                        repetir.setdefault(avaliacao_id, []).append(resposta)
+                    else:
+                        self._descartar(avaliacao_id, resposta, e)
+        return repetir
+
+    def _descartar(self, avaliacao_id, resposta, erro):
+        logger.error(f"Resposta {resposta['atividade_id']} da avaliação {avaliacao_id} descartada "
+                     f"pela fila de escrita: {str(erro)}")
+        with self._cond:
+            self._stats['descartadas'] += 1
+
+    def _gravar_transacao(self, respostas_por_avaliacao):
+        total = sum(len(respostas) for respostas in respostas_por_avaliacao.values())
+        conn = self.pool.conexao()
+        try:
+            self.gravar(conn, respostas_por_avaliacao)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            with self._cond:
+                self._stats['erros'] += 1
+            raise
+        finally:
+            conn.close()
+
+        with self._cond:
+            self._stats['gravadas'] += total
+            self._stats['lotes'] += 1
+
+    def estatisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pendentes'] = len(self._pendentes)
+            stats['em_gravacao'] = sorted(self._em_gravacao)
+        stats['ativa'] = self._thread is not None and self._thread.is_alive()
+        stats['processo'] = self._pid_trava
+        stats['intervalo'] = self.intervalo
+        stats['max_lote'] = self.max_lote
+        stats['max_pendentes'] = self.max_pendentes
+        return stats
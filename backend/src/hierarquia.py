@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hierarquia de órgãos (orgao_superior_id) e maturidade consolidada.
+
+A tabela orgaos_closure guarda todos os pares (ancestral, descendente) da
+hierarquia com a distância entre eles, e é mantida por triggers em orgaos
+(migração 9), que também recusam ciclos. Assim a subárvore de um órgão (ele e
+todos os subordinados, em qualquer profundidade) e o caminho até a raiz são
+uma única consulta indexada.
+
+A consolidação da subárvore (distribuição de níveis, média de
+institucionalização e KPAs defasadas) é calculada com a BaseAnalitica
+restrita aos órgãos dela.
+
+O resultado fica em cache por órgão. A chave é o conjunto de órgãos da
+subárvore mais a soma das versões da classificação materializada deles
+(orgao_maturidade.versao, incrementada a cada regravação): qualquer mudança
+na maturidade de um descendente, ou na própria árvore, muda a chave e
+invalida o resultado.
+"""
+
+import threading
+from collections import OrderedDict
+
+from model_registry import modelo_atual
+from maturity import obter_maturidades
+from analytics import BaseAnalitica
+
+MAX_ENTRADAS_CACHE = 256
+
+SQL_SUBARVORE = '''
+    SELECT c.descendant, m.versao, m.assinatura_modelo
+    FROM orgaos_closure c
+    LEFT JOIN orgao_maturidade m ON m.orgao_id = c.descendant
+    WHERE c.ancestor = ?
+'''
+
+
+class CicloHierarquia(ValueError):
+    """O órgão superior informado é o próprio órgão ou um subordinado dele"""
+
+
+def verificar_superior(conn, orgao_id, orgao_superior_id):
+    """
+    Valida o órgão superior antes de gravar (orgao_id None na criação).
+    Lança LookupError se ele não existir e CicloHierarquia se criar um ciclo.
+    """
+    if orgao_superior_id is None:
+        return
+
+    cursor = conn.cursor()
+    cursor.execute('SELECT 1 FROM orgaos WHERE id = ?', (orgao_superior_id,))
+    if not cursor.fetchone():
+        raise LookupError('Órgão superior não encontrado')
+
+    if orgao_id is not None:
+        cursor.execute('''
+            SELECT 1 FROM orgaos_closure WHERE ancestor = ? AND descendant = ?
+        ''', (orgao_id, orgao_superior_id))
+        if cursor.fetchone():
+            raise CicloHierarquia('O órgão superior não pode ser o próprio órgão nem um subordinado dele')
+
+
+def subordinados(conn, orgao_id, profundidade_maxima=None):
+    """Descendentes do órgão (sem ele), por profundidade e nome"""
+    parametros = [orgao_id]
+    filtro = ''
+    if profundidade_maxima is not None:
+        filtro = 'AND c.depth <= ?'
+        parametros.append(profundidade_maxima)
+
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT o.id, o.nome, o.sigla, o.orgao_superior_id, c.depth
+        FROM orgaos_closure c
+        JOIN orgaos o ON o.id = c.descendant
+        WHERE c.ancestor = ? AND c.depth > 0 {filtro}
+        ORDER BY c.depth, o.nome COLLATE NOCASE, o.id
+    ''', parametros)
+    return [{
+        'id': row[0],
+        'nome': row[1],
+        'sigla': row[2],
+        'orgao_superior_id': row[3],
+        'profundidade': row[4]
+    } for row in cursor.fetchall()]
+
+
+def ancestrais(conn, orgao_id):
+    """Caminho da raiz até o órgão (sem ele)"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT o.id, o.nome, o.sigla, c.depth
+        FROM orgaos_closure c
+        JOIN orgaos o ON o.id = c.ancestor
+        WHERE c.descendant = ? AND c.depth > 0
+        ORDER BY c.depth DESC
+    ''', (orgao_id,))
+    return [{
+        'id': row[0],
+        'nome': row[1],
+        'sigla': row[2],
+        'distancia': row[3]
+    } for row in cursor.fetchall()]
+
+
+def estado_subarvore(conn, orgao_id):
+    """
+    Órgãos da subárvore e a versão da classificação de cada um.
+
+    Classificações ausentes ou de outra versão do modelo são materializadas
+    antes (obter_maturidades), para que a versão reflita o estado atual.
+    Retorna {orgao_id: versao} (vazio se o órgão não existir).
+    """
+    assinatura = modelo_atual().assinatura
+    cursor = conn.cursor()
+    cursor.execute(SQL_SUBARVORE, (orgao_id,))
+    linhas = cursor.fetchall()
+
+    pendentes = [id_ for id_, versao, assinatura_modelo in linhas
+                 if versao is None or assinatura_modelo != assinatura]
+    if pendentes:
+        obter_maturidades(conn, pendentes)
+        cursor.execute(SQL_SUBARVORE, (orgao_id,))
+        linhas = cursor.fetchall()
+
+    return {id_: versao or 0 for id_, versao, _ in linhas}
+
+
+class CacheConsolidado:
+    """Consolidação por órgão, válida enquanto a chave da subárvore não muda"""
+
+    def __init__(self, max_entradas=MAX_ENTRADAS_CACHE):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()  # (orgao_id, limite_kpas) -> (chave, resultado)
+        self._lock = threading.Lock()
+        self._stats = {'acertos': 0, 'falhas': 0}
+
+    def obter(self, conn, orgao_id, limite_kpas=5):
+        """Consolidação da subárvore do órgão, ou None se ele não existir"""
+        versoes = estado_subarvore(conn, orgao_id)
+        if not versoes:
+            return None
+
+        chave = (modelo_atual().assinatura, frozenset(versoes), sum(versoes.values()))
+        entrada = (orgao_id, limite_kpas)
+
+        with self._lock:
+            guardado = self._entradas.get(entrada)
+            if guardado is not None and guardado[0] == chave:
+                self._entradas.move_to_end(entrada)
+                self._stats['acertos'] += 1
+                return guardado[1]
+            self._stats['falhas'] += 1
+
+        base = BaseAnalitica.carregar(conn, list(versoes))
+        resultado = base.consolidado(limite_kpas)
+        resultado['orgao_id'] = orgao_id
+
+        with self._lock:
+            self._entradas[entrada] = (chave, resultado)
+            self._entradas.move_to_end(entrada)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return resultado
+
+    def estatisticas(self):
+        with self._lock:
+            return dict(self._stats, entradas=len(self._entradas), max_entradas=self.max_entradas)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Histórico de maturidade dos órgãos (séries temporais).
+
+A tabela maturidade_historico (migração 10) só recebe inserções; triggers
+recusam UPDATE e DELETE. Cada linha é um retrato do órgão: nível certificado,
+status, % geral de instituição e institucionalização e o % de
+institucionalização de cada KPA (JSON, null nas KPAs de nível não avaliado).
+
+Os retratos são gravados:
+- na finalização de uma avaliação (origem 'finalizacao'), na mesma transação;
+- uma vez por dia para todos os órgãos (origem 'diario'), pela thread
+  AgendadorSnapshots, pelo endpoint administrativo ou por
+  "python historico.py [banco]" (cron). Um índice único parcial garante um
+  retrato diário por órgão, então repetir a chamada no mesmo dia não duplica.
+
+Os valores vêm da BaseAnalitica (as mesmas máscaras da certificação), de
+modo que o histórico não depende de recalcular respostas que mudaram depois.
+Uma série é uma varredura do intervalo de datas: o último retrato de cada
+órgão em cada período (dia, semana, mês ou ano), agregado por período.
+"""
+
+import sys
+import json
+import math
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from analytics import BaseAnalitica, INSTITUIDO, INSTITUCIONALIZADO
+from paginacao import ParametroInvalido
+
+logger = logging.getLogger(__name__)
+
+ORIGEM_FINALIZACAO = 'finalizacao'
+ORIGEM_DIARIO = 'diario'
+
+# Expressão SQL do início de cada período (semanas começam na segunda-feira)
+AGRUPAMENTOS = {
+    'dia': "date(h.data_registro)",
+    'semana': "date(h.data_registro, '-6 days', 'weekday 1')",
+    'mes': "strftime('%Y-%m-01', h.data_registro)",
+    'ano': "strftime('%Y-01-01', h.data_registro)"
+}
+
+AGRUPAMENTO_PADRAO = 'mes'
+
+# Margem depois da meia-noite (UTC) para o retrato diário
+MARGEM_AGENDADOR = 60  # segundos
+
+
+def ler_agrupamento(args, nome='agrupamento'):
+    """Agrupamento da query string (padrão: mes)"""
+    valor = (args.get(nome) or AGRUPAMENTO_PADRAO).strip().lower()
+    if valor not in AGRUPAMENTOS:
+        raise ParametroInvalido(f"{nome} deve ser {', '.join(AGRUPAMENTOS)}")
+    return valor
+
+
+def _percentual(valor):
+    return None if math.isnan(valor) else round(float(valor), 1)
+
+
+def retratos(conn, orgao_ids=None):
+    """Retrato atual dos órgãos: [(orgao_id, nivel, status, % instituição, % institucionalização, kpas_json)]"""
+    base = BaseAnalitica.carregar(conn, orgao_ids)
+    if not base.orgaos:
+        return []
+
+    niveis = base.nivel_certificado()
+    instituicao = base.percentual_geral(INSTITUIDO)
+    institucionalizacao = base.percentual_geral(INSTITUCIONALIZADO)
+    por_kpa = base.percentual_por_kpa(INSTITUCIONALIZADO)
+
+    linhas = []
+    for i, orgao in enumerate(base.orgaos):
+        nivel = int(niveis[i])
+        kpas = {kpa: _percentual(por_kpa[i, k]) for k, kpa in enumerate(base.kpas)}
+        linhas.append((
+            orgao['id'],
+            nivel,
+            'certificado' if nivel >= 2 else 'inicial',
+            _percentual(instituicao[i]),
+            _percentual(institucionalizacao[i]),
+            json.dumps(kpas)
+        ))
+    return linhas
+
+
+def registrar_finalizacao(conn, avaliacao_id):
+    """Grava o retrato do órgão da avaliação finalizada (sem commit)"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT orgao_id FROM avaliacoes WHERE id = ?', (avaliacao_id,))
+    row = cursor.fetchone()
+    if not row or row[0] is None:
+        return 0
+
+    cursor.executemany('''
+        INSERT INTO maturidade_historico (
+            orgao_id, origem, avaliacao_id, nivel_maturidade, status,
+            percentual_instituicao, percentual_institucionalizacao, kpas
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(orgao_id, ORIGEM_FINALIZACAO, avaliacao_id, *valores)
+          for orgao_id, *valores in retratos(conn, [row[0]])])
+    return cursor.rowcount
+
+
+def registrar_snapshot_diario(conn):
+    """
+    Grava o retrato do dia (UTC) dos órgãos que ainda não têm um e faz o
+    commit. Retorna quantos retratos foram gravados.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT o.id FROM orgaos o
+        WHERE NOT EXISTS (
+            SELECT 1 FROM maturidade_historico h
+            WHERE h.orgao_id = o.id AND h.origem = ? AND date(h.data_registro) = date('now')
+        )
+    ''', (ORIGEM_DIARIO,))
+    pendentes = [row[0] for row in cursor.fetchall()]
+    if not pendentes:
+        return 0
+
+    cursor.executemany('''
+        INSERT OR IGNORE INTO maturidade_historico (
+            orgao_id, origem, nivel_maturidade, status,
+            percentual_instituicao, percentual_institucionalizacao, kpas
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(orgao_id, ORIGEM_DIARIO, *valores) for orgao_id, *valores in retratos(conn, pendentes)])
+    gravados = cursor.rowcount
+    conn.commit()
+    return gravados
+
+
+def serie_temporal(conn, orgao_id=None, subarvore=None, inicio=None, fim=None,
+                   agrupamento=AGRUPAMENTO_PADRAO):
+    """
+    Série do histórico por período: para cada período, o último retrato de
+    cada órgão nele, agregado (nível médio, mínimo e máximo, distribuição de
+    níveis, % médios geral e por KPA). Sem filtro de órgão, todos os órgãos.
+    """
+    periodo = AGRUPAMENTOS[agrupamento]
+    condicoes = []
+    parametros = []
+    if orgao_id is not None:
+        condicoes.append('h.orgao_id = ?')
+        parametros.append(orgao_id)
+    if subarvore is not None:
+        condicoes.append('h.orgao_id IN (SELECT descendant FROM orgaos_closure WHERE ancestor = ?)')
+        parametros.append(subarvore)
+    if inicio:
+        condicoes.append('h.data_registro >= ?')
+        parametros.append(inicio)
+    if fim:
+        condicoes.append('h.data_registro <= ?')
+        parametros.append(fim)
+
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        WITH retratos AS (
+            SELECT h.*, {periodo} AS periodo,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY h.orgao_id, {periodo}
+                       ORDER BY h.data_registro DESC, h.id DESC
+                   ) AS ordem
+            FROM maturidade_historico h
+            {'WHERE ' + ' AND '.join(condicoes) if condicoes else ''}
+        )
+        SELECT periodo, orgao_id, nivel_maturidade, percentual_instituicao,
+               percentual_institucionalizacao, kpas, data_registro
+        FROM retratos
+        WHERE ordem = 1
+        ORDER BY periodo, orgao_id
+    ''', parametros)
+
+    serie = []
+    atual = None
+    for periodo, orgao_id_, nivel, instituicao, institucionalizacao, kpas, data_registro in cursor.fetchall():
+        if atual is None or atual['periodo'] != periodo:
+            atual = {'periodo': periodo, 'niveis': [], 'instituicao': [],
+                     'institucionalizacao': [], 'kpas': {}, 'ultimo_registro': data_registro}
+            serie.append(atual)
+        atual['niveis'].append(nivel)
+        if instituicao is not None:
+            atual['instituicao'].append(instituicao)
+        if institucionalizacao is not None:
+            atual['institucionalizacao'].append(institucionalizacao)
+        for kpa, valor in json.loads(kpas or '{}').items():
+            if valor is not None:
+                atual['kpas'].setdefault(kpa, []).append(valor)
+        atual['ultimo_registro'] = max(atual['ultimo_registro'], data_registro)
+
+    return [_resumo_periodo(p) for p in serie]
+
+
+def _media(valores):
+    return round(sum(valores) / len(valores), 1) if valores else None
+
+
+def _resumo_periodo(periodo):
+    niveis = periodo['niveis']
+    distribuicao = {}
+    for nivel in niveis:
+        distribuicao[str(nivel)] = distribuicao.get(str(nivel), 0) + 1
+    return {
+        'periodo': periodo['periodo'],
+        'ultimo_registro': periodo['ultimo_registro'],
+        'orgaos': len(niveis),
+        'nivel_medio': _media(niveis),
+        'nivel_minimo': min(niveis),
+        'nivel_maximo': max(niveis),
+        'distribuicao_niveis': dict(sorted(distribuicao.items())),
+        'percentual_instituicao': _media(periodo['instituicao']),
+        'percentual_institucionalizacao': _media(periodo['institucionalizacao']),
+        'kpas': {kpa: _media(valores) for kpa, valores in sorted(periodo['kpas'].items())}
+    }
+
+
+def inicio_periodo_recente(meses):
+    """Limite inicial ('AAAA-MM-01 00:00:00', UTC) dos últimos N meses, incluindo o atual"""
+    hoje = datetime.now(timezone.utc)
+    indice = hoje.year * 12 + hoje.month - 1 - (meses - 1)
+    return f'{indice // 12:04d}-{indice % 12 + 1:02d}-01 00:00:00'
+
+
+class AgendadorSnapshots:
+    """Thread que grava o retrato diário ao iniciar e depois a cada meia-noite (UTC)"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._parar = threading.Event()
+        self._thread = None
+        self._stats = {'execucoes': 0, 'retratos': 0, 'erros': 0, 'ultima_execucao': None}
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name='snapshot-diario', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def executar_agora(self):
+        """Grava os retratos pendentes do dia; retorna quantos foram gravados"""
+        conn = self.pool.conexao()
+        try:
+            gravados = registrar_snapshot_diario(conn)
+        except Exception:
+            conn.rollback()
+            with self._lock:
+                self._stats['erros'] += 1
+            raise
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._stats['execucoes'] += 1
+            self._stats['retratos'] += gravados
+            self._stats['ultima_execucao'] = datetime.now(timezone.utc).isoformat()
+        return gravados
+
+    def _executar(self):
+        while not self._parar.is_set():
+            try:
+                gravados = self.executar_agora()
+                if gravados:
+                    logger.info(f"📸 Retrato diário de maturidade gravado para {gravados} órgão(s)")
+            except sqlite3.Error as e:
+                logger.error(f"Erro ao gravar o retrato diário de maturidade: {str(e)}")
+
+            agora = datetime.now(timezone.utc)
+            amanha = (agora + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            self._parar.wait((amanha - agora).total_seconds() + MARGEM_AGENDADOR)
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['ativo'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+
+if __name__ == '__main__':
+    # Retrato diário via cron: python historico.py [caminho do banco]
+    logging.basicConfig(level=logging.INFO)
+    conexao = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else 'prisma.db')
+    try:
+        print(f"📸 {registrar_snapshot_diario(conexao)} retrato(s) gravado(s)")
+    finally:
+        conexao.close()
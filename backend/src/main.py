@@ -2,17 +2,41 @@
 # -*- coding: utf-8 -*-
 
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
+import sys
 import sqlite3
 import logging
 import os
 import uuid
 import json
+import atexit
 import hashlib
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from pdf_generator import gerar_pdf_completo
+from database import PoolConexoes
+from migrations import aplicar_migracoes
+from model_registry import modelo_atual
+from maturity import obter_maturidades, atualizar_maturidade_avaliacao, classificar_orgaos
+from anexos import TIPOS_ANEXO, CAMPO_POR_TIPO, sincronizar_anexos, anexos_da_avaliacao, anexo_para_dict
+from fila_escrita import FilaEscrita, FilaEscritaIndisponivel
+from relatorio_orgao import ContextoRelatorioOrgao, carregar_dados_pdf_simples
+from relatorio_pdf import gerar_pdf_simples, montar_pdf_relatorio
+from tema_pdf import aquecer_tema
+from mascaras import MASCARAS_VAZIAS, obter_mascaras, contar, nivel_completo
+from analytics import BaseAnalitica, ler_camada, ler_percentis
+from simulacao import simular
+from hierarquia import CacheConsolidado, CicloHierarquia, verificar_superior, subordinados, ancestrais
+from cache_respostas import CacheRespostas, geracao_dados
+from exportacoes import FilaExportacoes
+from exportacao_lote import LotesExportacao
+from cache_arquivos import CacheArquivosRelatorio, versao_dados_orgao
+from historico import (AgendadorSnapshots, registrar_finalizacao, serie_temporal, ler_agrupamento,
+                       inicio_periodo_recente)
+from paginacao import (ParametroInvalido, ler_paginacao, ler_booleano, ler_inteiro, ler_data,
+                       intervalo_prefixo, montar_pagina)
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -23,7 +47,8 @@ app = Flask(__name__)
 CORS(app, 
      origins=['http://localhost:3000', 'http://172.16.200.63:3000' ],
      methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-     allow_headers=['Content-Type', 'X-User-Email'] )
+     allow_headers=['Content-Type', 'X-User-Email'],
+     expose_headers=['X-Exportacao-Lote', 'X-Exportacao-Progresso'] )
 
 # Configuração de CORS
 #CORS(app, origins=['http://localhost:3000', 'http://172.16.200.63:3000'] )
@@ -34,6 +59,29 @@ ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx',
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 
+# Escrita adiada do salvamento automático (ver fila_escrita.py)
+app.config['ESCRITA_ADIADA'] = os.environ.get('PRISMA_ESCRITA_ADIADA', '0') == '1'
+
+# Processos do servidor (gunicorn -w); WEB_CONCURRENCY é o padrão do próprio gunicorn
+app.config['PROCESSOS_SERVIDOR'] = int(os.environ.get('PRISMA_PROCESSOS_SERVIDOR')
+                                       or os.environ.get('WEB_CONCURRENCY') or '1')
+
+# A fila e a barreira da finalização valem por processo
+if app.config['ESCRITA_ADIADA'] and app.config['PROCESSOS_SERVIDOR'] > 1:
+    logger.error("❌ PRISMA_ESCRITA_ADIADA=1 exige um único processo do servidor; escrita adiada desativada")
+    app.config['ESCRITA_ADIADA'] = False
+
+# Exportações de relatórios em segundo plano (ver exportacoes.py)
+EXPORT_FOLDER = 'exportacoes'
+
+# Relatórios exportados reaproveitados enquanto os dados não mudam (ver cache_arquivos.py)
+CACHE_RELATORIOS_FOLDER = 'cache_relatorios'
+app.config['CACHE_RELATORIOS_MB'] = int(os.environ.get('PRISMA_CACHE_RELATORIOS_MB', '256'))
+app.config['PROCESSOS_EXPORTACAO'] = int(os.environ.get('PRISMA_PROCESSOS_EXPORTACAO', '0')) or None
+
+# Retrato diário da maturidade de todos os órgãos (ver historico.py)
+app.config['SNAPSHOT_DIARIO'] = os.environ.get('PRISMA_SNAPSHOT_DIARIO', '1') == '1'
+
 # Criar diretório de uploads se não existir
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -49,12 +97,20 @@ if not os.path.exists(UPLOAD_FOLDER):
 # Configuração do banco de dados
 DATABASE = 'prisma.db'
 
+# Pool de conexões: uma conexão por requisição, devolvida no teardown
+pool_conexoes = PoolConexoes(DATABASE)
+pool_conexoes.init_app(app)
+
+def obter_conexao():
+    """Obtém a conexão do pool associada à requisição atual"""
+    return pool_conexoes.conexao()
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def init_db():
     """Inicializa o banco de dados"""
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     # ✅ TABELAS EXISTENTES (NÃO MEXER)
@@ -68,14 +124,6 @@ def init_db():
 #        )
 #    ''')
     
-    # Migração: adicionar coluna orgao_superior_id se não existir
-    try:
-        cursor.execute('ALTER TABLE orgaos ADD COLUMN orgao_superior_id INTEGER')
-        conn.commit()
-        print("✅ Coluna orgao_superior_id adicionada")
-    except sqlite3.OperationalError:
-        print("ℹ️ Coluna orgao_superior_id já existe")
-        
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS orgaos (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -165,6 +213,9 @@ def init_db():
         )
     ''')
     
+    # Migrações versionadas (colunas novas e índices)
+    aplicar_migracoes(conn, UPLOAD_FOLDER)
+    
     # Inserir perfis padrão se não existirem
     cursor.execute('SELECT COUNT(*) FROM perfis')
     if cursor.fetchone()[0] == 0:
@@ -257,7 +308,7 @@ def init_db():
 
 def verificar_permissao(user_email, permissao):
     """Verifica se o usuário tem uma permissão específica"""
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -278,7 +329,7 @@ def verificar_permissao(user_email, permissao):
 
 def obter_dados_usuario(user_email):
     """Obtém dados completos do usuário"""
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -331,6 +382,8 @@ def status():
             'GET  /api/avaliacoes/<id> (obter avaliação)',
             'GET  /api/avaliacoes/<id>/respostas (obter respostas)',
             'POST /api/avaliacoes/<id>/respostas (salvar resposta)',
+            'POST /api/avaliacoes/<id>/respostas/lote (salvar respostas em lote)',
+            'GET  /api/avaliacoes/<id>/anexos (anexos de evidência)',
             'POST /api/avaliacoes/<id>/finalizar (finalizar avaliação)',
             'POST /api/upload (upload de arquivos)',
             'GET  /api/dashboard (dados dashboard)',
@@ -342,15 +395,110 @@ def status():
             'GET  /api/perfis (listar perfis)',
             'GET  /api/admin/relatorios (relatórios administrativos)',
             'POST /api/admin/relatorios/exportar (exportar relatórios)',            
+            'POST /api/admin/relatorios/exportar-todos (ZIP com o PDF individual de cada órgão)',
+            'GET  /api/admin/relatorios/exportar-todos/<id> (progresso da exportação em lote)',
+            'GET  /api/admin/analytics/ranking (ranking de maturidade)',
+            'GET  /api/admin/analytics/percentis-kpa (percentis por KPA)',
+            'GET  /api/admin/analytics/mapa-calor (mapa de calor órgão x KPA)',
+            'GET  /api/admin/analytics/niveis (distribuição de níveis)',
+            'GET  /api/admin/analytics/lacunas (lacunas de institucionalização)',
+            'POST /api/maturidade/lote (classificação de vários órgãos)',
+            'POST /api/orgaos/<id>/simulacao (simulação de maturidade)',
+            'GET  /api/orgaos/<id>/consolidado (maturidade consolidada da subárvore)',
+            'GET  /api/orgaos/<id>/subordinados (subárvore do órgão)',
+            'GET  /api/orgaos/<id>/ancestrais (caminho até a raiz)',
+            'GET  /api/maturidade/historico (série temporal da maturidade)',
+            'POST /api/admin/maturidade/historico/snapshot (retrato diário sob demanda)',
             'GET  /api/auth/me (dados do usuário logado)'
             'GET  /api/relatorio-individual (relatório do órgão)',
             'POST /api/relatorio-individual/exportar (exportar relatório individual)',
+            'GET  /api/exportacoes/<id> (situação da exportação)',
+            'GET  /api/exportacoes/<id>/arquivo (download da exportação)',
             'GET  /api/auth/verify (verificação de usuário)',
         ]
     })
     
     
     
+# ===== EXPORTAÇÕES EM SEGUNDO PLANO (exportacoes.py) =====
+
+def exportacao_assincrona():
+    """A exportação pediu {"assincrono": true}: responder com o job, não com o arquivo"""
+    data = request.get_json(silent=True)
+    return isinstance(data, dict) and bool(data.get('assincrono'))
+
+def responder_exportacao(conn, tipo, user_email, dados, nome_arquivo, orgao_id=None, versao=None, extras=None):
+    """
+    Cria o job de exportação e responde 202 com a situação dele. Com versao, o
+    PDF pronto também entra no cache de relatórios, como na exportação direta.
+    """
+    ao_concluir = None
+    if versao is not None:
+        def ao_concluir(caminho):
+            with open(caminho, 'rb') as arquivo:
+                cache_arquivos.guardar(tipo, orgao_id, 'pdf', versao, arquivo.read(), extras)
+
+    exportacao = fila_exportacoes.criar(conn, tipo, user_email, dados, nome_arquivo, orgao_id,
+                                        ao_concluir=ao_concluir)
+    return jsonify({
+        'success': True,
+        'exportacao': exportacao,
+        'url_status': f"/api/exportacoes/{exportacao['id']}"
+    }), 202
+
+@app.route('/api/exportacoes/<exportacao_id>', methods=['GET'])
+def situacao_exportacao(exportacao_id):
+    """Situação de um job de exportação do usuário"""
+    user_email = request.headers.get('X-User-Email', '')
+
+    conn = obter_conexao()
+    exportacao = fila_exportacoes.obter(conn, exportacao_id, user_email)
+    conn.close()
+
+    if not exportacao:
+        return jsonify({'success': False, 'message': 'Exportação não encontrada'}), 404
+    return jsonify({'success': True, 'exportacao': exportacao})
+
+@app.route('/api/exportacoes/<exportacao_id>/arquivo', methods=['GET'])
+def baixar_exportacao(exportacao_id):
+    """Arquivo de uma exportação concluída (409 enquanto não estiver pronta)"""
+    user_email = request.headers.get('X-User-Email', '')
+
+    conn = obter_conexao()
+    caminho, nome_arquivo, exportacao = fila_exportacoes.arquivo(conn, exportacao_id, user_email)
+    conn.close()
+
+    if not exportacao:
+        return jsonify({'success': False, 'message': 'Exportação não encontrada'}), 404
+    if not caminho:
+        return jsonify({
+            'success': False,
+            'message': f"Exportação {exportacao['status']}: arquivo indisponível",
+            'exportacao': exportacao
+        }), 409
+    if not os.path.exists(caminho):
+        return jsonify({'success': False, 'message': 'Arquivo da exportação não encontrado'}), 410
+
+    return send_file(caminho, mimetype=MIMETYPES_EXPORTACAO[exportacao['formato']], as_attachment=True,
+                     download_name=nome_arquivo)
+
+MIMETYPES_EXPORTACAO = {
+    'pdf': 'application/pdf',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv'
+}
+
+def enviar_relatorio(arquivo, formato, nome_arquivo):
+    """Envia um arquivo do cache de relatórios como download"""
+    return send_file(arquivo, mimetype=MIMETYPES_EXPORTACAO[formato], as_attachment=True,
+                     download_name=nome_arquivo)
+
+def corpo_relatorio(gerado):
+    """Bytes de um relatório gerado (BytesIO ou resposta Flask)"""
+    if hasattr(gerado, 'getvalue'):
+        return gerado.getvalue()
+    return app.make_response(gerado).get_data()
+
 @app.route("/api/relatorio-individual/exportar-completo", methods=["POST"])
 def exportar_relatorio_individual_completo():
     user_email = request.headers.get("X-User-Email", "")
@@ -362,10 +510,23 @@ def exportar_relatorio_individual_completo():
     if not orgao_id:
         return jsonify({"success": False, "message": "Usuário não vinculado a um órgão"}), 400
 
-    conn = sqlite3.connect(DATABASE)
+    from datetime import datetime
+
+    orgao_sigla = dados_usuario.get("orgao_sigla", "orgao")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"relatorio_completo_{orgao_sigla}_{timestamp}.pdf"
+
+    conn = obter_conexao()
     cursor = conn.cursor()
 
     try:
+        # Mesmo relatório já gerado para esta versão dos dados do órgão
+        versao = versao_dados_orgao(conn, orgao_id)
+        assincrona = exportacao_assincrona()
+        arquivo = cache_arquivos.obter("individual_completo", orgao_id, "pdf", versao)
+        if arquivo:
+            return enviar_relatorio(arquivo, "pdf", filename)
+
         # ===== DADOS DO ÓRGÃO =====
         cursor.execute("SELECT id, nome, sigla FROM orgaos WHERE id = ?", (orgao_id,))
         orgao_data = cursor.fetchone()
@@ -402,7 +563,10 @@ def exportar_relatorio_individual_completo():
         if avaliacoes:
             avaliacao_mais_recente_id = avaliacoes[0]["id"]
             cursor.execute("SELECT * FROM respostas WHERE avaliacao_id = ?", (avaliacao_mais_recente_id,))
-            for row in cursor.fetchall():
+            linhas = cursor.fetchall()
+            anexos = anexos_da_avaliacao(conn, avaliacao_mais_recente_id)
+            for row in linhas:
+                anexos_atividade = anexos.get(row[2], {})
                 respostas.append({
                     "id": row[0],
                     "avaliacao_id": row[1],
@@ -413,8 +577,8 @@ def exportar_relatorio_individual_completo():
                     "justificativa_institucionalizado": row[6],
                     "evidencias_instituido": row[7],
                     "evidencias_institucionalizado": row[8],
-                    "arquivos_instituido": row[9],
-                    "arquivos_institucionalizado": row[10],
+                    "arquivos_instituido": anexos_atividade.get("instituido", []),
+                    "arquivos_institucionalizado": anexos_atividade.get("institucionalizado", []),
                 })
 
 
@@ -424,22 +588,13 @@ def exportar_relatorio_individual_completo():
             "respostas": respostas
         }
 
-        pdf_buffer = gerar_pdf_completo(dados_relatorio)
-
-        from flask import Response
-        from datetime import datetime
+        if assincrona:
+            return responder_exportacao(conn, "individual_completo", user_email, dados_relatorio,
+                                        filename, orgao_id, versao)
 
-        orgao_sigla = dados_usuario.get("orgao_sigla", "orgao")
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"relatorio_completo_{orgao_sigla}_{timestamp}.pdf"
-        
-        return Response(
-            pdf_buffer.getvalue(),
-            mimetype="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}"
-            }
-        )
+        pdf_buffer = gerar_pdf_completo(dados_relatorio)
+        arquivo = cache_arquivos.guardar("individual_completo", orgao_id, "pdf", versao, pdf_buffer.getvalue())
+        return enviar_relatorio(arquivo, "pdf", filename)
 
     except Exception as e:
         logger.error(f"Erro ao exportar relatório completo: {str(e)}")
@@ -459,6 +614,78 @@ def list_routes():
         })
     return jsonify(routes)
 
+@app.route('/debug/pool')
+def estatisticas_pool():
+    """Estatísticas do pool de conexões SQLite"""
+    user_email = request.headers.get('X-User-Email', '')
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Sem permissão para ver as estatísticas'}), 403
+    return jsonify(pool_conexoes.estatisticas())
+
+@app.route('/debug/fila-escrita')
+def estatisticas_fila_escrita():
+    """Estatísticas da fila de escrita adiada"""
+    user_email = request.headers.get('X-User-Email', '')
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Sem permissão para ver as estatísticas'}), 403
+    stats = fila_escrita.estatisticas()
+    stats['habilitada'] = app.config['ESCRITA_ADIADA']
+    return jsonify(stats)
+
+@app.route('/debug/cache-consolidado')
+def estatisticas_cache_consolidado():
+    """Estatísticas do cache de maturidade consolidada por órgão"""
+    user_email = request.headers.get('X-User-Email', '')
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Sem permissão para ver as estatísticas'}), 403
+    return jsonify(cache_consolidado.estatisticas())
+
+@app.route('/debug/cache-relatorios')
+def estatisticas_cache_relatorios():
+    """Estatísticas do cache de respostas dos relatórios administrativos"""
+    user_email = request.headers.get('X-User-Email', '')
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Sem permissão para ver as estatísticas'}), 403
+    conn = obter_conexao()
+    stats = cache_relatorios.estatisticas()
+    stats['geracao_dados'] = geracao_dados(conn)
+    conn.close()
+    return jsonify(stats)
+
+@app.route('/debug/exportacoes')
+def estatisticas_exportacoes():
+    """Estatísticas do pool de exportação de relatórios"""
+    user_email = request.headers.get('X-User-Email', '')
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Sem permissão para ver as estatísticas'}), 403
+    return jsonify(fila_exportacoes.estatisticas())
+
+@app.route('/debug/lotes-exportacao')
+def estatisticas_lotes_exportacao():
+    """Estatísticas das exportações em lote (ZIP de todos os órgãos)"""
+    user_email = request.headers.get('X-User-Email', '')
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Sem permissão para ver as estatísticas'}), 403
+    return jsonify(lotes_exportacao.estatisticas())
+
+@app.route('/debug/cache-arquivos')
+def estatisticas_cache_arquivos():
+    """Estatísticas do cache em disco dos relatórios exportados"""
+    user_email = request.headers.get('X-User-Email', '')
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Sem permissão para ver as estatísticas'}), 403
+    return jsonify(cache_arquivos.estatisticas())
+
+@app.route('/debug/snapshot-diario')
+def estatisticas_snapshot_diario():
+    """Estatísticas do agendador do retrato diário de maturidade"""
+    user_email = request.headers.get('X-User-Email', '')
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Sem permissão para ver as estatísticas'}), 403
+    stats = agendador_snapshots.estatisticas()
+    stats['habilitado'] = app.config['SNAPSHOT_DIARIO']
+    return jsonify(stats)
+
 @app.route('/api/auth/alterar-senha', methods=['OPTIONS'])
 def alterar_senha_preflight():
     return '', 200
@@ -506,7 +733,7 @@ def alterar_senha():
         }), 400
     
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = obter_conexao()
         cursor = conn.cursor()
         
         # Verificar senha atual
@@ -581,7 +808,7 @@ def login():
         # Hash da senha fornecida
         senha_hash = hashlib.sha256(senha.encode()).hexdigest()
         
-        conn = sqlite3.connect(DATABASE)
+        conn = obter_conexao()
         cursor = conn.cursor()
         
         # Buscar usuário com email e senha
@@ -672,29 +899,84 @@ def obter_usuario_logado():
     else:
         return jsonify({'success': False, 'message': 'Usuário não encontrado'}), 404
 
+def resposta_listagem(itens, limite, proximo_cursor):
+    """Lista completa (sem limit/cursor) ou página com o cursor da próxima"""
+    if limite is None:
+        return jsonify(itens)
+    return jsonify({
+        'itens': itens,
+        'limite': limite,
+        'proximo_cursor': proximo_cursor
+    })
+
 @app.route('/api/usuarios')
 def listar_usuarios():
-    """Lista todos os usuários (apenas para administradores)"""
+    """
+    Lista os usuários (apenas para administradores).
+    
+    Filtros opcionais: orgao_id, perfil (nome ou id), ativo e nome (prefixo).
+    Com limit e/ou cursor, retorna uma página ordenada por nome.
+    """
     user_email = request.headers.get('X-User-Email', '')
     
     if not verificar_permissao(user_email, 'gerenciar_usuarios'):
         return jsonify({'success': False, 'message': 'Sem permissão para gerenciar usuários'}), 403
     
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
+    try:
+        limite, posicao = ler_paginacao(request.args, 2)
+        orgao_id = ler_inteiro(request.args, 'orgao_id')
+        ativo = ler_booleano(request.args, 'ativo')
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    perfil = request.args.get('perfil', '').strip()
+    prefixo_nome = request.args.get('nome', '').strip()
+    
+    condicoes = []
+    parametros = []
+    if orgao_id is not None:
+        condicoes.append('u.orgao_id = ?')
+        parametros.append(orgao_id)
+    if perfil:
+        if perfil.isdigit():
+            condicoes.append('u.perfil_id = ?')
+            parametros.append(int(perfil))
+        else:
+            condicoes.append('u.perfil_id IN (SELECT id FROM perfis WHERE nome = ?)')
+            parametros.append(perfil)
+    if ativo is not None:
+        condicoes.append('u.ativo = ?')
+        parametros.append(1 if ativo else 0)
+    if prefixo_nome:
+        condicoes.append('u.nome COLLATE NOCASE >= ? AND u.nome COLLATE NOCASE < ?')
+        parametros.extend(intervalo_prefixo(prefixo_nome))
+    if posicao:
+        # O primeiro termo só limita a busca no índice; o segundo desempata pelo id
+        condicoes.append('u.nome COLLATE NOCASE >= ? AND (u.nome COLLATE NOCASE, u.id) > (?, ?)')
+        parametros.extend([posicao[0]] + posicao)
+    
+    sql = '''
         SELECT u.id, u.email, u.nome, u.ativo, u.ultimo_acesso, u.data_criacao,
                p.nome as perfil_nome,
                o.nome as orgao_nome, o.sigla as orgao_sigla
         FROM usuarios u
         LEFT JOIN perfis p ON u.perfil_id = p.id
         LEFT JOIN orgaos o ON u.orgao_id = o.id
-        ORDER BY u.nome
-    ''')
+    '''
+    if condicoes:
+        sql += ' WHERE ' + ' AND '.join(condicoes)
+    sql += ' ORDER BY u.nome COLLATE NOCASE, u.id'
+    if limite is not None:
+        sql += ' LIMIT ?'
+        parametros.append(limite + 1)
+    
+    conn = obter_conexao()
+    cursor = conn.cursor()
+    cursor.execute(sql, parametros)
+    linhas, proximo_cursor = montar_pagina(cursor.fetchall(), limite, lambda row: (row[2], row[0]))
     
     usuarios = []
-    for row in cursor.fetchall():
+    for row in linhas:
         usuarios.append({
             'id': row[0],
             'email': row[1],
@@ -708,7 +990,7 @@ def listar_usuarios():
         })
     
     conn.close()
-    return jsonify(usuarios)
+    return resposta_listagem(usuarios, limite, proximo_cursor)
 
 @app.route('/api/usuarios', methods=['POST'])
 def criar_usuario():
@@ -736,7 +1018,7 @@ def criar_usuario():
         return jsonify({'success': False, 'message': 'Senha deve ter pelo menos 6 caracteres'}), 400
     
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = obter_conexao()
         cursor = conn.cursor()
         
         # Verificar se email já existe
@@ -778,7 +1060,7 @@ def atualizar_usuario(usuario_id):
     
     data = request.get_json()
     
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     # Construir query de atualização dinamicamente
@@ -826,7 +1108,7 @@ def desativar_usuario(usuario_id):
     if not verificar_permissao(user_email, 'gerenciar_usuarios'):
         return jsonify({'success': False, 'message': 'Sem permissão para gerenciar usuários'}), 403
     
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -843,7 +1125,7 @@ def desativar_usuario(usuario_id):
 @app.route('/api/perfis')
 def listar_perfis():
     """Lista todos os perfis disponíveis"""
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     cursor.execute('SELECT id, nome, descricao FROM perfis ORDER BY nome')
@@ -863,16 +1145,50 @@ def listar_perfis():
 
 @app.route('/api/orgaos')
 def listar_orgaos():
-    """Lista todos os órgãos"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('''
+    """
+    Lista os órgãos.
+    
+    Filtros opcionais: orgao_superior_id e nome (prefixo). Com limit e/ou
+    cursor, retorna uma página ordenada por nome.
+    """
+    try:
+        limite, posicao = ler_paginacao(request.args, 2)
+        orgao_superior_id = ler_inteiro(request.args, 'orgao_superior_id')
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    prefixo_nome = request.args.get('nome', '').strip()
+    
+    condicoes = []
+    parametros = []
+    if orgao_superior_id is not None:
+        condicoes.append('o.orgao_superior_id = ?')
+        parametros.append(orgao_superior_id)
+    if prefixo_nome:
+        condicoes.append('o.nome COLLATE NOCASE >= ? AND o.nome COLLATE NOCASE < ?')
+        parametros.extend(intervalo_prefixo(prefixo_nome))
+    if posicao:
+        # O primeiro termo só limita a busca no índice; o segundo desempata pelo id
+        condicoes.append('o.nome COLLATE NOCASE >= ? AND (o.nome COLLATE NOCASE, o.id) > (?, ?)')
+        parametros.extend([posicao[0]] + posicao)
+    
+    sql = '''
         SELECT o.id, o.nome, o.sigla, o.data_criacao, o.orgao_superior_id,
                os.nome as orgao_superior_nome, os.sigla as orgao_superior_sigla
         FROM orgaos o
         LEFT JOIN orgaos os ON o.orgao_superior_id = os.id
-        ORDER BY o.nome
-    ''')
+    '''
+    if condicoes:
+        sql += ' WHERE ' + ' AND '.join(condicoes)
+    sql += ' ORDER BY o.nome COLLATE NOCASE, o.id'
+    if limite is not None:
+        sql += ' LIMIT ?'
+        parametros.append(limite + 1)
+    
+    conn = obter_conexao()
+    cursor = conn.cursor()
+    cursor.execute(sql, parametros)
+    linhas, proximo_cursor = montar_pagina(cursor.fetchall(), limite, lambda row: (row[1], row[0]))
     orgaos = [{
         'id': row[0], 
         'nome': row[1], 
@@ -881,9 +1197,21 @@ def listar_orgaos():
         'orgao_superior_id': row[4],
         'orgao_superior_nome': row[5],
         'orgao_superior_sigla': row[6]
-    } for row in cursor.fetchall()]
+    } for row in linhas]
     conn.close()
-    return jsonify(orgaos)
+    return resposta_listagem(orgaos, limite, proximo_cursor)
+
+def ler_orgao_superior(data):
+    """orgao_superior_id do corpo JSON: inteiro (ou texto numérico) positivo, ou None"""
+    valor = data.get('orgao_superior_id')
+    if valor is None or valor == '' or valor == 0:
+        return None
+    if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+        raise ParametroInvalido('orgao_superior_id deve ser um número inteiro')
+    orgao_superior_id = ler_inteiro({'orgao_superior_id': valor}, 'orgao_superior_id')
+    if not 0 < orgao_superior_id < 2 ** 63:
+        raise ParametroInvalido('orgao_superior_id deve ser um número inteiro positivo')
+    return orgao_superior_id
 
 @app.route('/api/orgaos', methods=['POST'])
 def criar_orgao():
@@ -891,15 +1219,23 @@ def criar_orgao():
     data = request.get_json()
     nome = data.get('nome')
     sigla = data.get('sigla', '')
-    orgao_superior_id = data.get('orgao_superior_id')
     
     if not nome:
         return jsonify({'success': False, 'message': 'Nome é obrigatório'}), 400
     
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
+    
+    # A closure da hierarquia (orgaos_closure) é mantida por trigger
+    try:
+        orgao_superior_id = ler_orgao_superior(data)
+        verificar_superior(conn, None, orgao_superior_id)
+    except (ParametroInvalido, LookupError) as e:
+        conn.close()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
     cursor.execute('INSERT INTO orgaos (nome, sigla, orgao_superior_id) VALUES (?, ?, ?)', 
-               (nome, sigla, orgao_superior_id if orgao_superior_id else None))
+               (nome, sigla, orgao_superior_id))
     orgao_id = cursor.lastrowid
     conn.commit()
     conn.close()
@@ -921,12 +1257,11 @@ def atualizar_orgao(orgao_id):
     data = request.get_json()
     nome = data.get('nome')
     sigla = data.get('sigla', '')
-    orgao_superior_id = data.get('orgao_superior_id')
     
     if not nome:
         return jsonify({'success': False, 'message': 'Nome é obrigatório'}), 400
     
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     # Verificar se órgão existe
@@ -935,9 +1270,23 @@ def atualizar_orgao(orgao_id):
         conn.close()
         return jsonify({'success': False, 'message': 'Órgão não encontrado'}), 404
     
-    # Atualizar órgão
-    cursor.execute('UPDATE orgaos SET nome = ?, sigla = ?, orgao_superior_id = ? WHERE id = ?', 
-               (nome, sigla, orgao_superior_id if orgao_superior_id else None, orgao_id))
+    # O superior precisa existir e não pode ser o próprio órgão nem um subordinado
+    try:
+        orgao_superior_id = ler_orgao_superior(data)
+        verificar_superior(conn, orgao_id, orgao_superior_id)
+    except (ParametroInvalido, LookupError, CicloHierarquia) as e:
+        conn.close()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    # Atualizar órgão (a closure da hierarquia é atualizada por trigger)
+    try:
+        cursor.execute('UPDATE orgaos SET nome = ?, sigla = ?, orgao_superior_id = ? WHERE id = ?', 
+                   (nome, sigla, orgao_superior_id, orgao_id))
+    except sqlite3.IntegrityError as e:
+        # Ciclo criado por uma alteração concorrente (trigger trg_orgaos_closure_ciclo)
+        conn.rollback()
+        conn.close()
+        return jsonify({'success': False, 'message': str(e)}), 400
     conn.commit()
     conn.close()
     
@@ -946,6 +1295,167 @@ def atualizar_orgao(orgao_id):
         'message': 'Órgão atualizado com sucesso'
     })
 
+def pode_acessar_orgao(dados_usuario, orgao_id):
+    """O próprio órgão do usuário ou qualquer órgão para quem gera relatórios"""
+    return (dados_usuario.get('orgao_id') == orgao_id or
+            bool(dados_usuario.get('permissoes', {}).get('gerar_relatorios')))
+
+@app.route('/api/orgaos/<int:orgao_id>/simulacao', methods=['POST'])
+def simular_maturidade_orgao(orgao_id):
+    """
+    Simula alterações de respostas sem gravá-las.
+
+    Corpo: {"alteracoes": [{"atividade_id": "2.1.1", "instituido": true,
+    "institucionalizado": true}, ...]}. Retorna o nível atual, o nível
+    simulado e as atividades que faltam em cada nível.
+    """
+    user_email = request.headers.get('X-User-Email', '')
+    dados_usuario = obter_dados_usuario(user_email)
+    if not dados_usuario:
+        return jsonify({'success': False, 'message': 'Usuário não encontrado'}), 404
+    
+    if not pode_acessar_orgao(dados_usuario, orgao_id):
+        return jsonify({'success': False, 'message': 'Acesso negado'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    
+    conn = obter_conexao()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT id FROM orgaos WHERE id = ?', (orgao_id,))
+    if not cursor.fetchone():
+        conn.close()
+        return jsonify({'success': False, 'message': 'Órgão não encontrado'}), 404
+    
+    try:
+        resultado = simular(conn, orgao_id, data.get('alteracoes', []))
+        conn.commit()  # máscaras remontadas na leitura do estado atual
+    except ParametroInvalido as e:
+        conn.close()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    conn.close()
+    
+    return jsonify({'success': True, **resultado})
+
+@app.route('/api/orgaos/<int:orgao_id>/subordinados', methods=['GET'])
+def listar_subordinados_orgao(orgao_id):
+    """Todos os subordinados do órgão, em qualquer nível (profundidade_maxima opcional)"""
+    try:
+        profundidade_maxima = ler_inteiro(request.args, 'profundidade_maxima')
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    conn = obter_conexao()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM orgaos WHERE id = ?', (orgao_id,))
+    if not cursor.fetchone():
+        conn.close()
+        return jsonify({'success': False, 'message': 'Órgão não encontrado'}), 404
+    
+    orgaos = subordinados(conn, orgao_id, profundidade_maxima)
+    conn.close()
+    return jsonify({'success': True, 'orgao_id': orgao_id, 'total': len(orgaos), 'subordinados': orgaos})
+
+@app.route('/api/orgaos/<int:orgao_id>/ancestrais', methods=['GET'])
+def listar_ancestrais_orgao(orgao_id):
+    """Caminho de órgãos superiores, da raiz até o órgão"""
+    conn = obter_conexao()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM orgaos WHERE id = ?', (orgao_id,))
+    if not cursor.fetchone():
+        conn.close()
+        return jsonify({'success': False, 'message': 'Órgão não encontrado'}), 404
+    
+    caminho = ancestrais(conn, orgao_id)
+    conn.close()
+    return jsonify({'success': True, 'orgao_id': orgao_id, 'ancestrais': caminho})
+
+@app.route('/api/orgaos/<int:orgao_id>/consolidado', methods=['GET'])
+def maturidade_consolidada_orgao(orgao_id):
+    """
+    Maturidade consolidada do órgão e de todos os seus subordinados:
+    distribuição de níveis, média de institucionalização e KPAs defasadas
+    (limite_kpas, padrão 5).
+    """
+    user_email = request.headers.get('X-User-Email', '')
+    dados_usuario = obter_dados_usuario(user_email)
+    if not dados_usuario:
+        return jsonify({'success': False, 'message': 'Usuário não encontrado'}), 404
+    
+    if not pode_acessar_orgao(dados_usuario, orgao_id):
+        return jsonify({'success': False, 'message': 'Acesso negado'}), 403
+    
+    try:
+        limite_kpas = ler_inteiro(request.args, 'limite_kpas')
+        if limite_kpas is not None and limite_kpas < 0:
+            raise ParametroInvalido('limite_kpas não pode ser negativo')
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    conn = obter_conexao()
+    resultado = cache_consolidado.obter(conn, orgao_id, 5 if limite_kpas is None else limite_kpas)
+    conn.commit()  # classificações e máscaras materializadas na leitura
+    conn.close()
+    
+    if resultado is None:
+        return jsonify({'success': False, 'message': 'Órgão não encontrado'}), 404
+
+    return jsonify({'success': True, **resultado})
+
+@app.route('/api/maturidade/historico', methods=['GET'])
+def historico_maturidade():
+    """
+    Série temporal da maturidade a partir do histórico gravado.
+
+    Filtros: orgao_id, subarvore (o órgão e seus subordinados), inicio e fim
+    (AAAA-MM-DD). agrupamento: dia, semana, mes (padrão) ou ano. Sem filtro
+    de órgão, todos os órgãos (exige permissão de gerar relatórios).
+    """
+    user_email = request.headers.get('X-User-Email', '')
+    dados_usuario = obter_dados_usuario(user_email)
+    if not dados_usuario:
+        return jsonify({'success': False, 'message': 'Usuário não encontrado'}), 404
+
+    try:
+        orgao_id = ler_inteiro(request.args, 'orgao_id')
+        subarvore = ler_inteiro(request.args, 'subarvore')
+        inicio = ler_data(request.args, 'inicio', fim_do_dia=False)
+        fim = ler_data(request.args, 'fim')
+        agrupamento = ler_agrupamento(request.args)
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    filtros = [id_ for id_ in (orgao_id, subarvore) if id_ is not None]
+    if filtros:
+        permitido = all(pode_acessar_orgao(dados_usuario, id_) for id_ in filtros)
+    else:
+        permitido = bool(dados_usuario.get('permissoes', {}).get('gerar_relatorios'))
+    if not permitido:
+        return jsonify({'success': False, 'message': 'Acesso negado'}), 403
+
+    conn = obter_conexao()
+    serie = serie_temporal(conn, orgao_id, subarvore, inicio, fim, agrupamento)
+    conn.close()
+
+    return jsonify({
+        'success': True,
+        'agrupamento': agrupamento,
+        'inicio': inicio,
+        'fim': fim,
+        'serie': serie
+    })
+
+@app.route('/api/admin/maturidade/historico/snapshot', methods=['POST'])
+def gravar_snapshot_maturidade():
+    """Grava agora o retrato diário dos órgãos que ainda não têm o de hoje"""
+    user_email = request.headers.get('X-User-Email', '')
+
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Sem permissão para gerar relatórios'}), 403
+
+    gravados = agendador_snapshots.executar_agora()
+    return jsonify({'success': True, 'retratos_gravados': gravados})
+
 #@app.route('/api/orgaos/<int:orgao_id>', methods=['PUT'])
 #def atualizar_orgao(orgao_id):
 #    """Atualiza um órgão"""
@@ -961,7 +1471,7 @@ def atualizar_orgao(orgao_id):
 #    if not nome:
 #        return jsonify({'success': False, 'message': 'Nome é obrigatório'}), 400
 #    
-#    conn = sqlite3.connect(DATABASE)
+#    conn = obter_conexao()
 #    cursor = conn.cursor()
 #    
 #    # Verificar se órgão existe
@@ -982,22 +1492,62 @@ def atualizar_orgao(orgao_id):
 
 @app.route('/api/avaliacoes')
 def listar_avaliacoes():
-    """Lista avaliações do usuário"""
+    """
+    Lista avaliações do usuário.
+    
+    Filtros opcionais: status, orgao_id, subarvore (o órgão e todos os seus
+    subordinados) e titulo (prefixo). Com limit e/ou cursor, retorna uma
+    página da mais recente para a mais antiga.
+    """
     user_email = request.headers.get('X-User-Email', '')
     
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('''
+    try:
+        limite, posicao = ler_paginacao(request.args, 2)
+        orgao_id = ler_inteiro(request.args, 'orgao_id')
+        subarvore = ler_inteiro(request.args, 'subarvore')
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    status = request.args.get('status', '').strip()
+    prefixo_titulo = request.args.get('titulo', '').strip()
+    
+    condicoes = ['a.usuario_email = ?']
+    parametros = [user_email]
+    if status:
+        condicoes.append('a.status = ?')
+        parametros.append(status)
+    if orgao_id is not None:
+        condicoes.append('a.orgao_id = ?')
+        parametros.append(orgao_id)
+    if subarvore is not None:
+        condicoes.append('a.orgao_id IN (SELECT descendant FROM orgaos_closure WHERE ancestor = ?)')
+        parametros.append(subarvore)
+    if prefixo_titulo:
+        condicoes.append('a.titulo COLLATE NOCASE >= ? AND a.titulo COLLATE NOCASE < ?')
+        parametros.extend(intervalo_prefixo(prefixo_titulo))
+    if posicao:
+        condicoes.append('(a.data_criacao, a.id) < (?, ?)')
+        parametros.extend(posicao)
+    
+    sql = f'''
         SELECT a.id, a.titulo, a.nivel_desejado, a.status, a.data_criacao,
                o.nome as orgao_nome
         FROM avaliacoes a
         LEFT JOIN orgaos o ON a.orgao_id = o.id
-        WHERE a.usuario_email = ?
-        ORDER BY a.data_criacao DESC
-    ''', (user_email,))
+        WHERE {' AND '.join(condicoes)}
+        ORDER BY a.data_criacao DESC, a.id DESC
+    '''
+    if limite is not None:
+        sql += ' LIMIT ?'
+        parametros.append(limite + 1)
+    
+    conn = obter_conexao()
+    cursor = conn.cursor()
+    cursor.execute(sql, parametros)
+    linhas, proximo_cursor = montar_pagina(cursor.fetchall(), limite, lambda row: (row[4], row[0]))
     
     avaliacoes = []
-    for row in cursor.fetchall():
+    for row in linhas:
         avaliacoes.append({
             'id': row[0],
             'titulo': row[1],
@@ -1008,7 +1558,7 @@ def listar_avaliacoes():
         })
     
     conn.close()
-    return jsonify(avaliacoes)
+    return resposta_listagem(avaliacoes, limite, proximo_cursor)
 
 @app.route('/api/avaliacoes', methods=['POST'])
 def criar_avaliacao():
@@ -1023,7 +1573,7 @@ def criar_avaliacao():
     if not all([titulo, orgao_id, nivel_desejado]):
         return jsonify({'success': False, 'message': 'Dados incompletos'}), 400
     
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     cursor.execute('''
         INSERT INTO avaliacoes (titulo, orgao_id, nivel_desejado, usuario_email)
@@ -1043,7 +1593,7 @@ def criar_avaliacao():
 @app.route('/api/avaliacoes/<int:avaliacao_id>')
 def obter_avaliacao(avaliacao_id):
     """Obtém uma avaliação específica"""
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     cursor.execute('''
         SELECT a.id, a.titulo, a.nivel_desejado, a.status, a.data_criacao,
@@ -1073,19 +1623,26 @@ def obter_avaliacao(avaliacao_id):
 @app.route('/api/avaliacoes/<int:avaliacao_id>/respostas', methods=['GET'])
 def obter_respostas(avaliacao_id):
     """Obtém respostas de uma avaliação"""
-    conn = sqlite3.connect(DATABASE)
+    # Inclui as respostas ainda na fila de escrita
+    descarregar_respostas_pendentes(avaliacao_id)
+    
+    conn = obter_conexao()
     cursor = conn.cursor()
     cursor.execute('''
         SELECT atividade_id, instituido, institucionalizado,
                justificativa_instituido, justificativa_institucionalizado,
-               evidencias_instituido, evidencias_institucionalizado,
-               arquivos_instituido, arquivos_institucionalizado
+               evidencias_instituido, evidencias_institucionalizado
         FROM respostas
         WHERE avaliacao_id = ?
     ''', (avaliacao_id,))
+    linhas = cursor.fetchall()
+    
+    # Anexos de todas as respostas em uma única consulta
+    anexos = anexos_da_avaliacao(conn, avaliacao_id)
     
     respostas = []
-    for row in cursor.fetchall():
+    for row in linhas:
+        anexos_atividade = anexos.get(row[0], {})
         respostas.append({
             'atividade_id': row[0],
             'instituido': bool(row[1]),
@@ -1094,94 +1651,329 @@ def obter_respostas(avaliacao_id):
             'justificativa_institucionalizado': row[4] or '',
             'evidencias_instituido': row[5] or '',
             'evidencias_institucionalizado': row[6] or '',
-            'arquivos_instituido': json.loads(row[7]) if row[7] else [],
-            'arquivos_institucionalizado': json.loads(row[8]) if row[8] else []
+            'arquivos_instituido': anexos_atividade.get('instituido', []),
+            'arquivos_institucionalizado': anexos_atividade.get('institucionalizado', [])
         })
     
     conn.close()
     return jsonify(respostas)
 
+@app.route('/api/avaliacoes/<int:avaliacao_id>/anexos', methods=['GET'])
+def listar_anexos_avaliacao(avaliacao_id):
+    """Lista os anexos de evidência da avaliação (filtro opcional por tipo)"""
+    tipo = request.args.get('tipo', '').strip()
+    if tipo and tipo not in TIPOS_ANEXO:
+        return jsonify({'success': False, 'message': f"tipo deve ser {' ou '.join(TIPOS_ANEXO)}"}), 400
+    
+    conn = obter_conexao()
+    cursor = conn.cursor()
+    
+    sql = '''
+        SELECT r.atividade_id, x.tipo, x.nome, x.filename, x.size, x.sha256, x.mime, x.created_at
+        FROM respostas r
+        JOIN anexos x ON x.resposta_id = r.id
+        WHERE r.avaliacao_id = ?
+    '''
+    parametros = [avaliacao_id]
+    if tipo:
+        sql += ' AND x.tipo = ?'
+        parametros.append(tipo)
+    sql += ' ORDER BY r.atividade_id, x.id'
+    cursor.execute(sql, parametros)
+    
+    anexos = []
+    atividades_com_evidencia = []
+    for row in cursor.fetchall():
+        anexo = anexo_para_dict(*row[2:])
+        anexo['atividade_id'] = row[0]
+        anexo['tipo'] = row[1]
+        anexos.append(anexo)
+        if not atividades_com_evidencia or atividades_com_evidencia[-1] != row[0]:
+            atividades_com_evidencia.append(row[0])
+    
+    conn.close()
+    return jsonify({
+        'success': True,
+        'anexos': anexos,
+        'atividades_com_evidencia': atividades_com_evidencia
+    })
+
+# Insere ou atualiza a resposta de uma atividade (depende do índice único
+# respostas(avaliacao_id, atividade_id) criado pelas migrações)
+SQL_UPSERT_RESPOSTA = '''
+    INSERT INTO respostas (
+        avaliacao_id, atividade_id, instituido, institucionalizado,
+        justificativa_instituido, justificativa_institucionalizado,
+        evidencias_instituido, evidencias_institucionalizado
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (avaliacao_id, atividade_id) DO UPDATE SET
+        instituido = excluded.instituido,
+        institucionalizado = excluded.institucionalizado,
+        justificativa_instituido = excluded.justificativa_instituido,
+        justificativa_institucionalizado = excluded.justificativa_institucionalizado,
+        evidencias_instituido = excluded.evidencias_instituido,
+        evidencias_institucionalizado = excluded.evidencias_institucionalizado,
+        data_atualizacao = CURRENT_TIMESTAMP
+'''
+
+CAMPOS_MARCACAO_RESPOSTA = ('instituido', 'institucionalizado')
+CAMPOS_TEXTO_RESPOSTA = ('justificativa_instituido', 'justificativa_institucionalizado',
+                         'evidencias_instituido', 'evidencias_institucionalizado')
+
+def normalizar_resposta(data):
+    """
+    Valida o JSON de uma resposta e retorna só os campos conhecidos, nos
+    tipos gravados (ParametroInvalido se algum for inválido). Campos
+    ausentes continuam ausentes: na fila de escrita eles não sobrescrevem
+    uma gravação anterior da mesma atividade.
+    """
+    if not isinstance(data, dict):
+        raise ParametroInvalido('A resposta deve ser um objeto JSON')
+    
+    atividade_id = data.get('atividade_id')
+    if not isinstance(atividade_id, str) or not atividade_id.strip():
+        raise ParametroInvalido('atividade_id é obrigatório')
+    resposta = {'atividade_id': atividade_id}
+    
+    for campo in CAMPOS_MARCACAO_RESPOSTA:
+        if campo in data:
+            valor = data[campo]
+            if valor is None:
+                valor = False
+            if not isinstance(valor, (bool, int)) or valor not in (0, 1):
+                raise ParametroInvalido(f'{campo} deve ser true ou false')
+            resposta[campo] = bool(valor)
+    
+    for campo in CAMPOS_TEXTO_RESPOSTA:
+        if campo in data:
+            valor = data[campo]
+            if valor is not None and not isinstance(valor, str):
+                raise ParametroInvalido(f'{campo} deve ser texto')
+            resposta[campo] = valor or ''
+    
+    for campo in CAMPO_POR_TIPO.values():
+        if data.get(campo) is None:
+            continue
+        itens = data[campo]
+        if not isinstance(itens, list) or not all(
+                isinstance(item, str) or (isinstance(item, dict) and all(
+                    item.get(chave) is None or isinstance(item.get(chave), str)
+                    for chave in ('nome', 'filename', 'url')))
+                for item in itens):
+            raise ParametroInvalido(f'{campo} deve ser uma lista de arquivos')
+        resposta[campo] = itens
+    
+    return resposta
+
+def parametros_resposta(avaliacao_id, data):
+    """
+    Converte o JSON de uma resposta nos parâmetros de SQL_UPSERT_RESPOSTA
+    (os arquivos são gravados à parte, em anexos)
+    """
+    return (
+        avaliacao_id,
+        data.get('atividade_id'),
+        data.get('instituido', False),
+        data.get('institucionalizado', False),
+        data.get('justificativa_instituido', ''),
+        data.get('justificativa_institucionalizado', ''),
+        data.get('evidencias_instituido', ''),
+        data.get('evidencias_institucionalizado', '')
+    )
+
+def gravar_respostas(conn, avaliacao_id, respostas):
+    """Grava respostas de uma avaliação, com anexos e maturidade do órgão (sem commit)"""
+    conn.executemany(SQL_UPSERT_RESPOSTA, [parametros_resposta(avaliacao_id, r) for r in respostas])
+    sincronizar_anexos(conn, avaliacao_id, respostas, UPLOAD_FOLDER)
+    
+    # Resposta de avaliação finalizada altera a classificação do órgão
+    # (só o nível da avaliação, se alguma atividade alterada for dele)
+    atualizar_maturidade_avaliacao(conn, avaliacao_id,
+                                   atividade_ids=[r.get('atividade_id') for r in respostas])
+
+def gravar_respostas_pendentes(conn, respostas_por_avaliacao):
+    """Grava um lote da fila de escrita"""
+    for avaliacao_id, respostas in respostas_por_avaliacao.items():
+        gravar_respostas(conn, avaliacao_id, respostas)
+
+fila_escrita = FilaEscrita(pool_conexoes, gravar_respostas_pendentes,
+                           arquivo_trava=f'{pool_conexoes.caminho}.fila-escrita.lock')
+
+def descarregar_respostas_pendentes(avaliacao_id=None):
+    """Espera a fila gravar as respostas da avaliação (True se não há pendências)"""
+    if not app.config['ESCRITA_ADIADA']:
+        return True
+    try:
+        return fila_escrita.descarregar(avaliacao_id)
+    except FilaEscritaIndisponivel as e:
+        logger.error(str(e))
+        return False
+
+# Não perder respostas pendentes ao encerrar o processo
+atexit.register(descarregar_respostas_pendentes)
+
+# Maturidade consolidada por órgão (subárvore), invalidada pelas versões da classificação
+cache_consolidado = CacheConsolidado()
+
+# Respostas dos relatórios administrativos, invalidadas pela geração dos dados
+cache_relatorios = CacheRespostas()
+
+# Retrato diário do histórico de maturidade (iniciado junto com o servidor)
+agendador_snapshots = AgendadorSnapshots(pool_conexoes)
+
+# Jobs de exportação renderizados em um pool de processos
+fila_exportacoes = FilaExportacoes(pool_conexoes, EXPORT_FOLDER, app.config['PROCESSOS_EXPORTACAO'])
+atexit.register(fila_exportacoes.encerrar)
+
+# ZIPs com os PDFs individuais de todos os órgãos (mesmo pool de processos)
+lotes_exportacao = LotesExportacao(pool_conexoes, fila_exportacoes)
+
+# Arquivos de relatórios exportados, endereçados pela versão dos dados
+cache_arquivos = CacheArquivosRelatorio(CACHE_RELATORIOS_FOLDER, app.config['CACHE_RELATORIOS_MB'] * 1024 * 1024)
+
 @app.route('/api/avaliacoes/<int:avaliacao_id>/respostas', methods=['POST'])
 def salvar_resposta(avaliacao_id):
-    """Salva uma resposta"""
-    data = request.get_json()
+    """Salva uma resposta (na fila de escrita, se a escrita adiada estiver ativa)"""
+    try:
+        data = normalizar_resposta(request.get_json(silent=True))
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    atividade_id = data.get('atividade_id')
-    instituido = data.get('instituido', False)
-    institucionalizado = data.get('institucionalizado', False)
-    justificativa_instituido = data.get('justificativa_instituido', '')
-    justificativa_institucionalizado = data.get('justificativa_institucionalizado', '')
-    evidencias_instituido = data.get('evidencias_instituido', '')
-    evidencias_institucionalizado = data.get('evidencias_institucionalizado', '')
-    arquivos_instituido = json.dumps(data.get('arquivos_instituido', []))
-    arquivos_institucionalizado = json.dumps(data.get('arquivos_institucionalizado', []))
-    
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+    if app.config['ESCRITA_ADIADA']:
+        try:
+            enfileirada = fila_escrita.enfileirar(avaliacao_id, data)
+        except FilaEscritaIndisponivel as e:
+            logger.error(str(e))
+            return jsonify({'success': False, 'message': 'Fila de escrita indisponível'}), 503
+        if enfileirada:
+            return jsonify({'success': True, 'message': 'Resposta recebida', 'pendente': True}), 202
+        
+        # Fila cheia: grava direto, depois do que já estava na fila
+        logger.warning("Fila de escrita cheia, gravando resposta diretamente")
+        descarregar_respostas_pendentes(avaliacao_id)
     
-    # Verificar se já existe resposta para esta atividade
-    cursor.execute('''
-        SELECT id FROM respostas 
-        WHERE avaliacao_id = ? AND atividade_id = ?
-    ''', (avaliacao_id, atividade_id))
+    conn = obter_conexao()
     
-    if cursor.fetchone():
-        # Atualizar resposta existente
-        cursor.execute('''
-            UPDATE respostas 
-            SET instituido = ?, institucionalizado = ?,
-                justificativa_instituido = ?, justificativa_institucionalizado = ?,
-                evidencias_instituido = ?, evidencias_institucionalizado = ?,
-                arquivos_instituido = ?, arquivos_institucionalizado = ?,
-                data_atualizacao = CURRENT_TIMESTAMP
-            WHERE avaliacao_id = ? AND atividade_id = ?
-        ''', (instituido, institucionalizado, 
-              justificativa_instituido, justificativa_institucionalizado,
-              evidencias_instituido, evidencias_institucionalizado,
-              arquivos_instituido, arquivos_institucionalizado,
-              avaliacao_id, atividade_id))
-    else:
-        # Criar nova resposta
-        cursor.execute('''
-            INSERT INTO respostas (
-                avaliacao_id, atividade_id, instituido, institucionalizado,
-                justificativa_instituido, justificativa_institucionalizado,
-                evidencias_instituido, evidencias_institucionalizado,
-                arquivos_instituido, arquivos_institucionalizado
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (avaliacao_id, atividade_id, instituido, institucionalizado,
-              justificativa_instituido, justificativa_institucionalizado,
-              evidencias_instituido, evidencias_institucionalizado,
-              arquivos_instituido, arquivos_institucionalizado))
+    gravar_respostas(conn, avaliacao_id, [data])
     
     conn.commit()
     conn.close()
     
     return jsonify({'success': True, 'message': 'Resposta salva com sucesso'})
 
-@app.route('/api/avaliacoes/<int:avaliacao_id>/finalizar', methods=['POST'])
-def finalizar_avaliacao(avaliacao_id):
-    """Finaliza uma avaliação"""
-    conn = sqlite3.connect(DATABASE)
+@app.route('/api/avaliacoes/<int:avaliacao_id>/respostas/lote', methods=['POST'])
+def salvar_respostas_lote(avaliacao_id):
+    """Salva várias respostas em uma única transação"""
+    data = request.get_json() or {}
+    itens = data.get('respostas')
+    
+    if not isinstance(itens, list) or not itens:
+        return jsonify({'success': False, 'message': 'Informe a lista de respostas'}), 400
+    
+    # Validar itens antes de abrir a transação
+    resultados = []
+    validos = []
+    for indice, item in enumerate(itens):
+        try:
+            resposta = normalizar_resposta(item)
+        except ParametroInvalido as e:
+            atividade_id = item.get('atividade_id') if isinstance(item, dict) else None
+            resultados.append({
+                'indice': indice,
+                'atividade_id': atividade_id if isinstance(atividade_id, str) else None,
+                'success': False,
+                'message': str(e)
+            })
+            continue
+        
+        validos.append(resposta)
+        resultados.append({'indice': indice, 'atividade_id': resposta['atividade_id'], 'success': True})
+    
+    if not validos:
+        return jsonify({
+            'success': False,
+            'message': 'Nenhuma resposta válida no lote',
+            'resultados': resultados
+        }), 400
+    
+    # O lote é gravado depois das respostas que já estavam na fila
+    descarregar_respostas_pendentes(avaliacao_id)
+    
+    conn = obter_conexao()
     cursor = conn.cursor()
     
-    # Atualizar status da avaliação
-    cursor.execute('''
-        UPDATE avaliacoes 
-        SET status = 'finalizada', data_atualizacao = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (avaliacao_id,))
+    cursor.execute('SELECT id FROM avaliacoes WHERE id = ?', (avaliacao_id,))
+    if not cursor.fetchone():
+        conn.close()
+        return jsonify({'success': False, 'message': 'Avaliação não encontrada'}), 404
     
-    conn.commit()
-    conn.close()
+    # Atividades já respondidas, para informar se cada item foi inserido ou atualizado
+    cursor.execute('SELECT atividade_id FROM respostas WHERE avaliacao_id = ?', (avaliacao_id,))
+    existentes = {row[0] for row in cursor.fetchall()}
     
-    return jsonify({'success': True, 'message': 'Avaliação finalizada com sucesso'})
-
-@app.route('/api/upload', methods=['POST'])
-def upload_arquivo():
-    """Upload de arquivo"""
     try:
-        if 'arquivo' not in request.files:
+        gravar_respostas(conn, avaliacao_id, validos)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        logger.error(f"Erro ao salvar respostas em lote: {str(e)}")
+        return jsonify({'success': False, 'message': 'Erro interno do servidor'}), 500
+    
+    conn.close()
+    
+    for resultado in resultados:
+        if resultado['success']:
+            atividade_id = resultado['atividade_id']
+            resultado['acao'] = 'atualizada' if atividade_id in existentes else 'inserida'
+            existentes.add(atividade_id)
+    
+    salvas = len(validos)
+    return jsonify({
+        'success': True,
+        'message': f'{salvas} respostas salvas com sucesso',
+        'total': len(itens),
+        'salvas': salvas,
+        'erros': len(itens) - salvas,
+        'resultados': resultados
+    })
+
+@app.route('/api/avaliacoes/<int:avaliacao_id>/finalizar', methods=['POST'])
+def finalizar_avaliacao(avaliacao_id):
+    """Finaliza uma avaliação"""
+    # Barreira: a finalização precisa ver todas as respostas da fila
+    if not descarregar_respostas_pendentes(avaliacao_id):
+        return jsonify({
+            'success': False,
+            'message': 'Há respostas ainda não gravadas; tente finalizar novamente'
+        }), 503
+    
+    conn = obter_conexao()
+    cursor = conn.cursor()
+    
+    # Atualizar status da avaliação
+    cursor.execute('''
+        UPDATE avaliacoes 
+        SET status = 'finalizada', data_atualizacao = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (avaliacao_id,))
+    
+    # Recalcular a classificação do órgão na mesma transação
+    atualizar_maturidade_avaliacao(conn, avaliacao_id)
+    
+    # Retrato da maturidade no histórico
+    registrar_finalizacao(conn, avaliacao_id)
+    
+    conn.commit()
+    conn.close()
+    
+    return jsonify({'success': True, 'message': 'Avaliação finalizada com sucesso'})
+
+@app.route('/api/upload', methods=['POST'])
+def upload_arquivo():
+    """Upload de arquivo"""
+    try:
+        if 'arquivo' not in request.files:
             return jsonify({'success': False, 'message': 'Nenhum arquivo enviado'}), 400
         
         arquivo = request.files['arquivo']
@@ -1197,7 +1989,8 @@ def upload_arquivo():
         
         # Salvar arquivo com nome único
         import uuid
-        filename = f"{uuid.uuid4()}_{arquivo.filename}"
+        # O nome vem do cliente: sem diretórios nem caracteres especiais
+        filename = f"{uuid.uuid4()}_{secure_filename(arquivo.filename) or 'arquivo'}"
         filepath = os.path.join(upload_dir, filename)
         arquivo.save(filepath)
         
@@ -1219,6 +2012,34 @@ def uploaded_file(filename):
     
 
     
+# Meses da evolução temporal no relatório administrativo
+MESES_EVOLUCAO_ADMIN = 12
+
+def responder_em_cache(nome, calcular):
+    """
+    Responde com o JSON de calcular(), reaproveitado enquanto a geração dos
+    dados não mudar (ver cache_respostas.py). A chave inclui a query string e
+    a assinatura do modelo; só respostas 200 são guardadas. Envia ETag e
+    responde 304 quando o If-None-Match do cliente bate com ele.
+    """
+    conn = obter_conexao()
+    geracao = geracao_dados(conn)
+    conn.close()
+    
+    chave = (nome, modelo_atual().assinatura, tuple(sorted(request.args.items(multi=True))))
+    guardada = cache_relatorios.obter(chave, geracao)
+    if guardada is None:
+        resposta = app.make_response(calcular())
+        if resposta.status_code != 200:
+            return resposta
+        guardada = cache_relatorios.guardar(chave, geracao, resposta.get_data())
+    
+    resposta = app.response_class(guardada.corpo, mimetype='application/json')
+    resposta.set_etag(guardada.etag)
+    # O navegador guarda, mas revalida a cada carga (ETag)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta.make_conditional(request)
+
 @app.route('/api/admin/relatorios', methods=['GET'])
 def obter_relatorios_admin():
     """Obtém relatórios administrativos com debug detalhado"""
@@ -1252,9 +2073,13 @@ def obter_relatorios_admin():
         traceback.print_exc()
         return jsonify({'success': False, 'message': 'Erro ao verificar usuário'}), 500
     
+    return responder_em_cache('relatorios-admin', calcular_relatorios_admin)
+
+def calcular_relatorios_admin():
+    """Ranking de maturidade, avaliações e estatísticas de todos os órgãos"""
     try:
         print("   🔍 Conectando ao banco...")
-        conn = sqlite3.connect(DATABASE)
+        conn = obter_conexao()
         cursor = conn.cursor()
         print("   ✅ Conexão estabelecida")
         
@@ -1265,95 +2090,69 @@ def obter_relatorios_admin():
         print(f"   ✅ {len(orgaos)} órgãos encontrados")
         
         # ===== RANKING DE MATURIDADE POR ÓRGÃO (CORRIGIDO) =====
+        # Classificação materializada de todos os órgãos (orgao_maturidade)
+        print("   🔍 Classificando maturidade dos órgãos...")
+        classificacoes = obter_maturidades(conn)
+        
+        # Contar avaliações por status (para estatísticas)
+        cursor.execute('''
+            SELECT orgao_id, status, COUNT(*) 
+            FROM avaliacoes 
+            GROUP BY orgao_id, status
+        ''')
+        avaliacoes_stats_por_orgao = {}
+        for orgao_id, status_avaliacao, quantidade in cursor.fetchall():
+            avaliacoes_stats_por_orgao.setdefault(orgao_id, {})[status_avaliacao] = quantidade
+        
+        # Data da última avaliação de cada órgão (atualização, ou criação se não houver)
+        cursor.execute('''
+            SELECT orgao_id, MAX(COALESCE(data_atualizacao, data_criacao))
+            FROM avaliacoes 
+            GROUP BY orgao_id
+        ''')
+        ultima_avaliacao_por_orgao = dict(cursor.fetchall())
+        
         ranking_maturidade = []
         
-        for i, orgao in enumerate(orgaos):
-            print(f"   🔍 Processando órgão {i+1}/{len(orgaos)}: {orgao[1]}")
+        for orgao_id, orgao_nome, orgao_sigla in orgaos:
+            classificacao_maturidade = classificacoes[orgao_id]
             
-            try:
-                orgao_id = orgao[0]
-                orgao_nome = orgao[1]
-                orgao_sigla = orgao[2]
-                
-                print(f"      Calculando maturidade para órgão {orgao_id}...")
-                
-                # ✅ USAR A MESMA LÓGICA DO RELATÓRIO INDIVIDUAL
-                classificacao_maturidade = calcular_nivel_maturidade_orgao(orgao_id)
-                print(f"      ✅ Maturidade calculada: Nível {classificacao_maturidade.get('nivel_maturidade', 1)}")
-                
-                # Contar avaliações por status (para estatísticas)
-                print(f"      Contando avaliações...")
-                cursor.execute('''
-                    SELECT status, COUNT(*) 
-                    FROM avaliacoes 
-                    WHERE orgao_id = ? 
-                    GROUP BY status
-                ''', (orgao_id,))
-                
-                avaliacoes_stats = dict(cursor.fetchall())
-                total_avaliacoes = sum(avaliacoes_stats.values())
-                avaliacoes_finalizadas = avaliacoes_stats.get('finalizada', 0)
-                avaliacoes_andamento = avaliacoes_stats.get('em_andamento', 0)
-                
-                print(f"      Avaliações: {total_avaliacoes} total, {avaliacoes_finalizadas} finalizadas, {avaliacoes_andamento} em andamento")
-                
-                # Buscar última avaliação do órgão
-                print(f"      Buscando última avaliação...")
-                cursor.execute('''
-                    SELECT data_criacao, data_atualizacao
-                    FROM avaliacoes 
-                    WHERE orgao_id = ? 
-                    ORDER BY COALESCE(data_atualizacao, data_criacao) DESC 
-                    LIMIT 1
-                ''', (orgao_id,))
-
-                ultima_avaliacao_data = cursor.fetchone()
-                ultima_avaliacao = None
-                if ultima_avaliacao_data:
-                    # Usar data de atualização se existir, senão data de criação
-                    data_ref = ultima_avaliacao_data[1] or ultima_avaliacao_data[0]
-                    if data_ref:
-                        ultima_avaliacao = data_ref[:10]  # Apenas a data (YYYY-MM-DD)
-                
-                print(f"      Última avaliação: {ultima_avaliacao}")
-
-                # Calcular maturidade média baseada no nível certificado
-                nivel = classificacao_maturidade.get('nivel_maturidade', 1)
-                maturidade_media = nivel * 20  # Nível 1=20%, 2=40%, 3=60%, 4=80%, 5=100%
-
-                # Status baseado em atividade recente
-                status = 'ativo' if total_avaliacoes > 0 else 'inativo'
-                
-                print(f"      Nível: {nivel}, Maturidade: {maturidade_media}%, Status: {status}")
-
-                # Dados para o ranking
-                ranking_item = {
-                    'orgao_id': orgao_id,
-                    'orgao_nome': orgao_nome,
-                    'orgao_sigla': orgao_sigla,
-                    'nivel_maturidade': nivel,
-                    'maturidade_media': maturidade_media,
-                    'ultima_avaliacao': ultima_avaliacao,
-                    'status': status,
-                    'status_certificacao': classificacao_maturidade.get('status', 'inicial'),
-                    'descricao_maturidade': classificacao_maturidade.get('descricao', 'Nível Inicial'),
-                    'data_certificacao': classificacao_maturidade.get('data_certificacao'),
-                    'total_avaliacoes': total_avaliacoes,
-                    'avaliacoes_finalizadas': avaliacoes_finalizadas,
-                    'avaliacoes_andamento': avaliacoes_andamento,
-                    'criterios_atendidos': classificacao_maturidade.get('criterios_atendidos', False),
-                    'finalizadas': avaliacoes_finalizadas,
-                    'em_andamento': avaliacoes_andamento
-                }
-                
-                ranking_maturidade.append(ranking_item)
-                print(f"      ✅ Órgão {orgao_nome} processado com sucesso")
-                
-            except Exception as e:
-                print(f"      ❌ Erro ao processar órgão {orgao[1]}: {e}")
-                import traceback
-                traceback.print_exc()
-                continue
+            avaliacoes_stats = avaliacoes_stats_por_orgao.get(orgao_id, {})
+            total_avaliacoes = sum(avaliacoes_stats.values())
+            avaliacoes_finalizadas = avaliacoes_stats.get('finalizada', 0)
+            avaliacoes_andamento = avaliacoes_stats.get('em_andamento', 0)
+            
+            data_ref = ultima_avaliacao_por_orgao.get(orgao_id)
+            ultima_avaliacao = data_ref[:10] if data_ref else None  # Apenas a data (YYYY-MM-DD)
+
+            # Calcular maturidade média baseada no nível certificado
+            nivel = classificacao_maturidade.get('nivel_maturidade', 1)
+            maturidade_media = nivel * 20  # Nível 1=20%, 2=40%, 3=60%, 4=80%, 5=100%
+
+            # Status baseado em atividade recente
+            status = 'ativo' if total_avaliacoes > 0 else 'inativo'
+
+            # Dados para o ranking
+            ranking_item = {
+                'orgao_id': orgao_id,
+                'orgao_nome': orgao_nome,
+                'orgao_sigla': orgao_sigla,
+                'nivel_maturidade': nivel,
+                'maturidade_media': maturidade_media,
+                'ultima_avaliacao': ultima_avaliacao,
+                'status': status,
+                'status_certificacao': classificacao_maturidade.get('status', 'inicial'),
+                'descricao_maturidade': classificacao_maturidade.get('descricao', 'Nível Inicial'),
+                'data_certificacao': classificacao_maturidade.get('data_certificacao'),
+                'total_avaliacoes': total_avaliacoes,
+                'avaliacoes_finalizadas': avaliacoes_finalizadas,
+                'avaliacoes_andamento': avaliacoes_andamento,
+                'criterios_atendidos': classificacao_maturidade.get('criterios_atendidos', False),
+                'finalizadas': avaliacoes_finalizadas,
+                'em_andamento': avaliacoes_andamento
+            }
+            
+            ranking_maturidade.append(ranking_item)
         
         print(f"   ✅ Ranking processado: {len(ranking_maturidade)} órgãos")
         
@@ -1410,6 +2209,9 @@ def obter_relatorios_admin():
         print(f"   Estatísticas: {total_orgaos} órgãos, {orgaos_certificados} certificados, {total_avaliacoes_sistema} avaliações")
         print(f"   Órgãos por nível: {orgaos_por_nivel}")
         
+        # Evolução mensal a partir do histórico de maturidade
+        evolucao_temporal = serie_temporal(conn, inicio=inicio_periodo_recente(MESES_EVOLUCAO_ADMIN))
+        
         conn.close()
         print("   ✅ Conexão fechada")
         
@@ -1429,7 +2231,7 @@ def obter_relatorios_admin():
             
             # ✅ COMPATIBILIDADE COM FRONTEND EXISTENTE
             'avaliacoes_por_orgao': ranking_maturidade,
-            'evolucao_temporal': [],
+            'evolucao_temporal': evolucao_temporal,
             
             # ✅ ESTATÍSTICAS NO FORMATO ESPERADO PELO FRONTEND
             'estatisticas_gerais': {
@@ -1449,7 +2251,7 @@ def obter_relatorios_admin():
     
             # ✅ CORRIGIDO: Enviar dados específicos para 'avaliacoes_por_orgao'
             'avaliacoes_por_orgao': avaliacoes_por_orgao_data,
-            'evolucao_temporal': [],  # Manter vazio por enquanto
+            'evolucao_temporal': evolucao_temporal,
     
             'estatisticas_gerais': {  
                 'total_avaliacoes': total_avaliacoes_sistema,
@@ -1491,6 +2293,162 @@ def calcular_media_maturidade_sistema(ranking_maturidade):
     media_sistema = int(total_pontos / total_orgaos) if total_orgaos > 0 else 0
     return min(100, media_sistema)  # Garantir que não passe de 100%
 
+# ===== ANÁLISES ADMINISTRATIVAS (analytics.py) =====
+
+def responder_analise(calcular):
+    """
+    Verifica a permissão gerar_relatorios, monta a base analítica e responde
+    com calcular(base), em cache até a próxima escrita (responder_em_cache).
+    Erros de parâmetro viram 400.
+    """
+    user_email = request.headers.get('X-User-Email', '')
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Acesso negado'}), 403
+
+    def analisar():
+        try:
+            conn = obter_conexao()
+            base = BaseAnalitica.carregar(conn)
+            conn.commit()  # máscaras remontadas na carga
+            conn.close()
+            return jsonify({'success': True, **calcular(base)})
+        except ParametroInvalido as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except Exception as e:
+            logger.error(f"Erro na análise administrativa: {str(e)}")
+            return jsonify({'success': False, 'message': 'Erro interno do servidor'}), 500
+
+    return responder_em_cache(request.path, analisar)
+
+@app.route('/api/admin/analytics/ranking', methods=['GET'])
+def analise_ranking():
+    """Ranking dos órgãos por nível certificado e % de institucionalização"""
+    try:
+        limite = ler_inteiro(request.args, 'limit')
+        if limite is not None and limite < 1:
+            raise ParametroInvalido('limit deve ser maior que zero')
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return responder_analise(lambda base: {'ranking': base.ranking(limite)})
+
+@app.route('/api/admin/analytics/percentis-kpa', methods=['GET'])
+def analise_percentis_kpa():
+    """Percentis (p=25,50,75,90) do % por KPA entre os órgãos avaliados"""
+    try:
+        percentis = ler_percentis(request.args)
+        camada = ler_camada(request.args)
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return responder_analise(lambda base: {'kpas': base.percentis_kpa(percentis, camada)})
+
+@app.route('/api/admin/analytics/mapa-calor', methods=['GET'])
+def analise_mapa_calor():
+    """Matriz órgão x KPA com o % da camada (instituido ou institucionalizado)"""
+    try:
+        camada = ler_camada(request.args)
+        todos = ler_booleano(request.args, 'todos')
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return responder_analise(lambda base: base.mapa_calor(camada, somente_avaliados=not todos))
+
+@app.route('/api/admin/analytics/niveis', methods=['GET'])
+def analise_niveis():
+    """Distribuição dos órgãos por nível certificado e por nível avaliado"""
+    return responder_analise(lambda base: base.distribuicao_niveis())
+
+@app.route('/api/admin/analytics/lacunas', methods=['GET'])
+def analise_lacunas():
+    """Atividades não institucionalizadas por nível, KPA e atividade"""
+    return responder_analise(lambda base: base.lacunas())
+
+# ===== MATURIDADE EM LOTE =====
+
+MAX_ORGAOS_LOTE = 1000
+
+def ler_orgaos_lote(valor):
+    """orgao_ids do corpo: lista de ids ou "all" (None = todos os órgãos)"""
+    if isinstance(valor, str) and valor.strip().lower() in ('all', 'todos'):
+        return None
+    if not isinstance(valor, list) or not valor:
+        raise ParametroInvalido('orgao_ids deve ser uma lista de ids ou "all"')
+    if len(valor) > MAX_ORGAOS_LOTE:
+        raise ParametroInvalido(f'Máximo de {MAX_ORGAOS_LOTE} órgãos por chamada; use "all"')
+    try:
+        # Sem repetição, na ordem recebida
+        return list(dict.fromkeys(int(orgao_id) for orgao_id in valor))
+    except (TypeError, ValueError):
+        raise ParametroInvalido('orgao_ids deve conter apenas números inteiros')
+
+@app.route('/api/maturidade/lote', methods=['POST'])
+def classificar_maturidade_lote():
+    """
+    Classificação de maturidade de vários órgãos em uma chamada.
+
+    Corpo: {"orgao_ids": [1, 2, ...] ou "all", "data_referencia": "AAAA-MM-DD"}.
+    Sem data_referencia, lê a classificação materializada (orgao_maturidade);
+    com ela, reclassifica em uma única consulta considerando só as avaliações
+    finalizadas até a data.
+    """
+    user_email = request.headers.get('X-User-Email', '')
+    if not verificar_permissao(user_email, 'gerar_relatorios'):
+        return jsonify({'success': False, 'message': 'Acesso negado'}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        orgao_ids = ler_orgaos_lote(data.get('orgao_ids'))
+        ate = ler_data(data, 'data_referencia')
+    except ParametroInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    try:
+        conn = obter_conexao()
+        cursor = conn.cursor()
+
+        if orgao_ids is None:
+            cursor.execute('SELECT id, nome, sigla FROM orgaos ORDER BY id')
+        else:
+            cursor.execute(f'''
+                SELECT id, nome, sigla FROM orgaos
+                WHERE id IN ({', '.join(['?'] * len(orgao_ids))})
+            ''', orgao_ids)
+        orgaos = {row[0]: row for row in cursor.fetchall()}
+        encontrados = list(orgaos) if orgao_ids is None else [i for i in orgao_ids if i in orgaos]
+        consulta_ids = None if orgao_ids is None else encontrados
+
+        if ate is None:
+            classificacoes = obter_maturidades(conn, consulta_ids)
+        else:
+            classificacoes = classificar_orgaos(conn, consulta_ids, ate=ate)
+            conn.commit()  # máscaras remontadas na consulta
+
+        conn.close()
+
+        resultado = []
+        for orgao_id in encontrados:
+            classificacao = classificacoes[orgao_id]
+            resultado.append({
+                'orgao_id': orgao_id,
+                'orgao_nome': orgaos[orgao_id][1],
+                'orgao_sigla': orgaos[orgao_id][2],
+                'nivel_maturidade': classificacao['nivel_maturidade'],
+                'status': classificacao['status'],
+                # A data de certificação só é conhecida para a classificação atual
+                'data_certificacao': classificacao['data_certificacao'] if ate is None else None,
+                'completude_niveis': classificacao['completude_niveis']
+            })
+
+        return jsonify({
+            'success': True,
+            'data_referencia': ate,
+            'total': len(resultado),
+            'orgaos': resultado,
+            'nao_encontrados': [] if orgao_ids is None else [i for i in orgao_ids if i not in orgaos]
+        })
+
+    except Exception as e:
+        logger.error(f"Erro na classificação em lote: {str(e)}")
+        return jsonify({'success': False, 'message': 'Erro interno do servidor'}), 500
+
 @app.route('/api/relatorio-individual', methods=['GET'])
 def relatorio_individual():
     """Relatório individual do órgão do usuário - VERSÃO CORRIGIDA"""
@@ -1505,7 +2463,7 @@ def relatorio_individual():
     if not orgao_id:
         return jsonify({'success': False, 'message': 'Usuário não vinculado a um órgão'}), 400
     
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     try:
@@ -1522,269 +2480,14 @@ def relatorio_individual():
             'sigla': orgao_data[2]
         }
         
-        # Todas as avaliações do órgão
-        cursor.execute('''
-            SELECT id, titulo, status, data_criacao, nivel_desejado
-            FROM avaliacoes 
-            WHERE orgao_id = ? 
-            ORDER BY data_criacao DESC
-        ''', (orgao_id,))
-        
-        avaliacoes = []
-        for row in cursor.fetchall():
-            avaliacoes.append({
-                'id': row[0],
-                'titulo': row[1],
-                'status': row[2],
-                'data_criacao': row[3],
-                'nivel_desejado': row[4]
-            })
+        # Avaliações e respostas do órgão carregadas uma única vez;
+        # todas as seções são calculadas em memória a partir delas
+        contexto = ContextoRelatorioOrgao.carregar(conn, orgao_id)
         
-        # 🆕 EVOLUÇÃO TEMPORAL CORRIGIDA
-        # Buscar a avaliação mais recente finalizada de cada nível
-        evolucao_temporal = []
-        for nivel in [2, 3, 4, 5]:  # Níveis implementáveis
-            cursor.execute('''
-                SELECT a.id, a.data_criacao, a.titulo, a.nivel_desejado
-                FROM avaliacoes a
-                WHERE a.orgao_id = ? AND a.status = 'finalizada' AND a.nivel_desejado = ?
-                ORDER BY a.data_criacao DESC
-                LIMIT 1
-            ''', (orgao_id, nivel))
-            
-            resultado = cursor.fetchone()
-            if resultado:
-                avaliacao_id = resultado[0]
-                
-                # Calcular maturidade desta avaliação específica
-                cursor.execute('''
-                    SELECT 
-                        COUNT(*) as total,
-                        COUNT(CASE WHEN instituido = 1 THEN 1 END) as instituidas,
-                        COUNT(CASE WHEN institucionalizado = 1 THEN 1 END) as institucionalizadas
-                    FROM respostas
-                    WHERE avaliacao_id = ?
-                ''', (avaliacao_id,))
-                
-                resultado_respostas = cursor.fetchone()
-                if resultado_respostas and resultado_respostas[0] > 0:
-                    total = resultado_respostas[0]
-                    instituidas = resultado_respostas[1]
-                    institucionalizadas = resultado_respostas[2]
-                    
-                    # Maturidade baseada em institucionalização
-                    maturidade_geral = int((institucionalizadas / total) * 100)
-                    
-                    evolucao_temporal.append({
-                        'data_avaliacao': resultado[1],
-                        'titulo_avaliacao': resultado[2],
-                        'nivel': resultado[3],
-                        'maturidade_geral': maturidade_geral,
-                        'total_atividades': total,
-                        'instituidas': instituidas,
-                        'institucionalizadas': institucionalizadas
-                    })
-        
-        # Ordenar por nível para mostrar evolução
-        evolucao_temporal.sort(key=lambda x: x['nivel'])
-        
-        # 🆕 MATURIDADE POR KPA CORRIGIDA
-        # Considerar apenas avaliações mais recentes finalizadas por nível
-        maturidade_por_kpa = []
-        
-        # Para cada nível, pegar a avaliação mais recente finalizada
-        avaliacoes_consideradas = []
-        for nivel in [2, 3, 4, 5]:
-            cursor.execute('''
-                SELECT a.id
-                FROM avaliacoes a
-                WHERE a.orgao_id = ? AND a.status = 'finalizada' AND a.nivel_desejado = ?
-                ORDER BY a.data_criacao DESC
-                LIMIT 1
-            ''', (orgao_id, nivel))
-            
-            resultado = cursor.fetchone()
-            if resultado:
-                avaliacoes_consideradas.append(resultado[0])
-        
-        # Agrupar respostas por KPA das avaliações consideradas
-        if avaliacoes_consideradas:
-            placeholders = ','.join(['?' for _ in avaliacoes_consideradas])
-            cursor.execute(f'''
-                SELECT r.atividade_id, r.instituido, r.institucionalizado
-                FROM respostas r
-                WHERE r.avaliacao_id IN ({placeholders})
-            ''', avaliacoes_consideradas)
-            
-            respostas_por_atividade = {}
-            for row in cursor.fetchall():
-                atividade_id = row[0]
-                kpa_codigo = '.'.join(atividade_id.split('.')[:2])  # Ex: "2.1.1" -> "2.1"
-                
-                if kpa_codigo not in respostas_por_atividade:
-                    respostas_por_atividade[kpa_codigo] = {
-                        'total': 0,
-                        'instituidas': 0,
-                        'institucionalizadas': 0
-                    }
-                
-                respostas_por_atividade[kpa_codigo]['total'] += 1
-                if row[1]:  # instituido
-                    respostas_por_atividade[kpa_codigo]['instituidas'] += 1
-                if row[2]:  # institucionalizado
-                    respostas_por_atividade[kpa_codigo]['institucionalizadas'] += 1
-            
-            # Converter para lista com percentuais
-            for kpa_codigo, dados in respostas_por_atividade.items():
-                if dados['total'] > 0:
-                    percentual_instituidas = int((dados['instituidas'] / dados['total']) * 100)
-                    percentual_institucionalizadas = int((dados['institucionalizadas'] / dados['total']) * 100)
-                    
-                    maturidade_por_kpa.append({
-                        'kpa_codigo': kpa_codigo,
-                        'area_modelo': obter_area_kpa(kpa_codigo),
-                        'total_atividades': dados['total'],
-                        'instituidas': dados['instituidas'],
-                        'institucionalizadas': dados['institucionalizadas'],
-                        'percentual_instituidas': percentual_instituidas,
-                        'percentual_institucionalizadas': percentual_institucionalizadas
-                    })
-        
-        # Ordenar por KPA
-        maturidade_por_kpa.sort(key=lambda x: x['kpa_codigo'])
-        
-        # 🆕 DETALHAMENTO POR KPA CORRIGIDO
-        # Mostrar avaliações finalizadas mais recentes por nível + avaliações em andamento
-        detalhamento_kpas = []
-        
-        # Avaliações finalizadas (uma por nível)
-        for nivel in [2, 3, 4, 5]:
-            cursor.execute('''
-                SELECT a.id, a.titulo, a.data_criacao
-                FROM avaliacoes a
-                WHERE a.orgao_id = ? AND a.status = 'finalizada' AND a.nivel_desejado = ?
-                ORDER BY a.data_criacao DESC
-                LIMIT 1
-            ''', (orgao_id, nivel))
-            
-            resultado = cursor.fetchone()
-            if resultado:
-                avaliacao_id = resultado[0]
-                
-                # Buscar KPAs desta avaliação
-                cursor.execute('''
-                    SELECT r.atividade_id, r.instituido, r.institucionalizado
-                    FROM respostas r
-                    WHERE r.avaliacao_id = ?
-                ''', (avaliacao_id,))
-                
-                kpas_nivel = {}
-                for row in cursor.fetchall():
-                    atividade_id = row[0]
-                    kpa_codigo = '.'.join(atividade_id.split('.')[:2])
-                    
-                    if kpa_codigo not in kpas_nivel:
-                        kpas_nivel[kpa_codigo] = {
-                            'total': 0,
-                            'instituidas': 0,
-                            'institucionalizadas': 0
-                        }
-                    
-                    kpas_nivel[kpa_codigo]['total'] += 1
-                    if row[1]:
-                        kpas_nivel[kpa_codigo]['instituidas'] += 1
-                    if row[2]:
-                        kpas_nivel[kpa_codigo]['institucionalizadas'] += 1
-                
-                # Adicionar ao detalhamento
-                for kpa_codigo, dados in kpas_nivel.items():
-                    todas_institucionalizadas = dados['institucionalizadas'] == dados['total']
-                    todas_instituidas = dados['instituidas'] == dados['total']
-                    
-                    if todas_institucionalizadas:
-                        status = 'Institucionalizado'
-                        cor_status = 'success'
-                    elif todas_instituidas:
-                        status = 'Instituído'
-                        cor_status = 'warning'
-                    else:
-                        status = 'Parcial'
-                        cor_status = 'danger'
-                    
-                    detalhamento_kpas.append({
-                        'kpa_codigo': kpa_codigo,
-                        'area_modelo': obter_area_kpa(kpa_codigo),
-                        'nivel': nivel,
-                        'tipo': 'finalizada',
-                        'titulo_avaliacao': resultado[1],
-                        'data_avaliacao': resultado[2],
-                        'total_atividades': dados['total'],
-                        'instituidas': dados['instituidas'],
-                        'institucionalizadas': dados['institucionalizadas'],
-                        'status': status,
-                        'cor_status': cor_status
-                    })
-        
-        # Avaliações em andamento (uma por nível)
-        for nivel in [2, 3, 4, 5]:
-            cursor.execute('''
-                SELECT a.id, a.titulo, a.data_criacao
-                FROM avaliacoes a
-                WHERE a.orgao_id = ? AND a.status = 'em_andamento' AND a.nivel_desejado = ?
-                ORDER BY a.data_criacao DESC
-                LIMIT 1
-            ''', (orgao_id, nivel))
-            
-            resultado = cursor.fetchone()
-            if resultado:
-                avaliacao_id = resultado[0]
-                
-                # Calcular percentual de preenchimento
-                cursor.execute('''
-                    SELECT COUNT(*) FROM respostas WHERE avaliacao_id = ?
-                ''', (avaliacao_id,))
-                respostas_preenchidas = cursor.fetchone()[0]
-                
-                # Total de atividades do nível (baseado no modelo)
-                total_atividades_nivel = obter_total_atividades_nivel(nivel)
-                
-                percentual_preenchimento = 0
-                if total_atividades_nivel > 0:
-                    percentual_preenchimento = int((respostas_preenchidas / total_atividades_nivel) * 100)
-                
-                # Buscar KPAs desta avaliação em andamento
-                cursor.execute('''
-                    SELECT r.atividade_id
-                    FROM respostas r
-                    WHERE r.avaliacao_id = ?
-                ''', (avaliacao_id,))
-                
-                kpas_preenchidos = set()
-                for row in cursor.fetchall():
-                    atividade_id = row[0]
-                    kpa_codigo = '.'.join(atividade_id.split('.')[:2])
-                    kpas_preenchidos.add(kpa_codigo)
-                
-                # Adicionar KPAs do nível ao detalhamento
-                kpas_do_nivel = [f"{nivel}.{i}" for i in range(1, 7)]  # 6 KPAs por nível
-                for kpa_codigo in kpas_do_nivel:
-                    preenchido = kpa_codigo in kpas_preenchidos
-                    
-                    detalhamento_kpas.append({
-                        'kpa_codigo': kpa_codigo,
-                        'area_modelo': obter_area_kpa(kpa_codigo),
-                        'nivel': nivel,
-                        'tipo': 'em_andamento',
-                        'titulo_avaliacao': resultado[1],
-                        'data_avaliacao': resultado[2],
-                        'percentual_preenchimento': percentual_preenchimento,
-                        'kpa_preenchido': preenchido,
-                        'status': 'Em Andamento',
-                        'cor_status': 'info'
-                    })
-        
-        # Ordenar detalhamento por nível e KPA
-        detalhamento_kpas.sort(key=lambda x: (x['nivel'], x['kpa_codigo']))
+        avaliacoes = contexto.lista_avaliacoes()
+        evolucao_temporal = contexto.evolucao_temporal()
+        maturidade_por_kpa = contexto.maturidade_por_kpa()
+        detalhamento_kpas = contexto.detalhamento_kpas()
         
         # Gerar recomendações baseadas no detalhamento
         recomendacoes = gerar_recomendacoes_corrigidas(detalhamento_kpas)
@@ -1796,6 +2499,9 @@ def relatorio_individual():
             classificacao_maturidade['status']
         )
         
+        # Histórico gravado (não muda quando as respostas são editadas)
+        historico_maturidade = serie_temporal(conn, orgao_id=orgao_id)
+        
         conn.close()
         
         return jsonify({
@@ -1804,6 +2510,7 @@ def relatorio_individual():
             'avaliacoes': avaliacoes,
             'maturidade_por_kpa': maturidade_por_kpa,
             'evolucao_temporal': evolucao_temporal,
+            'historico_maturidade': historico_maturidade,
             'detalhamento_kpas': detalhamento_kpas,
             'recomendacoes': recomendacoes,
             'classificacao_maturidade': classificacao_maturidade,
@@ -1817,44 +2524,11 @@ def relatorio_individual():
         
 def obter_total_atividades_nivel(nivel):
     """Retorna o total de atividades de um nível baseado no modelo"""
-    # Baseado no modelo da planilha - cada nível tem 6 KPAs com diferentes quantidades de atividades
-    atividades_por_nivel = {
-        2: 30,  # Aproximadamente 5 atividades por KPA
-        3: 30,
-        4: 30,
-        5: 30
-    }
-    return atividades_por_nivel.get(nivel, 30)
+    return modelo_atual().total_por_nivel.get(nivel, 0)
 
 def obter_area_kpa(kpa_codigo):
     """Retorna a área do modelo baseada no código KPA"""
-    areas = {
-        '2.1': 'Governança de Riscos',
-        '2.2': 'Estratégia e Objetivos',
-        '2.3': 'Implementação',
-        '2.4': 'Avaliação e Melhoria',
-        '2.5': 'Comunicação e Consulta',
-        '2.6': 'Monitoramento e Análise Crítica',
-        '3.1': 'Governança de Riscos',
-        '3.2': 'Estratégia e Objetivos',
-        '3.3': 'Implementação',
-        '3.4': 'Avaliação e Melhoria',
-        '3.5': 'Comunicação e Consulta',
-        '3.6': 'Monitoramento e Análise Crítica',
-        '4.1': 'Governança de Riscos',
-        '4.2': 'Estratégia e Objetivos',
-        '4.3': 'Implementação',
-        '4.4': 'Avaliação e Melhoria',
-        '4.5': 'Comunicação e Consulta',
-        '4.6': 'Monitoramento e Análise Crítica',
-        '5.1': 'Governança de Riscos',
-        '5.2': 'Estratégia e Objetivos',
-        '5.3': 'Implementação',
-        '5.4': 'Avaliação e Melhoria',
-        '5.5': 'Comunicação e Consulta',
-        '5.6': 'Monitoramento e Análise Crítica'
-    }
-    return areas.get(kpa_codigo, 'Área não identificada')
+    return modelo_atual().area_kpa(kpa_codigo)
     
 def calcular_nivel_maturidade_orgao(orgao_id):
     """
@@ -1864,118 +2538,13 @@ def calcular_nivel_maturidade_orgao(orgao_id):
     - Deve existir avaliação finalizada para o nível
     - Todos os níveis inferiores devem também atender os mesmos critérios
     """
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+    conn = obter_conexao()
     
     try:
-        print(f"🔍 DEBUG CLASSIFICAÇÃO - Órgão ID: {orgao_id}")
-        
-        # Carregar modelo completo para saber quantas atividades cada nível deve ter
-        modelo_atividades = carregar_modelo_atividades()
-        print(f"📋 Modelo carregado: {len(modelo_atividades)} níveis")
-        
-        # Verificar níveis de 5 para 2 (do maior para o menor)
-        for nivel_candidato in [5, 4, 3, 2]:
-            # Verificar se existe avaliação finalizada para este nível
-            cursor.execute('''
-                SELECT a.id, a.titulo, a.data_criacao
-                FROM avaliacoes a
-                WHERE a.orgao_id = ? AND a.status = 'finalizada' AND a.nivel_desejado = ?
-                ORDER BY a.data_criacao DESC
-                LIMIT 1
-            ''', (orgao_id, nivel_candidato))
-            
-            avaliacao_nivel = cursor.fetchone()
-            if not avaliacao_nivel:
-                print(f"   ❌ Não há avaliação finalizada para o nível {nivel_candidato}")
-                continue
-            
-            # Verificar se TODOS os níveis de 2 até o nível candidato atendem os critérios
-            niveis_validos = True
-            
-            for nivel_verificar in range(2, nivel_candidato + 1):
-                # Buscar avaliação mais recente finalizada deste nível
-                cursor.execute('''
-                    SELECT a.id, a.titulo
-                    FROM avaliacoes a
-                    WHERE a.orgao_id = ? AND a.status = 'finalizada' AND a.nivel_desejado = ?
-                    ORDER BY a.data_criacao DESC
-                    LIMIT 1
-                ''', (orgao_id, nivel_verificar))
-                
-                avaliacao_verificar = cursor.fetchone()
-                if not avaliacao_verificar:
-                    niveis_validos = False
-                    break
-                
-                avaliacao_id = avaliacao_verificar[0]
-                
-                # Obter todas as atividades que DEVERIAM estar no nível
-                atividades_esperadas = modelo_atividades.get(nivel_verificar, [])
-                total_atividades_esperadas = len(atividades_esperadas)
-                
-                
-                if total_atividades_esperadas == 0:
-                    niveis_validos = False
-                    break
-                
-                # Verificar quantas atividades foram respondidas nesta avaliação
-                cursor.execute('''
-                    SELECT atividade_id, institucionalizado, instituido
-                    FROM respostas
-                    WHERE avaliacao_id = ?
-                ''', (avaliacao_id,))
-                
-                respostas = cursor.fetchall()
-                atividades_respondidas = {row[0]: {'institucionalizado': row[1], 'instituido': row[2]} for row in respostas}
-                
-                
-                # Verificar se TODAS as atividades esperadas foram respondidas
-                atividades_faltantes = []
-                atividades_nao_institucionalizadas = []
-                
-                for atividade_id in atividades_esperadas:
-                    if atividade_id not in atividades_respondidas:
-                        atividades_faltantes.append(atividade_id)
-                    elif not atividades_respondidas[atividade_id]['institucionalizado']:  # não institucionalizada
-                        atividades_nao_institucionalizadas.append(atividade_id)
-                
-                # Se há atividades faltantes ou não institucionalizadas, nível não é válido
-                if atividades_faltantes or atividades_nao_institucionalizadas:
-                    niveis_validos = False
-                    break
-                else:
-                    print(f"      ✅ Nível {nivel_verificar} atende critérios")
-            
-            # Se todos os níveis até o candidato são válidos, este é o nível de maturidade
-            if niveis_validos:
-                conn.close()
-                return {
-                    'nivel_maturidade': nivel_candidato,
-                    'status': 'certificado',
-                    'descricao': f'Nível {nivel_candidato} de Maturidade em Gestão de Riscos',
-                    'data_certificacao': datetime.now().isoformat(),
-                    'criterios_atendidos': True,
-                    'detalhes': f'Todas as atividades dos níveis 2 a {nivel_candidato} estão institucionalizadas'
-                }
-            else:
-                print(f"   ❌ Nível {nivel_candidato} não atende todos os critérios")
-        
-        print(f"\n❌ NENHUM NÍVEL CERTIFICADO")
-        conn.close()
-        return {
-            'nivel_maturidade': 1,
-            'status': 'inicial',
-            'descricao': 'Nível Inicial - Critérios de certificação não atendidos',
-            'data_certificacao': None,
-            'criterios_atendidos': False,
-            'detalhes': 'Nem todas as atividades dos níveis estão institucionalizadas ou avaliações não finalizadas'
-        }
+        return obter_maturidades(conn, [orgao_id])[orgao_id]
         
     except Exception as e:
-        conn.close()
         logger.error(f"Erro ao calcular nível de maturidade: {str(e)}")
-        print(f"❌ ERRO: {str(e)}")
         return {
             'nivel_maturidade': 1,
             'status': 'erro',
@@ -1984,162 +2553,21 @@ def calcular_nivel_maturidade_orgao(orgao_id):
             'criterios_atendidos': False,
             'detalhes': f'Erro: {str(e)}'
         }
+    finally:
+        conn.close()
 
 def carregar_modelo_atividades():
     """
-    Carrega o modelo de atividades do arquivo JSON para saber 
-    exatamente quais atividades cada nível deve ter
+    Retorna as atividades que cada nível deve ter, segundo o modelo
+    compilado ({nivel: (atividade_id, ...)})
     """
-    try:
-        # Tentar carregar do arquivo modelo_avaliacao.json
-        import json
-        import os
-        
-        # Procurar o arquivo no diretório atual ou public
-        caminhos_possiveis = [
-            'modelo_avaliacao.json',
-            'public/modelo_avaliacao.json',
-            '../public/modelo_avaliacao.json',
-            'upload/modelo_avaliacao.json'  # ✅ ADICIONAR este caminho
-        ]
-        
-        modelo_data = None
-        caminho_encontrado = None
-        for caminho in caminhos_possiveis:
-            if os.path.exists(caminho):
-                with open(caminho, 'r', encoding='utf-8') as f:
-                    modelo_data = json.load(f)
-                caminho_encontrado = caminho
-                break
-        
-        if not modelo_data:
-            print("❌ Arquivo modelo não encontrado, usando modelo básico")
-            return gerar_modelo_basico()
-        
-        print(f"✅ Modelo carregado de: {caminho_encontrado}")
-        
-        # ✅ CORRIGIR: Usar a estrutura correta do JSON
-        atividades_por_nivel = {}
-        
-        # O arquivo tem a estrutura: {"kpas_por_nivel": {"2": [...], "3": [...]}}
-        if 'kpas_por_nivel' in modelo_data:
-            for nivel_str, kpas_lista in modelo_data['kpas_por_nivel'].items():
-                nivel_num = int(nivel_str)
-                atividades_por_nivel[nivel_num] = []
-                
-                # kpas_lista é uma lista de KPAs
-                for kpa in kpas_lista:
-                    if 'atividades' in kpa:
-                        for atividade in kpa['atividades']:
-                            if 'id' in atividade:  # ✅ CORRIGIR: usar 'id' não 'codigo'
-                                atividades_por_nivel[nivel_num].append(atividade['id'])
-        
-        # ✅ ADICIONAR: Debug para verificar quantas atividades foram carregadas
-        for nivel, atividades in atividades_por_nivel.items():
-            print(f"📋 Nível {nivel}: {len(atividades)} atividades carregadas")
-            if nivel == 2:  # Debug detalhado para nível 2
-                print(f"   Atividades: {atividades}")
-        
-        return atividades_por_nivel
-        
-    except Exception as e:
-        print(f"❌ Erro ao carregar modelo de atividades: {str(e)}")
-        logger.error(f"Erro ao carregar modelo de atividades: {str(e)}")
-        return gerar_modelo_basico()
-
-def gerar_modelo_basico():
-    """
-    Gera modelo básico automaticamente baseado na estrutura real conhecida
-    Se conseguir ler o JSON, usa os dados reais. Senão, usa estrutura conhecida.
-    """
-    import json
-    import os
-    
-    # PRIMEIRO: Tentar ler o arquivo JSON real
-    caminhos_json = [
-        'modelo_avaliacao',
-        'public/modelo_avaliacao.json',
-        '../public/modelo_avaliacao.json',
-        'upload/modelo_avaliacao.json'
-    ]
-    
-    for caminho in caminhos_json:
-        try:
-            if os.path.exists(caminho):
-                with open(caminho, 'r', encoding='utf-8') as f:
-                    modelo_data = json.load(f)
-                
-                print(f"✅ Gerando modelo básico a partir de: {caminho}")
-                
-                # Extrair atividades do JSON real
-                modelo_basico = {}
-                
-                if 'kpas_por_nivel' in modelo_data:
-                    for nivel_str, kpas_lista in modelo_data['kpas_por_nivel'].items():
-                        nivel_num = int(nivel_str)
-                        modelo_basico[nivel_num] = []
-                        
-                        for kpa in kpas_lista:
-                            if 'atividades' in kpa:
-                                for atividade in kpa['atividades']:
-                                    if 'id' in atividade:
-                                        modelo_basico[nivel_num].append(atividade['id'])
-                
-                print(f"📋 Modelo gerado automaticamente:")
-                for nivel, atividades in modelo_basico.items():
-                    print(f"   Nível {nivel}: {len(atividades)} atividades")
-                
-                return modelo_basico
-                
-        except Exception as e:
-            print(f"⚠️ Erro ao ler {caminho}: {e}")
-            continue
-    
-    # SEGUNDO: Se não conseguiu ler o JSON, usar estrutura conhecida inteligente
-    print("⚠️ JSON não encontrado, usando estrutura conhecida")
-    
-    # Estrutura real conhecida (baseada no que você confirmou)
-    estrutura_real = {
-        2: {
-            1: 5,  # KPA 2.1: 5 atividades (2.1.1 a 2.1.5)
-            2: 5,  # KPA 2.2: 5 atividades (2.2.1 a 2.2.5)
-            3: 5,  # KPA 2.3: 5 atividades (2.3.1 a 2.3.5)
-            4: 6,  # KPA 2.4: 6 atividades (2.4.1 a 2.4.6)
-            5: 5,  # KPA 2.5: 5 atividades (2.5.1 a 2.5.5)
-            6: 4   # KPA 2.6: 4 atividades (2.6.1 a 2.6.4) ← SEM 2.6.5!
-        },
-        3: {
-            1: 5, 2: 5, 3: 5, 4: 5, 5: 5, 6: 5  # Assumir 5 para cada KPA do nível 3
-        },
-        4: {
-            1: 5, 2: 5, 3: 5, 4: 5, 5: 5, 6: 5  # Assumir 5 para cada KPA do nível 4
-        },
-        5: {
-            1: 5, 2: 5, 3: 5, 4: 5, 5: 5, 6: 5  # Assumir 5 para cada KPA do nível 5
-        }
-    }
-    
-    modelo_basico = {}
-    
-    for nivel, kpas_info in estrutura_real.items():
-        modelo_basico[nivel] = []
-        
-        for kpa_num, qtd_atividades in kpas_info.items():
-            for atividade_num in range(1, qtd_atividades + 1):
-                codigo = f"{nivel}.{kpa_num}.{atividade_num}"
-                modelo_basico[nivel].append(codigo)
-    
-    print(f"📋 Modelo gerado por estrutura conhecida:")
-    for nivel, atividades in modelo_basico.items():
-        print(f"   Nível {nivel}: {len(atividades)} atividades")
-    
-    return modelo_basico
+    return modelo_atual().atividades_por_nivel
 
 def verificar_completude_nivel(orgao_id, nivel, avaliacao_id=None):
     """
     Verifica se um nível específico está completo (todas atividades institucionalizadas)
     """
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     try:
@@ -2159,31 +2587,23 @@ def verificar_completude_nivel(orgao_id, nivel, avaliacao_id=None):
             
             avaliacao_id = resultado[0]
         
-        # Carregar atividades esperadas para o nível
-        modelo_atividades = carregar_modelo_atividades()
-        atividades_esperadas = modelo_atividades.get(nivel, [])
+        # Máscara das atividades esperadas para o nível
+        modelo = modelo_atual()
+        mascara_nivel = modelo.mascara_por_nivel.get(nivel, 0)
         
-        if not atividades_esperadas:
+        if not mascara_nivel:
             return False, "Modelo de atividades não encontrado"
         
-        # Buscar respostas da avaliação
-        cursor.execute('''
-            SELECT atividade_id, institucionalizado
-            FROM respostas
-            WHERE avaliacao_id = ?
-        ''', (avaliacao_id,))
-        
-        respostas = cursor.fetchall()
-        atividades_respondidas = {row[0]: row[1] for row in respostas}
+        # Máscaras de bits das respostas da avaliação
+        mascaras = obter_mascaras(conn, [avaliacao_id]).get(avaliacao_id, MASCARAS_VAZIAS)
+        conn.commit()
         
         # Verificar completude
-        total_esperadas = len(atividades_esperadas)
-        total_respondidas = len([a for a in atividades_esperadas if a in atividades_respondidas])
-        total_institucionalizadas = len([a for a in atividades_esperadas 
-                                       if a in atividades_respondidas and atividades_respondidas[a]])
+        total_esperadas = modelo.total_por_nivel[nivel]
+        total_respondidas = contar(mascaras.respondidas, mascara_nivel)
+        total_institucionalizadas = contar(mascaras.institucionalizadas, mascara_nivel)
         
-        completo = (total_respondidas == total_esperadas and 
-                   total_institucionalizadas == total_esperadas)
+        completo = nivel_completo(mascaras, modelo, nivel)
         
         detalhes = {
             'total_esperadas': total_esperadas,
@@ -2313,783 +2733,6 @@ def gerar_recomendacoes(maturidade_por_kpa):
     return recomendacoes[:6]
     
 
-def gerar_pdf_simples(dados):
-    """Gera PDF completo do relatório individual - VERSÃO FINAL"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib import colors
-    from reportlab.lib.units import inch
-    from io import BytesIO
-    from datetime import datetime
-    import sqlite3
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    styles = getSampleStyleSheet()
-    
-    # Estilos customizados
-    titulo_secao = ParagraphStyle(
-        'TituloSecao',
-        parent=styles['Heading1'],
-        fontSize=14,
-        textColor=colors.HexColor('#2e75b6'),
-        spaceAfter=10,
-        borderWidth=1,
-        borderColor=colors.HexColor('#2e75b6'),
-        borderPadding=5,
-        backColor=colors.HexColor('#f2f8ff')
-    )
-    
-    subtitulo = ParagraphStyle(
-        'Subtitulo',
-        parent=styles['Heading2'],
-        fontSize=12,
-        textColor=colors.HexColor('#4472c4'),
-        spaceAfter=8
-    )
-    
-    subtitulo_verde = ParagraphStyle(
-        'SubtituloVerde',
-        parent=styles['Heading2'],
-        fontSize=11,
-        textColor=colors.HexColor('#2d5016'),
-        spaceAfter=6,
-        backColor=colors.HexColor('#e8f5e8'),
-        borderWidth=1,
-        borderColor=colors.HexColor('#4caf50'),
-        borderPadding=3
-    )
-    
-    subtitulo_azul = ParagraphStyle(
-        'SubtituloAzul',
-        parent=styles['Heading2'],
-        fontSize=11,
-        textColor=colors.HexColor('#1565c0'),
-        spaceAfter=6,
-        backColor=colors.HexColor('#e3f2fd'),
-        borderWidth=1,
-        borderColor=colors.HexColor('#2196f3'),
-        borderPadding=3
-    )
-    
-    # Estilos para recomendações
-    rec_alta = ParagraphStyle(
-        'RecomendacaoAlta',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#d32f2f'),
-        backColor=colors.HexColor('#ffebee'),
-        borderWidth=1,
-        borderColor=colors.HexColor('#f44336'),
-        borderPadding=5,
-        spaceAfter=8
-    )
-    
-    rec_media = ParagraphStyle(
-        'RecomendacaoMedia',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#f57c00'),
-        backColor=colors.HexColor('#fff3e0'),
-        borderWidth=1,
-        borderColor=colors.HexColor('#ff9800'),
-        borderPadding=5,
-        spaceAfter=8
-    )
-    
-    rec_baixa = ParagraphStyle(
-        'RecomendacaoBaixa',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#1976d2'),
-        backColor=colors.HexColor('#e3f2fd'),
-        borderWidth=1,
-        borderColor=colors.HexColor('#2196f3'),
-        borderPadding=5,
-        spaceAfter=8
-    )
-    
-    story = []
-    
-    # ===== CABEÇALHO =====
-    story.append(Paragraph("RELATÓRIO DE MATURIDADE EM GESTÃO DE RISCOS", styles['Title']))
-    story.append(Spacer(1, 20))
-    
-    story.append(Paragraph(f"<b>Órgão:</b> {dados['orgao_nome']}", styles['Normal']))
-    story.append(Paragraph(f"<b>Sigla:</b> {dados['orgao_sigla']}", styles['Normal']))
-    story.append(Paragraph(f"<b>Usuário:</b> {dados['usuario_nome']}", styles['Normal']))
-    story.append(Paragraph(f"<b>Data:</b> {datetime.now().strftime('%d/%m/%Y às %H:%M')}", styles['Normal']))
-    story.append(Spacer(1, 30))
-    
-    # Obter orgao_id para as próximas seções
-    orgao_id = None
-    try:
-        from main import obter_dados_usuario
-        user_email = dados.get('usuario_email', '')
-        if user_email:
-            dados_usuario = obter_dados_usuario(user_email)
-            orgao_id = dados_usuario.get('orgao_id') if dados_usuario else None
-    except:
-        pass
-    
-    # ===== 1. CERTIFICAÇÃO =====
-    story.append(Paragraph("1. CERTIFICAÇÃO DE MATURIDADE", titulo_secao))
-    
-    classificacao = None
-    try:
-        if orgao_id:
-            from main import calcular_nivel_maturidade_orgao
-            classificacao = calcular_nivel_maturidade_orgao(orgao_id)
-            
-            if classificacao.get('status') == 'certificado':
-                story.append(Paragraph(f"🏆 <b>NÍVEL {classificacao.get('nivel_maturidade')} CERTIFICADO</b>", subtitulo))
-                story.append(Paragraph(f"<b>Status:</b> {classificacao.get('descricao', 'N/A')}", styles['Normal']))
-                
-                data_cert = classificacao.get('data_certificacao', '')
-                if data_cert:
-                    data_formatada = data_cert[:10] if len(data_cert) >= 10 else data_cert
-                    story.append(Paragraph(f"<b>Data de Certificação:</b> {data_formatada}", styles['Normal']))
-                    
-                story.append(Paragraph(f"<b>Detalhes:</b> {classificacao.get('detalhes', 'N/A')}", styles['Normal']))
-            else:
-                story.append(Paragraph("⚠️ <b>NÍVEL INICIAL</b>", subtitulo))
-                story.append(Paragraph(f"<b>Status:</b> {classificacao.get('descricao', 'Critérios não atendidos')}", styles['Normal']))
-                story.append(Paragraph(f"<b>Detalhes:</b> {classificacao.get('detalhes', 'N/A')}", styles['Normal']))
-        else:
-            story.append(Paragraph("⚠️ Órgão não identificado", styles['Normal']))
-            
-    except Exception as e:
-        story.append(Paragraph(f"⚠️ Erro ao obter certificação: {str(e)}", styles['Normal']))
-    
-    story.append(Spacer(1, 20))
-    
-    # ===== 2. MATURIDADE POR KPA =====
-    story.append(Paragraph("2. MATURIDADE POR ÁREA DE PROCESSO (KPA)", titulo_secao))
-    
-    maturidade_kpas = []  # Guardar para usar no detalhamento e recomendações
-    
-    try:
-        if orgao_id:
-            conn = sqlite3.connect('sistema_cge.db')
-            cursor = conn.cursor()
-            
-            # Buscar maturidade por KPA das avaliações finalizadas mais recentes
-            for nivel in [2, 3, 4, 5]:
-                # Buscar avaliação mais recente finalizada do nível
-                cursor.execute('''
-                    SELECT a.id, a.titulo, a.data_criacao
-                    FROM avaliacoes a
-                    WHERE a.orgao_id = ? AND a.status = 'finalizada' AND a.nivel_desejado = ?
-                    ORDER BY a.data_criacao DESC
-                    LIMIT 1
-                ''', (orgao_id, nivel))
-                
-                resultado = cursor.fetchone()
-                if resultado:
-                    avaliacao_id = resultado[0]
-                    
-                    # Agrupar respostas por KPA
-                    cursor.execute('''
-                        SELECT atividade_id, instituido, institucionalizado
-                        FROM respostas
-                        WHERE avaliacao_id = ?
-                    ''', (avaliacao_id,))
-                    
-                    kpas_nivel = {}
-                    for row in cursor.fetchall():
-                        atividade_id = row[0]
-                        kpa_codigo = '.'.join(atividade_id.split('.')[:2])
-                        
-                        if kpa_codigo not in kpas_nivel:
-                            kpas_nivel[kpa_codigo] = {
-                                'total': 0,
-                                'instituidas': 0,
-                                'institucionalizadas': 0
-                            }
-                        
-                        kpas_nivel[kpa_codigo]['total'] += 1
-                        if row[1]:  # instituido
-                            kpas_nivel[kpa_codigo]['instituidas'] += 1
-                        if row[2]:  # institucionalizado
-                            kpas_nivel[kpa_codigo]['institucionalizadas'] += 1
-                    
-                    # Adicionar à lista de maturidade
-                    for kpa_codigo, dados_kpa in kpas_nivel.items():
-                        if dados_kpa['total'] > 0:
-                            perc_instituidas = int((dados_kpa['instituidas'] / dados_kpa['total']) * 100)
-                            perc_institucionalizadas = int((dados_kpa['institucionalizadas'] / dados_kpa['total']) * 100)
-                            
-                            # Obter nome da área
-                            area_nome = obter_area_kpa_segura(kpa_codigo)
-                            
-                            maturidade_kpas.append({
-                                'kpa_codigo': kpa_codigo,
-                                'area_nome': area_nome,
-                                'nivel': nivel,
-                                'perc_instituidas': perc_instituidas,
-                                'perc_institucionalizadas': perc_institucionalizadas,
-                                'total_atividades': dados_kpa['total'],
-                                'atividades_institucionalizadas': dados_kpa['institucionalizadas'],
-                                'atividades_instituidas': dados_kpa['instituidas'],
-                                'avaliacao_id': avaliacao_id,
-                                'titulo_avaliacao': resultado[1],
-                                'data_avaliacao': resultado[2][:10] if resultado[2] else 'N/A'
-                            })
-            
-            # Criar tabela de maturidade por KPA
-            if maturidade_kpas:
-                dados_tabela = [['KPA', 'Área', 'Nível', 'Instituídas', 'Institucionalizadas', 'Status']]
-                
-                for kpa in maturidade_kpas:
-                    # Determinar status
-                    if kpa['perc_institucionalizadas'] == 100:
-                        status = "✅ Completo"
-                    elif kpa['perc_institucionalizadas'] > 0:
-                        status = "⚠️ Parcial"
-                    else:
-                        status = "❌ Inicial"
-                    
-                    dados_tabela.append([
-                        kpa['kpa_codigo'],
-                        kpa['area_nome'][:20] + '...' if len(kpa['area_nome']) > 20 else kpa['area_nome'],
-                        str(kpa['nivel']),
-                        f"{kpa['perc_instituidas']}%",
-                        f"{kpa['perc_institucionalizadas']}%",
-                        status
-                    ])
-                
-                # Criar tabela formatada
-                tabela_kpas = Table(dados_tabela, colWidths=[0.6*inch, 1.8*inch, 0.5*inch, 0.8*inch, 1*inch, 0.8*inch])
-                tabela_kpas.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2e75b6')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 9),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('FONTSIZE', (0, 1), (-1, -1), 8),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ]))
-                
-                story.append(tabela_kpas)
-                
-                # Resumo estatístico
-                story.append(Spacer(1, 15))
-                story.append(Paragraph("<b>Resumo Estatístico:</b>", subtitulo))
-                
-                total_kpas = len(maturidade_kpas)
-                kpas_completos = len([k for k in maturidade_kpas if k['perc_institucionalizadas'] == 100])
-                kpas_parciais = len([k for k in maturidade_kpas if 0 < k['perc_institucionalizadas'] < 100])
-                kpas_iniciais = len([k for k in maturidade_kpas if k['perc_institucionalizadas'] == 0])
-                
-                story.append(Paragraph(f"• <b>Total de KPAs avaliados:</b> {total_kpas}", styles['Normal']))
-                story.append(Paragraph(f"• <b>KPAs completos (100%):</b> {kpas_completos}", styles['Normal']))
-                story.append(Paragraph(f"• <b>KPAs parciais (1-99%):</b> {kpas_parciais}", styles['Normal']))
-                story.append(Paragraph(f"• <b>KPAs iniciais (0%):</b> {kpas_iniciais}", styles['Normal']))
-                
-            else:
-                story.append(Paragraph("Nenhum dado de maturidade por KPA disponível.", styles['Normal']))
-            
-            conn.close()
-        else:
-            story.append(Paragraph("Órgão não identificado para buscar dados de maturidade.", styles['Normal']))
-            
-    except Exception as e:
-        story.append(Paragraph(f"Erro ao obter maturidade por KPA: {str(e)}", styles['Normal']))
-    
-    story.append(Spacer(1, 20))
-    
-    # ===== 3. EVOLUÇÃO TEMPORAL =====
-    story.append(Paragraph("3. EVOLUÇÃO DA MATURIDADE AO LONGO DO TEMPO", titulo_secao))
-    
-    evolucao_temporal = []
-    try:
-        if orgao_id:
-            conn = sqlite3.connect('sistema_cge.db')
-            cursor = conn.cursor()
-            
-            # Buscar evolução temporal - uma avaliação finalizada por nível
-            for nivel in [2, 3, 4, 5]:
-                cursor.execute('''
-                    SELECT a.id, a.titulo, a.data_criacao, a.nivel_desejado
-                    FROM avaliacoes a
-                    WHERE a.orgao_id = ? AND a.status = 'finalizada' AND a.nivel_desejado = ?
-                    ORDER BY a.data_criacao DESC
-                    LIMIT 1
-                ''', (orgao_id, nivel))
-                
-                resultado = cursor.fetchone()
-                if resultado:
-                    avaliacao_id = resultado[0]
-                    
-                    # Calcular maturidade desta avaliação específica
-                    cursor.execute('''
-                        SELECT 
-                            COUNT(*) as total,
-                            COUNT(CASE WHEN instituido = 1 THEN 1 END) as instituidas,
-                            COUNT(CASE WHEN institucionalizado = 1 THEN 1 END) as institucionalizadas
-                        FROM respostas
-                        WHERE avaliacao_id = ?
-                    ''', (avaliacao_id,))
-                    
-                    resultado_respostas = cursor.fetchone()
-                    if resultado_respostas and resultado_respostas[0] > 0:
-                        total = resultado_respostas[0]
-                        instituidas = resultado_respostas[1]
-                        institucionalizadas = resultado_respostas[2]
-                        
-                        # Maturidade baseada em institucionalização
-                        maturidade_geral = int((institucionalizadas / total) * 100)
-                        maturidade_instituidas = int((instituidas / total) * 100)
-                        
-                        # Formatar data
-                        data_avaliacao = resultado[2][:10] if resultado[2] else 'N/A'
-                        
-                        evolucao_temporal.append({
-                            'nivel': resultado[3],
-                            'titulo': resultado[1],
-                            'data': data_avaliacao,
-                            'maturidade_institucionalizada': maturidade_geral,
-                            'maturidade_instituida': maturidade_instituidas,
-                            'total_atividades': total,
-                            'atividades_institucionalizadas': institucionalizadas,
-                            'atividades_instituidas': instituidas
-                        })
-            
-            # Ordenar por nível
-            evolucao_temporal.sort(key=lambda x: x['nivel'])
-            
-            if evolucao_temporal:
-                story.append(Paragraph("<b>Histórico de Progresso por Nível:</b>", subtitulo))
-                
-                # Criar tabela de evolução
-                dados_tabela = [['Nível', 'Data Avaliação', 'Título', 'Maturidade', 'Atividades', 'Tendência']]
-                
-                maturidade_anterior = 0
-                for i, item in enumerate(evolucao_temporal):
-                    # Calcular tendência
-                    if i == 0:
-                        tendencia = "🆕 Inicial"
-                    else:
-                        if item['maturidade_institucionalizada'] > maturidade_anterior:
-                            tendencia = "📈 Crescimento"
-                        elif item['maturidade_institucionalizada'] == maturidade_anterior:
-                            tendencia = "➡️ Estável"
-                        else:
-                            tendencia = "📉 Declínio"
-                    
-                    dados_tabela.append([
-                        f"Nível {item['nivel']}",
-                        item['data'],
-                        item['titulo'][:15] + '...' if len(item['titulo']) > 15 else item['titulo'],
-                        f"{item['maturidade_institucionalizada']}%",
-                        f"{item['atividades_institucionalizadas']}/{item['total_atividades']}",
-                        tendencia
-                    ])
-                    
-                    maturidade_anterior = item['maturidade_institucionalizada']
-                
-                # Criar tabela formatada
-                tabela_evolucao = Table(dados_tabela, colWidths=[0.8*inch, 1*inch, 1.5*inch, 0.8*inch, 0.8*inch, 1*inch])
-                tabela_evolucao.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2e75b6')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 9),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('FONTSIZE', (0, 1), (-1, -1), 8),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ]))
-                
-                story.append(tabela_evolucao)
-                
-                # Análise da evolução
-                story.append(Spacer(1, 15))
-                story.append(Paragraph("<b>Análise da Evolução:</b>", subtitulo))
-                
-                if len(evolucao_temporal) >= 2:
-                    primeiro = evolucao_temporal[0]
-                    ultimo = evolucao_temporal[-1]
-                    
-                    crescimento = ultimo['maturidade_institucionalizada'] - primeiro['maturidade_institucionalizada']
-                    niveis_avaliados = len(evolucao_temporal)
-                    
-                    story.append(Paragraph(f"• <b>Níveis avaliados:</b> {niveis_avaliados} ({primeiro['nivel']} ao {ultimo['nivel']})", styles['Normal']))
-                    story.append(Paragraph(f"• <b>Período:</b> {primeiro['data']} a {ultimo['data']}", styles['Normal']))
-                    story.append(Paragraph(f"• <b>Crescimento total:</b> {crescimento:+d} pontos percentuais", styles['Normal']))
-                    
-                    if crescimento > 0:
-                        story.append(Paragraph(f"• <b>Tendência:</b> 📈 Evolução positiva da maturidade", styles['Normal']))
-                    elif crescimento == 0:
-                        story.append(Paragraph(f"• <b>Tendência:</b> ➡️ Maturidade estável", styles['Normal']))
-                    else:
-                        story.append(Paragraph(f"• <b>Tendência:</b> 📉 Necessita atenção", styles['Normal']))
-                        
-                    # Nível atual
-                    nivel_atual = ultimo['nivel']
-                    maturidade_atual = ultimo['maturidade_institucionalizada']
-                    story.append(Paragraph(f"• <b>Status atual:</b> Nível {nivel_atual} com {maturidade_atual}% de maturidade", styles['Normal']))
-                    
-                else:
-                    story.append(Paragraph("• Apenas um nível avaliado. Evolução temporal será disponível com mais avaliações.", styles['Normal']))
-                
-            else:
-                story.append(Paragraph("Nenhuma avaliação finalizada encontrada para análise temporal.", styles['Normal']))
-            
-            conn.close()
-        else:
-            story.append(Paragraph("Órgão não identificado para análise temporal.", styles['Normal']))
-            
-    except Exception as e:
-        story.append(Paragraph(f"Erro ao obter evolução temporal: {str(e)}", styles['Normal']))
-    
-    # ===== QUEBRA DE PÁGINA =====
-    story.append(PageBreak())
-    
-    # ===== 4. DETALHAMENTO POR KPA =====
-    story.append(Paragraph("4. DETALHAMENTO POR KPA", titulo_secao))
-    
-    avaliacoes_andamento = []
-    try:
-        if orgao_id:
-            conn = sqlite3.connect('sistema_cge.db')
-            cursor = conn.cursor()
-            
-            # ===== 4.1 AVALIAÇÕES FINALIZADAS =====
-            story.append(Paragraph("4.1. Avaliações Finalizadas", subtitulo_verde))
-            
-            if maturidade_kpas:
-                for kpa in maturidade_kpas:
-                    # Determinar status detalhado
-                    if kpa['perc_institucionalizadas'] == 100:
-                        status_icon = "✅"
-                        status_texto = "Institucionalizado"
-                    elif kpa['perc_institucionalizadas'] > 0:
-                        status_icon = "⚠️"
-                        status_texto = "Parcialmente Implementado"
-                    else:
-                        status_icon = "❌"
-                        status_texto = "Não Implementado"
-                    
-                    # Informações do KPA
-                    story.append(Paragraph(f"<b>{kpa['kpa_codigo']} - {kpa['area_nome']}</b>", styles['Normal']))
-                    story.append(Paragraph(f"Nível {kpa['nivel']} | Data: {kpa['data_avaliacao']} | Status: {status_icon} {status_texto}", styles['Normal']))
-                    story.append(Paragraph(f"Atividades: {kpa['atividades_institucionalizadas']}/{kpa['total_atividades']} institucionalizadas, {kpa['atividades_instituidas']}/{kpa['total_atividades']} instituídas", styles['Normal']))
-                    story.append(Paragraph(f"Avaliação: {kpa['titulo_avaliacao']}", styles['Normal']))
-                    story.append(Spacer(1, 8))
-            else:
-                story.append(Paragraph("Nenhuma avaliação finalizada encontrada.", styles['Normal']))
-            
-            story.append(Spacer(1, 15))
-            
-            # ===== 4.2 AVALIAÇÕES EM ANDAMENTO =====
-            story.append(Paragraph("4.2. Avaliações em Andamento", subtitulo_azul))
-            
-            # Buscar avaliações em andamento
-            cursor.execute('''
-                SELECT a.id, a.titulo, a.nivel_desejado, a.data_criacao
-                FROM avaliacoes a
-                WHERE a.orgao_id = ? AND a.status = 'em_andamento'
-                ORDER BY a.data_criacao DESC
-            ''', (orgao_id,))
-            
-            avaliacoes_andamento = cursor.fetchall()
-            
-            if avaliacoes_andamento:
-                for avaliacao in avaliacoes_andamento:
-                    avaliacao_id = avaliacao[0]
-                    titulo = avaliacao[1]
-                    nivel = avaliacao[2]
-                    data_criacao = avaliacao[3][:10] if avaliacao[3] else 'N/A'
-                    
-                    # Calcular progresso por KPA desta avaliação
-                    cursor.execute('''
-                        SELECT atividade_id, instituido, institucionalizado
-                        FROM respostas
-                        WHERE avaliacao_id = ?
-                    ''', (avaliacao_id,))
-                    
-                    respostas_andamento = cursor.fetchall()
-                    
-                    # Agrupar por KPA
-                    kpas_andamento = {}
-                    for resposta in respostas_andamento:
-                        atividade_id = resposta[0]
-                        kpa_codigo = '.'.join(atividade_id.split('.')[:2])
-                        
-                        if kpa_codigo not in kpas_andamento:
-                            kpas_andamento[kpa_codigo] = {
-                                'respondidas': 0,
-                                'total_esperado': 0
-                            }
-                        
-                        kpas_andamento[kpa_codigo]['respondidas'] += 1
-                    
-                    # Calcular total esperado por KPA (baseado no modelo)
-                    from main import carregar_modelo_atividades
-                    modelo = carregar_modelo_atividades()
-                    atividades_nivel = modelo.get(nivel, [])
-                    
-                    for atividade_id in atividades_nivel:
-                        kpa_codigo = '.'.join(atividade_id.split('.')[:2])
-                        if kpa_codigo not in kpas_andamento:
-                            kpas_andamento[kpa_codigo] = {
-                                'respondidas': 0,
-                                'total_esperado': 0
-                            }
-                        kpas_andamento[kpa_codigo]['total_esperado'] += 1
-                    
-                    # Mostrar informações da avaliação
-                    story.append(Paragraph(f"<b>Avaliação: {titulo}</b>", styles['Normal']))
-                    story.append(Paragraph(f"Nível {nivel} | Criada em: {data_criacao}", styles['Normal']))
-                    story.append(Spacer(1, 5))
-                    
-                    # Mostrar progresso por KPA
-                    if kpas_andamento:
-                        for kpa_codigo, dados in kpas_andamento.items():
-                            if dados['total_esperado'] > 0:
-                                percentual = int((dados['respondidas'] / dados['total_esperado']) * 100)
-                                area_nome = obter_area_kpa_segura(kpa_codigo)
-                                
-                                # Ícone baseado no progresso
-                                if percentual == 100:
-                                    icone = "✅"
-                                elif percentual >= 50:
-                                    icone = "🔄"
-                                else:
-                                    icone = "⏳"
-                                
-                                story.append(Paragraph(f"  {icone} <b>{kpa_codigo} - {area_nome}</b>", styles['Normal']))
-                                story.append(Paragraph(f"     Preenchimento: {percentual}% ({dados['respondidas']}/{dados['total_esperado']} atividades)", styles['Normal']))
-                    else:
-                        story.append(Paragraph("  Nenhuma atividade respondida ainda.", styles['Normal']))
-                    
-                    story.append(Spacer(1, 10))
-            else:
-                story.append(Paragraph("Nenhuma avaliação em andamento encontrada.", styles['Normal']))
-            
-            conn.close()
-        else:
-            story.append(Paragraph("Órgão não identificado para detalhamento.", styles['Normal']))
-            
-    except Exception as e:
-        story.append(Paragraph(f"Erro ao obter detalhamento por KPA: {str(e)}", styles['Normal']))
-    
-    story.append(Spacer(1, 20))
-    
-    # ===== 5. RECOMENDAÇÕES =====
-    story.append(Paragraph("5. RECOMENDAÇÕES", titulo_secao))
-    
-    # Gerar recomendações baseadas nos dados coletados
-    recomendacoes = gerar_recomendacoes_inteligentes(maturidade_kpas, avaliacoes_andamento, classificacao, evolucao_temporal)
-    
-    if recomendacoes:
-        # Separar por prioridade
-        alta_prioridade = [r for r in recomendacoes if r['prioridade'] == 'alta']
-        media_prioridade = [r for r in recomendacoes if r['prioridade'] == 'media']
-        baixa_prioridade = [r for r in recomendacoes if r['prioridade'] == 'baixa']
-        
-        # Alta prioridade
-        if alta_prioridade:
-            story.append(Paragraph("🔴 <b>ALTA PRIORIDADE</b>", subtitulo))
-            for rec in alta_prioridade:
-                story.append(Paragraph(f"<b>• {rec['titulo']}</b>", rec_alta))
-                story.append(Paragraph(f"  {rec['descricao']}", styles['Normal']))
-                story.append(Spacer(1, 5))
-        
-        # Média prioridade
-        if media_prioridade:
-            story.append(Paragraph("🟡 <b>MÉDIA PRIORIDADE</b>", subtitulo))
-            for rec in media_prioridade:
-                story.append(Paragraph(f"<b>• {rec['titulo']}</b>", rec_media))
-                story.append(Paragraph(f"  {rec['descricao']}", styles['Normal']))
-                story.append(Spacer(1, 5))
-        
-        # Baixa prioridade
-        if baixa_prioridade:
-            story.append(Paragraph("🔵 <b>BAIXA PRIORIDADE</b>", subtitulo))
-            for rec in baixa_prioridade:
-                story.append(Paragraph(f"<b>• {rec['titulo']}</b>", rec_baixa))
-                story.append(Paragraph(f"  {rec['descricao']}", styles['Normal']))
-                story.append(Spacer(1, 5))
-    else:
-        story.append(Paragraph("Nenhuma recomendação específica no momento. Continue monitorando o progresso das avaliações.", styles['Normal']))
-    
-    story.append(Spacer(1, 20))
-    
-    # ===== 6. RESUMO DE AVALIAÇÕES =====
-    story.append(Paragraph("6. RESUMO DE AVALIAÇÕES", titulo_secao))
-    
-    try:
-        if orgao_id:
-            conn = sqlite3.connect('sistema_cge.db')
-            cursor = conn.cursor()
-            
-            # Contar avaliações por status
-            cursor.execute('''
-                SELECT status, COUNT(*) 
-                FROM avaliacoes 
-                WHERE orgao_id = ? 
-                GROUP BY status
-            ''', (orgao_id,))
-            
-            resultados = cursor.fetchall()
-            
-            if resultados:
-                dados_tabela = [['Status', 'Quantidade']]
-                for status, count in resultados:
-                    status_nome = 'Finalizada' if status == 'finalizada' else 'Em Andamento'
-                    dados_tabela.append([status_nome, str(count)])
-                
-                tabela = Table(dados_tabela, colWidths=[2*inch, 1*inch])
-                tabela.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2e75b6')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 10),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ]))
-                story.append(tabela)
-            else:
-                story.append(Paragraph("Nenhuma avaliação encontrada.", styles['Normal']))
-            
-            conn.close()
-        else:
-            story.append(Paragraph("Órgão não identificado para buscar avaliações.", styles['Normal']))
-            
-    except Exception as e:
-        story.append(Paragraph(f"Erro ao obter resumo: {str(e)}", styles['Normal']))
-    
-    story.append(Spacer(1, 30))
-    
-    # ===== RODAPÉ =====
-    story.append(Paragraph("---", styles['Normal']))
-    story.append(Paragraph("Relatório gerado pelo Sistema de Gestão de Riscos CGE-MT", styles['Normal']))
-    story.append(Paragraph(f"Versão: {datetime.now().strftime('%Y.%m.%d')} | Relatório Completo", styles['Normal']))
-    
-    # Construir PDF
-    doc.build(story)
-    buffer.seek(0)
-    
-    return buffer
-
-def gerar_recomendacoes_inteligentes(maturidade_kpas, avaliacoes_andamento, classificacao, evolucao_temporal):
-    """Gera recomendações inteligentes baseadas nos dados do relatório"""
-    recomendacoes = []
-    
-    # 1. KPAs parcialmente implementados (ALTA PRIORIDADE)
-    kpas_parciais = [k for k in maturidade_kpas if 0 < k['perc_institucionalizadas'] < 100]
-    for kpa in kpas_parciais:
-        faltantes = kpa['total_atividades'] - kpa['atividades_institucionalizadas']
-        recomendacoes.append({
-            'prioridade': 'alta',
-            'titulo': f"Completar {kpa['kpa_codigo']} - {kpa['area_nome']}",
-            'descricao': f"Faltam {faltantes} de {kpa['total_atividades']} atividades para institucionalização completa. Priorize a implementação das atividades pendentes para alcançar 100% de maturidade nesta área."
-        })
-    
-    # 2. Avaliações em andamento com baixo progresso (MÉDIA PRIORIDADE)
-    if avaliacoes_andamento:
-        for avaliacao in avaliacoes_andamento:
-            # Calcular progresso geral da avaliação (simplificado)
-            titulo = avaliacao[1]
-            nivel = avaliacao[2]
-            
-            recomendacoes.append({
-                'prioridade': 'media',
-                'titulo': f"Retomar avaliação \"{titulo}\"",
-                'descricao': f"Avaliação do Nível {nivel} está em andamento. Recomenda-se definir cronograma para conclusão e designar responsáveis para cada KPA pendente."
-            })
-    
-    # 3. Evolução temporal negativa (ALTA PRIORIDADE)
-    if len(evolucao_temporal) >= 2:
-        primeiro = evolucao_temporal[0]
-        ultimo = evolucao_temporal[-1]
-        crescimento = ultimo['maturidade_institucionalizada'] - primeiro['maturidade_institucionalizada']
-        
-        if crescimento < 0:
-            recomendacoes.append({
-                'prioridade': 'alta',
-                'titulo': "Reverter tendência de declínio",
-                'descricao': f"A maturidade apresentou declínio de {abs(crescimento)} pontos percentuais. Recomenda-se revisar os processos implementados e reforçar as práticas de gestão de riscos."
-            })
-    
-    # 4. Próximo nível de maturidade (BAIXA PRIORIDADE)
-    if classificacao and classificacao.get('status') == 'certificado':
-        nivel_atual = classificacao.get('nivel_maturidade', 1)
-        if nivel_atual < 5:
-            proximo_nivel = nivel_atual + 1
-            recomendacoes.append({
-                'prioridade': 'baixa',
-                'titulo': f"Preparar para Nível {proximo_nivel}",
-                'descricao': f"Com o Nível {nivel_atual} certificado, considere iniciar a preparação para avaliação do Nível {proximo_nivel}. Estude os requisitos e planeje a implementação das novas práticas."
-            })
-    
-    # 5. Melhores práticas gerais (BAIXA PRIORIDADE)
-    if len(maturidade_kpas) > 0:
-        kpas_completos = len([k for k in maturidade_kpas if k['perc_institucionalizadas'] == 100])
-        total_kpas = len(maturidade_kpas)
-        
-        if kpas_completos == total_kpas:
-            recomendacoes.append({
-                'prioridade': 'baixa',
-                'titulo': "Manter excelência operacional",
-                'descricao': "Todos os KPAs avaliados estão com 100% de institucionalização. Mantenha as práticas implementadas e considere auditorias periódicas para garantir a continuidade."
-            })
-        elif kpas_completos > total_kpas * 0.7:
-            recomendacoes.append({
-                'prioridade': 'baixa',
-                'titulo': "Consolidar boas práticas",
-                'descricao': f"Boa performance com {kpas_completos} de {total_kpas} KPAs completos. Documente as práticas bem-sucedidas e replique para as áreas pendentes."
-            })
-    
-    # 6. Recomendação de monitoramento (BAIXA PRIORIDADE)
-    recomendacoes.append({
-        'prioridade': 'baixa',
-        'titulo': "Monitoramento contínuo",
-        'descricao': "Estabeleça rotina de monitoramento mensal do progresso das avaliações e revisão trimestral da maturidade em gestão de riscos. Utilize este relatório como baseline para acompanhamento."
-    })
-    
-    return recomendacoes
-
-def obter_area_kpa_segura(kpa_codigo):
-    """Retorna a área do KPA de forma segura"""
-    areas = {
-        '2.1': 'Governança de Riscos',
-        '2.2': 'Identificação de Riscos',
-        '2.3': 'Análise e Avaliação',
-        '2.4': 'Tratamento de Riscos',
-        '2.5': 'Monitoramento e Análise',
-        '2.6': 'Integração Organizacional',
-        '3.1': 'Governança Avançada',
-        '3.2': 'Estratégia e Objetivos',
-        '3.3': 'Implementação Avançada',
-        '3.4': 'Avaliação e Melhoria',
-        '3.5': 'Comunicação e Consulta',
-        '3.6': 'Monitoramento Avançado',
-        '4.1': 'Governança Estratégica',
-        '4.2': 'Estratégia Integrada',
-        '4.3': 'Implementação Otimizada',
-        '4.4': 'Avaliação Contínua',
-        '4.5': 'Comunicação Efetiva',
-        '4.6': 'Monitoramento Estratégico',
-        '5.1': 'Governança Excelente',
-        '5.2': 'Estratégia Inovadora',
-        '5.3': 'Implementação Excelente',
-        '5.4': 'Melhoria Contínua',
-        '5.5': 'Comunicação Integrada',
-        '5.6': 'Monitoramento Inteligente'
-    }
-    return areas.get(kpa_codigo, 'Área não identificada')
-    
-    
 #def gerar_pdf_relatorio_individual(dados_relatorio, dados_usuario):
 #    """Gera PDF completo do relatório individual - VERSÃO ROBUSTA"""
 #    
@@ -3268,19 +2911,39 @@ def exportar_relatorio_individual():
             'usuario_email': user_email
         }
         
-        # Gerar PDF simples
-        pdf_buffer = gerar_pdf_simples(dados_basicos)
-        
         from flask import Response
         from datetime import datetime
         
-        return Response(
-            pdf_buffer.getvalue(),
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename=relatorio_{dados_usuario.get("orgao_sigla", "orgao")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-            }
-        )
+        filename = f'relatorio_{dados_usuario.get("orgao_sigla", "orgao")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+        orgao_id = dados_usuario.get('orgao_id')
+        conn = obter_conexao()
+        
+        if not orgao_id:
+            if exportacao_assincrona():
+                return responder_exportacao(conn, 'individual', user_email,
+                                            carregar_dados_pdf_simples(conn, orgao_id, dados_basicos),
+                                            filename, orgao_id)
+            return Response(
+                gerar_pdf_simples(carregar_dados_pdf_simples(conn, orgao_id, dados_basicos)).getvalue(),
+                mimetype='application/pdf',
+                headers={
+                    'Content-Disposition': f'attachment; filename={filename}'
+                }
+            )
+        
+        # O PDF traz o nome do usuário: ele também faz parte da chave do cache
+        versao = versao_dados_orgao(conn, orgao_id)
+        arquivo = cache_arquivos.obter('individual', orgao_id, 'pdf', versao, dados_basicos)
+        if arquivo is None and exportacao_assincrona():
+            return responder_exportacao(conn, 'individual', user_email,
+                                        carregar_dados_pdf_simples(conn, orgao_id, dados_basicos),
+                                        filename, orgao_id, versao, dados_basicos)
+        if arquivo is None:
+            # Dados coletados de uma vez; a montagem do PDF não acessa o banco
+            pdf_buffer = gerar_pdf_simples(carregar_dados_pdf_simples(conn, orgao_id, dados_basicos))
+            arquivo = cache_arquivos.guardar('individual', orgao_id, 'pdf', versao,
+                                             pdf_buffer.getvalue(), dados_basicos)
+        return enviar_relatorio(arquivo, 'pdf', filename)
         
     except Exception as e:
         logger.error(f"Erro ao exportar relatório: {str(e)}")
@@ -3313,7 +2976,7 @@ def exportar_relatorio_individual():
 #    if not orgao_id:
 #        return jsonify({'success': False, 'message': 'Usuário não vinculado a um órgão'}), 400
 #    
-#    conn = sqlite3.connect(DATABASE)
+#    conn = obter_conexao()
 #    cursor = conn.cursor()
 #    
 #   try:
@@ -3619,12 +3282,22 @@ def exportar_relatorio():
     
     data = request.get_json()
     formato = data.get('formato', 'pdf')
+    assincrona = formato == 'pdf' and exportacao_assincrona()
     
     try:
         # Buscar dados para o relatório
-        conn = sqlite3.connect(DATABASE)
+        conn = obter_conexao()
         cursor = conn.cursor()
         
+        # Relatório de todos os órgãos: versão é a geração global dos dados
+        versao = geracao_dados(conn)
+        nome_arquivo = f'relatorio_consolidado_cge_mt_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{formato}'
+        if formato in MIMETYPES_EXPORTACAO:
+            arquivo = cache_arquivos.obter('consolidado', None, formato, versao)
+            if arquivo:
+                conn.close()
+                return enviar_relatorio(arquivo, formato, nome_arquivo)
+        
         # Dados consolidados
         cursor.execute('SELECT COUNT(*) FROM avaliacoes')
         total_avaliacoes = cursor.fetchone()[0]
@@ -3650,225 +3323,85 @@ def exportar_relatorio():
         ''')
         
         dados_orgaos = cursor.fetchall()
+        
+        if assincrona:
+            dados = {
+                'total_avaliacoes': total_avaliacoes,
+                'avaliacoes_finalizadas': avaliacoes_finalizadas,
+                'orgaos_participantes': orgaos_participantes,
+                'dados_orgaos': [list(row) for row in dados_orgaos]
+            }
+            return responder_exportacao(conn, 'consolidado', user_email, dados, nome_arquivo, versao=versao)
         conn.close()
         
         if formato == 'pdf':
-            return gerar_pdf_relatorio(total_avaliacoes, avaliacoes_finalizadas, orgaos_participantes, dados_orgaos)
+            gerado = montar_pdf_relatorio(total_avaliacoes, avaliacoes_finalizadas, orgaos_participantes, dados_orgaos)
         elif formato == 'xlsx':
-            return gerar_excel_relatorio(total_avaliacoes, avaliacoes_finalizadas, orgaos_participantes, dados_orgaos)
+            gerado = gerar_excel_relatorio(total_avaliacoes, avaliacoes_finalizadas, orgaos_participantes, dados_orgaos)
         elif formato == 'csv':
-            return gerar_csv_relatorio(dados_orgaos)
+            gerado = gerar_csv_relatorio(dados_orgaos)
         else:
             return jsonify({'success': False, 'message': 'Formato não suportado'}), 400
+        
+        arquivo = cache_arquivos.guardar('consolidado', None, formato, versao, corpo_relatorio(gerado))
+        return enviar_relatorio(arquivo, formato, nome_arquivo)
             
     except Exception as e:
         logger.error(f"Erro ao exportar relatório: {str(e)}")
         return jsonify({'success': False, 'message': f'Erro interno: {str(e)}'}), 500
         
         
-def gerar_pdf_relatorio(total_avaliacoes, avaliacoes_finalizadas, orgaos_participantes, dados_orgaos):
-    """Gera relatório consolidado em PDF - VERSÃO CORRIGIDA"""
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT
-    from io import BytesIO
-    from datetime import datetime
-    
-    # Criar buffer em memória
-    buffer = BytesIO()
-    
-    # Criar documento com margens adequadas
-    doc = SimpleDocTemplate(
-        buffer, 
-        pagesize=A4, 
-        rightMargin=50, 
-        leftMargin=50, 
-        topMargin=50, 
-        bottomMargin=50
-    )
-    
-    # Estilos personalizados
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=20,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=15,
-        spaceBefore=20,
-        textColor=colors.darkblue
-    )
-    
-    # Conteúdo do documento
-    story = []
-    
-    # Cabeçalho
-    story.append(Paragraph("RELATÓRIO CONSOLIDADO", title_style))
-    story.append(Paragraph("Sistema de Avaliação de Maturidade CGE-MT", styles['Heading3']))
-    story.append(Spacer(1, 10))
-    story.append(Paragraph(f"Gerado em: {datetime.now().strftime('%d/%m/%Y às %H:%M')}", styles['Normal']))
-    story.append(Spacer(1, 30))
-    
-    # ===== ESTATÍSTICAS GERAIS =====
-    story.append(Paragraph("1. ESTATÍSTICAS GERAIS", subtitle_style))
-    
-    taxa_conclusao = (avaliacoes_finalizadas/total_avaliacoes*100) if total_avaliacoes > 0 else 0
-    
-    estatisticas_data = [
-        ['Métrica', 'Valor'],
-        ['Total de Avaliações', str(total_avaliacoes)],
-        ['Avaliações Finalizadas', str(avaliacoes_finalizadas)],
-        ['Avaliações em Andamento', str(total_avaliacoes - avaliacoes_finalizadas)],
-        ['Órgãos Participantes', str(orgaos_participantes)],
-        ['Taxa de Conclusão', f"{taxa_conclusao:.1f}%"]
-    ]
-    
-    estatisticas_table = Table(estatisticas_data, colWidths=[3.5*inch, 2*inch])
-    estatisticas_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('TOPPADDING', (0, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
-    ]))
-    
-    story.append(estatisticas_table)
-    story.append(Spacer(1, 30))
-    
-    # ===== AVALIAÇÕES POR ÓRGÃO =====
-    story.append(Paragraph("2. AVALIAÇÕES POR ÓRGÃO", subtitle_style))
-    
-    if dados_orgaos:
-        # Cabeçalho da tabela
-        orgaos_data = [['Órgão', 'Sigla', 'Total', 'Finalizadas', 'Em Andamento', 'Taxa (%)']]
-        
-        for orgao in dados_orgaos:
-            nome_orgao = str(orgao[0]) if orgao[0] else 'N/A'
-            sigla_orgao = str(orgao[1]) if orgao[1] else '-'
-            total = int(orgao[2]) if orgao[2] else 0
-            finalizadas = int(orgao[3]) if orgao[3] else 0
-            em_andamento = int(orgao[4]) if orgao[4] else 0
-            
-            # Calcular taxa de conclusão por órgão
-            taxa_orgao = (finalizadas / total * 100) if total > 0 else 0
-            
-            # Quebrar nome longo em múltiplas linhas se necessário
-            if len(nome_orgao) > 40:
-                nome_orgao = nome_orgao[:37] + "..."
-            
-            orgaos_data.append([
-                nome_orgao,
-                sigla_orgao,
-                str(total),
-                str(finalizadas),
-                str(em_andamento),
-                f"{taxa_orgao:.1f}%"
-            ])
-        
-        # Criar tabela com larguras ajustadas
-        orgaos_table = Table(orgaos_data, colWidths=[2.8*inch, 0.8*inch, 0.6*inch, 0.8*inch, 1*inch, 0.8*inch])
-        orgaos_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),  # Nome do órgão alinhado à esquerda
-            ('ALIGN', (1, 0), (-1, -1), 'CENTER'),  # Demais colunas centralizadas
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TOPPADDING', (0, 1), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            # Alternar cores das linhas
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.lightgrey, colors.white])
-        ]))
-        
-        story.append(orgaos_table)
-    else:
-        story.append(Paragraph("Nenhum dado de órgão disponível.", styles['Normal']))
-    
-    story.append(Spacer(1, 30))
-    
-    # ===== RESUMO EXECUTIVO =====
-    story.append(Paragraph("3. RESUMO EXECUTIVO", subtitle_style))
+@app.route('/api/admin/relatorios/exportar-todos', methods=['POST'])
+def exportar_relatorios_todos():
+    """ZIP com o PDF individual de cada órgão, enviado à medida que os PDFs ficam prontos"""
+    user_email = request.headers.get('X-User-Email', '')
     
-    # Análise automática dos dados
-    if total_avaliacoes > 0:
-        if taxa_conclusao >= 80:
-            status_geral = "Excelente"
-        elif taxa_conclusao >= 60:
-            status_geral = "Bom"
-        elif taxa_conclusao >= 40:
-            status_geral = "Regular"
-        else:
-            status_geral = "Necessita Atenção"
-        
-        story.append(Paragraph(f"• <b>Status Geral do Sistema:</b> {status_geral}", styles['Normal']))
-        story.append(Paragraph(f"• <b>Taxa de Conclusão:</b> {taxa_conclusao:.1f}% das avaliações foram finalizadas", styles['Normal']))
-        story.append(Paragraph(f"• <b>Participação:</b> {orgaos_participantes} órgãos estão participando do processo de avaliação", styles['Normal']))
-        
-        # Identificar órgão com melhor desempenho
-        if dados_orgaos:
-            melhor_orgao = None
-            melhor_taxa = 0
-            
-            for orgao in dados_orgaos:
-                total_orgao = int(orgao[2]) if orgao[2] else 0
-                finalizadas_orgao = int(orgao[3]) if orgao[3] else 0
-                
-                if total_orgao > 0:
-                    taxa_orgao = (finalizadas_orgao / total_orgao * 100)
-                    if taxa_orgao > melhor_taxa:
-                        melhor_taxa = taxa_orgao
-                        melhor_orgao = orgao[0]
-            
-            if melhor_orgao and melhor_taxa > 0:
-                story.append(Paragraph(f"• <b>Melhor Desempenho:</b> {melhor_orgao} ({melhor_taxa:.1f}% de conclusão)", styles['Normal']))
-    else:
-        story.append(Paragraph("• Nenhuma avaliação foi iniciada no sistema.", styles['Normal']))
+    if not verificar_permissao(user_email, 'visualizar_relatorios_gerais'):
+        return jsonify({'success': False, 'message': 'Sem permissão para exportar relatórios'}), 403
     
-    # Rodapé
-    story.append(Spacer(1, 50))
-    story.append(Paragraph("---", styles['Normal']))
-    story.append(Paragraph("Relatório gerado automaticamente pelo Sistema CGE-MT", styles['Normal']))
-    story.append(Paragraph("Controladoria Geral do Estado de Mato Grosso", styles['Normal']))
+    dados_usuario = obter_dados_usuario(user_email)
+    if not dados_usuario:
+        return jsonify({'success': False, 'message': 'Usuário não encontrado'}), 404
     
-    # Gerar PDF
-    doc.build(story)
+    conn = obter_conexao()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, nome, sigla FROM orgaos ORDER BY nome, id')
+    orgaos = []
+    for orgao_id, nome, sigla in cursor.fetchall():
+        nome_arquivo = f"relatorio_{secure_filename(sigla or nome or '') or 'orgao'}_{orgao_id}.pdf"
+        orgaos.append((orgao_id, nome_arquivo, {
+            'orgao_nome': nome or 'N/A',
+            'orgao_sigla': sigla or 'N/A',
+            'usuario_nome': dados_usuario.get('nome', 'N/A'),
+            'usuario_email': user_email
+        }))
+    conn.close()
     
-    # Preparar resposta
-    buffer.seek(0)
+    lote_id = lotes_exportacao.criar(user_email, len(orgaos))
+    nome_zip = f'relatorios_orgaos_cge_mt_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
     
+    # O gerador roda depois do fim da requisição: só usa os dados já lidos
     from flask import Response
     return Response(
-        buffer.getvalue(),
-        mimetype='application/pdf',
+        lotes_exportacao.gerar_zip(lote_id, orgaos, pool_conexoes.caminho),
+        mimetype='application/zip',
         headers={
-            'Content-Disposition': f'attachment; filename=relatorio_consolidado_cge_mt_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+            'Content-Disposition': f'attachment; filename={nome_zip}',
+            'X-Exportacao-Lote': lote_id,
+            'X-Exportacao-Progresso': f'/api/admin/relatorios/exportar-todos/{lote_id}'
         }
     )
 
+@app.route('/api/admin/relatorios/exportar-todos/<lote_id>', methods=['GET'])
+def progresso_exportacao_todos(lote_id):
+    """Progresso de uma exportação em lote do usuário"""
+    user_email = request.headers.get('X-User-Email', '')
+    
+    progresso = lotes_exportacao.obter(lote_id, user_email)
+    if not progresso:
+        return jsonify({'success': False, 'message': 'Exportação não encontrada'}), 404
+    return jsonify({'success': True, 'lote': progresso})
+
 def gerar_excel_relatorio(total_avaliacoes, avaliacoes_finalizadas, orgaos_participantes, dados_orgaos):
     """Gera relatório em Excel"""
     import pandas as pd
@@ -3901,7 +3434,7 @@ def gerar_excel_relatorio(total_avaliacoes, avaliacoes_finalizadas, orgaos_parti
         
         # Aba de informações
         info_df = pd.DataFrame({
-            'Informação': ['Data de Geração', 'Sistema', 'Versão'],
+            'Informação': ['Dados apurados em', 'Sistema', 'Versão'],
             'Valor': [datetime.now().strftime('%d/%m/%Y %H:%M:%S'), 'Sistema CGE-MT', '4.2']
         })
         info_df.to_excel(writer, sheet_name='Informações', index=False)
@@ -3951,7 +3484,7 @@ def dashboard():
     """Dados do dashboard"""
     user_email = request.headers.get('X-User-Email', '')
     
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     # Contar avaliações por status
@@ -3999,7 +3532,7 @@ def dashboard():
     
 def atualizar_permissoes_admin():
     """Atualiza permissões do administrador com novas permissões"""
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     # Buscar perfil Administrador CGE
@@ -4026,10 +3559,12 @@ def atualizar_permissoes_admin():
         cursor.execute('UPDATE perfis SET permissoes = ? WHERE id = ?', (novas_permissoes, perfil_id))
         conn.commit()
         print(f"✅ Permissões do Administrador CGE atualizadas")
+    
+    conn.close()
         
 def corrigir_vinculacao_admin():
     """Corrige vinculação do usuário admin ao órgão CGE"""
-    conn = sqlite3.connect(DATABASE)
+    conn = obter_conexao()
     cursor = conn.cursor()
     
     # Buscar ID do órgão CGE
@@ -4065,6 +3600,15 @@ if __name__ == '__main__':
     init_db()
     #atualizar_permissoes_admin()
     corrigir_vinculacao_admin()
+    
+    if app.config['SNAPSHOT_DIARIO']:
+        agendador_snapshots.iniciar()
+        logger.info("📸 Retrato diário de maturidade agendado")
+    
+    # Pool de exportação e retomada dos jobs interrompidos
+    fila_exportacoes.iniciar()
+    # Tema dos PDFs das exportações síncronas, montado antes da primeira requisição
+    aquecer_tema()
 
     logger.info("✅ Tabelas do banco de dados criadas")
     logger.info("👥 Sistema de gestão de usuários habilitado")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Máscaras de bits das respostas de cada avaliação.
+
+Cada avaliação tem três máscaras (respondidas, instituídas e
+institucionalizadas) em que o bit i corresponde à i-ésima atividade do
+modelo compilado (ModeloCompilado.posicao_por_atividade). Com elas:
+- o nível N está completo quando (institucionalizadas & mascara_nivel) == mascara_nivel;
+- as contagens por nível ou KPA são popcounts de (mascara & mascara_nivel_ou_kpa).
+
+As máscaras ficam na tabela avaliacao_mascaras como BLOB. Cada linha guarda
+a versao_respostas da avaliação (incrementada por trigger a cada mudança em
+respostas) e a assinatura do modelo com que foi montada; se qualquer uma
+das duas não bater, a linha é remontada na próxima leitura.
+"""
+
+from collections import namedtuple
+
+from model_registry import modelo_atual
+
+MascarasAvaliacao = namedtuple('MascarasAvaliacao', 'respondidas instituidas institucionalizadas')
+
+MASCARAS_VAZIAS = MascarasAvaliacao(0, 0, 0)
+
+
+def codificar(mascara):
+    """int -> BLOB (little-endian)"""
+    return mascara.to_bytes((mascara.bit_length() + 7) // 8 or 1, 'little')
+
+
+def decodificar(blob):
+    """BLOB -> int"""
+    return int.from_bytes(blob or b'', 'little')
+
+
+def contar_bits(mascara):
+    """Popcount (int.bit_count() só existe a partir do Python 3.10)"""
+    return bin(mascara).count('1')
+
+
+def contar(mascara, referencia):
+    """Quantos bits da referência estão ligados na máscara"""
+    return contar_bits(mascara & referencia)
+
+
+def montar_mascaras(modelo, respostas):
+    """Máscaras a partir de (atividade_id, instituido, institucionalizado)"""
+    respondidas = instituidas = institucionalizadas = 0
+    posicoes = modelo.posicao_por_atividade
+    for atividade_id, instituido, institucionalizado in respostas:
+        posicao = posicoes.get(atividade_id)
+        if posicao is None:
+            continue
+        bit = 1 << posicao
+        respondidas |= bit
+        if instituido:
+            instituidas |= bit
+        if institucionalizado:
+            institucionalizadas |= bit
+    return MascarasAvaliacao(respondidas, instituidas, institucionalizadas)
+
+
+def nivel_completo(mascaras, modelo, nivel):
+    """Todas as atividades do nível respondidas e institucionalizadas"""
+    mascara_nivel = modelo.mascara_por_nivel.get(nivel, 0)
+    return mascara_nivel != 0 and (mascaras.institucionalizadas & mascara_nivel) == mascara_nivel
+
+
+def contagem_por_kpa(mascaras, modelo, kpas):
+    """{kpa: {'total_esperadas', 'respondidas', 'instituidas', 'institucionalizadas'}}"""
+    contagem = {}
+    for kpa_codigo in kpas:
+        mascara_kpa = modelo.mascara_por_kpa.get(kpa_codigo, 0)
+        contagem[kpa_codigo] = {
+            'total_esperadas': contar_bits(mascara_kpa),
+            'respondidas': contar(mascaras.respondidas, mascara_kpa),
+            'instituidas': contar(mascaras.instituidas, mascara_kpa),
+            'institucionalizadas': contar(mascaras.institucionalizadas, mascara_kpa)
+        }
+    return contagem
+
+
+def remontar_mascaras(conn, versoes):
+    """
+    Remonta e grava as máscaras das avaliações ({avaliacao_id: versao_respostas}).
+
+    Uma única consulta em respostas para todas elas. Não faz commit.
+    Retorna {avaliacao_id: MascarasAvaliacao}.
+    """
+    if not versoes:
+        return {}
+
+    modelo = modelo_atual()
+    ids = list(versoes)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT avaliacao_id, atividade_id, instituido, institucionalizado
+        FROM respostas
+        WHERE avaliacao_id IN ({', '.join(['?'] * len(ids))})
+    ''', ids)
+
+    respostas = {avaliacao_id: [] for avaliacao_id in ids}
+    for avaliacao_id, *resposta in cursor.fetchall():
+        respostas[avaliacao_id].append(resposta)
+
+    mascaras = {avaliacao_id: montar_mascaras(modelo, linhas) for avaliacao_id, linhas in respostas.items()}
+
+    cursor.executemany('''
+        INSERT INTO avaliacao_mascaras (
+            avaliacao_id, versao_respostas, assinatura_modelo,
+            respondidas, instituidas, institucionalizadas
+        ) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (avaliacao_id) DO UPDATE SET
+            versao_respostas = excluded.versao_respostas,
+            assinatura_modelo = excluded.assinatura_modelo,
+            respondidas = excluded.respondidas,
+            instituidas = excluded.instituidas,
+            institucionalizadas = excluded.institucionalizadas
+    ''', [(
+        avaliacao_id,
+        versoes[avaliacao_id],
+        modelo.assinatura,
+        codificar(m.respondidas),
+        codificar(m.instituidas),
+        codificar(m.institucionalizadas)
+    ) for avaliacao_id, m in mascaras.items()])
+
+    return mascaras
+
+
+def mascaras_atualizadas(modelo, linha):
+    """
+    Máscaras de uma linha (versao_avaliacao, versao_mascara, assinatura,
+    respondidas, instituidas, institucionalizadas) ou None se estiver desatualizada.
+    """
+    versao_avaliacao, versao_mascara, assinatura, *blobs = linha
+    if versao_mascara is None or versao_mascara != versao_avaliacao or assinatura != modelo.assinatura:
+        return None
+    return MascarasAvaliacao(*(decodificar(blob) for blob in blobs))
+
+
+def obter_mascaras(conn, avaliacao_ids):
+    """
+    Máscaras das avaliações ({avaliacao_id: MascarasAvaliacao}).
+
+    Avaliações sem máscara ou com máscara desatualizada são remontadas e
+    gravadas (sem commit).
+    """
+    avaliacao_ids = list(avaliacao_ids)
+    if not avaliacao_ids:
+        return {}
+
+    modelo = modelo_atual()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT a.id, a.versao_respostas, m.versao_respostas, m.assinatura_modelo,
+               m.respondidas, m.instituidas, m.institucionalizadas
+        FROM avaliacoes a
+        LEFT JOIN avaliacao_mascaras m ON m.avaliacao_id = a.id
+        WHERE a.id IN ({', '.join(['?'] * len(avaliacao_ids))})
+    ''', avaliacao_ids)
+
+    mascaras = {}
+    desatualizadas = {}
+    for avaliacao_id, *linha in cursor.fetchall():
+        atual = mascaras_atualizadas(modelo, linha)
+        if atual is None:
+            desatualizadas[avaliacao_id] = linha[0]
+        else:
+            mascaras[avaliacao_id] = atual
+
+    mascaras.update(remontar_mascaras(conn, desatualizadas))
+    return mascaras
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Classificação do nível de maturidade dos órgãos.
+
+Critérios de certificação do nível N:
+- deve existir avaliação finalizada para cada nível de 2 até N (vale a mais
+  recente de cada nível);
+- TODAS as atividades do modelo para esses níveis devem estar respondidas
+  e institucionalizadas.
+
+A classificação de qualquer número de órgãos é feita com uma única consulta:
+ROW_NUMBER() escolhe a avaliação finalizada mais recente por (órgão, nível)
+e traz as máscaras de bits das respostas (mascaras.py); a certificação de
+cada nível é um AND com a máscara do nível.
+
+O resultado fica materializado na tabela orgao_maturidade, com a completude
+de cada nível (completude_niveis) como resultado parcial. A certificação do
+nível N depende só dos níveis 2..N e a completude de cada nível depende só
+da avaliação finalizada mais recente daquele nível. Por isso, quando uma
+avaliação é finalizada ou muda uma resposta de avaliação finalizada, só o
+(órgão, nível) da avaliação é recalculado (e apenas se as atividades
+alteradas forem daquele nível); os demais níveis vêm do resultado gravado e
+a classificação é remontada a partir deles. As leituras usam a tabela e só
+recalculam órgãos ausentes ou calculados com outra versão do modelo.
+"""
+
+import json
+from datetime import datetime
+
+from model_registry import modelo_atual
+from mascaras import mascaras_atualizadas, remontar_mascaras, contar, nivel_completo
+
+NIVEIS_CERTIFICAVEIS = (2, 3, 4, 5)
+
+
+def classificacao_inicial(completude_niveis=None):
+    """Classificação de órgão que não atende aos critérios de nenhum nível"""
+    return {
+        'nivel_maturidade': 1,
+        'status': 'inicial',
+        'descricao': 'Nível Inicial - Critérios de certificação não atendidos',
+        'data_certificacao': None,
+        'criterios_atendidos': False,
+        'detalhes': 'Nem todas as atividades dos níveis estão institucionalizadas ou avaliações não finalizadas',
+        'completude_niveis': completude_niveis or {}
+    }
+
+
+def classificacao_certificada(nivel, completude_niveis, data_certificacao=None):
+    return {
+        'nivel_maturidade': nivel,
+        'status': 'certificado',
+        'descricao': f'Nível {nivel} de Maturidade em Gestão de Riscos',
+        'data_certificacao': data_certificacao or datetime.now().isoformat(),
+        'criterios_atendidos': True,
+        'detalhes': f'Todas as atividades dos níveis 2 a {nivel} estão institucionalizadas',
+        'completude_niveis': completude_niveis
+    }
+
+
+def nivel_certificado(completude_niveis):
+    """Maior nível N tal que todos os níveis de 2 a N estão completos (1 se nenhum)"""
+    nivel = 1
+    for candidato in NIVEIS_CERTIFICAVEIS:
+        dados = completude_niveis.get(candidato)
+        if not dados or not dados['completo']:
+            break
+        nivel = candidato
+    return nivel
+
+
+def classificar(completude_niveis, data_certificacao=None):
+    """Monta a classificação a partir da completude de cada nível"""
+    nivel = nivel_certificado(completude_niveis)
+    if nivel >= 2:
+        return classificacao_certificada(nivel, completude_niveis, data_certificacao)
+    return classificacao_inicial(completude_niveis)
+
+
+def ultimas_avaliacoes_finalizadas(conn, orgao_ids=None, niveis=NIVEIS_CERTIFICAVEIS, ate=None):
+    """
+    Avaliação finalizada mais recente de cada (órgão, nível), com as
+    máscaras de bits das respostas.
+
+    Uma consulta escolhe as avaliações (ROW_NUMBER) e traz as máscaras;
+    as ausentes ou desatualizadas são remontadas (sem commit). Com ate
+    ('AAAA-MM-DD HH:MM:SS'), só valem as avaliações finalizadas até essa data
+    (data_atualizacao é gravada na finalização). Retorna tuplas
+    (orgao_id, nivel, avaliacao_id, titulo, data_criacao, mascaras).
+    """
+    modelo = modelo_atual()
+
+    niveis = list(niveis)
+    if not niveis:
+        return []
+
+    parametros = list(niveis)
+    filtro_orgaos = ''
+    if orgao_ids is not None:
+        orgao_ids = list(orgao_ids)
+        if not orgao_ids:
+            return []
+        filtro_orgaos = f"AND orgao_id IN ({', '.join(['?'] * len(orgao_ids))})"
+        parametros.extend(orgao_ids)
+
+    filtro_data = ''
+    if ate is not None:
+        filtro_data = 'AND COALESCE(data_atualizacao, data_criacao) <= ?'
+        parametros.append(ate)
+
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        WITH ultimas AS (
+            SELECT id, orgao_id, nivel_desejado, titulo, data_criacao, versao_respostas,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY orgao_id, nivel_desejado
+                       ORDER BY data_criacao DESC, id DESC
+                   ) AS ordem
+            FROM avaliacoes
+            WHERE status = 'finalizada'
+              AND nivel_desejado IN ({', '.join(['?'] * len(niveis))})
+              {filtro_orgaos}
+              {filtro_data}
+        )
+        SELECT u.orgao_id, u.nivel_desejado, u.id, u.titulo, u.data_criacao,
+               u.versao_respostas, m.versao_respostas, m.assinatura_modelo,
+               m.respondidas, m.instituidas, m.institucionalizadas
+        FROM ultimas u
+        LEFT JOIN avaliacao_mascaras m ON m.avaliacao_id = u.id
+        WHERE u.ordem = 1
+    ''', parametros)
+
+    avaliacoes = []
+    mascaras = {}
+    desatualizadas = {}
+    for orgao_id, nivel, avaliacao_id, titulo, data_criacao, *linha in cursor.fetchall():
+        avaliacoes.append((orgao_id, nivel, avaliacao_id, titulo, data_criacao))
+        atual = mascaras_atualizadas(modelo, linha)
+        if atual is None:
+            desatualizadas[avaliacao_id] = linha[0]
+        else:
+            mascaras[avaliacao_id] = atual
+    mascaras.update(remontar_mascaras(conn, desatualizadas))
+
+    return [avaliacao + (mascaras[avaliacao[2]],) for avaliacao in avaliacoes]
+
+
+def completude_nivel(modelo, nivel, avaliacao_id, titulo, data_criacao, mascaras):
+    """
+    Completude de um nível a partir da avaliação finalizada mais recente dele.
+
+    É um AND com a máscara do nível e as contagens são popcounts.
+    """
+    mascara_nivel = modelo.mascara_por_nivel.get(nivel, 0)
+    total = modelo.total_por_nivel.get(nivel, 0)
+    respondidas = contar(mascaras.respondidas, mascara_nivel)
+    institucionalizadas = contar(mascaras.institucionalizadas, mascara_nivel)
+    return {
+        'avaliacao_id': avaliacao_id,
+        'titulo_avaliacao': titulo,
+        'data_avaliacao': data_criacao,
+        'total_esperadas': total,
+        'total_respondidas': respondidas,
+        'total_institucionalizadas': institucionalizadas,
+        'percentual_completude': int((respondidas / total) * 100) if total > 0 else 0,
+        'percentual_institucionalizacao': int((institucionalizadas / total) * 100) if total > 0 else 0,
+        'completo': nivel_completo(mascaras, modelo, nivel)
+    }
+
+
+def consultar_completude_niveis(conn, orgao_ids=None, niveis=NIVEIS_CERTIFICAVEIS, ate=None):
+    """
+    Completude da avaliação finalizada mais recente de cada (órgão, nível).
+
+    Retorna {orgao_id: {nivel: {...}}}; órgãos sem avaliação finalizada não
+    aparecem no resultado.
+    """
+    modelo = modelo_atual()
+
+    completude = {}
+    for orgao_id, nivel, *avaliacao in ultimas_avaliacoes_finalizadas(conn, orgao_ids, niveis, ate):
+        completude.setdefault(orgao_id, {})[nivel] = completude_nivel(modelo, nivel, *avaliacao)
+
+    return completude
+
+
+def classificar_orgaos(conn, orgao_ids=None, ate=None):
+    """
+    Classifica vários órgãos de uma vez.
+
+    Sem orgao_ids, classifica todos os órgãos cadastrados. Com ate, usa só
+    as avaliações finalizadas até a data. Retorna {orgao_id: classificacao},
+    no mesmo formato de calcular_nivel_maturidade_orgao.
+    """
+    if orgao_ids is None:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM orgaos')
+        orgao_ids = [row[0] for row in cursor.fetchall()]
+        completude = consultar_completude_niveis(conn, ate=ate)
+    else:
+        orgao_ids = list(orgao_ids)
+        completude = consultar_completude_niveis(conn, orgao_ids, ate=ate)
+
+    return {orgao_id: classificar(completude.get(orgao_id, {})) for orgao_id in orgao_ids}
+
+
+# ===== CLASSIFICAÇÃO MATERIALIZADA (orgao_maturidade) =====
+
+def atualizar_maturidade_orgaos(conn, orgao_ids):
+    """
+    Recalcula e grava a classificação dos órgãos informados.
+
+    Não faz commit: a gravação entra na transação de quem chamou (a mesma
+    escrita que alterou as avaliações ou respostas).
+    """
+    orgao_ids = list(orgao_ids)
+    if not orgao_ids:
+        return {}
+
+    classificacoes = classificar_orgaos(conn, orgao_ids)
+    gravar_classificacoes(conn, classificacoes)
+    return classificacoes
+
+
+def gravar_classificacoes(conn, classificacoes):
+    """Grava {orgao_id: classificacao} em orgao_maturidade (sem commit)"""
+    assinatura = modelo_atual().assinatura
+    conn.executemany('''
+        INSERT INTO orgao_maturidade (
+            orgao_id, nivel_maturidade, status, completude_niveis,
+            assinatura_modelo, data_certificacao
+        ) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (orgao_id) DO UPDATE SET
+            completude_niveis = excluded.completude_niveis,
+            assinatura_modelo = excluded.assinatura_modelo,
+            -- a data de certificação só muda quando o nível muda
+            data_certificacao = CASE
+                WHEN orgao_maturidade.nivel_maturidade = excluded.nivel_maturidade
+                     AND orgao_maturidade.status = excluded.status
+                THEN orgao_maturidade.data_certificacao
+                ELSE excluded.data_certificacao
+            END,
+            nivel_maturidade = excluded.nivel_maturidade,
+            status = excluded.status,
+            versao = orgao_maturidade.versao + 1,
+            data_atualizacao = CURRENT_TIMESTAMP
+    ''', [(
+        orgao_id,
+        classificacao['nivel_maturidade'],
+        classificacao['status'],
+        json.dumps(classificacao['completude_niveis']),
+        assinatura,
+        classificacao['data_certificacao']
+    ) for orgao_id, classificacao in classificacoes.items()])
+
+
+# ===== RECÁLCULO INCREMENTAL =====
+
+def niveis_afetados(modelo, nivel_avaliacao, atividade_ids=None):
+    """
+    Níveis cuja completude pode mudar com a alteração de uma avaliação.
+
+    Só o nível da própria avaliação conta, e só se alguma das atividades
+    alteradas for desse nível (sem atividade_ids, o nível é sempre afetado).
+    """
+    if nivel_avaliacao not in NIVEIS_CERTIFICAVEIS:
+        return set()
+    if atividade_ids is None:
+        return {nivel_avaliacao}
+    if any(modelo.nivel_por_atividade.get(a) == nivel_avaliacao for a in atividade_ids):
+        return {nivel_avaliacao}
+    return set()
+
+
+def atualizar_niveis_orgao(conn, orgao_id, niveis):
+    """
+    Recalcula só a completude dos níveis informados do órgão e remonta a
+    classificação com os demais níveis vindos de orgao_maturidade.
+
+    Sem resultado gravado (ou gravado com outra versão do modelo), recalcula
+    o órgão inteiro. Não faz commit.
+    """
+    modelo = modelo_atual()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT nivel_maturidade, status, completude_niveis, assinatura_modelo, data_certificacao
+        FROM orgao_maturidade WHERE orgao_id = ?
+    ''', (orgao_id,))
+    gravada = cursor.fetchone()
+    if not gravada or gravada[3] != modelo.assinatura:
+        return atualizar_maturidade_orgaos(conn, [orgao_id])[orgao_id]
+
+    nivel_anterior, status_anterior, completude_json, _, data_certificacao = gravada
+    completude = {int(n): dados for n, dados in json.loads(completude_json or '{}').items()}
+
+    recalculada = consultar_completude_niveis(conn, [orgao_id], niveis).get(orgao_id, {})
+    for nivel in niveis:
+        if nivel in recalculada:
+            completude[nivel] = recalculada[nivel]
+        else:
+            completude.pop(nivel, None)
+
+    classificacao = classificar(completude)
+    if (classificacao['nivel_maturidade'], classificacao['status']) == (nivel_anterior, status_anterior):
+        classificacao['data_certificacao'] = data_certificacao
+
+    gravar_classificacoes(conn, {orgao_id: classificacao})
+    return classificacao
+
+
+def atualizar_maturidade_avaliacao(conn, avaliacao_id, somente_finalizada=True, atividade_ids=None):
+    """
+    Atualiza a classificação do órgão dono da avaliação após uma alteração.
+
+    Com somente_finalizada, avaliações em andamento são ignoradas (as
+    respostas delas não contam para a certificação). atividade_ids são as
+    atividades alteradas (salvamento de respostas); sem elas, considera-se
+    que a avaliação inteira mudou (finalização). Retorna a classificação, ou
+    None quando nenhum nível foi afetado.
+    """
+    cursor = conn.cursor()
+    cursor.execute('SELECT orgao_id, status, nivel_desejado FROM avaliacoes WHERE id = ?', (avaliacao_id,))
+    resultado = cursor.fetchone()
+    if not resultado or resultado[0] is None:
+        return None
+
+    orgao_id, status, nivel = resultado
+    if somente_finalizada and status != 'finalizada':
+        return None
+
+    niveis = niveis_afetados(modelo_atual(), nivel, atividade_ids)
+    if not niveis:
+        return None
+
+    return atualizar_niveis_orgao(conn, orgao_id, niveis)
+
+
+def obter_maturidades(conn, orgao_ids=None):
+    """
+    Lê a classificação materializada dos órgãos ({orgao_id: classificacao}).
+
+    Órgãos ainda não materializados, ou calculados com outra versão do
+    modelo, são recalculados e gravados nesta mesma chamada.
+    """
+    cursor = conn.cursor()
+    if orgao_ids is None:
+        cursor.execute('''
+            SELECT o.id, m.nivel_maturidade, m.completude_niveis, m.assinatura_modelo, m.data_certificacao
+            FROM orgaos o
+            LEFT JOIN orgao_maturidade m ON m.orgao_id = o.id
+        ''')
+    else:
+        orgao_ids = list(orgao_ids)
+        if not orgao_ids:
+            return {}
+        cursor.execute(f'''
+            SELECT o.id, m.nivel_maturidade, m.completude_niveis, m.assinatura_modelo, m.data_certificacao
+            FROM orgaos o
+            LEFT JOIN orgao_maturidade m ON m.orgao_id = o.id
+            WHERE o.id IN ({', '.join(['?'] * len(orgao_ids))})
+        ''', orgao_ids)
+
+    assinatura = modelo_atual().assinatura
+    maturidades = {}
+    pendentes = []
+
+    for orgao_id, nivel, completude_json, assinatura_modelo, data_certificacao in cursor.fetchall():
+        if nivel is None or assinatura_modelo != assinatura:
+            pendentes.append(orgao_id)
+            continue
+        completude = {int(n): dados for n, dados in json.loads(completude_json or '{}').items()}
+        maturidades[orgao_id] = classificar(completude, data_certificacao)
+
+    if pendentes:
+        maturidades.update(atualizar_maturidade_orgaos(conn, pendentes))
+        conn.commit()
+
+    # Órgãos inexistentes recebem a classificação inicial
+    for orgao_id in orgao_ids or []:
+        maturidades.setdefault(orgao_id, classificacao_inicial())
+
+    return maturidades
@@ -0,0 +1,650 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Migrações versionadas do esquema SQLite.
+
+Cada migração tem um número de versão, uma descrição e uma função que recebe
+o cursor e as opções da aplicação (ex.: pasta_uploads). As versões aplicadas
+ficam registradas na tabela schema_version, e cada migração roda na sua
+própria transação: ou é aplicada por inteiro ou não é registrada.
+"""
+
+import json
+import logging
+
+from anexos import TIPOS_ANEXO, CAMPO_POR_TIPO, metadados_arquivo, normalizar_item
+
+logger = logging.getLogger(__name__)
+
+
+def coluna_existe(cursor, tabela, coluna):
+    """Verifica se a coluna já existe na tabela"""
+    cursor.execute(f'PRAGMA table_info({tabela})')
+    return any(row[1] == coluna for row in cursor.fetchall())
+
+
+def _m001_orgao_superior(cursor, opcoes):
+    # Bancos antigos foram criados antes da hierarquia de órgãos
+    if not coluna_existe(cursor, 'orgaos', 'orgao_superior_id'):
+        cursor.execute('ALTER TABLE orgaos ADD COLUMN orgao_superior_id INTEGER')
+
+
+def _m002_indices_consultas(cursor, opcoes):
+    # "Avaliação finalizada mais recente por nível" e contagens por status
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_avaliacoes_orgao_status_nivel_data
+        ON avaliacoes (orgao_id, status, nivel_desejado, data_criacao DESC)
+    ''')
+
+    # Respostas duplicadas (salvas em paralelo) impedem o índice único:
+    # mantém apenas a gravação mais recente de cada atividade
+    cursor.execute('''
+        DELETE FROM respostas
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM respostas GROUP BY avaliacao_id, atividade_id
+        )
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_respostas_avaliacao_atividade
+        ON respostas (avaliacao_id, atividade_id)
+    ''')
+
+    # Login e verificação de permissão filtram por email e ativo
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_usuarios_email_ativo
+        ON usuarios (email, ativo)
+    ''')
+
+
+def _m003_orgao_maturidade(cursor, opcoes):
+    # Classificação materializada por órgão; preenchida sob demanda e
+    # recalculada nas escritas que afetam a certificação
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orgao_maturidade (
+            orgao_id INTEGER PRIMARY KEY,
+            nivel_maturidade INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            completude_niveis TEXT, -- JSON com a completude de cada nível
+            assinatura_modelo TEXT,
+            data_certificacao TIMESTAMP,
+            data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (orgao_id) REFERENCES orgaos (id)
+        )
+    ''')
+
+
+def _m004_contadores_respostas(cursor, opcoes):
+    # Contadores de respostas por avaliação, mantidos pelos triggers abaixo
+    for coluna in ('total_respostas', 'total_instituidas', 'total_institucionalizadas'):
+        if not coluna_existe(cursor, 'avaliacoes', coluna):
+            cursor.execute(f'ALTER TABLE avaliacoes ADD COLUMN {coluna} INTEGER NOT NULL DEFAULT 0')
+
+    cursor.execute('''
+        UPDATE avaliacoes SET
+            total_respostas = (
+                SELECT COUNT(*) FROM respostas r WHERE r.avaliacao_id = avaliacoes.id
+            ),
+            total_instituidas = (
+                SELECT COUNT(*) FROM respostas r
+                WHERE r.avaliacao_id = avaliacoes.id AND r.instituido = 1
+            ),
+            total_institucionalizadas = (
+                SELECT COUNT(*) FROM respostas r
+                WHERE r.avaliacao_id = avaliacoes.id AND r.institucionalizado = 1
+            )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_respostas_contadores_insert
+        AFTER INSERT ON respostas
+        BEGIN
+            UPDATE avaliacoes SET
+                total_respostas = total_respostas + 1,
+                total_instituidas = total_instituidas + (NEW.instituido IS 1),
+                total_institucionalizadas = total_institucionalizadas + (NEW.institucionalizado IS 1)
+            WHERE id = NEW.avaliacao_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_respostas_contadores_delete
+        AFTER DELETE ON respostas
+        BEGIN
+            UPDATE avaliacoes SET
+                total_respostas = total_respostas - 1,
+                total_instituidas = total_instituidas - (OLD.instituido IS 1),
+                total_institucionalizadas = total_institucionalizadas - (OLD.institucionalizado IS 1)
+            WHERE id = OLD.avaliacao_id;
+        END
+    ''')
+    # Também cobre a troca de avaliacao_id: subtrai da antiga e soma na nova
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_respostas_contadores_update
+        AFTER UPDATE OF avaliacao_id, instituido, institucionalizado ON respostas
+        BEGIN
+            UPDATE avaliacoes SET
+                total_respostas = total_respostas - 1,
+                total_instituidas = total_instituidas - (OLD.instituido IS 1),
+                total_institucionalizadas = total_institucionalizadas - (OLD.institucionalizado IS 1)
+            WHERE id = OLD.avaliacao_id;
+            UPDATE avaliacoes SET
+                total_respostas = total_respostas + 1,
+                total_instituidas = total_instituidas + (NEW.instituido IS 1),
+                total_institucionalizadas = total_institucionalizadas + (NEW.institucionalizado IS 1)
+            WHERE id = NEW.avaliacao_id;
+        END
+    ''')
+
+
+def _m005_indices_listagens(cursor, opcoes):
+    # Paginação por (nome, id) sem diferenciar maiúsculas, com e sem filtros
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_usuarios_nome
+        ON usuarios (nome COLLATE NOCASE, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_usuarios_orgao_nome
+        ON usuarios (orgao_id, nome COLLATE NOCASE, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_usuarios_perfil_nome
+        ON usuarios (perfil_id, nome COLLATE NOCASE, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_usuarios_ativo_nome
+        ON usuarios (ativo, nome COLLATE NOCASE, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orgaos_nome
+        ON orgaos (nome COLLATE NOCASE, id)
+    ''')
+
+    # Avaliações do usuário, da mais recente para a mais antiga
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_avaliacoes_usuario_data
+        ON avaliacoes (usuario_email, data_criacao DESC, id DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_avaliacoes_usuario_status_data
+        ON avaliacoes (usuario_email, status, data_criacao DESC, id DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_avaliacoes_usuario_orgao_data
+        ON avaliacoes (usuario_email, orgao_id, data_criacao DESC, id DESC)
+    ''')
+
+
+def _m006_anexos(cursor, opcoes):
+    # Arquivos de evidência, antes guardados como JSON em respostas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS anexos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            resposta_id INTEGER NOT NULL,
+            tipo TEXT NOT NULL, -- 'instituido' ou 'institucionalizado'
+            nome TEXT,          -- nome original do arquivo
+            filename TEXT NOT NULL,
+            size INTEGER,
+            sha256 TEXT,
+            mime TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (resposta_id) REFERENCES respostas (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_anexos_resposta_tipo_arquivo
+        ON anexos (resposta_id, tipo, filename)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_anexos_sha256
+        ON anexos (sha256)
+    ''')
+
+    # Sem FOREIGN KEYS ativas, a remoção em cascata é feita por trigger
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_respostas_remove_anexos
+        AFTER DELETE ON respostas
+        BEGIN
+            DELETE FROM anexos WHERE resposta_id = OLD.id;
+        END
+    ''')
+
+    # Explode o JSON existente em linhas de anexos
+    cursor.execute(f'''
+        SELECT id, {', '.join(CAMPO_POR_TIPO[tipo] for tipo in TIPOS_ANEXO)}
+        FROM respostas
+        WHERE {' OR '.join(f"COALESCE({CAMPO_POR_TIPO[tipo]}, '') NOT IN ('', '[]')" for tipo in TIPOS_ANEXO)}
+    ''')
+    anexos = []
+    for resposta_id, *listas_json in cursor.fetchall():
+        for tipo, lista_json in zip(TIPOS_ANEXO, listas_json):
+            try:
+                itens = json.loads(lista_json) if lista_json else []
+            except ValueError:
+                logger.warning(f"JSON de anexos inválido na resposta {resposta_id} ({tipo}), ignorado")
+                continue
+            vistos = set()
+            for item in itens if isinstance(itens, list) else []:
+                nome, filename = normalizar_item(item)
+                if not filename or filename in vistos:
+                    continue
+                vistos.add(filename)
+                anexos.append((resposta_id, tipo, nome, filename) +
+                              metadados_arquivo(filename, opcoes['pasta_uploads']))
+
+    cursor.executemany('''
+        INSERT OR IGNORE INTO anexos (resposta_id, tipo, nome, filename, size, sha256, mime)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', anexos)
+
+    # As colunas antigas deixam de ser usadas
+    cursor.execute(f'''
+        UPDATE respostas
+        SET {', '.join(f'{CAMPO_POR_TIPO[tipo]} = NULL' for tipo in TIPOS_ANEXO)}
+    ''')
+
+
+def _m007_mascaras_avaliacao(cursor, opcoes):
+    # Versão das respostas de cada avaliação: qualquer mudança que afete as
+    # máscaras de bits incrementa o contador
+    if not coluna_existe(cursor, 'avaliacoes', 'versao_respostas'):
+        cursor.execute('ALTER TABLE avaliacoes ADD COLUMN versao_respostas INTEGER NOT NULL DEFAULT 0')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_respostas_versao_insert
+        AFTER INSERT ON respostas
+        BEGIN
+            UPDATE avaliacoes SET versao_respostas = versao_respostas + 1
+            WHERE id = NEW.avaliacao_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_respostas_versao_delete
+        AFTER DELETE ON respostas
+        BEGIN
+            UPDATE avaliacoes SET versao_respostas = versao_respostas + 1
+            WHERE id = OLD.avaliacao_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_respostas_versao_update
+        AFTER UPDATE OF avaliacao_id, atividade_id, instituido, institucionalizado ON respostas
+        BEGIN
+            UPDATE avaliacoes SET versao_respostas = versao_respostas + 1
+            WHERE id IN (OLD.avaliacao_id, NEW.avaliacao_id);
+        END
+    ''')
+
+    # Máscaras de bits das respostas (ver mascaras.py); montadas sob demanda
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS avaliacao_mascaras (
+            avaliacao_id INTEGER PRIMARY KEY,
+            versao_respostas INTEGER NOT NULL,
+            assinatura_modelo TEXT NOT NULL,
+            respondidas BLOB NOT NULL,
+            instituidas BLOB NOT NULL,
+            institucionalizadas BLOB NOT NULL,
+            FOREIGN KEY (avaliacao_id) REFERENCES avaliacoes (id)
+        )
+    ''')
+
+
+
+def _m008_hierarquia_orgaos(cursor, opcoes):
+    # Filhos de um órgão (subárvore por CTE recursiva e filtro da listagem)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orgaos_superior_nome
+        ON orgaos (orgao_superior_id, nome COLLATE NOCASE, id)
+    ''')
+
+    # Versão da classificação materializada: incrementada a cada regravação,
+    # identifica o estado dos órgãos nos resultados consolidados em cache
+    if not coluna_existe(cursor, 'orgao_maturidade', 'versao'):
+        cursor.execute('ALTER TABLE orgao_maturidade ADD COLUMN versao INTEGER NOT NULL DEFAULT 0')
+
+def _romper_ciclos_orgaos(cursor):
+    """
+    Desfaz ciclos já existentes em orgao_superior_id (anulando o superior do
+    órgão de menor id de cada ciclo), para que a closure possa ser montada.
+    """
+    cursor.execute('SELECT id, orgao_superior_id FROM orgaos')
+    superiores = dict(cursor.fetchall())
+
+    situacao = {}  # 1 = no caminho atual, 2 = resolvido
+    romper = []
+    for inicio in superiores:
+        caminho = []
+        atual = inicio
+        while atual in superiores and atual not in situacao:
+            situacao[atual] = 1
+            caminho.append(atual)
+            atual = superiores[atual]
+        if atual in superiores and situacao.get(atual) == 1:
+            ciclo = caminho[caminho.index(atual):]
+            romper.append(min(ciclo))
+        for orgao_id in caminho:
+            situacao[orgao_id] = 2
+
+    for orgao_id in romper:
+        logger.warning(f"Ciclo em orgao_superior_id desfeito: órgão {orgao_id} ficou sem superior")
+        cursor.execute('UPDATE orgaos SET orgao_superior_id = NULL WHERE id = ?', (orgao_id,))
+
+
+def _m009_closure_orgaos(cursor, opcoes):
+    # Todos os pares (ancestral, descendente) da hierarquia de órgãos, com a
+    # distância entre eles; cada órgão é ancestral de si mesmo (depth 0)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orgaos_closure (
+            ancestor INTEGER NOT NULL,
+            descendant INTEGER NOT NULL,
+            depth INTEGER NOT NULL,
+            PRIMARY KEY (ancestor, descendant)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orgaos_closure_descendente
+        ON orgaos_closure (descendant, depth)
+    ''')
+
+    _romper_ciclos_orgaos(cursor)
+    cursor.execute('DELETE FROM orgaos_closure')
+    cursor.execute('''
+        WITH RECURSIVE caminhos(ancestor, descendant, depth) AS (
+            SELECT id, id, 0 FROM orgaos
+            UNION ALL
+            SELECT o.orgao_superior_id, c.descendant, c.depth + 1
+            FROM caminhos c
+            JOIN orgaos o ON o.id = c.ancestor
+            JOIN orgaos s ON s.id = o.orgao_superior_id
+        )
+        INSERT INTO orgaos_closure (ancestor, descendant, depth)
+        SELECT ancestor, descendant, depth FROM caminhos
+    ''')
+
+    # Um órgão não pode ficar subordinado a si mesmo nem a um descendente
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_orgaos_closure_ciclo
+        BEFORE UPDATE OF orgao_superior_id ON orgaos
+        WHEN NEW.orgao_superior_id IS NOT NULL AND EXISTS (
+            SELECT 1 FROM orgaos_closure
+            WHERE ancestor = NEW.id AND descendant = NEW.orgao_superior_id
+        )
+        BEGIN
+            SELECT RAISE(ABORT, 'Ciclo na hierarquia de órgãos');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_orgaos_closure_insert
+        AFTER INSERT ON orgaos
+        BEGIN
+            INSERT INTO orgaos_closure (ancestor, descendant, depth) VALUES (NEW.id, NEW.id, 0);
+            INSERT INTO orgaos_closure (ancestor, descendant, depth)
+            SELECT ancestor, NEW.id, depth + 1 FROM orgaos_closure
+            WHERE descendant = NEW.orgao_superior_id;
+        END
+    ''')
+    # Mover um órgão move a subárvore inteira: remove os caminhos dos
+    # ancestrais antigos e liga os novos ancestrais a cada descendente
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_orgaos_closure_update
+        AFTER UPDATE OF orgao_superior_id ON orgaos
+        WHEN OLD.orgao_superior_id IS NOT NEW.orgao_superior_id
+        BEGIN
+            DELETE FROM orgaos_closure
+            WHERE descendant IN (SELECT descendant FROM orgaos_closure WHERE ancestor = NEW.id)
+              AND ancestor IN (SELECT ancestor FROM orgaos_closure WHERE descendant = NEW.id AND ancestor <> NEW.id);
+            INSERT INTO orgaos_closure (ancestor, descendant, depth)
+            SELECT sup.ancestor, sub.descendant, sup.depth + sub.depth + 1
+            FROM orgaos_closure sup, orgaos_closure sub
+            WHERE sup.descendant = NEW.orgao_superior_id AND sub.ancestor = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_orgaos_closure_delete
+        AFTER DELETE ON orgaos
+        BEGIN
+            DELETE FROM orgaos_closure WHERE ancestor = OLD.id OR descendant = OLD.id;
+        END
+    ''')
+
+
+def _m010_maturidade_historico(cursor, opcoes):
+    # Retratos da maturidade de cada órgão ao longo do tempo (historico.py);
+    # kpas é o JSON {kpa: % de institucionalização ou null}
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maturidade_historico (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            orgao_id INTEGER NOT NULL,
+            data_registro TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            origem TEXT NOT NULL CHECK (origem IN ('finalizacao', 'diario')),
+            avaliacao_id INTEGER,
+            nivel_maturidade INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            percentual_instituicao REAL,
+            percentual_institucionalizacao REAL,
+            kpas TEXT NOT NULL,
+            FOREIGN KEY (orgao_id) REFERENCES orgaos (id),
+            FOREIGN KEY (avaliacao_id) REFERENCES avaliacoes (id)
+        )
+    ''')
+    # Séries de um órgão e de todos os órgãos num intervalo de datas
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_maturidade_historico_orgao_data
+        ON maturidade_historico (orgao_id, data_registro)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_maturidade_historico_data
+        ON maturidade_historico (data_registro)
+    ''')
+    # Um retrato diário por órgão e dia
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_maturidade_historico_diario
+        ON maturidade_historico (orgao_id, date(data_registro))
+        WHERE origem = 'diario'
+    ''')
+
+    # Somente inserções
+    for operacao in ('UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_maturidade_historico_{operacao.lower()}
+            BEFORE {operacao} ON maturidade_historico
+            BEGIN
+                SELECT RAISE(ABORT, 'maturidade_historico só aceita inserções');
+            END
+        ''')
+
+
+def _m011_geracao_dados(cursor, opcoes):
+    # Contador global de escritas nos dados dos relatórios; respostas em
+    # cache (cache_respostas.py) valem enquanto ele não muda
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS geracao_dados (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            geracao INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO geracao_dados (id, geracao) VALUES (1, 0)')
+
+    # Em avaliacoes, só as colunas editadas pela aplicação: os contadores e a
+    # versão das respostas mudam junto com respostas, que já conta
+    eventos = {
+        'avaliacoes_insert': 'AFTER INSERT ON avaliacoes',
+        'avaliacoes_update': ('AFTER UPDATE OF titulo, orgao_id, nivel_desejado, status, '
+                              'data_atualizacao, usuario_email ON avaliacoes'),
+        'avaliacoes_delete': 'AFTER DELETE ON avaliacoes',
+        'respostas_insert': 'AFTER INSERT ON respostas',
+        'respostas_update': 'AFTER UPDATE ON respostas',
+        'respostas_delete': 'AFTER DELETE ON respostas',
+        'orgaos_insert': 'AFTER INSERT ON orgaos',
+        'orgaos_update': 'AFTER UPDATE ON orgaos',
+        'orgaos_delete': 'AFTER DELETE ON orgaos',
+        'historico_insert': 'AFTER INSERT ON maturidade_historico',
+    }
+    for nome, evento in eventos.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_geracao_{nome}
+            {evento}
+            BEGIN
+                UPDATE geracao_dados SET geracao = geracao + 1 WHERE id = 1;
+            END
+        ''')
+
+
+def _m012_exportacoes(cursor, opcoes):
+    # Jobs de exportação de relatórios (exportacoes.py); dados é o JSON
+    # coletado na requisição, usado para renderizar e para retomar o job
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS exportacoes (
+            id TEXT PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            formato TEXT NOT NULL DEFAULT 'pdf',
+            status TEXT NOT NULL,
+            usuario_email TEXT NOT NULL,
+            orgao_id INTEGER,
+            dados TEXT NOT NULL,
+            nome_arquivo TEXT NOT NULL,
+            arquivo TEXT,
+            tamanho INTEGER,
+            mensagem TEXT,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_inicio TIMESTAMP,
+            data_conclusao TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_exportacoes_status_data
+        ON exportacoes (status, data_criacao)
+    ''')
+
+
+def _m013_versao_dados_orgao(cursor, opcoes):
+    # Versão dos dados de cada órgão, incrementada por triggers a cada
+    # escrita nas avaliações, respostas ou no cadastro do órgão; chave do
+    # cache de relatórios em disco (cache_arquivos.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orgao_versao_dados (
+            orgao_id INTEGER PRIMARY KEY,
+            versao INTEGER NOT NULL
+        )
+    ''')
+
+    # Incrementa a versão de um órgão (expressão) ou do órgão de uma avaliação
+    do_orgao = '''
+        INSERT INTO orgao_versao_dados (orgao_id, versao)
+        SELECT {orgao}, 1 WHERE {orgao} IS NOT NULL
+        ON CONFLICT (orgao_id) DO UPDATE SET versao = versao + 1;
+    '''
+    da_avaliacao = '''
+        INSERT INTO orgao_versao_dados (orgao_id, versao)
+        SELECT orgao_id, 1 FROM avaliacoes WHERE id = {avaliacao} AND orgao_id IS NOT NULL
+        ON CONFLICT (orgao_id) DO UPDATE SET versao = versao + 1;
+    '''
+
+    gatilhos = {
+        'avaliacoes_insert': ('AFTER INSERT ON avaliacoes', do_orgao.format(orgao='NEW.orgao_id')),
+        'avaliacoes_update': ('AFTER UPDATE OF titulo, orgao_id, nivel_desejado, status, '
+                              'data_atualizacao, usuario_email ON avaliacoes',
+                              do_orgao.format(orgao='OLD.orgao_id') + do_orgao.format(orgao='NEW.orgao_id')),
+        'avaliacoes_delete': ('AFTER DELETE ON avaliacoes', do_orgao.format(orgao='OLD.orgao_id')),
+        'respostas_insert': ('AFTER INSERT ON respostas', da_avaliacao.format(avaliacao='NEW.avaliacao_id')),
+        'respostas_update': ('AFTER UPDATE ON respostas', da_avaliacao.format(avaliacao='NEW.avaliacao_id')),
+        'respostas_delete': ('AFTER DELETE ON respostas', da_avaliacao.format(avaliacao='OLD.avaliacao_id')),
+        'orgaos_update': ('AFTER UPDATE ON orgaos', do_orgao.format(orgao='NEW.id')),
+        'orgaos_delete': ('AFTER DELETE ON orgaos', do_orgao.format(orgao='OLD.id')),
+    }
+    for nome, (evento, corpo) in gatilhos.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_versao_orgao_{nome}
+            {evento}
+            BEGIN
+                {corpo}
+            END
+        ''')
+
+
+def _m014_dono_exportacoes(cursor, opcoes):
+    # Processo web dono de cada job de exportação; retomar() só assume jobs
+    # de donos que não estão mais ativos (exportacoes.py)
+    if not coluna_existe(cursor, 'exportacoes', 'dono'):
+        cursor.execute('ALTER TABLE exportacoes ADD COLUMN dono TEXT')
+
+
+def _m015_lotes_exportacao(cursor, opcoes):
+    # Progresso das exportações em lote (exportacao_lote.py), consultado por
+    # qualquer processo do servidor; erros é o JSON dos órgãos que falharam
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lotes_exportacao (
+            id TEXT PRIMARY KEY,
+            usuario_email TEXT NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            concluidos INTEGER NOT NULL DEFAULT 0,
+            erros TEXT NOT NULL DEFAULT '[]',
+            data_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_conclusao TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_lotes_exportacao_data
+        ON lotes_exportacao (data_inicio)
+    ''')
+
+# (versão, descrição, função) - sempre acrescentar no final
+MIGRACOES = [
+    (1, 'Coluna orgao_superior_id em orgaos', _m001_orgao_superior),
+    (2, 'Índices para consultas de avaliações, respostas e usuários', _m002_indices_consultas),
+    (3, 'Tabela orgao_maturidade (classificação materializada)', _m003_orgao_maturidade),
+    (4, 'Contadores de respostas em avaliacoes, mantidos por triggers', _m004_contadores_respostas),
+    (5, 'Índices para listagens paginadas de usuários, órgãos e avaliações', _m005_indices_listagens),
+    (6, 'Tabela anexos (substitui o JSON de arquivos em respostas)', _m006_anexos),
+    (7, 'Máscaras de bits das respostas por avaliação', _m007_mascaras_avaliacao),
+    (8, 'Índice da hierarquia de órgãos e versão da classificação', _m008_hierarquia_orgaos),
+    (9, 'Tabela orgaos_closure (hierarquia de órgãos), mantida por triggers', _m009_closure_orgaos),
+    (10, 'Tabela maturidade_historico (retratos de maturidade, somente inserção)', _m010_maturidade_historico),
+    (11, 'Contador global de escritas (geracao_dados), mantido por triggers', _m011_geracao_dados),
+    (12, 'Tabela exportacoes (jobs de exportação de relatórios)', _m012_exportacoes),
+    (13, 'Versão dos dados por órgão (orgao_versao_dados), mantida por triggers', _m013_versao_dados_orgao),
+    (14, 'Coluna dono em exportacoes (processo que renderiza o job)', _m014_dono_exportacoes),
+    (15, 'Tabela lotes_exportacao (progresso das exportações em lote)', _m015_lotes_exportacao),
+]
+
+
+def versao_atual(cursor):
+    """Retorna a maior versão de esquema aplicada (0 se nenhuma)"""
+    cursor.execute('SELECT COALESCE(MAX(versao), 0) FROM schema_version')
+    return cursor.fetchone()[0]
+
+
+def aplicar_migracoes(conn, pasta_uploads):
+    """Aplica, em ordem, as migrações ainda não registradas em schema_version"""
+    opcoes = {'pasta_uploads': pasta_uploads}
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT,
+            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    versao = versao_atual(cursor)
+    aplicadas = []
+
+    for numero, descricao, migrar in MIGRACOES:
+        if numero <= versao:
+            continue
+
+        try:
+            cursor.execute('BEGIN')
+            migrar(cursor, opcoes)
+            cursor.execute('INSERT INTO schema_version (versao, descricao) VALUES (?, ?)',
+                           (numero, descricao))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Erro na migração {numero} ({descricao}): {str(e)}")
+            raise
+
+        logger.info(f"✅ Migração {numero} aplicada: {descricao}")
+        aplicadas.append(numero)
+
+    return aplicadas
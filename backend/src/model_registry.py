@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registro do modelo de maturidade (modelo_avaliacao.json).
+
+O arquivo é lido e compilado uma única vez por processo. A cada consulta o
+registro só compara o mtime do arquivo e recompila quando ele muda. O modelo
+compilado é imutável e pode ser compartilhado entre threads.
+"""
+
+import os
+import json
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_DIR_MODULO = os.path.dirname(os.path.abspath(__file__))
+
+# Locais procurados, em ordem (relativos ao diretório de execução e ao projeto)
+CAMINHOS_MODELO = [
+    'modelo_avaliacao.json',
+    'public/modelo_avaliacao.json',
+    '../public/modelo_avaliacao.json',
+    'upload/modelo_avaliacao.json',
+    os.path.join(_DIR_MODULO, '..', '..', 'frontend', 'public', 'modelo_avaliacao.json'),
+]
+
+# Estrutura conhecida (atividades por KPA), usada se o JSON não for encontrado
+ESTRUTURA_CONHECIDA = {
+    2: {1: 5, 2: 5, 3: 5, 4: 6, 5: 5, 6: 4},
+    3: {1: 5, 2: 5, 3: 5, 4: 5, 5: 5, 6: 5},
+    4: {1: 5, 2: 5, 3: 5, 4: 5, 5: 5, 6: 5},
+    5: {1: 5, 2: 5, 3: 5, 4: 5, 5: 5, 6: 5}
+}
+
+AREA_NAO_IDENTIFICADA = 'Área não identificada'
+
+
+def _codigo_kpa(codigo):
+    """'KPA 2.1' -> '2.1'"""
+    return str(codigo).replace('KPA', '').strip()
+
+
+class ModeloCompilado:
+    """Índices imutáveis do modelo de maturidade"""
+
+    def __init__(self, kpas_por_nivel, origem):
+        self.origem = origem
+
+        atividades_por_nivel = {}
+        atividades_por_kpa = {}
+        area_por_kpa = {}
+        kpas_do_nivel = {}
+        nivel_por_atividade = {}
+        repetidas = []
+
+        for nivel in sorted(kpas_por_nivel):
+            ids_nivel = []
+            kpas_do_nivel[nivel] = []
+
+            for kpa in kpas_por_nivel[nivel]:
+                kpa_codigo = _codigo_kpa(kpa['codigo'])
+                kpas_do_nivel[nivel].append(kpa_codigo)
+                area_por_kpa[kpa_codigo] = kpa.get('area') or AREA_NAO_IDENTIFICADA
+
+                ids_kpa = []
+                for atividade_id in kpa['atividades']:
+                    if atividade_id in nivel_por_atividade:
+                        repetidas.append(f'{atividade_id} (KPA {kpa_codigo})')
+                        continue
+                    nivel_por_atividade[atividade_id] = nivel
+                    ids_kpa.append(atividade_id)
+                    ids_nivel.append(atividade_id)
+
+                atividades_por_kpa[kpa_codigo] = tuple(ids_kpa)
+
+            atividades_por_nivel[nivel] = tuple(ids_nivel)
+            kpas_do_nivel[nivel] = tuple(kpas_do_nivel[nivel])
+
+        if repetidas:
+            logger.warning(f"Atividades repetidas no modelo foram ignoradas: {', '.join(repetidas)}")
+
+        self.niveis = tuple(sorted(atividades_por_nivel))
+        self.atividades_por_nivel = atividades_por_nivel
+        self.conjunto_por_nivel = {n: frozenset(ids) for n, ids in atividades_por_nivel.items()}
+        self.total_por_nivel = {n: len(ids) for n, ids in atividades_por_nivel.items()}
+        self.kpas_por_nivel = kpas_do_nivel
+        self.atividades_por_kpa = atividades_por_kpa
+        self.area_por_kpa = area_por_kpa
+        self.nivel_por_atividade = nivel_por_atividade
+
+        # Posição de cada atividade nas máscaras de bits (ver mascaras.py):
+        # bit i = i-ésima atividade do modelo, na ordem nível -> KPA -> atividade
+        self.atividades = tuple(a for n in self.niveis for a in atividades_por_nivel[n])
+        self.posicao_por_atividade = {a: i for i, a in enumerate(self.atividades)}
+        self.mascara_por_nivel = {n: self.mascara(ids) for n, ids in atividades_por_nivel.items()}
+        self.mascara_por_kpa = {k: self.mascara(ids) for k, ids in atividades_por_kpa.items()}
+
+        # Identifica o conteúdo do modelo (resultados calculados com outra
+        # assinatura estão desatualizados)
+        self.assinatura = hashlib.sha1(
+            json.dumps(sorted(atividades_por_nivel.items())).encode()
+        ).hexdigest()
+
+    @classmethod
+    def do_json(cls, modelo_data, origem):
+        kpas_por_nivel = {}
+        for nivel_str, kpas_lista in modelo_data.get('kpas_por_nivel', {}).items():
+            kpas_por_nivel[int(nivel_str)] = [{
+                'codigo': kpa.get('codigo', ''),
+                'area': kpa.get('area'),
+                'atividades': [a['id'] for a in kpa.get('atividades', []) if 'id' in a]
+            } for kpa in kpas_lista]
+        return cls(kpas_por_nivel, origem)
+
+    @classmethod
+    def da_estrutura_conhecida(cls):
+        kpas_por_nivel = {}
+        for nivel, kpas_info in ESTRUTURA_CONHECIDA.items():
+            kpas_por_nivel[nivel] = [{
+                'codigo': f'{nivel}.{kpa_num}',
+                'area': None,
+                'atividades': [f'{nivel}.{kpa_num}.{i}' for i in range(1, qtd + 1)]
+            } for kpa_num, qtd in kpas_info.items()]
+        return cls(kpas_por_nivel, 'estrutura conhecida')
+
+    def mascara(self, atividade_ids):
+        """Máscara de bits com as atividades do modelo informadas (as demais são ignoradas)"""
+        mascara = 0
+        for atividade_id in atividade_ids:
+            posicao = self.posicao_por_atividade.get(atividade_id)
+            if posicao is not None:
+                mascara |= 1 << posicao
+        return mascara
+
+    def area_kpa(self, kpa_codigo):
+        return self.area_por_kpa.get(kpa_codigo, AREA_NAO_IDENTIFICADA)
+
+
+class RegistroModelo:
+    """Mantém o modelo compilado e o recarrega quando o arquivo muda"""
+
+    def __init__(self, caminhos=None):
+        self.caminhos = list(caminhos or CAMINHOS_MODELO)
+        self._lock = threading.Lock()
+        self._caminho = None
+        self._mtime = None
+        self._modelo = None
+
+    def _localizar(self):
+        for caminho in self.caminhos:
+            if os.path.exists(caminho):
+                return caminho
+        return None
+
+    def modelo(self):
+        """Retorna o modelo compilado, recompilando se o arquivo mudou"""
+        caminho, mtime = self._caminho, None
+        if caminho:
+            try:
+                mtime = os.stat(caminho).st_mtime_ns
+            except OSError:
+                caminho = None
+
+        if self._modelo is not None and caminho and mtime == self._mtime:
+            return self._modelo
+
+        with self._lock:
+            return self._recarregar(caminho)
+
+    def _recarregar(self, caminho):
+        caminho = caminho or self._localizar()
+
+        if caminho is None:
+            if self._modelo is None:
+                logger.warning("❌ Arquivo modelo não encontrado, usando estrutura conhecida")
+                self._modelo = ModeloCompilado.da_estrutura_conhecida()
+            return self._modelo
+
+        mtime = None
+        try:
+            mtime = os.stat(caminho).st_mtime_ns
+            if self._modelo is not None and caminho == self._caminho and mtime == self._mtime:
+                return self._modelo  # outra thread já recarregou
+
+            with open(caminho, 'r', encoding='utf-8') as f:
+                modelo = ModeloCompilado.do_json(json.load(f), caminho)
+        except Exception as e:
+            logger.error(f"Erro ao carregar modelo de atividades: {str(e)}")
+            if self._modelo is None:
+                self._modelo = ModeloCompilado.da_estrutura_conhecida()
+            # Só tenta de novo quando o arquivo mudar outra vez
+            self._caminho, self._mtime = caminho, mtime
+            return self._modelo
+
+        self._modelo, self._caminho, self._mtime = modelo, caminho, mtime
+        logger.info(f"✅ Modelo carregado de {caminho}: " +
+                    ', '.join(f"nível {n}: {t} atividades" for n, t in modelo.total_por_nivel.items()))
+        return modelo
+
+
+# Registro compartilhado pelo processo
+registro_modelo = RegistroModelo()
+
+
+def modelo_atual():
+    """Atalho para o modelo compilado do registro do processo"""
+    return registro_modelo.modelo()
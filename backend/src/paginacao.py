@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Paginação por cursor (keyset) para as rotas de listagem.
+
+A página seguinte é buscada a partir da chave de ordenação da última linha
+entregue (ex.: nome e id), e não com OFFSET. Assim o custo de cada página
+não cresce com a posição na lista. O cursor entregue ao cliente é opaco:
+os valores da chave em JSON, codificados em base64.
+"""
+
+import json
+import base64
+import binascii
+from datetime import datetime
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 200
+
+# Maior caractere Unicode: fecha o intervalo usado no filtro por prefixo
+_FIM_PREFIXO = '\U0010ffff'
+
+
+class ParametroInvalido(ValueError):
+    """Parâmetro de paginação ou filtro inválido (resposta 400)"""
+
+
+def codificar_cursor(valores):
+    """Chave de ordenação da última linha -> cursor opaco"""
+    texto = json.dumps(list(valores), separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor, tamanho):
+    """Cursor opaco -> lista com os valores da chave de ordenação"""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise ParametroInvalido('Cursor inválido')
+
+    if not isinstance(valores, list) or len(valores) != tamanho:
+        raise ParametroInvalido('Cursor inválido')
+    # Os valores vão direto para os parâmetros da consulta
+    for valor in valores:
+        if valor is not None and (isinstance(valor, bool) or not isinstance(valor, (str, int, float))):
+            raise ParametroInvalido('Cursor inválido')
+    return valores
+
+
+def ler_paginacao(args, tamanho_chave):
+    """
+    Lê limit e cursor da query string.
+
+    Retorna (limite, posicao). Sem nenhum dos dois parâmetros, limite é None
+    e a rota devolve a lista completa, como antes.
+    """
+    limite = args.get('limit')
+    cursor = args.get('cursor')
+
+    if limite is None and cursor is None:
+        return None, None
+
+    if limite is None:
+        limite = LIMITE_PADRAO
+    else:
+        try:
+            limite = int(limite)
+        except ValueError:
+            raise ParametroInvalido('limit deve ser um número inteiro')
+        if limite < 1:
+            raise ParametroInvalido('limit deve ser maior que zero')
+        limite = min(limite, LIMITE_MAXIMO)
+
+    posicao = decodificar_cursor(cursor, tamanho_chave) if cursor else None
+    return limite, posicao
+
+
+def ler_booleano(args, nome):
+    """Filtro booleano opcional (true/false, 1/0, sim/nao)"""
+    valor = args.get(nome)
+    if valor is None or valor == '':
+        return None
+
+    valor = valor.strip().lower()
+    if valor in ('1', 'true', 'sim', 's'):
+        return True
+    if valor in ('0', 'false', 'nao', 'não', 'n'):
+        return False
+    raise ParametroInvalido(f'{nome} deve ser true ou false')
+
+
+def ler_inteiro(args, nome):
+    """Filtro inteiro opcional"""
+    valor = args.get(nome)
+    if valor is None or valor == '':
+        return None
+
+    try:
+        return int(valor)
+    except (ValueError, TypeError):
+        raise ParametroInvalido(f'{nome} deve ser um número inteiro')
+
+
+def ler_data(args, nome, fim_do_dia=True):
+    """
+    Data ou data/hora opcional (ISO 8601) como limite inclusivo no formato
+    das colunas TIMESTAMP ('AAAA-MM-DD HH:MM:SS'). Só a data vale até o fim
+    do dia (ou desde o início dele, com fim_do_dia=False).
+    """
+    valor = args.get(nome)
+    if valor is None or valor == '':
+        return None
+
+    texto = str(valor).strip()
+    try:
+        data = datetime.fromisoformat(texto)
+    except ValueError:
+        raise ParametroInvalido(f'{nome} deve ser uma data no formato AAAA-MM-DD')
+
+    if len(texto) == 10 and fim_do_dia:
+        data = data.replace(hour=23, minute=59, second=59)
+    return data.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def intervalo_prefixo(prefixo):
+    """
+    Intervalo [inicio, fim) com todos os textos que começam com o prefixo.
+
+    Diferente de LIKE 'x%', a comparação por intervalo usa o índice da coluna.
+    """
+    return prefixo, prefixo + _FIM_PREFIXO
+
+
+def montar_pagina(linhas, limite, chave):
+    """
+    Corta a página e calcula o cursor da próxima.
+
+    A consulta deve buscar limite + 1 linhas: a linha extra só indica que
+    existe próxima página. chave(linha) retorna os valores da ordenação.
+    """
+    if limite is None:
+        return linhas, None
+
+    pagina = linhas[:limite]
+    proximo_cursor = None
+    if len(linhas) > limite and pagina:
+        proximo_cursor = codificar_cursor(chave(pagina[-1]))
+    return pagina, proximo_cursor
@@ -1,19 +1,17 @@
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
-from reportlab.lib.colors import navy, blue, black, red, green, white
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from datetime import datetime
 import io
 
+from tema_pdf import tema_relatorio
+
 def gerar_pdf_completo(dados_relatorio):
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter,
                           rightMargin=72, leftMargin=72,
                           topMargin=72, bottomMargin=18)
     
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Justify', alignment=TA_JUSTIFY))
+    styles = tema_relatorio().estilos
     
     story = []
     
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contexto de relatório de um órgão.
+
+Carrega as avaliações do órgão e as respostas das avaliações que entram no
+relatório em duas consultas. Depois calcula em memória todas as seções do
+relatório individual (evolução temporal, maturidade por KPA e detalhamento).
+
+carregar_dados_pdf_simples() coleta, com o mesmo contexto, os dados do PDF
+individual, que é montado depois sem acesso ao banco (relatorio_pdf).
+"""
+
+from datetime import datetime
+
+from model_registry import modelo_atual
+from maturity import obter_maturidades
+
+NIVEIS_RELATORIO = (2, 3, 4, 5)
+
+
+def codigo_kpa_atividade(atividade_id):
+    """'2.1.3' -> '2.1'"""
+    return '.'.join(atividade_id.split('.')[:2])
+
+
+def contar_por_kpa(respostas):
+    """{kpa: {'total', 'instituidas', 'institucionalizadas'}} na ordem das respostas"""
+    kpas = {}
+    for atividade_id, instituido, institucionalizado in respostas:
+        dados = kpas.setdefault(codigo_kpa_atividade(atividade_id), {
+            'total': 0,
+            'instituidas': 0,
+            'institucionalizadas': 0
+        })
+        dados['total'] += 1
+        if instituido:
+            dados['instituidas'] += 1
+        if institucionalizado:
+            dados['institucionalizadas'] += 1
+    return kpas
+
+
+class ContextoRelatorioOrgao:
+    """Retrato das avaliações e respostas de um órgão, usado por todas as seções"""
+
+    def __init__(self, orgao_id, avaliacoes, respostas_por_avaliacao):
+        self.orgao_id = orgao_id
+        # Da mais recente para a mais antiga
+        self.avaliacoes = avaliacoes
+        self.respostas_por_avaliacao = respostas_por_avaliacao
+
+        self.finalizadas_por_nivel = self._mais_recente_por_nivel('finalizada')
+        self.andamento_por_nivel = self._mais_recente_por_nivel('em_andamento')
+
+    @classmethod
+    def carregar(cls, conn, orgao_id):
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, titulo, status, data_criacao, nivel_desejado,
+                   total_respostas, total_instituidas, total_institucionalizadas
+            FROM avaliacoes
+            WHERE orgao_id = ?
+            ORDER BY data_criacao DESC, id DESC
+        ''', (orgao_id,))
+        avaliacoes = [{
+            'id': row[0],
+            'titulo': row[1],
+            'status': row[2],
+            'data_criacao': row[3],
+            'nivel_desejado': row[4],
+            'total_respostas': row[5],
+            'total_instituidas': row[6],
+            'total_institucionalizadas': row[7]
+        } for row in cursor.fetchall()]
+
+        contexto = cls(orgao_id, avaliacoes, {})
+
+        # Só as respostas das avaliações que aparecem no relatório
+        ids = [a['id'] for a in contexto.finalizadas_por_nivel.values()]
+        ids += [a['id'] for a in contexto.andamento_por_nivel.values()]
+        if ids:
+            cursor.execute(f'''
+                SELECT avaliacao_id, atividade_id, instituido, institucionalizado
+                FROM respostas
+                WHERE avaliacao_id IN ({', '.join(['?'] * len(ids))})
+                ORDER BY id
+            ''', ids)
+            for avaliacao_id, *resposta in cursor.fetchall():
+                contexto.respostas_por_avaliacao.setdefault(avaliacao_id, []).append(tuple(resposta))
+
+        return contexto
+
+    def _mais_recente_por_nivel(self, status):
+        por_nivel = {}
+        for avaliacao in self.avaliacoes:
+            nivel = avaliacao['nivel_desejado']
+            if avaliacao['status'] == status and nivel in NIVEIS_RELATORIO and nivel not in por_nivel:
+                por_nivel[nivel] = avaliacao
+        return por_nivel
+
+    def respostas(self, avaliacao_id):
+        return self.respostas_por_avaliacao.get(avaliacao_id, [])
+
+    # ===== SEÇÕES =====
+
+    def lista_avaliacoes(self):
+        return [{
+            'id': a['id'],
+            'titulo': a['titulo'],
+            'status': a['status'],
+            'data_criacao': a['data_criacao'],
+            'nivel_desejado': a['nivel_desejado']
+        } for a in self.avaliacoes]
+
+    def evolucao_temporal(self):
+        """Avaliação finalizada mais recente de cada nível (contadores de avaliacoes)"""
+        evolucao = []
+        for nivel in sorted(self.finalizadas_por_nivel):
+            avaliacao = self.finalizadas_por_nivel[nivel]
+            total = avaliacao['total_respostas']
+            if total > 0:
+                evolucao.append({
+                    'data_avaliacao': avaliacao['data_criacao'],
+                    'titulo_avaliacao': avaliacao['titulo'],
+                    'nivel': nivel,
+                    # Maturidade baseada em institucionalização
+                    'maturidade_geral': int((avaliacao['total_institucionalizadas'] / total) * 100),
+                    'total_atividades': total,
+                    'instituidas': avaliacao['total_instituidas'],
+                    'institucionalizadas': avaliacao['total_institucionalizadas']
+                })
+        return evolucao
+
+    def maturidade_por_kpa(self):
+        """Respostas das avaliações finalizadas mais recentes, agrupadas por KPA"""
+        modelo = modelo_atual()
+        respostas = [resposta
+                     for avaliacao in self.finalizadas_por_nivel.values()
+                     for resposta in self.respostas(avaliacao['id'])]
+
+        maturidade = []
+        for kpa_codigo, dados in contar_por_kpa(respostas).items():
+            maturidade.append({
+                'kpa_codigo': kpa_codigo,
+                'area_modelo': modelo.area_kpa(kpa_codigo),
+                'total_atividades': dados['total'],
+                'instituidas': dados['instituidas'],
+                'institucionalizadas': dados['institucionalizadas'],
+                'percentual_instituidas': int((dados['instituidas'] / dados['total']) * 100),
+                'percentual_institucionalizadas': int((dados['institucionalizadas'] / dados['total']) * 100)
+            })
+
+        maturidade.sort(key=lambda x: x['kpa_codigo'])
+        return maturidade
+
+    def detalhamento_kpas(self):
+        """KPAs das finalizadas mais recentes e das em andamento, por nível"""
+        modelo = modelo_atual()
+        detalhamento = []
+
+        for nivel, avaliacao in self.finalizadas_por_nivel.items():
+            for kpa_codigo, dados in contar_por_kpa(self.respostas(avaliacao['id'])).items():
+                if dados['institucionalizadas'] == dados['total']:
+                    status, cor_status = 'Institucionalizado', 'success'
+                elif dados['instituidas'] == dados['total']:
+                    status, cor_status = 'Instituído', 'warning'
+                else:
+                    status, cor_status = 'Parcial', 'danger'
+
+                detalhamento.append({
+                    'kpa_codigo': kpa_codigo,
+                    'area_modelo': modelo.area_kpa(kpa_codigo),
+                    'nivel': nivel,
+                    'tipo': 'finalizada',
+                    'titulo_avaliacao': avaliacao['titulo'],
+                    'data_avaliacao': avaliacao['data_criacao'],
+                    'total_atividades': dados['total'],
+                    'instituidas': dados['instituidas'],
+                    'institucionalizadas': dados['institucionalizadas'],
+                    'status': status,
+                    'cor_status': cor_status
+                })
+
+        for nivel, avaliacao in self.andamento_por_nivel.items():
+            total_atividades_nivel = modelo.total_por_nivel.get(nivel, 0)
+            percentual_preenchimento = 0
+            if total_atividades_nivel > 0:
+                percentual_preenchimento = int((avaliacao['total_respostas'] / total_atividades_nivel) * 100)
+
+            kpas_preenchidos = {codigo_kpa_atividade(atividade_id)
+                                for atividade_id, _, _ in self.respostas(avaliacao['id'])}
+
+            for kpa_codigo in modelo.kpas_por_nivel.get(nivel, ()):
+                detalhamento.append({
+                    'kpa_codigo': kpa_codigo,
+                    'area_modelo': modelo.area_kpa(kpa_codigo),
+                    'nivel': nivel,
+                    'tipo': 'em_andamento',
+                    'titulo_avaliacao': avaliacao['titulo'],
+                    'data_avaliacao': avaliacao['data_criacao'],
+                    'percentual_preenchimento': percentual_preenchimento,
+                    'kpa_preenchido': kpa_codigo in kpas_preenchidos,
+                    'status': 'Em Andamento',
+                    'cor_status': 'info'
+                })
+
+        detalhamento.sort(key=lambda x: (x['nivel'], x['kpa_codigo']))
+        return detalhamento
+
+
+# ===== DADOS DO PDF INDIVIDUAL =====
+
+# Nomes das áreas usados no PDF individual
+AREAS_KPA_PDF = {
+    '2.1': 'Governança de Riscos',
+    '2.2': 'Identificação de Riscos',
+    '2.3': 'Análise e Avaliação',
+    '2.4': 'Tratamento de Riscos',
+    '2.5': 'Monitoramento e Análise',
+    '2.6': 'Integração Organizacional',
+    '3.1': 'Governança Avançada',
+    '3.2': 'Estratégia e Objetivos',
+    '3.3': 'Implementação Avançada',
+    '3.4': 'Avaliação e Melhoria',
+    '3.5': 'Comunicação e Consulta',
+    '3.6': 'Monitoramento Avançado',
+    '4.1': 'Governança Estratégica',
+    '4.2': 'Estratégia Integrada',
+    '4.3': 'Implementação Otimizada',
+    '4.4': 'Avaliação Contínua',
+    '4.5': 'Comunicação Efetiva',
+    '4.6': 'Monitoramento Estratégico',
+    '5.1': 'Governança Excelente',
+    '5.2': 'Estratégia Inovadora',
+    '5.3': 'Implementação Excelente',
+    '5.4': 'Melhoria Contínua',
+    '5.5': 'Comunicação Integrada',
+    '5.6': 'Monitoramento Inteligente'
+}
+
+
+def obter_area_kpa_segura(kpa_codigo):
+    """Retorna a área do KPA de forma segura"""
+    return AREAS_KPA_PDF.get(kpa_codigo, 'Área não identificada')
+
+
+def _data_curta(data):
+    return data[:10] if data else 'N/A'
+
+
+def carregar_dados_pdf_simples(conn, orgao_id, dados_basicos):
+    """
+    Coleta tudo o que o PDF individual (relatorio_pdf.gerar_pdf_simples)
+    mostra, em uma única transação de leitura. Retorna um dict
+    serializável em JSON: o PDF é montado só a partir dele, no processo web
+    ou em um processo de exportação.
+    """
+    agora = datetime.now()
+    dados = dict(dados_basicos)
+    dados.update({
+        'orgao_id': orgao_id,
+        'data_geracao': agora.strftime('%d/%m/%Y às %H:%M'),
+        'versao': agora.strftime('%Y.%m.%d'),
+        'classificacao': None,
+        'maturidade_kpas': [],
+        'evolucao_temporal': [],
+        'avaliacoes_andamento': [],
+        'resumo_status': [],
+        'recomendacoes': []
+    })
+    if not orgao_id:
+        return dados
+
+    # Sem transação aberta pelo chamador, todas as leituras vêm do mesmo retrato
+    propria = not conn.in_transaction
+    if propria:
+        # A classificação que ainda não foi materializada é gravada (com commit)
+        # antes de abrir o retrato: gravar dentro de uma leitura em andamento
+        # falha na hora ("database is locked") se outro processo gravou depois
+        # dela, em vez de esperar o busy_timeout
+        obter_maturidades(conn, [orgao_id])
+        conn.execute('BEGIN')
+    try:
+        dados['classificacao'] = obter_maturidades(conn, [orgao_id])[orgao_id]
+
+        contexto = ContextoRelatorioOrgao.carregar(conn, orgao_id)
+        andamento = [a for a in contexto.avaliacoes if a['status'] == 'em_andamento']
+        atividades_andamento = {}
+        if andamento:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT avaliacao_id, atividade_id
+                FROM respostas
+                WHERE avaliacao_id IN ({', '.join(['?'] * len(andamento))})
+                ORDER BY id
+            ''', [a['id'] for a in andamento])
+            for avaliacao_id, atividade_id in cursor.fetchall():
+                atividades_andamento.setdefault(avaliacao_id, []).append(atividade_id)
+    finally:
+        if propria and conn.in_transaction:
+            conn.rollback()
+
+    # Maturidade por KPA da finalizada mais recente de cada nível
+    for nivel in sorted(contexto.finalizadas_por_nivel):
+        avaliacao = contexto.finalizadas_por_nivel[nivel]
+        for kpa_codigo, contagem in contar_por_kpa(contexto.respostas(avaliacao['id'])).items():
+            dados['maturidade_kpas'].append({
+                'kpa_codigo': kpa_codigo,
+                'area_nome': obter_area_kpa_segura(kpa_codigo),
+                'nivel': nivel,
+                'perc_instituidas': int((contagem['instituidas'] / contagem['total']) * 100),
+                'perc_institucionalizadas': int((contagem['institucionalizadas'] / contagem['total']) * 100),
+                'total_atividades': contagem['total'],
+                'atividades_institucionalizadas': contagem['institucionalizadas'],
+                'atividades_instituidas': contagem['instituidas'],
+                'avaliacao_id': avaliacao['id'],
+                'titulo_avaliacao': avaliacao['titulo'],
+                'data_avaliacao': _data_curta(avaliacao['data_criacao'])
+            })
+
+    # Evolução: mesma avaliação por nível, pelos contadores de avaliacoes
+    for item in contexto.evolucao_temporal():
+        total = item['total_atividades']
+        dados['evolucao_temporal'].append({
+            'nivel': item['nivel'],
+            'titulo': item['titulo_avaliacao'],
+            'data': _data_curta(item['data_avaliacao']),
+            'maturidade_institucionalizada': item['maturidade_geral'],
+            'maturidade_instituida': int((item['instituidas'] / total) * 100),
+            'total_atividades': total,
+            'atividades_institucionalizadas': item['institucionalizadas'],
+            'atividades_instituidas': item['instituidas']
+        })
+
+    # Preenchimento por KPA de cada avaliação em andamento
+    atividades_por_nivel = modelo_atual().atividades_por_nivel
+    for avaliacao in andamento:
+        kpas = {}
+        for atividade_id in atividades_andamento.get(avaliacao['id'], []):
+            kpa = kpas.setdefault(codigo_kpa_atividade(atividade_id), {'respondidas': 0, 'total_esperado': 0})
+            kpa['respondidas'] += 1
+        for atividade_id in atividades_por_nivel.get(avaliacao['nivel_desejado'], ()):
+            kpa = kpas.setdefault(codigo_kpa_atividade(atividade_id), {'respondidas': 0, 'total_esperado': 0})
+            kpa['total_esperado'] += 1
+
+        dados['avaliacoes_andamento'].append({
+            'id': avaliacao['id'],
+            'titulo': avaliacao['titulo'],
+            'nivel': avaliacao['nivel_desejado'],
+            'data_criacao': _data_curta(avaliacao['data_criacao']),
+            'kpas': [{
+                'kpa_codigo': kpa_codigo,
+                'area_nome': obter_area_kpa_segura(kpa_codigo),
+                'respondidas': kpa['respondidas'],
+                'total_esperado': kpa['total_esperado']
+            } for kpa_codigo, kpa in kpas.items()]
+        })
+
+    contagem_status = {}
+    for avaliacao in contexto.avaliacoes:
+        contagem_status[avaliacao['status']] = contagem_status.get(avaliacao['status'], 0) + 1
+    dados['resumo_status'] = sorted(contagem_status.items())
+
+    dados['recomendacoes'] = gerar_recomendacoes_inteligentes(
+        dados['maturidade_kpas'], dados['avaliacoes_andamento'],
+        dados['classificacao'], dados['evolucao_temporal'])
+    return dados
+
+
+def gerar_recomendacoes_inteligentes(maturidade_kpas, avaliacoes_andamento, classificacao, evolucao_temporal):
+    """Gera recomendações inteligentes baseadas nos dados do relatório"""
+    recomendacoes = []
+    
+    # 1. KPAs parcialmente implementados (ALTA PRIORIDADE)
+    kpas_parciais = [k for k in maturidade_kpas if 0 < k['perc_institucionalizadas'] < 100]
+    for kpa in kpas_parciais:
+        faltantes = kpa['total_atividades'] - kpa['atividades_institucionalizadas']
+        recomendacoes.append({
+            'prioridade': 'alta',
+            'titulo': f"Completar {kpa['kpa_codigo']} - {kpa['area_nome']}",
+            'descricao': f"Faltam {faltantes} de {kpa['total_atividades']} atividades para institucionalização completa. Priorize a implementação das atividades pendentes para alcançar 100% de maturidade nesta área."
+        })
+    
+    # 2. Avaliações em andamento com baixo progresso (MÉDIA PRIORIDADE)
+    if avaliacoes_andamento:
+        for avaliacao in avaliacoes_andamento:
+            # Calcular progresso geral da avaliação (simplificado)
+            titulo = avaliacao['titulo']
+            nivel = avaliacao['nivel']
+            
+            recomendacoes.append({
+                'prioridade': 'media',
+                'titulo': f"Retomar avaliação \"{titulo}\"",
+                'descricao': f"Avaliação do Nível {nivel} está em andamento. Recomenda-se definir cronograma para conclusão e designar responsáveis para cada KPA pendente."
+            })
+    
+    # 3. Evolução temporal negativa (ALTA PRIORIDADE)
+    if len(evolucao_temporal) >= 2:
+        primeiro = evolucao_temporal[0]
+        ultimo = evolucao_temporal[-1]
+        crescimento = ultimo['maturidade_institucionalizada'] - primeiro['maturidade_institucionalizada']
+        
+        if crescimento < 0:
+            recomendacoes.append({
+                'prioridade': 'alta',
+                'titulo': "Reverter tendência de declínio",
+                'descricao': f"A maturidade apresentou declínio de {abs(crescimento)} pontos percentuais. Recomenda-se revisar os processos implementados e reforçar as práticas de gestão de riscos."
+            })
+    
+    # 4. Próximo nível de maturidade (BAIXA PRIORIDADE)
+    if classificacao and classificacao.get('status') == 'certificado':
+        nivel_atual = classificacao.get('nivel_maturidade', 1)
+        if nivel_atual < 5:
+            proximo_nivel = nivel_atual + 1
+            recomendacoes.append({
+                'prioridade': 'baixa',
+                'titulo': f"Preparar para Nível {proximo_nivel}",
+                'descricao': f"Com o Nível {nivel_atual} certificado, considere iniciar a preparação para avaliação do Nível {proximo_nivel}. Estude os requisitos e planeje a implementação das novas práticas."
+            })
+    
+    # 5. Melhores práticas gerais (BAIXA PRIORIDADE)
+    if len(maturidade_kpas) > 0:
+        kpas_completos = len([k for k in maturidade_kpas if k['perc_institucionalizadas'] == 100])
+        total_kpas = len(maturidade_kpas)
+        
+        if kpas_completos == total_kpas:
+            recomendacoes.append({
+                'prioridade': 'baixa',
+                'titulo': "Manter excelência operacional",
+                'descricao': "Todos os KPAs avaliados estão com 100% de institucionalização. Mantenha as práticas implementadas e considere auditorias periódicas para garantir a continuidade."
+            })
+        elif kpas_completos > total_kpas * 0.7:
+            recomendacoes.append({
+                'prioridade': 'baixa',
+                'titulo': "Consolidar boas práticas",
+                'descricao': f"Boa performance com {kpas_completos} de {total_kpas} KPAs completos. Documente as práticas bem-sucedidas e replique para as áreas pendentes."
+            })
+    
+    # 6. Recomendação de monitoramento (BAIXA PRIORIDADE)
+    recomendacoes.append({
+        'prioridade': 'baixa',
+        'titulo': "Monitoramento contínuo",
+        'descricao': "Estabeleça rotina de monitoramento mensal do progresso das avaliações e revisão trimestral da maturidade em gestão de riscos. Utilize este relatório como baseline para acompanhamento."
+    })
+    
+    return recomendacoes
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDFs do relatório individual e do consolidado.
+
+gerar_pdf_simples() só monta o documento a partir do dict coletado por
+relatorio_orgao.carregar_dados_pdf_simples(): não abre conexões nem importa
+o main, então roda igual no processo web, em um processo de exportação ou
+isolada (benchmark). montar_pdf_relatorio() monta o consolidado a partir
+dos totais já consultados. Os dois usam o tema compartilhado (tema_pdf).
+"""
+
+from io import BytesIO
+from datetime import datetime
+
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, PageBreak
+from reportlab.lib.units import inch
+
+from tema_pdf import tema_relatorio
+
+
+def gerar_pdf_simples(dados):
+    """Gera PDF completo do relatório individual - VERSÃO FINAL"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    tema = tema_relatorio()
+    styles = tema.estilos
+    titulo_secao = styles['TituloSecao']
+    subtitulo = styles['Subtitulo']
+    subtitulo_verde = styles['SubtituloVerde']
+    subtitulo_azul = styles['SubtituloAzul']
+    rec_alta = styles['RecomendacaoAlta']
+    rec_media = styles['RecomendacaoMedia']
+    rec_baixa = styles['RecomendacaoBaixa']
+
+    story = []
+    orgao_id = dados.get('orgao_id')
+    classificacao = dados.get('classificacao')
+    maturidade_kpas = dados.get('maturidade_kpas', [])
+    evolucao_temporal = dados.get('evolucao_temporal', [])
+    avaliacoes_andamento = dados.get('avaliacoes_andamento', [])
+
+    # ===== CABEÇALHO =====
+    story.append(Paragraph("RELATÓRIO DE MATURIDADE EM GESTÃO DE RISCOS", styles['Title']))
+    story.append(Spacer(1, 20))
+
+    story.append(Paragraph(f"<b>Órgão:</b> {dados['orgao_nome']}", styles['Normal']))
+    story.append(Paragraph(f"<b>Sigla:</b> {dados['orgao_sigla']}", styles['Normal']))
+    story.append(Paragraph(f"<b>Usuário:</b> {dados['usuario_nome']}", styles['Normal']))
+    # O PDF é reaproveitado enquanto os dados do órgão não mudam (cache_arquivos)
+    story.append(Paragraph(f"<b>Dados apurados em:</b> {dados['data_geracao']}", styles['Normal']))
+    story.append(Spacer(1, 30))
+
+    # ===== 1. CERTIFICAÇÃO =====
+    story.append(Paragraph("1. CERTIFICAÇÃO DE MATURIDADE", titulo_secao))
+
+    if orgao_id and classificacao:
+        if classificacao.get('status') == 'certificado':
+            story.append(Paragraph(f"🏆 <b>NÍVEL {classificacao.get('nivel_maturidade')} CERTIFICADO</b>", subtitulo))
+            story.append(Paragraph(f"<b>Status:</b> {classificacao.get('descricao', 'N/A')}", styles['Normal']))
+
+            data_cert = classificacao.get('data_certificacao', '')
+            if data_cert:
+                data_formatada = data_cert[:10] if len(data_cert) >= 10 else data_cert
+                story.append(Paragraph(f"<b>Data de Certificação:</b> {data_formatada}", styles['Normal']))
+
+            story.append(Paragraph(f"<b>Detalhes:</b> {classificacao.get('detalhes', 'N/A')}", styles['Normal']))
+        else:
+            story.append(Paragraph("⚠️ <b>NÍVEL INICIAL</b>", subtitulo))
+            story.append(Paragraph(f"<b>Status:</b> {classificacao.get('descricao', 'Critérios não atendidos')}", styles['Normal']))
+            story.append(Paragraph(f"<b>Detalhes:</b> {classificacao.get('detalhes', 'N/A')}", styles['Normal']))
+    else:
+        story.append(Paragraph("⚠️ Órgão não identificado", styles['Normal']))
+
+    story.append(Spacer(1, 20))
+
+    # ===== 2. MATURIDADE POR KPA =====
+    story.append(Paragraph("2. MATURIDADE POR ÁREA DE PROCESSO (KPA)", titulo_secao))
+
+    if not orgao_id:
+        story.append(Paragraph("Órgão não identificado para buscar dados de maturidade.", styles['Normal']))
+    elif maturidade_kpas:
+        dados_tabela = [['KPA', 'Área', 'Nível', 'Instituídas', 'Institucionalizadas', 'Status']]
+
+        for kpa in maturidade_kpas:
+            # Determinar status
+            if kpa['perc_institucionalizadas'] == 100:
+                status = "✅ Completo"
+            elif kpa['perc_institucionalizadas'] > 0:
+                status = "⚠️ Parcial"
+            else:
+                status = "❌ Inicial"
+
+            dados_tabela.append([
+                kpa['kpa_codigo'],
+                kpa['area_nome'][:20] + '...' if len(kpa['area_nome']) > 20 else kpa['area_nome'],
+                str(kpa['nivel']),
+                f"{kpa['perc_instituidas']}%",
+                f"{kpa['perc_institucionalizadas']}%",
+                status
+            ])
+
+        # Criar tabela formatada
+        tabela_kpas = Table(dados_tabela, colWidths=[0.6*inch, 1.8*inch, 0.5*inch, 0.8*inch, 1*inch, 0.8*inch])
+        tabela_kpas.setStyle(tema.tabela_dados)
+
+        story.append(tabela_kpas)
+
+        # Resumo estatístico
+        story.append(Spacer(1, 15))
+        story.append(Paragraph("<b>Resumo Estatístico:</b>", subtitulo))
+
+        total_kpas = len(maturidade_kpas)
+        kpas_completos = len([k for k in maturidade_kpas if k['perc_institucionalizadas'] == 100])
+        kpas_parciais = len([k for k in maturidade_kpas if 0 < k['perc_institucionalizadas'] < 100])
+        kpas_iniciais = len([k for k in maturidade_kpas if k['perc_institucionalizadas'] == 0])
+
+        story.append(Paragraph(f"• <b>Total de KPAs avaliados:</b> {total_kpas}", styles['Normal']))
+        story.append(Paragraph(f"• <b>KPAs completos (100%):</b> {kpas_completos}", styles['Normal']))
+        story.append(Paragraph(f"• <b>KPAs parciais (1-99%):</b> {kpas_parciais}", styles['Normal']))
+        story.append(Paragraph(f"• <b>KPAs iniciais (0%):</b> {kpas_iniciais}", styles['Normal']))
+    else:
+        story.append(Paragraph("Nenhum dado de maturidade por KPA disponível.", styles['Normal']))
+
+    story.append(Spacer(1, 20))
+
+    # ===== 3. EVOLUÇÃO TEMPORAL =====
+    story.append(Paragraph("3. EVOLUÇÃO DA MATURIDADE AO LONGO DO TEMPO", titulo_secao))
+
+    if not orgao_id:
+        story.append(Paragraph("Órgão não identificado para análise temporal.", styles['Normal']))
+    elif evolucao_temporal:
+        story.append(Paragraph("<b>Histórico de Progresso por Nível:</b>", subtitulo))
+
+        # Criar tabela de evolução
+        dados_tabela = [['Nível', 'Data Avaliação', 'Título', 'Maturidade', 'Atividades', 'Tendência']]
+
+        maturidade_anterior = 0
+        for i, item in enumerate(evolucao_temporal):
+            # Calcular tendência
+            if i == 0:
+                tendencia = "🆕 Inicial"
+            else:
+                if item['maturidade_institucionalizada'] > maturidade_anterior:
+                    tendencia = "📈 Crescimento"
+                elif item['maturidade_institucionalizada'] == maturidade_anterior:
+                    tendencia = "➡️ Estável"
+                else:
+                    tendencia = "📉 Declínio"
+
+            dados_tabela.append([
+                f"Nível {item['nivel']}",
+                item['data'],
+                item['titulo'][:15] + '...' if len(item['titulo']) > 15 else item['titulo'],
+                f"{item['maturidade_institucionalizada']}%",
+                f"{item['atividades_institucionalizadas']}/{item['total_atividades']}",
+                tendencia
+            ])
+
+            maturidade_anterior = item['maturidade_institucionalizada']
+
+        # Criar tabela formatada
+        tabela_evolucao = Table(dados_tabela, colWidths=[0.8*inch, 1*inch, 1.5*inch, 0.8*inch, 0.8*inch, 1*inch])
+        tabela_evolucao.setStyle(tema.tabela_dados)
+
+        story.append(tabela_evolucao)
+
+        # Análise da evolução
+        story.append(Spacer(1, 15))
+        story.append(Paragraph("<b>Análise da Evolução:</b>", subtitulo))
+
+        if len(evolucao_temporal) >= 2:
+            primeiro = evolucao_temporal[0]
+            ultimo = evolucao_temporal[-1]
+
+            crescimento = ultimo['maturidade_institucionalizada'] - primeiro['maturidade_institucionalizada']
+            niveis_avaliados = len(evolucao_temporal)
+
+            story.append(Paragraph(f"• <b>Níveis avaliados:</b> {niveis_avaliados} ({primeiro['nivel']} ao {ultimo['nivel']})", styles['Normal']))
+            story.append(Paragraph(f"• <b>Período:</b> {primeiro['data']} a {ultimo['data']}", styles['Normal']))
+            story.append(Paragraph(f"• <b>Crescimento total:</b> {crescimento:+d} pontos percentuais", styles['Normal']))
+
+            if crescimento > 0:
+                story.append(Paragraph(f"• <b>Tendência:</b> 📈 Evolução positiva da maturidade", styles['Normal']))
+            elif crescimento == 0:
+                story.append(Paragraph(f"• <b>Tendência:</b> ➡️ Maturidade estável", styles['Normal']))
+            else:
+                story.append(Paragraph(f"• <b>Tendência:</b> 📉 Necessita atenção", styles['Normal']))
+
+            # Nível atual
+            nivel_atual = ultimo['nivel']
+            maturidade_atual = ultimo['maturidade_institucionalizada']
+            story.append(Paragraph(f"• <b>Status atual:</b> Nível {nivel_atual} com {maturidade_atual}% de maturidade", styles['Normal']))
+
+        else:
+            story.append(Paragraph("• Apenas um nível avaliado. Evolução temporal será disponível com mais avaliações.", styles['Normal']))
+    else:
+        story.append(Paragraph("Nenhuma avaliação finalizada encontrada para análise temporal.", styles['Normal']))
+
+    # ===== QUEBRA DE PÁGINA =====
+    story.append(PageBreak())
+
+    # ===== 4. DETALHAMENTO POR KPA =====
+    story.append(Paragraph("4. DETALHAMENTO POR KPA", titulo_secao))
+
+    if orgao_id:
+        # ===== 4.1 AVALIAÇÕES FINALIZADAS =====
+        story.append(Paragraph("4.1. Avaliações Finalizadas", subtitulo_verde))
+
+        if maturidade_kpas:
+            for kpa in maturidade_kpas:
+                # Determinar status detalhado
+                if kpa['perc_institucionalizadas'] == 100:
+                    status_icon = "✅"
+                    status_texto = "Institucionalizado"
+                elif kpa['perc_institucionalizadas'] > 0:
+                    status_icon = "⚠️"
+                    status_texto = "Parcialmente Implementado"
+                else:
+                    status_icon = "❌"
+                    status_texto = "Não Implementado"
+
+                # Informações do KPA
+                story.append(Paragraph(f"<b>{kpa['kpa_codigo']} - {kpa['area_nome']}</b>", styles['Normal']))
+                story.append(Paragraph(f"Nível {kpa['nivel']} | Data: {kpa['data_avaliacao']} | Status: {status_icon} {status_texto}", styles['Normal']))
+                story.append(Paragraph(f"Atividades: {kpa['atividades_institucionalizadas']}/{kpa['total_atividades']} institucionalizadas, {kpa['atividades_instituidas']}/{kpa['total_atividades']} instituídas", styles['Normal']))
+                story.append(Paragraph(f"Avaliação: {kpa['titulo_avaliacao']}", styles['Normal']))
+                story.append(Spacer(1, 8))
+        else:
+            story.append(Paragraph("Nenhuma avaliação finalizada encontrada.", styles['Normal']))
+
+        story.append(Spacer(1, 15))
+
+        # ===== 4.2 AVALIAÇÕES EM ANDAMENTO =====
+        story.append(Paragraph("4.2. Avaliações em Andamento", subtitulo_azul))
+
+        if avaliacoes_andamento:
+            for avaliacao in avaliacoes_andamento:
+                # Mostrar informações da avaliação
+                story.append(Paragraph(f"<b>Avaliação: {avaliacao['titulo']}</b>", styles['Normal']))
+                story.append(Paragraph(f"Nível {avaliacao['nivel']} | Criada em: {avaliacao['data_criacao']}", styles['Normal']))
+                story.append(Spacer(1, 5))
+
+                # Mostrar progresso por KPA
+                if avaliacao['kpas']:
+                    for kpa in avaliacao['kpas']:
+                        if kpa['total_esperado'] > 0:
+                            percentual = int((kpa['respondidas'] / kpa['total_esperado']) * 100)
+
+                            # Ícone baseado no progresso
+                            if percentual == 100:
+                                icone = "✅"
+                            elif percentual >= 50:
+                                icone = "🔄"
+                            else:
+                                icone = "⏳"
+
+                            story.append(Paragraph(f"  {icone} <b>{kpa['kpa_codigo']} - {kpa['area_nome']}</b>", styles['Normal']))
+                            story.append(Paragraph(f"     Preenchimento: {percentual}% ({kpa['respondidas']}/{kpa['total_esperado']} atividades)", styles['Normal']))
+                else:
+                    story.append(Paragraph("  Nenhuma atividade respondida ainda.", styles['Normal']))
+
+                story.append(Spacer(1, 10))
+        else:
+            story.append(Paragraph("Nenhuma avaliação em andamento encontrada.", styles['Normal']))
+    else:
+        story.append(Paragraph("Órgão não identificado para detalhamento.", styles['Normal']))
+
+    story.append(Spacer(1, 20))
+
+    # ===== 5. RECOMENDAÇÕES =====
+    story.append(Paragraph("5. RECOMENDAÇÕES", titulo_secao))
+
+    recomendacoes = dados.get('recomendacoes', [])
+
+    if recomendacoes:
+        # Separar por prioridade
+        alta_prioridade = [r for r in recomendacoes if r['prioridade'] == 'alta']
+        media_prioridade = [r for r in recomendacoes if r['prioridade'] == 'media']
+        baixa_prioridade = [r for r in recomendacoes if r['prioridade'] == 'baixa']
+
+        # Alta prioridade
+        if alta_prioridade:
+            story.append(Paragraph("🔴 <b>ALTA PRIORIDADE</b>", subtitulo))
+            for rec in alta_prioridade:
+                story.append(Paragraph(f"<b>• {rec['titulo']}</b>", rec_alta))
+                story.append(Paragraph(f"  {rec['descricao']}", styles['Normal']))
+                story.append(Spacer(1, 5))
+
+        # Média prioridade
+        if media_prioridade:
+            story.append(Paragraph("🟡 <b>MÉDIA PRIORIDADE</b>", subtitulo))
+            for rec in media_prioridade:
+                story.append(Paragraph(f"<b>• {rec['titulo']}</b>", rec_media))
+                story.append(Paragraph(f"  {rec['descricao']}", styles['Normal']))
+                story.append(Spacer(1, 5))
+
+        # Baixa prioridade
+        if baixa_prioridade:
+            story.append(Paragraph("🔵 <b>BAIXA PRIORIDADE</b>", subtitulo))
+            for rec in baixa_prioridade:
+                story.append(Paragraph(f"<b>• {rec['titulo']}</b>", rec_baixa))
+                story.append(Paragraph(f"  {rec['descricao']}", styles['Normal']))
+                story.append(Spacer(1, 5))
+    else:
+        story.append(Paragraph("Nenhuma recomendação específica no momento. Continue monitorando o progresso das avaliações.", styles['Normal']))
+
+    story.append(Spacer(1, 20))
+
+    # ===== 6. RESUMO DE AVALIAÇÕES =====
+    story.append(Paragraph("6. RESUMO DE AVALIAÇÕES", titulo_secao))
+
+    resumo_status = dados.get('resumo_status', [])
+
+    if not orgao_id:
+        story.append(Paragraph("Órgão não identificado para buscar avaliações.", styles['Normal']))
+    elif resumo_status:
+        dados_tabela = [['Status', 'Quantidade']]
+        for status, count in resumo_status:
+            status_nome = 'Finalizada' if status == 'finalizada' else 'Em Andamento'
+            dados_tabela.append([status_nome, str(count)])
+
+        tabela = Table(dados_tabela, colWidths=[2*inch, 1*inch])
+        tabela.setStyle(tema.tabela_resumo)
+        story.append(tabela)
+    else:
+        story.append(Paragraph("Nenhuma avaliação encontrada.", styles['Normal']))
+
+    story.append(Spacer(1, 30))
+
+    # ===== RODAPÉ =====
+    story.append(Paragraph("---", styles['Normal']))
+    story.append(Paragraph("Relatório gerado pelo Sistema de Gestão de Riscos CGE-MT", styles['Normal']))
+    story.append(Paragraph(f"Versão: {dados['versao']} | Relatório Completo", styles['Normal']))
+
+    # Construir PDF
+    doc.build(story)
+    buffer.seek(0)
+
+    return buffer
+
+
+def montar_pdf_relatorio(total_avaliacoes, avaliacoes_finalizadas, orgaos_participantes, dados_orgaos):
+    """Gera relatório consolidado em PDF - VERSÃO CORRIGIDA"""
+    # Criar buffer em memória
+    buffer = BytesIO()
+
+    # Criar documento com margens adequadas
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        rightMargin=50,
+        leftMargin=50,
+        topMargin=50,
+        bottomMargin=50
+    )
+
+    # Estilos do tema compartilhado
+    tema = tema_relatorio()
+    styles = tema.estilos
+    title_style = styles['CustomTitle']
+    subtitle_style = styles['CustomSubtitle']
+
+    # Conteúdo do documento
+    story = []
+
+    # Cabeçalho
+    story.append(Paragraph("RELATÓRIO CONSOLIDADO", title_style))
+    story.append(Paragraph("Sistema de Avaliação de Maturidade CGE-MT", styles['Heading3']))
+    story.append(Spacer(1, 10))
+    # O PDF é reaproveitado enquanto a geração dos dados não muda (cache_arquivos)
+    story.append(Paragraph(f"Dados apurados em: {datetime.now().strftime('%d/%m/%Y às %H:%M')}", styles['Normal']))
+    story.append(Spacer(1, 30))
+
+    # ===== ESTATÍSTICAS GERAIS =====
+    story.append(Paragraph("1. ESTATÍSTICAS GERAIS", subtitle_style))
+
+    taxa_conclusao = (avaliacoes_finalizadas/total_avaliacoes*100) if total_avaliacoes > 0 else 0
+
+    estatisticas_data = [
+        ['Métrica', 'Valor'],
+        ['Total de Avaliações', str(total_avaliacoes)],
+        ['Avaliações Finalizadas', str(avaliacoes_finalizadas)],
+        ['Avaliações em Andamento', str(total_avaliacoes - avaliacoes_finalizadas)],
+        ['Órgãos Participantes', str(orgaos_participantes)],
+        ['Taxa de Conclusão', f"{taxa_conclusao:.1f}%"]
+    ]
+
+    estatisticas_table = Table(estatisticas_data, colWidths=[3.5*inch, 2*inch])
+    estatisticas_table.setStyle(tema.tabela_estatisticas)
+
+    story.append(estatisticas_table)
+    story.append(Spacer(1, 30))
+
+    # ===== AVALIAÇÕES POR ÓRGÃO =====
+    story.append(Paragraph("2. AVALIAÇÕES POR ÓRGÃO", subtitle_style))
+
+    if dados_orgaos:
+        # Cabeçalho da tabela
+        orgaos_data = [['Órgão', 'Sigla', 'Total', 'Finalizadas', 'Em Andamento', 'Taxa (%)']]
+
+        for orgao in dados_orgaos:
+            nome_orgao = str(orgao[0]) if orgao[0] else 'N/A'
+            sigla_orgao = str(orgao[1]) if orgao[1] else '-'
+            total = int(orgao[2]) if orgao[2] else 0
+            finalizadas = int(orgao[3]) if orgao[3] else 0
+            em_andamento = int(orgao[4]) if orgao[4] else 0
+
+            # Calcular taxa de conclusão por órgão
+            taxa_orgao = (finalizadas / total * 100) if total > 0 else 0
+
+            # Quebrar nome longo em múltiplas linhas se necessário
+            if len(nome_orgao) > 40:
+                nome_orgao = nome_orgao[:37] + "..."
+
+            orgaos_data.append([
+                nome_orgao,
+                sigla_orgao,
+                str(total),
+                str(finalizadas),
+                str(em_andamento),
+                f"{taxa_orgao:.1f}%"
+            ])
+
+        # Criar tabela com larguras ajustadas
+        orgaos_table = Table(orgaos_data, colWidths=[2.8*inch, 0.8*inch, 0.6*inch, 0.8*inch, 1*inch, 0.8*inch])
+        orgaos_table.setStyle(tema.tabela_orgaos)
+
+        story.append(orgaos_table)
+    else:
+        story.append(Paragraph("Nenhum dado de órgão disponível.", styles['Normal']))
+
+    story.append(Spacer(1, 30))
+
+    # ===== RESUMO EXECUTIVO =====
+    story.append(Paragraph("3. RESUMO EXECUTIVO", subtitle_style))
+
+    # Análise automática dos dados
+    if total_avaliacoes > 0:
+        if taxa_conclusao >= 80:
+            status_geral = "Excelente"
+        elif taxa_conclusao >= 60:
+            status_geral = "Bom"
+        elif taxa_conclusao >= 40:
+            status_geral = "Regular"
+        else:
+            status_geral = "Necessita Atenção"
+
+        story.append(Paragraph(f"• <b>Status Geral do Sistema:</b> {status_geral}", styles['Normal']))
+        story.append(Paragraph(f"• <b>Taxa de Conclusão:</b> {taxa_conclusao:.1f}% das avaliações foram finalizadas", styles['Normal']))
+        story.append(Paragraph(f"• <b>Participação:</b> {orgaos_participantes} órgãos estão participando do processo de avaliação", styles['Normal']))
+
+        # Identificar órgão com melhor desempenho
+        if dados_orgaos:
+            melhor_orgao = None
+            melhor_taxa = 0
+
+            for orgao in dados_orgaos:
+                total_orgao = int(orgao[2]) if orgao[2] else 0
+                finalizadas_orgao = int(orgao[3]) if orgao[3] else 0
+
+                if total_orgao > 0:
+                    taxa_orgao = (finalizadas_orgao / total_orgao * 100)
+                    if taxa_orgao > melhor_taxa:
+                        melhor_taxa = taxa_orgao
+                        melhor_orgao = orgao[0]
+
+            if melhor_orgao and melhor_taxa > 0:
+                story.append(Paragraph(f"• <b>Melhor Desempenho:</b> {melhor_orgao} ({melhor_taxa:.1f}% de conclusão)", styles['Normal']))
+    else:
+        story.append(Paragraph("• Nenhuma avaliação foi iniciada no sistema.", styles['Normal']))
+
+    # Rodapé
+    story.append(Spacer(1, 50))
+    story.append(Paragraph("---", styles['Normal']))
+    story.append(Paragraph("Relatório gerado automaticamente pelo Sistema CGE-MT", styles['Normal']))
+    story.append(Paragraph("Controladoria Geral do Estado de Mato Grosso", styles['Normal']))
+
+    # Gerar PDF
+    doc.build(story)
+
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Simulação de maturidade ("o que falta para chegar ao nível N?").
+
+O estado atual do órgão são as máscaras de bits da avaliação finalizada mais
+recente de cada nível (as mesmas usadas na certificação). As alterações
+hipotéticas são aplicadas sobre cópias dessas máscaras, em memória, sem
+gravar nada; a classificação e as atividades faltantes são calculadas com
+as máscaras do modelo compilado. Uma simulação custa uma consulta e algumas
+operações de bits.
+"""
+
+from model_registry import modelo_atual
+from maturity import (NIVEIS_CERTIFICAVEIS, ultimas_avaliacoes_finalizadas,
+                      completude_nivel, classificar)
+from mascaras import MASCARAS_VAZIAS, MascarasAvaliacao
+from paginacao import ParametroInvalido
+
+MAX_ALTERACOES = 1000
+
+
+class EstadoOrgao:
+    """Máscaras e avaliação finalizada mais recente de cada nível do órgão"""
+
+    def __init__(self, orgao_id, avaliacoes):
+        self.orgao_id = orgao_id
+        # {nivel: (avaliacao_id, titulo, data_criacao, mascaras)}
+        self.avaliacoes = avaliacoes
+
+    @classmethod
+    def carregar(cls, conn, orgao_id):
+        """Estado atual (sem commit; máscaras desatualizadas são remontadas)"""
+        avaliacoes = {nivel: tuple(avaliacao)
+                      for _, nivel, *avaliacao in ultimas_avaliacoes_finalizadas(conn, [orgao_id])}
+        return cls(orgao_id, avaliacoes)
+
+    def mascaras(self, nivel):
+        avaliacao = self.avaliacoes.get(nivel)
+        return avaliacao[3] if avaliacao else None
+
+    def completude(self, modelo):
+        return {nivel: completude_nivel(modelo, nivel, *avaliacao)
+                for nivel, avaliacao in self.avaliacoes.items()}
+
+    def aplicar(self, modelo, alteracoes):
+        """
+        Novo estado com as alterações aplicadas (o atual não muda).
+
+        Cada alteração é {"atividade_id", "instituido"?, "institucionalizado"?};
+        campos ausentes mantêm o valor atual. A alteração vale para a avaliação
+        do nível da atividade; se o nível não tiver avaliação finalizada, a
+        simulação considera uma avaliação nova só com as respostas simuladas.
+        """
+        mascaras = {nivel: avaliacao[3] for nivel, avaliacao in self.avaliacoes.items()}
+
+        for alteracao in alteracoes:
+            atividade_id = alteracao['atividade_id']
+            nivel = modelo.nivel_por_atividade[atividade_id]
+            bit = 1 << modelo.posicao_por_atividade[atividade_id]
+            respondidas, instituidas, institucionalizadas = mascaras.get(nivel, MASCARAS_VAZIAS)
+
+            respondidas |= bit
+            if 'instituido' in alteracao:
+                instituidas = instituidas | bit if alteracao['instituido'] else instituidas & ~bit
+            if 'institucionalizado' in alteracao:
+                if alteracao['institucionalizado']:
+                    institucionalizadas |= bit
+                else:
+                    institucionalizadas &= ~bit
+            mascaras[nivel] = MascarasAvaliacao(respondidas, instituidas, institucionalizadas)
+
+        avaliacoes = {}
+        for nivel, mascara in mascaras.items():
+            avaliacao_id, titulo, data_criacao, _ = self.avaliacoes.get(nivel, (None, None, None, None))
+            avaliacoes[nivel] = (avaliacao_id, titulo, data_criacao, mascara)
+        return EstadoOrgao(self.orgao_id, avaliacoes)
+
+
+def validar_alteracoes(modelo, alteracoes):
+    """Alterações do corpo da requisição -> lista normalizada (ParametroInvalido se inválida)"""
+    if not isinstance(alteracoes, list):
+        raise ParametroInvalido('alteracoes deve ser uma lista')
+    if len(alteracoes) > MAX_ALTERACOES:
+        raise ParametroInvalido(f'Máximo de {MAX_ALTERACOES} alterações por simulação')
+
+    normalizadas = []
+    for alteracao in alteracoes:
+        if not isinstance(alteracao, dict) or not alteracao.get('atividade_id'):
+            raise ParametroInvalido('Cada alteração deve ter atividade_id')
+        atividade_id = str(alteracao['atividade_id'])
+        if atividade_id not in modelo.posicao_por_atividade:
+            raise ParametroInvalido(f'Atividade desconhecida: {atividade_id}')
+
+        normalizada = {'atividade_id': atividade_id}
+        for campo in ('instituido', 'institucionalizado'):
+            if campo in alteracao:
+                normalizada[campo] = bool(alteracao[campo])
+        normalizadas.append(normalizada)
+    return normalizadas
+
+
+def atividades_faltantes(modelo, mascaras, nivel):
+    """Atividades do nível não institucionalizadas, na ordem do modelo"""
+    institucionalizadas = mascaras.institucionalizadas if mascaras else 0
+    return [atividade_id for atividade_id in modelo.atividades_por_nivel.get(nivel, ())
+            if not institucionalizadas >> modelo.posicao_por_atividade[atividade_id] & 1]
+
+
+def simular(conn, orgao_id, alteracoes):
+    """
+    Aplica as alterações ao estado atual do órgão e compara as classificações.
+
+    Para cada nível, retorna as atividades faltantes (o conjunto mínimo: a
+    certificação exige todas institucionalizadas) e, para cada nível acima do
+    simulado, tudo o que falta nos níveis 2..N para alcançá-lo.
+    """
+    modelo = modelo_atual()
+    alteracoes = validar_alteracoes(modelo, alteracoes)
+
+    atual = EstadoOrgao.carregar(conn, orgao_id)
+    simulado = atual.aplicar(modelo, alteracoes)
+
+    classificacao_atual = classificar(atual.completude(modelo))
+    classificacao_simulada = classificar(simulado.completude(modelo))
+    niveis_alterados = {modelo.nivel_por_atividade[a['atividade_id']] for a in alteracoes}
+
+    niveis = []
+    faltantes_por_nivel = {}
+    for nivel in NIVEIS_CERTIFICAVEIS:
+        mascaras = simulado.mascaras(nivel)
+        faltantes = atividades_faltantes(modelo, mascaras, nivel)
+        faltantes_por_nivel[nivel] = faltantes
+        niveis.append({
+            'nivel': nivel,
+            'avaliacao_id': simulado.avaliacoes[nivel][0] if mascaras else None,
+            # Sem avaliação finalizada do nível, é preciso finalizar uma
+            'avaliacao_finalizada': atual.mascaras(nivel) is not None,
+            'simulado': nivel in niveis_alterados,
+            'total_esperadas': modelo.total_por_nivel.get(nivel, 0),
+            'total_institucionalizadas': modelo.total_por_nivel.get(nivel, 0) - len(faltantes),
+            'completo': mascaras is not None and not faltantes,
+            'atividades_faltantes': faltantes
+        })
+
+    nivel_simulado = classificacao_simulada['nivel_maturidade']
+    para_atingir = {}
+    acumulado = []
+    for nivel in NIVEIS_CERTIFICAVEIS:
+        acumulado = acumulado + faltantes_por_nivel[nivel]
+        if nivel > nivel_simulado:
+            para_atingir[nivel] = {
+                'total_atividades': len(acumulado),
+                'atividades': acumulado,
+                'niveis_sem_avaliacao': [n for n in NIVEIS_CERTIFICAVEIS
+                                         if n <= nivel and simulado.mascaras(n) is None]
+            }
+
+    return {
+        'orgao_id': orgao_id,
+        'alteracoes_aplicadas': len(alteracoes),
+        'nivel_atual': classificacao_atual['nivel_maturidade'],
+        'status_atual': classificacao_atual['status'],
+        'nivel_simulado': nivel_simulado,
+        'status_simulado': classificacao_simulada['status'],
+        'niveis': niveis,
+        'para_atingir': para_atingir
+    }
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tema compartilhado dos relatórios em PDF.
+
+Cores, fontes, estilos de parágrafo e estilos de tabela de todos os PDFs
+(individual, individual completo e consolidado) são montados uma única vez
+por processo em tema_relatorio(); os renderizadores só usam os objetos
+prontos. aquecer_tema() monta o tema e carrega as métricas das fontes e é o
+inicializador dos processos de exportação, de modo que a primeira
+renderização de cada processo já começa com tudo pronto.
+
+Os objetos do tema são só lidos durante a montagem dos documentos e podem
+ser compartilhados entre threads.
+"""
+
+import threading
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.platypus import TableStyle
+
+# ===== PALETA E FONTES =====
+
+AZUL = colors.HexColor('#2e75b6')
+AZUL_CLARO = colors.HexColor('#4472c4')
+AZUL_FUNDO = colors.HexColor('#f2f8ff')
+VERDE_TEXTO = colors.HexColor('#2d5016')
+VERDE_FUNDO = colors.HexColor('#e8f5e8')
+VERDE_BORDA = colors.HexColor('#4caf50')
+AZUL_TEXTO = colors.HexColor('#1565c0')
+AZUL_INFO_FUNDO = colors.HexColor('#e3f2fd')
+AZUL_INFO_BORDA = colors.HexColor('#2196f3')
+VERMELHO_TEXTO = colors.HexColor('#d32f2f')
+VERMELHO_FUNDO = colors.HexColor('#ffebee')
+VERMELHO_BORDA = colors.HexColor('#f44336')
+LARANJA_TEXTO = colors.HexColor('#f57c00')
+LARANJA_FUNDO = colors.HexColor('#fff3e0')
+LARANJA_BORDA = colors.HexColor('#ff9800')
+AZUL_REC_TEXTO = colors.HexColor('#1976d2')
+
+FONTE = 'Helvetica'
+FONTE_NEGRITO = 'Helvetica-Bold'
+FONTES = (FONTE, FONTE_NEGRITO, 'Helvetica-Oblique', 'Helvetica-BoldOblique')
+
+
+class TemaRelatorio:
+    """Estilos prontos (estilos[nome]) e estilos de tabela dos relatórios"""
+
+    def __init__(self):
+        estilos = getSampleStyleSheet()
+        self.estilos = estilos
+
+        estilos.add(ParagraphStyle(name='Justify', alignment=TA_JUSTIFY))
+
+        # Relatório individual
+        estilos.add(ParagraphStyle(
+            'TituloSecao',
+            parent=estilos['Heading1'],
+            fontSize=14,
+            textColor=AZUL,
+            spaceAfter=10,
+            borderWidth=1,
+            borderColor=AZUL,
+            borderPadding=5,
+            backColor=AZUL_FUNDO
+        ))
+        estilos.add(ParagraphStyle(
+            'Subtitulo',
+            parent=estilos['Heading2'],
+            fontSize=12,
+            textColor=AZUL_CLARO,
+            spaceAfter=8
+        ))
+        estilos.add(ParagraphStyle(
+            'SubtituloVerde',
+            parent=estilos['Heading2'],
+            fontSize=11,
+            textColor=VERDE_TEXTO,
+            spaceAfter=6,
+            backColor=VERDE_FUNDO,
+            borderWidth=1,
+            borderColor=VERDE_BORDA,
+            borderPadding=3
+        ))
+        estilos.add(ParagraphStyle(
+            'SubtituloAzul',
+            parent=estilos['Heading2'],
+            fontSize=11,
+            textColor=AZUL_TEXTO,
+            spaceAfter=6,
+            backColor=AZUL_INFO_FUNDO,
+            borderWidth=1,
+            borderColor=AZUL_INFO_BORDA,
+            borderPadding=3
+        ))
+
+        # Recomendações, por prioridade
+        for nome, texto, fundo, borda in (('RecomendacaoAlta', VERMELHO_TEXTO, VERMELHO_FUNDO, VERMELHO_BORDA),
+                                          ('RecomendacaoMedia', LARANJA_TEXTO, LARANJA_FUNDO, LARANJA_BORDA),
+                                          ('RecomendacaoBaixa', AZUL_REC_TEXTO, AZUL_INFO_FUNDO, AZUL_INFO_BORDA)):
+            estilos.add(ParagraphStyle(
+                nome,
+                parent=estilos['Normal'],
+                fontSize=10,
+                textColor=texto,
+                backColor=fundo,
+                borderWidth=1,
+                borderColor=borda,
+                borderPadding=5,
+                spaceAfter=8
+            ))
+
+        # Relatório consolidado
+        estilos.add(ParagraphStyle(
+            'CustomTitle',
+            parent=estilos['Heading1'],
+            fontSize=20,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=colors.darkblue
+        ))
+        estilos.add(ParagraphStyle(
+            'CustomSubtitle',
+            parent=estilos['Heading2'],
+            fontSize=14,
+            spaceAfter=15,
+            spaceBefore=20,
+            textColor=colors.darkblue
+        ))
+
+        # Tabelas de dados do individual (maturidade por KPA e evolução)
+        self.tabela_dados = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), AZUL),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), FONTE_NEGRITO),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ])
+
+        # Resumo de avaliações por status do individual
+        self.tabela_resumo = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), AZUL),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), FONTE_NEGRITO),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ])
+
+        # Estatísticas gerais do consolidado
+        self.tabela_estatisticas = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), FONTE_NEGRITO),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('FONTSIZE', (0, 1), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('TOPPADDING', (0, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
+        ])
+
+        # Avaliações por órgão do consolidado
+        self.tabela_orgaos = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),  # Nome do órgão alinhado à esquerda
+            ('ALIGN', (1, 0), (-1, -1), 'CENTER'),  # Demais colunas centralizadas
+            ('FONTNAME', (0, 0), (-1, 0), FONTE_NEGRITO),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('TOPPADDING', (0, 1), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            # Alternar cores das linhas
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.lightgrey, colors.white])
+        ])
+
+
+_tema = None
+_lock = threading.Lock()
+
+
+def tema_relatorio():
+    """Tema do processo (montado na primeira chamada)"""
+    global _tema
+    if _tema is None:
+        with _lock:
+            if _tema is None:
+                _tema = TemaRelatorio()
+    return _tema
+
+
+def aquecer_tema():
+    """Monta o tema e carrega as métricas das fontes (inicializador dos processos)"""
+    for fonte in FONTES:
+        pdfmetrics.getFont(fonte)
+        pdfmetrics.stringWidth('Relatório', fonte, 10)
+    return tema_relatorio()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fixtures dos testes do backend.
+
+O app é importado uma vez por sessão, com o diretório de trabalho e o banco
+em uma pasta temporária (init_db cria o esquema, as migrações e os dados
+padrão). Cada teste cria os próprios órgãos e avaliações.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+ADMIN = {'X-User-Email': 'admin@cge.mt.gov.br'}
+
+
+def inserir_resposta(conn, avaliacao_id, atividade_id, instituido, institucionalizado):
+    """INSERT direto em respostas (sem commit), sem passar pela API"""
+    conn.execute('''
+        INSERT INTO respostas (avaliacao_id, atividade_id, instituido, institucionalizado)
+        VALUES (?, ?, ?, ?)
+    ''', (avaliacao_id, atividade_id, instituido, institucionalizado))
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    pasta = tmp_path_factory.mktemp('prisma')
+    diretorio_original = os.getcwd()
+    # main cria uploads/, exportacoes/ e o cache de relatórios no diretório atual
+    os.chdir(pasta)
+    try:
+        import main
+        main.pool_conexoes.fechar_todas()
+        main.pool_conexoes.caminho = str(pasta / 'prisma.db')
+        main.app.config.update(TESTING=True, ESCRITA_ADIADA=False)
+        main.init_db()
+        yield main.app
+        main.fila_exportacoes.encerrar()
+        main.pool_conexoes.fechar_todas()
+    finally:
+        os.chdir(diretorio_original)
+
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def conn(app):
+    import main
+    conexao = main.pool_conexoes.conexao()
+    yield conexao
+    conexao.close()
+
+
+@pytest.fixture
+def criar_orgao(cliente):
+    """Cria um órgão pela API e retorna o id"""
+    contador = iter(range(1, 10 ** 6))
+
+    def criar(nome=None, superior=None):
+        corpo = {'nome': nome or f'Órgão de teste {next(contador)}', 'sigla': 'OT'}
+        if superior is not None:
+            corpo['orgao_superior_id'] = superior
+        resposta = cliente.post('/api/orgaos', json=corpo, headers=ADMIN)
+        assert resposta.status_code == 200, resposta.get_json()
+        return resposta.get_json()['orgao']['id']
+
+    return criar
+
+
+@pytest.fixture
+def criar_avaliacao(cliente):
+    """Cria uma avaliação pela API e retorna o id"""
+    def criar(orgao_id, nivel=2):
+        resposta = cliente.post('/api/avaliacoes', json={
+            'titulo': f'Avaliação nível {nivel}',
+            'orgao_id': orgao_id,
+            'nivel_desejado': nivel
+        }, headers=ADMIN)
+        assert resposta.status_code == 200, resposta.get_json()
+        return resposta.get_json()['avaliacao_id']
+
+    return criar
+
+
+@pytest.fixture
+def atividades_do_nivel():
+    """Atividades do modelo atual de um nível, em ordem"""
+    from model_registry import modelo_atual
+
+    def atividades(nivel):
+        return sorted(a for a, n in modelo_atual().nivel_por_atividade.items() if n == nivel)
+
+    return atividades
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Análises administrativas (/api/admin/analytics/*)"""
+
+import pytest
+
+from conftest import ADMIN
+
+
+@pytest.mark.parametrize('rota', ['ranking', 'percentis-kpa', 'mapa-calor', 'niveis', 'lacunas'])
+def test_analises_exigem_permissao(cliente, rota):
+    assert cliente.get(f'/api/admin/analytics/{rota}').status_code == 403
+    resposta = cliente.get(f'/api/admin/analytics/{rota}', headers=ADMIN)
+    assert resposta.status_code == 200
+    assert resposta.get_json()['success'] is True
+
+
+def test_erro_interno_nao_expoe_detalhes(cliente, criar_orgao, monkeypatch):
+    import main
+
+    def falhar(conn):
+        raise RuntimeError('/srv/prisma/prisma.db: detalhe interno')
+
+    monkeypatch.setattr(main.BaseAnalitica, 'carregar', falhar)
+    # Escrita nova: a análise não vem do cache
+    criar_orgao()
+    resposta = cliente.get('/api/admin/analytics/niveis', headers=ADMIN)
+    assert resposta.status_code == 500
+    assert resposta.get_json() == {'success': False, 'message': 'Erro interno do servidor'}
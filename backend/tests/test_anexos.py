@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Anexos de evidência (anexos.py): metadados dos arquivos enviados e nomes de
+arquivo vindos do cliente que apontam para fora da pasta de uploads.
+"""
+
+import hashlib
+import io
+import os
+
+import pytest
+
+from anexos import caminho_upload, metadados_arquivo, normalizar_item
+
+from conftest import ADMIN
+
+
+@pytest.mark.parametrize('filename', [
+    '../prisma.db', '/etc/passwd', '..', '.', '', 'sub/arquivo.pdf', '..\\prisma.db', 'a\0b', None, 3,
+])
+def test_nomes_fora_da_pasta_sao_recusados(tmp_path, filename):
+    assert caminho_upload(filename, str(tmp_path)) is None
+    assert metadados_arquivo(filename, str(tmp_path))[:2] == (None, None)
+
+
+def test_link_simbolico_para_fora_da_pasta(tmp_path):
+    pasta = tmp_path / 'uploads'
+    pasta.mkdir()
+    segredo = tmp_path / 'segredo.txt'
+    segredo.write_text('segredo')
+    (pasta / 'link.txt').symlink_to(segredo)
+
+    assert caminho_upload('link.txt', str(pasta)) is None
+    assert metadados_arquivo('link.txt', str(pasta))[:2] == (None, None)
+
+
+def test_metadados_de_arquivo_enviado(tmp_path):
+    (tmp_path / 'evidencia.pdf').write_bytes(b'%PDF-1.4 conteudo')
+
+    size, sha256, mime = metadados_arquivo('evidencia.pdf', str(tmp_path))
+    assert size == len(b'%PDF-1.4 conteudo')
+    assert sha256 == hashlib.sha256(b'%PDF-1.4 conteudo').hexdigest()
+    assert mime == 'application/pdf'
+
+
+def test_normalizar_item():
+    assert normalizar_item('a.pdf') == ('a.pdf', 'a.pdf')
+    assert normalizar_item({'nome': 'Relatório', 'url': '/uploads/b.pdf'}) == ('Relatório', 'b.pdf')
+    assert normalizar_item({'nome': 'x', 'filename': '../prisma.db'}) == ('x', None)
+    assert normalizar_item('/etc/passwd') == ('/etc/passwd', None)
+    assert normalizar_item(5) == (None, None)
+
+
+def test_anexos_pela_api(app, cliente, criar_orgao, criar_avaliacao):
+    avaliacao_id = criar_avaliacao(criar_orgao())
+
+    enviado = cliente.post('/api/upload', data={'arquivo': (io.BytesIO(b'evidencia'), '../../rel atório.pdf')},
+                           content_type='multipart/form-data').get_json()
+    # O nome salvo não sai da pasta de uploads
+    assert '/' not in enviado['filename'] and '..' not in enviado['filename']
+    assert os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], enviado['filename']))
+
+    resposta = cliente.post(f'/api/avaliacoes/{avaliacao_id}/respostas', json={
+        'atividade_id': '2.1.1',
+        'instituido': True,
+        'arquivos_instituido': [
+            {'nome': 'Evidência', 'filename': enviado['filename']},
+            {'nome': 'banco', 'filename': '../prisma.db'},
+            {'nome': 'senhas', 'filename': '/etc/passwd'},
+            '../../etc/hosts',
+        ]
+    }, headers=ADMIN)
+    assert resposta.status_code == 200
+
+    anexos = cliente.get(f'/api/avaliacoes/{avaliacao_id}/anexos', headers=ADMIN).get_json()['anexos']
+    assert [anexo['filename'] for anexo in anexos] == [enviado['filename']]
+    assert anexos[0]['size'] == len(b'evidencia')
+    assert anexos[0]['sha256'] == hashlib.sha256(b'evidencia').hexdigest()
+
+    respostas = cliente.get(f'/api/avaliacoes/{avaliacao_id}/respostas', headers=ADMIN).get_json()
+    arquivos = respostas[0]['arquivos_instituido']
+    assert [arquivo['filename'] for arquivo in arquivos] == [enviado['filename']]
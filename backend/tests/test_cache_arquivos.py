@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache em disco dos relatórios exportados (cache_arquivos.py) e a versão dos
+dados por órgão que o endereça (orgao_versao_dados, migração 13, mantida por
+triggers).
+"""
+
+import os
+import time
+
+from cache_arquivos import CacheArquivosRelatorio
+
+from conftest import ADMIN, inserir_resposta
+
+
+def versao(conn, orgao_id):
+    row = conn.execute('SELECT versao FROM orgao_versao_dados WHERE orgao_id = ?', (orgao_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def test_versao_dos_dados_do_orgao(conn, criar_orgao, criar_avaliacao):
+    orgao_id = criar_orgao()
+    outro_id = criar_orgao()
+    inicial = versao(conn, orgao_id)
+
+    avaliacao_id = criar_avaliacao(orgao_id)
+    assert versao(conn, orgao_id) > inicial
+
+    passos = [
+        lambda: inserir_resposta(conn, avaliacao_id, 'a1', 1, 0),
+        lambda: conn.execute("UPDATE respostas SET institucionalizado = 1 WHERE avaliacao_id = ?",
+                             (avaliacao_id,)),
+        lambda: conn.execute("DELETE FROM respostas WHERE avaliacao_id = ?", (avaliacao_id,)),
+        lambda: conn.execute("UPDATE avaliacoes SET status = 'finalizada' WHERE id = ?", (avaliacao_id,)),
+        lambda: conn.execute("UPDATE orgaos SET sigla = 'X' WHERE id = ?", (orgao_id,)),
+    ]
+    for passo in passos:
+        antes = versao(conn, orgao_id)
+        passo()
+        conn.commit()
+        assert versao(conn, orgao_id) > antes
+
+    # Trocar a avaliação de órgão muda a versão dos dois
+    antes, antes_outro = versao(conn, orgao_id), versao(conn, outro_id)
+    conn.execute('UPDATE avaliacoes SET orgao_id = ? WHERE id = ?', (outro_id, avaliacao_id))
+    conn.commit()
+    assert versao(conn, orgao_id) > antes
+    assert versao(conn, outro_id) > antes_outro
+
+    antes_outro = versao(conn, outro_id)
+    conn.execute('DELETE FROM avaliacoes WHERE id = ?', (avaliacao_id,))
+    conn.commit()
+    assert versao(conn, outro_id) > antes_outro
+
+    # Escrita em outro órgão não muda a versão deste
+    antes = versao(conn, orgao_id)
+    conn.execute("UPDATE orgaos SET sigla = 'Y' WHERE id = ?", (outro_id,))
+    conn.commit()
+    assert versao(conn, orgao_id) == antes
+
+
+def test_versoes_e_variantes(tmp_path):
+    cache = CacheArquivosRelatorio(str(tmp_path))
+    assert cache.obter('individual', 1, 'pdf', 1) is None
+
+    with cache.guardar('individual', 1, 'pdf', 1, b'v1') as arquivo:
+        assert arquivo.read() == b'v1'
+    with cache.obter('individual', 1, 'pdf', 1) as arquivo:
+        assert arquivo.read() == b'v1'
+
+    # Versão nova substitui a anterior; outra variante e outro órgão ficam
+    cache.guardar('individual', 1, 'pdf', 1, b'variante', {'usuario': 'a'}).close()
+    cache.guardar('individual', 10, 'pdf', 1, b'outro').close()
+    cache.guardar('individual', 1, 'pdf', 2, b'v2').close()
+    assert cache.obter('individual', 1, 'pdf', 1) is None
+    for chaves, corpo in [(('individual', 1, 'pdf', 2), b'v2'),
+                          (('individual', 1, 'pdf', 1, {'usuario': 'a'}), b'variante'),
+                          (('individual', 10, 'pdf', 1), b'outro')]:
+        with cache.obter(*chaves) as arquivo:
+            assert arquivo.read() == corpo
+
+    # A variante também troca de versão sem apagar a principal
+    cache.guardar('individual', 1, 'pdf', 2, b'variante 2', {'usuario': 'a'}).close()
+    assert cache.obter('individual', 1, 'pdf', 1, {'usuario': 'a'}) is None
+    with cache.obter('individual', 1, 'pdf', 2) as arquivo:
+        assert arquivo.read() == b'v2'
+
+
+def test_limite_remove_os_menos_usados(tmp_path):
+    cache = CacheArquivosRelatorio(str(tmp_path), max_bytes=25)
+    for orgao_id in (1, 2):
+        cache.guardar('individual', orgao_id, 'pdf', 1, b'x' * 10).close()
+    antigo = time.time() - 60
+    os.utime(cache.caminho('individual', 1, 'pdf', 1), (antigo, antigo))
+
+    cache.guardar('individual', 3, 'pdf', 1, b'x' * 10).close()
+    assert cache.obter('individual', 1, 'pdf', 1) is None
+    assert cache.estatisticas()['bytes'] <= 25
+
+
+def test_exportacao_repetida_vem_do_cache(cliente, conn):
+    import main
+    orgao_id = conn.execute('SELECT orgao_id FROM usuarios WHERE email = ?',
+                            (ADMIN['X-User-Email'],)).fetchone()[0]
+    conn.execute('UPDATE orgaos SET sigla = sigla WHERE id = ?', (orgao_id,))
+    conn.commit()
+
+    def exportar():
+        resposta = cliente.post('/api/relatorio-individual/exportar', headers=ADMIN)
+        assert resposta.status_code == 200
+        assert resposta.mimetype == 'application/pdf'
+        return resposta.data
+
+    antes = main.cache_arquivos.estatisticas()
+    primeiro = exportar()
+    segundo = exportar()
+    depois = main.cache_arquivos.estatisticas()
+    assert primeiro == segundo
+    assert depois['gravados'] == antes['gravados'] + 1
+    assert depois['acertos'] == antes['acertos'] + 1
+
+    # Escrita no órgão muda a versão: o PDF é gerado de novo
+    conn.execute('UPDATE orgaos SET sigla = sigla WHERE id = ?', (orgao_id,))
+    conn.commit()
+    exportar()
+    assert main.cache_arquivos.estatisticas()['gravados'] == antes['gravados'] + 2
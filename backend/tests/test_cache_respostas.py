@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Respostas dos relatórios administrativos em cache por geração dos dados
+(cache_respostas.py): ETag, 304 com If-None-Match e invalidação na escrita.
+"""
+
+import pytest
+
+from conftest import ADMIN
+
+
+@pytest.mark.parametrize('rota', ['/api/admin/relatorios', '/api/admin/analytics/niveis'])
+def test_etag_e_304(cliente, criar_orgao, rota):
+    primeira = cliente.get(rota, headers=ADMIN)
+    assert primeira.status_code == 200
+    assert primeira.headers['Cache-Control'] == 'private, no-cache'
+    etag = primeira.headers['ETag']
+
+    repetida = cliente.get(rota, headers={**ADMIN, 'If-None-Match': etag})
+    assert repetida.status_code == 304
+    assert repetida.data == b''
+
+    # Sem If-None-Match o corpo em cache é enviado de novo, igual
+    assert cliente.get(rota, headers=ADMIN).data == primeira.data
+
+    # Uma escrita muda a geração dos dados: o ETag antigo não vale mais
+    criar_orgao()
+    depois = cliente.get(rota, headers={**ADMIN, 'If-None-Match': etag})
+    assert depois.status_code == 200
+    assert depois.headers['ETag'] != etag
+
+
+def test_cache_nao_dispensa_permissao(cliente):
+    assert cliente.get('/api/admin/relatorios', headers=ADMIN).status_code == 200
+    # Usuário desconhecido: 404, como antes do cache
+    assert cliente.get('/api/admin/relatorios').status_code == 404
+    assert cliente.get('/api/admin/analytics/niveis').status_code == 403
+
+
+def test_query_string_faz_parte_da_chave(cliente, criar_orgao):
+    criar_orgao()
+    criar_orgao()
+    padrao = cliente.get('/api/admin/analytics/ranking', headers=ADMIN)
+    limitado = cliente.get('/api/admin/analytics/ranking?limit=1', headers=ADMIN)
+    assert padrao.status_code == limitado.status_code == 200
+    assert padrao.headers['ETag'] != limitado.headers['ETag']
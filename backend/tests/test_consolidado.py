@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Maturidade consolidada da subárvore de um órgão (hierarquia.CacheConsolidado):
+o resultado acompanha a hierarquia e as classificações dos descendentes.
+"""
+
+from conftest import ADMIN
+
+
+def certificar_nivel2(cliente, orgao_id, criar_avaliacao, atividades_do_nivel):
+    avaliacao_id = criar_avaliacao(orgao_id, 2)
+    resposta = cliente.post(f'/api/avaliacoes/{avaliacao_id}/respostas/lote', json={'respostas': [
+        {'atividade_id': a, 'instituido': True, 'institucionalizado': True} for a in atividades_do_nivel(2)
+    ]}, headers=ADMIN)
+    assert resposta.status_code == 200
+    assert cliente.post(f'/api/avaliacoes/{avaliacao_id}/finalizar', headers=ADMIN).status_code == 200
+
+
+def consolidado(cliente, orgao_id, query=''):
+    resposta = cliente.get(f'/api/orgaos/{orgao_id}/consolidado{query}', headers=ADMIN)
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()
+
+
+def test_consolidado_acompanha_a_subarvore(app, cliente, criar_orgao, criar_avaliacao, atividades_do_nivel):
+    import main
+    raiz = criar_orgao()
+    filho = criar_orgao(superior=raiz)
+    neto = criar_orgao(superior=filho)
+
+    inicial = consolidado(cliente, raiz)
+    assert inicial['total_orgaos'] == 3
+    assert inicial['orgaos_avaliados'] == 0
+    assert inicial['distribuicao_niveis']['1'] == 3
+
+    # Sem mudanças, a consolidação vem do cache
+    acertos = main.cache_consolidado.estatisticas()['acertos']
+    assert consolidado(cliente, raiz) == inicial
+    assert main.cache_consolidado.estatisticas()['acertos'] == acertos + 1
+
+    # Certificação de um descendente invalida a consolidação dos ancestrais
+    certificar_nivel2(cliente, neto, criar_avaliacao, atividades_do_nivel)
+    depois = consolidado(cliente, raiz)
+    assert depois['orgaos_avaliados'] == 1
+    assert depois['distribuicao_niveis']['2'] == 1
+    assert depois['media_institucionalizacao'] is not None
+    assert consolidado(cliente, filho)['distribuicao_niveis']['2'] == 1
+
+    # Mover o filho (com o neto) para fora da subárvore
+    resposta = cliente.put(f'/api/orgaos/{filho}', json={'nome': 'Filho', 'orgao_superior_id': None},
+                           headers=ADMIN)
+    assert resposta.status_code == 200
+    movido = consolidado(cliente, raiz)
+    assert movido['total_orgaos'] == 1
+    assert movido['orgaos_avaliados'] == 0
+
+
+def test_consolidado_parametros(cliente, criar_orgao):
+    orgao_id = criar_orgao()
+    assert consolidado(cliente, orgao_id, '?limite_kpas=0')['kpas_defasadas'] == []
+    assert cliente.get(f'/api/orgaos/{orgao_id}/consolidado?limite_kpas=-1', headers=ADMIN).status_code == 400
+    assert cliente.get('/api/orgaos/999999999/consolidado', headers=ADMIN).status_code == 404
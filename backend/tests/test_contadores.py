@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contadores de respostas em avaliacoes (migração 4), mantidos por triggers:
+devem bater com a contagem das respostas depois de inserções, alterações,
+exclusões e do UPSERT da API.
+"""
+
+from conftest import inserir_resposta
+
+
+def contadores(conn, avaliacao_id):
+    return conn.execute('''
+        SELECT total_respostas, total_instituidas, total_institucionalizadas
+        FROM avaliacoes WHERE id = ?
+    ''', (avaliacao_id,)).fetchone()
+
+
+def contadores_recalculados(conn, avaliacao_id):
+    return conn.execute('''
+        SELECT COUNT(*),
+               COUNT(*) FILTER (WHERE instituido = 1),
+               COUNT(*) FILTER (WHERE institucionalizado = 1)
+        FROM respostas WHERE avaliacao_id = ?
+    ''', (avaliacao_id,)).fetchone()
+
+
+def test_contadores_de_respostas(conn, criar_orgao, criar_avaliacao):
+    orgao_id = criar_orgao()
+    avaliacao_id = criar_avaliacao(orgao_id)
+    outra_id = criar_avaliacao(orgao_id)
+
+    inserir_resposta(conn, avaliacao_id, 'a1', 1, 1)
+    inserir_resposta(conn, avaliacao_id, 'a2', 1, 0)
+    inserir_resposta(conn, avaliacao_id, 'a3', 0, 0)
+    conn.commit()
+    assert contadores(conn, avaliacao_id) == (3, 2, 1)
+
+    conn.execute('''
+        UPDATE respostas SET instituido = 0, institucionalizado = 1
+        WHERE avaliacao_id = ? AND atividade_id = 'a2'
+    ''', (avaliacao_id,))
+    conn.execute('''
+        UPDATE respostas SET avaliacao_id = ? WHERE avaliacao_id = ? AND atividade_id = 'a1'
+    ''', (outra_id, avaliacao_id))
+    conn.execute("DELETE FROM respostas WHERE avaliacao_id = ? AND atividade_id = 'a3'", (avaliacao_id,))
+    conn.commit()
+
+    for id_ in (avaliacao_id, outra_id):
+        assert contadores(conn, id_) == contadores_recalculados(conn, id_)
+    assert contadores(conn, avaliacao_id) == (1, 0, 1)
+    assert contadores(conn, outra_id) == (1, 1, 1)
+
+
+def test_contadores_com_upsert_da_api(cliente, conn, criar_orgao, criar_avaliacao):
+    avaliacao_id = criar_avaliacao(criar_orgao())
+    url = f'/api/avaliacoes/{avaliacao_id}/respostas'
+
+    cliente.post(url, json={'atividade_id': 'a1', 'instituido': True})
+    cliente.post(url, json={'atividade_id': 'a1', 'instituido': True, 'institucionalizado': True})
+    cliente.post(url, json={'atividade_id': 'a2', 'instituido': False})
+
+    assert contadores(conn, avaliacao_id) == contadores_recalculados(conn, avaliacao_id) == (2, 1, 1)
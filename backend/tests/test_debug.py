@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Rotas /debug/* de estatísticas: só para usuários com gerar_relatorios"""
+
+import pytest
+
+from conftest import ADMIN
+
+ROTAS = [
+    '/debug/pool',
+    '/debug/fila-escrita',
+    '/debug/cache-consolidado',
+    '/debug/cache-relatorios',
+    '/debug/exportacoes',
+    '/debug/lotes-exportacao',
+    '/debug/cache-arquivos',
+    '/debug/snapshot-diario',
+]
+
+
+@pytest.mark.parametrize('rota', ROTAS)
+def test_estatisticas_exigem_permissao(cliente, rota):
+    assert cliente.get(rota).status_code == 403
+    assert cliente.get(rota, headers={'X-User-Email': 'ninguem@cge.mt.gov.br'}).status_code == 403
+
+    resposta = cliente.get(rota, headers=ADMIN)
+    assert resposta.status_code == 200
+    assert isinstance(resposta.get_json(), dict)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exportação em lote (exportacao_lote.py): ZIP com o PDF de cada órgão e o
+progresso do lote, consultável a partir de qualquer processo.
+"""
+
+import io
+import zipfile
+
+from exportacao_lote import LotesExportacao, CONCLUIDA, CANCELADA
+
+from conftest import ADMIN
+
+
+def test_zip_e_progresso(app, cliente, conn, criar_orgao):
+    import main
+    criar_orgao(nome='Órgão do lote')
+    orgaos = conn.execute('SELECT id FROM orgaos').fetchall()
+
+    resposta = cliente.post('/api/admin/relatorios/exportar-todos',
+                            headers={**ADMIN, 'Origin': 'http://localhost:3000'})
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'application/zip'
+    # O frontend (outra origem) só lê os cabeçalhos liberados pelo CORS
+    expostos = resposta.headers['Access-Control-Expose-Headers']
+    assert 'X-Exportacao-Lote' in expostos and 'X-Exportacao-Progresso' in expostos
+
+    lote_id = resposta.headers['X-Exportacao-Lote']
+    with zipfile.ZipFile(io.BytesIO(resposta.get_data())) as arquivo_zip:
+        nomes = arquivo_zip.namelist()
+        assert 'erros.txt' not in nomes, arquivo_zip.read('erros.txt').decode()
+        assert sorted(int(nome.rsplit('_', 1)[1][:-4]) for nome in nomes) == sorted(id_ for id_, in orgaos)
+        assert all(arquivo_zip.read(nome).startswith(b'%PDF') for nome in nomes)
+
+    progresso = cliente.get(resposta.headers['X-Exportacao-Progresso'], headers=ADMIN).get_json()['lote']
+    assert progresso['id'] == lote_id
+    assert progresso['status'] == CONCLUIDA
+    assert progresso['total'] == progresso['concluidos'] == len(orgaos)
+    assert progresso['percentual'] == 100.0
+    assert progresso['erros'] == []
+
+    # Outro processo do servidor (outra instância) lê o mesmo progresso
+    outro_processo = LotesExportacao(main.pool_conexoes, main.fila_exportacoes)
+    assert outro_processo.obter(lote_id, ADMIN['X-User-Email']) == progresso
+
+    outro = {'X-User-Email': 'outro@cge.mt.gov.br'}
+    assert cliente.get(f'/api/admin/relatorios/exportar-todos/{lote_id}', headers=outro).status_code == 404
+
+
+def test_lote_interrompido_fica_cancelado(app, conn):
+    import main
+    lotes = LotesExportacao(main.pool_conexoes, main.fila_exportacoes)
+    orgaos = [(id_, f'relatorio_{id_}.pdf', {'orgao_nome': 'x'}) for id_, in
+              conn.execute('SELECT id FROM orgaos LIMIT 3').fetchall()]
+
+    lote_id = lotes.criar(ADMIN['X-User-Email'], len(orgaos))
+    assert lotes.obter(lote_id, ADMIN['X-User-Email'])['percentual'] == 0.0
+
+    # Cliente desconectado: o gerador é fechado no meio do ZIP
+    zip_em_andamento = lotes.gerar_zip(lote_id, orgaos, main.pool_conexoes.caminho)
+    next(zip_em_andamento)
+    zip_em_andamento.close()
+
+    progresso = lotes.obter(lote_id, ADMIN['X-User-Email'])
+    assert progresso['status'] == CANCELADA
+    assert progresso['data_conclusao'] is not None
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exportações em segundo plano (exportacoes.py): o fluxo pela API e a
+retomada de jobs interrompidos com vários processos web.
+"""
+
+import json
+import time
+import uuid
+
+import pytest
+
+from exportacoes import FilaExportacoes, PENDENTE, PROCESSANDO, CONCLUIDA
+
+from conftest import ADMIN
+
+
+def test_exportacao_assincrona_pela_api(cliente, conn):
+    # Muda a versão dos dados do órgão do admin para o PDF não vir do cache
+    conn.execute('''
+        UPDATE orgaos SET sigla = sigla
+        WHERE id = (SELECT orgao_id FROM usuarios WHERE email = ?)
+    ''', (ADMIN['X-User-Email'],))
+    conn.commit()
+
+    resposta = cliente.post('/api/relatorio-individual/exportar', json={'assincrono': True}, headers=ADMIN)
+    assert resposta.status_code == 202
+    url_status = resposta.get_json()['url_status']
+
+    limite = time.monotonic() + 60
+    while True:
+        exportacao = cliente.get(url_status, headers=ADMIN).get_json()['exportacao']
+        if exportacao['status'] not in (PENDENTE, PROCESSANDO) or time.monotonic() > limite:
+            break
+        time.sleep(0.2)
+    assert exportacao['status'] == CONCLUIDA, exportacao
+
+    # Só quem criou vê o job
+    outro = {'X-User-Email': 'outro@cge.mt.gov.br'}
+    assert cliente.get(url_status, headers=outro).status_code == 404
+    assert cliente.get(exportacao['url_download'], headers=outro).status_code == 404
+
+    arquivo = cliente.get(exportacao['url_download'], headers=ADMIN)
+    assert arquivo.status_code == 200
+    assert arquivo.mimetype == 'application/pdf'
+    assert arquivo.data.startswith(b'%PDF')
+
+
+@pytest.fixture
+def filas(app, tmp_path, monkeypatch):
+    """Cria filas como se fossem processos web diferentes, sem enviar nada ao pool"""
+    import main
+    criadas = []
+
+    def criar():
+        fila = FilaExportacoes(main.pool_conexoes, str(tmp_path))
+        fila.enviadas = []
+        monkeypatch.setattr(fila, '_executor_ativo', lambda recriar=False: (None, set()))
+        monkeypatch.setattr(fila, '_enviar', lambda exportacao_id, *_: fila.enviadas.append(exportacao_id))
+        criadas.append(fila)
+        return fila
+
+    yield criar
+    for fila in criadas:
+        fila.encerrar()
+
+
+def inserir_job(conn, dono, status=PENDENTE):
+    exportacao_id = uuid.uuid4().hex
+    conn.execute('''
+        INSERT INTO exportacoes (id, tipo, status, usuario_email, dados, nome_arquivo, dono)
+        VALUES (?, 'individual', ?, 'admin@cge.mt.gov.br', ?, 'relatorio.pdf', ?)
+    ''', (exportacao_id, status, json.dumps({}), dono))
+    conn.commit()
+    return exportacao_id
+
+
+def dono(conn, exportacao_id):
+    return conn.execute('SELECT dono FROM exportacoes WHERE id = ?', (exportacao_id,)).fetchone()[0]
+
+
+def test_retomada_nao_assume_jobs_de_processos_ativos(conn, filas):
+    conn.execute("UPDATE exportacoes SET status = 'erro' WHERE status IN (?, ?)", (PENDENTE, PROCESSANDO))
+    conn.commit()
+
+    ativa = filas()
+    ativa.iniciar()
+    do_ativo = inserir_job(conn, ativa.dono, PROCESSANDO)
+    sem_dono = inserir_job(conn, None)
+    de_morto = inserir_job(conn, '12345-morto', PROCESSANDO)
+
+    nova = filas()
+    nova.iniciar()
+    assert sorted(nova.enviadas) == sorted([sem_dono, de_morto])
+    assert dono(conn, do_ativo) == ativa.dono
+    assert dono(conn, sem_dono) == dono(conn, de_morto) == nova.dono
+
+    # Outro processo iniciando depois não pega nada: os jobs já têm um dono vivo
+    terceira = filas()
+    terceira.iniciar()
+    assert terceira.enviadas == []
+
+    # Quando o dono encerra, os jobs dele passam para quem retomar
+    ativa.encerrar()
+    assert terceira.retomar() == 1
+    assert terceira.enviadas == [do_ativo]
+    assert dono(conn, do_ativo) == terceira.dono
+    status = conn.execute('SELECT status FROM exportacoes WHERE id = ?', (do_ativo,)).fetchone()[0]
+    assert status == PENDENTE
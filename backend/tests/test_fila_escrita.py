@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fila de escrita adiada (fila_escrita.py): combinação de gravações repetidas,
+barreira descarregar(), isolamento de respostas inválidas e barreira da
+finalização no app.
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from database import PoolConexoes
+from fila_escrita import FilaEscrita, FilaEscritaIndisponivel
+
+from conftest import ADMIN
+
+# Sem gravação espontânea durante o teste: só descarregar() grava
+INTERVALO_LONGO = 60
+
+
+class Gravador:
+    """gravar() da fila que grava em uma tabela simples e registra os lotes"""
+
+    def __init__(self):
+        self.lotes = []
+        self.falhar = {}  # atividade_id -> exceção
+
+    def __call__(self, conn, respostas_por_avaliacao):
+        self.lotes.append({a: [dict(r) for r in rs] for a, rs in respostas_por_avaliacao.items()})
+        for avaliacao_id, respostas in respostas_por_avaliacao.items():
+            for resposta in respostas:
+                erro = self.falhar.get(resposta['atividade_id'])
+                if erro is not None:
+                    raise erro
+                conn.execute('''
+                    INSERT INTO respostas (avaliacao_id, atividade_id, instituido, justificativa)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (avaliacao_id, atividade_id) DO UPDATE SET
+                        instituido = excluded.instituido, justificativa = excluded.justificativa
+                ''', (avaliacao_id, resposta['atividade_id'], resposta.get('instituido'),
+                      resposta.get('justificativa')))
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = PoolConexoes(str(tmp_path / 'fila.db'))
+    conn = pool.conexao()
+    conn.execute('''
+        CREATE TABLE respostas (
+            avaliacao_id INTEGER, atividade_id TEXT, instituido INTEGER, justificativa TEXT,
+            PRIMARY KEY (avaliacao_id, atividade_id)
+        )
+    ''')
+    conn.commit()
+    conn.close()
+    yield pool
+    pool.fechar_todas()
+
+
+@pytest.fixture
+def gravador():
+    return Gravador()
+
+
+@pytest.fixture
+def fila(pool, gravador, tmp_path):
+    return FilaEscrita(pool, gravador, intervalo=INTERVALO_LONGO,
+                       arquivo_trava=str(tmp_path / 'fila.lock'))
+
+
+def gravadas(pool, avaliacao_id):
+    conn = pool.conexao()
+    try:
+        return {row[0]: (row[1], row[2]) for row in conn.execute('''
+            SELECT atividade_id, instituido, justificativa FROM respostas WHERE avaliacao_id = ?
+        ''', (avaliacao_id,))}
+    finally:
+        conn.close()
+
+
+def test_gravacoes_repetidas_sao_combinadas(fila, pool, gravador):
+    assert fila.enfileirar(1, {'atividade_id': 'a1', 'instituido': True})
+    assert fila.enfileirar(1, {'atividade_id': 'a1', 'justificativa': 'texto'})
+    assert fila.enfileirar(1, {'atividade_id': 'a2', 'instituido': False})
+    assert fila.enfileirar(2, {'atividade_id': 'a1', 'instituido': True})
+
+    assert fila.descarregar()
+
+    # Um lote só, com uma gravação por (avaliação, atividade) e os campos combinados
+    assert len(gravador.lotes) == 1
+    lote = gravador.lotes[0]
+    assert sorted(len(respostas) for respostas in lote.values()) == [1, 2]
+    assert gravadas(pool, 1) == {'a1': (1, 'texto'), 'a2': (0, None)}
+    assert gravadas(pool, 2) == {'a1': (1, None)}
+
+    stats = fila.estatisticas()
+    assert stats['recebidas'] == 4
+    assert stats['combinadas'] == 1
+    assert stats['gravadas'] == 3
+    assert stats['pendentes'] == 0
+
+
+def test_descarregar_e_barreira_por_avaliacao(fila, pool):
+    for indice in range(50):
+        fila.enfileirar(7, {'atividade_id': f'a{indice}', 'instituido': True})
+    fila.enfileirar(8, {'atividade_id': 'x', 'instituido': True})
+
+    # Sem descarregar nada foi gravado (intervalo longo)
+    assert gravadas(pool, 7) == {}
+
+    assert fila.descarregar(7)
+    assert len(gravadas(pool, 7)) == 50
+    assert fila.descarregar()
+    assert gravadas(pool, 8) == {'x': (1, None)}
+
+
+def test_descarregar_com_produtores_concorrentes(fila, pool):
+    def produzir(avaliacao_id):
+        for indice in range(200):
+            fila.enfileirar(avaliacao_id, {'atividade_id': f'a{indice % 20}', 'instituido': indice % 2})
+
+    threads = [threading.Thread(target=produzir, args=(avaliacao_id,)) for avaliacao_id in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fila.descarregar()
+    for avaliacao_id in (1, 2, 3):
+        # A última gravação de cada atividade prevalece
+        assert gravadas(pool, avaliacao_id) == {f'a{i}': ((180 + i) % 2, None) for i in range(20)}
+
+
+def test_resposta_invalida_nao_descarta_as_vizinhas(fila, pool, gravador):
+    gravador.falhar['ruim'] = sqlite3.IntegrityError('NOT NULL constraint failed')
+    fila.enfileirar(1, {'atividade_id': 'a1', 'instituido': True})
+    fila.enfileirar(1, {'atividade_id': 'ruim', 'instituido': True})
+    fila.enfileirar(1, {'atividade_id': 'a2', 'instituido': True})
+    fila.enfileirar(2, {'atividade_id': 'a1', 'instituido': True})
+
+    assert fila.descarregar()
+    assert set(gravadas(pool, 1)) == {'a1', 'a2'}
+    assert set(gravadas(pool, 2)) == {'a1'}
+    assert fila.estatisticas()['descartadas'] == 1
+
+
+def test_banco_ocupado_volta_para_a_fila(pool, gravador, tmp_path):
+    fila = FilaEscrita(pool, gravador, intervalo=0.01, arquivo_trava=str(tmp_path / 'fila.lock'))
+    tentativas = []
+
+    def gravar(conn, respostas_por_avaliacao):
+        tentativas.append(1)
+        if len(tentativas) <= 2:
+            raise sqlite3.OperationalError('database is locked')
+        gravador(conn, respostas_por_avaliacao)
+
+    fila.gravar = gravar
+    fila.enfileirar(1, {'atividade_id': 'a1', 'instituido': True})
+
+    assert fila.descarregar(timeout=5)
+    assert gravadas(pool, 1) == {'a1': (1, None)}
+    assert len(tentativas) == 3
+    assert fila.estatisticas()['descartadas'] == 0
+
+
+def test_outro_processo_nao_usa_a_fila(fila, pool, gravador, tmp_path):
+    fila.enfileirar(1, {'atividade_id': 'a1'})
+
+    # Outra instância com o mesmo arquivo de trava (como outro processo)
+    concorrente = FilaEscrita(pool, gravador, intervalo=INTERVALO_LONGO,
+                              arquivo_trava=str(tmp_path / 'fila.lock'))
+    with pytest.raises(FilaEscritaIndisponivel):
+        concorrente.enfileirar(1, {'atividade_id': 'a2'})
+    assert fila.descarregar()
+
+
+@pytest.fixture
+def escrita_adiada(app, monkeypatch, tmp_path):
+    """Liga a escrita adiada no app com uma fila que só grava na barreira"""
+    import main
+    fila = FilaEscrita(main.pool_conexoes, main.gravar_respostas_pendentes, intervalo=INTERVALO_LONGO,
+                       arquivo_trava=str(tmp_path / 'app.lock'))
+    monkeypatch.setattr(main, 'fila_escrita', fila)
+    monkeypatch.setitem(app.config, 'ESCRITA_ADIADA', True)
+    yield fila
+    fila.descarregar()
+
+
+def test_finalizacao_espera_a_fila(cliente, conn, escrita_adiada, criar_orgao, criar_avaliacao,
+                                   atividades_do_nivel):
+    orgao_id = criar_orgao()
+    avaliacao_id = criar_avaliacao(orgao_id, 2)
+    atividades = atividades_do_nivel(2)
+
+    for atividade_id in atividades:
+        resposta = cliente.post(f'/api/avaliacoes/{avaliacao_id}/respostas', json={
+            'atividade_id': atividade_id, 'instituido': True, 'institucionalizado': True
+        }, headers=ADMIN)
+        assert resposta.status_code == 202
+
+    total = conn.execute('SELECT total_respostas FROM avaliacoes WHERE id = ?', (avaliacao_id,)).fetchone()[0]
+    assert total == 0
+    assert escrita_adiada.estatisticas()['pendentes'] == len(atividades)
+
+    assert cliente.post(f'/api/avaliacoes/{avaliacao_id}/finalizar', headers=ADMIN).status_code == 200
+
+    # A finalização viu todas as respostas: contadores e certificação do nível 2
+    total = conn.execute('SELECT total_respostas FROM avaliacoes WHERE id = ?', (avaliacao_id,)).fetchone()[0]
+    assert total == len(atividades)
+    nivel = conn.execute('SELECT nivel_maturidade FROM orgao_maturidade WHERE orgao_id = ?',
+                         (orgao_id,)).fetchone()[0]
+    assert nivel == 2
+
+
+def test_resposta_invalida_responde_400_sem_enfileirar(cliente, escrita_adiada, criar_orgao, criar_avaliacao):
+    avaliacao_id = criar_avaliacao(criar_orgao())
+    for corpo in ({'instituido': True}, {'atividade_id': 5}, {'atividade_id': 'a1', 'instituido': 'sim'},
+                  {'atividade_id': 'a1', 'justificativa_instituido': 3},
+                  {'atividade_id': 'a1', 'arquivos_instituido': 'x.pdf'}):
+        resposta = cliente.post(f'/api/avaliacoes/{avaliacao_id}/respostas', json=corpo, headers=ADMIN)
+        assert resposta.status_code == 400
+    assert escrita_adiada.estatisticas()['recebidas'] == 0
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hierarquia de órgãos (hierarquia.py): a tabela orgaos_closure (migração 9),
+mantida por triggers, deve bater com a hierarquia recalculada depois de
+inserções, movimentações e exclusões, e a API recusa superiores inválidos.
+"""
+
+import sqlite3
+
+import pytest
+
+from hierarquia import subordinados, ancestrais
+
+from conftest import ADMIN
+
+
+def closure(conn):
+    return set(conn.execute('SELECT ancestor, descendant, depth FROM orgaos_closure').fetchall())
+
+
+def closure_recalculada(conn):
+    return set(conn.execute('''
+        WITH RECURSIVE caminhos(ancestor, descendant, depth) AS (
+            SELECT id, id, 0 FROM orgaos
+            UNION ALL
+            SELECT o.orgao_superior_id, c.descendant, c.depth + 1
+            FROM caminhos c
+            JOIN orgaos o ON o.id = c.ancestor
+            WHERE o.orgao_superior_id IS NOT NULL
+        )
+        SELECT ancestor, descendant, depth FROM caminhos
+    ''').fetchall())
+
+
+def test_closure_da_hierarquia(cliente, conn, criar_orgao):
+    raiz = criar_orgao()
+    filho = criar_orgao(superior=raiz)
+    neto = criar_orgao(superior=filho)
+    outra_raiz = criar_orgao()
+    assert closure(conn) == closure_recalculada(conn)
+    assert (raiz, neto, 2) in closure(conn)
+
+    # Mover o filho move a subárvore inteira
+    conn.execute('UPDATE orgaos SET orgao_superior_id = ? WHERE id = ?', (outra_raiz, filho))
+    conn.commit()
+    assert closure(conn) == closure_recalculada(conn)
+    assert (outra_raiz, neto, 2) in closure(conn)
+    assert not any(a == raiz and d == neto for a, d, _ in closure(conn))
+
+    conn.execute('UPDATE orgaos SET orgao_superior_id = NULL WHERE id = ?', (filho,))
+    conn.execute('DELETE FROM orgaos WHERE id = ?', (neto,))
+    conn.commit()
+    assert closure(conn) == closure_recalculada(conn)
+    assert not any(neto in (a, d) for a, d, _ in closure(conn))
+
+
+def test_closure_rejeita_ciclo(conn, criar_orgao):
+    raiz = criar_orgao()
+    filho = criar_orgao(superior=raiz)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute('UPDATE orgaos SET orgao_superior_id = ? WHERE id = ?', (filho, raiz))
+    conn.rollback()
+    assert closure(conn) == closure_recalculada(conn)
+
+
+def test_subordinados_e_ancestrais(conn, criar_orgao):
+    raiz = criar_orgao(nome='Raiz')
+    filho = criar_orgao(nome='Filho', superior=raiz)
+    neto = criar_orgao(nome='Neto', superior=filho)
+
+    assert [(o['id'], o['profundidade']) for o in subordinados(conn, raiz)] == [(filho, 1), (neto, 2)]
+    assert [o['id'] for o in subordinados(conn, raiz, profundidade_maxima=1)] == [filho]
+    assert [(o['id'], o['distancia']) for o in ancestrais(conn, neto)] == [(raiz, 2), (filho, 1)]
+
+
+def test_api_recusa_ciclo_e_superior_inexistente(cliente, conn, criar_orgao):
+    raiz = criar_orgao()
+    filho = criar_orgao(superior=raiz)
+
+    for superior in (raiz, filho):
+        resposta = cliente.put(f'/api/orgaos/{raiz}', json={'nome': 'Raiz', 'orgao_superior_id': superior},
+                               headers=ADMIN)
+        assert resposta.status_code == 400
+    resposta = cliente.post('/api/orgaos', json={'nome': 'Órfão', 'orgao_superior_id': 10 ** 9}, headers=ADMIN)
+    assert resposta.status_code == 400
+    assert closure(conn) == closure_recalculada(conn)
+
+
+@pytest.mark.parametrize('superior', [[1], {'id': 1}, True, 1.5, 'abc', -1])
+def test_orgao_superior_invalido_responde_400(cliente, criar_orgao, superior):
+    resposta = cliente.post('/api/orgaos', json={'nome': 'Órgão inválido', 'orgao_superior_id': superior},
+                            headers=ADMIN)
+    assert resposta.status_code == 400
+
+    orgao_id = criar_orgao()
+    resposta = cliente.put(f'/api/orgaos/{orgao_id}', json={'nome': 'Órgão', 'orgao_superior_id': superior},
+                           headers=ADMIN)
+    assert resposta.status_code == 400
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Histórico de maturidade (historico.py): retratos gravados na finalização e
+no retrato diário, somente inserção, e a série temporal por período.
+"""
+
+import sqlite3
+
+import pytest
+
+from conftest import ADMIN
+
+
+def retratos(conn, orgao_id):
+    return conn.execute('''
+        SELECT origem, nivel_maturidade FROM maturidade_historico WHERE orgao_id = ? ORDER BY id
+    ''', (orgao_id,)).fetchall()
+
+
+def test_retratos_e_serie(cliente, conn, criar_orgao, criar_avaliacao, atividades_do_nivel):
+    orgao_id = criar_orgao()
+    avaliacao_id = criar_avaliacao(orgao_id, 2)
+    cliente.post(f'/api/avaliacoes/{avaliacao_id}/respostas/lote', json={'respostas': [
+        {'atividade_id': a, 'instituido': True, 'institucionalizado': True} for a in atividades_do_nivel(2)
+    ]}, headers=ADMIN)
+    assert cliente.post(f'/api/avaliacoes/{avaliacao_id}/finalizar', headers=ADMIN).status_code == 200
+    assert retratos(conn, orgao_id) == [('finalizacao', 2)]
+
+    # Um retrato diário por órgão e dia
+    gravados = cliente.post('/api/admin/maturidade/historico/snapshot', headers=ADMIN).get_json()
+    assert gravados['retratos_gravados'] >= 1
+    assert cliente.post('/api/admin/maturidade/historico/snapshot',
+                        headers=ADMIN).get_json()['retratos_gravados'] == 0
+    assert retratos(conn, orgao_id) == [('finalizacao', 2), ('diario', 2)]
+
+    for agrupamento in ('dia', 'semana', 'mes', 'ano'):
+        resposta = cliente.get(f'/api/maturidade/historico?orgao_id={orgao_id}&agrupamento={agrupamento}',
+                               headers=ADMIN)
+        serie = resposta.get_json()['serie']
+        assert len(serie) == 1
+        assert (serie[0]['orgaos'], serie[0]['nivel_maximo']) == (1, 2)
+        assert serie[0]['distribuicao_niveis'] == {'2': 1}
+
+    # Fora do intervalo pedido não há retratos
+    resposta = cliente.get(f'/api/maturidade/historico?orgao_id={orgao_id}&fim=2000-01-01', headers=ADMIN)
+    assert resposta.get_json()['serie'] == []
+
+
+def test_historico_somente_insercao(conn, criar_orgao, cliente):
+    orgao_id = criar_orgao()
+    cliente.post('/api/admin/maturidade/historico/snapshot', headers=ADMIN)
+    assert retratos(conn, orgao_id)
+
+    for comando in ('UPDATE maturidade_historico SET nivel_maturidade = 5 WHERE orgao_id = ?',
+                    'DELETE FROM maturidade_historico WHERE orgao_id = ?'):
+        with pytest.raises(sqlite3.DatabaseError):
+            conn.execute(comando, (orgao_id,))
+        conn.rollback()
+    assert retratos(conn, orgao_id) == [('diario', 1)]
+
+
+@pytest.mark.parametrize('query', ['agrupamento=hora', 'inicio=ontem', 'orgao_id=x'])
+def test_parametros_invalidos(cliente, query):
+    assert cliente.get(f'/api/maturidade/historico?{query}', headers=ADMIN).status_code == 400
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Máscaras de bits das respostas (mascaras.py)"""
+
+import random
+
+import pytest
+
+from mascaras import (codificar, decodificar, contar_bits, contar, montar_mascaras, nivel_completo,
+                      contagem_por_kpa, obter_mascaras)
+from model_registry import modelo_atual
+
+
+@pytest.mark.parametrize('mascara', [0, 1, 255, 256, 2 ** 64 - 1, 2 ** 300 + 5])
+def test_codificar_ida_e_volta(mascara):
+    assert decodificar(codificar(mascara)) == mascara
+
+
+def test_contagem_de_bits():
+    gerador = random.Random(12)
+    for _ in range(200):
+        mascara, referencia = gerador.getrandbits(400), gerador.getrandbits(400)
+        assert contar_bits(mascara) == sum((mascara >> i) & 1 for i in range(400))
+        assert contar(mascara, referencia) == sum((mascara >> i) & (referencia >> i) & 1 for i in range(400))
+
+
+def test_nivel_completo_e_contagem_por_kpa():
+    modelo = modelo_atual()
+    nivel2 = modelo.atividades_por_nivel[2]
+
+    completas = montar_mascaras(modelo, [(a, True, True) for a in nivel2])
+    assert nivel_completo(completas, modelo, 2)
+    assert not nivel_completo(completas, modelo, 3)
+
+    # Uma atividade sem institucionalização impede a certificação do nível
+    faltando = montar_mascaras(modelo, [(a, True, a != nivel2[0]) for a in nivel2])
+    assert not nivel_completo(faltando, modelo, 2)
+
+    kpas = modelo.kpas_por_nivel[2]
+    contagem = contagem_por_kpa(faltando, modelo, kpas)
+    for kpa in kpas:
+        total = len(modelo.atividades_por_kpa[kpa])
+        assert contagem[kpa]['total_esperadas'] == total
+        assert contagem[kpa]['respondidas'] == contagem[kpa]['instituidas'] == total
+    assert sum(c['institucionalizadas'] for c in contagem.values()) == len(nivel2) - 1
+
+
+def test_atividades_fora_do_modelo_sao_ignoradas():
+    mascaras = montar_mascaras(modelo_atual(), [('nao-existe', True, True)])
+    assert mascaras == (0, 0, 0)
+
+
+def test_mascaras_gravadas_acompanham_as_respostas(cliente, conn, criar_orgao, criar_avaliacao,
+                                                   atividades_do_nivel):
+    modelo = modelo_atual()
+    avaliacao_id = criar_avaliacao(criar_orgao())
+    primeira, segunda = atividades_do_nivel(2)[:2]
+    url = f'/api/avaliacoes/{avaliacao_id}/respostas'
+
+    cliente.post(url, json={'atividade_id': primeira, 'instituido': True, 'institucionalizado': True})
+    mascaras = obter_mascaras(conn, [avaliacao_id])[avaliacao_id]
+    conn.commit()
+    bit = 1 << modelo.posicao_por_atividade[primeira]
+    assert mascaras == (bit, bit, bit)
+
+    # Nova resposta muda versao_respostas: a máscara gravada é remontada
+    cliente.post(url, json={'atividade_id': segunda, 'instituido': True, 'institucionalizado': False})
+    mascaras = obter_mascaras(conn, [avaliacao_id])[avaliacao_id]
+    conn.commit()
+    outro = 1 << modelo.posicao_por_atividade[segunda]
+    assert mascaras == (bit | outro, bit | outro, bit)
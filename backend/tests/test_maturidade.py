@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A classificação gravada em orgao_maturidade pelo recálculo incremental
+(finalização e respostas de avaliações finalizadas) deve ser igual à
+classificação completa do órgão (maturity.classificar_orgaos).
+"""
+
+import json
+
+from maturity import classificar_orgaos
+
+from conftest import ADMIN
+
+
+def classificacao_gravada(conn, orgao_id):
+    nivel, status, completude = conn.execute('''
+        SELECT nivel_maturidade, status, completude_niveis FROM orgao_maturidade WHERE orgao_id = ?
+    ''', (orgao_id,)).fetchone()
+    return nivel, status, json.loads(completude)
+
+
+def classificacao_completa(conn, orgao_id):
+    classificacao = classificar_orgaos(conn, [orgao_id])[orgao_id]
+    conn.rollback()
+    # Mesmo formato do JSON gravado (chaves dos níveis como texto)
+    return (classificacao['nivel_maturidade'], classificacao['status'],
+            json.loads(json.dumps(classificacao['completude_niveis'])))
+
+
+def responder(cliente, avaliacao_id, atividades, institucionalizado=True):
+    resposta = cliente.post(f'/api/avaliacoes/{avaliacao_id}/respostas/lote', json={'respostas': [
+        {'atividade_id': a, 'instituido': True, 'institucionalizado': institucionalizado}
+        for a in atividades
+    ]}, headers=ADMIN)
+    assert resposta.status_code == 200, resposta.get_json()
+
+
+def finalizar(cliente, avaliacao_id):
+    resposta = cliente.post(f'/api/avaliacoes/{avaliacao_id}/finalizar', headers=ADMIN)
+    assert resposta.status_code == 200, resposta.get_json()
+
+
+def test_incremental_igual_a_completa(cliente, conn, criar_orgao, criar_avaliacao, atividades_do_nivel):
+    orgao_id = criar_orgao()
+    nivel2, nivel3 = atividades_do_nivel(2), atividades_do_nivel(3)
+    assert nivel2 and nivel3
+
+    # Nível 2 completo e finalizado: órgão certificado no nível 2
+    avaliacao2 = criar_avaliacao(orgao_id, 2)
+    responder(cliente, avaliacao2, nivel2)
+    finalizar(cliente, avaliacao2)
+    assert classificacao_gravada(conn, orgao_id) == classificacao_completa(conn, orgao_id)
+    assert classificacao_gravada(conn, orgao_id)[:2] == (2, 'certificado')
+
+    # Nível 3 finalizado incompleto: continua no nível 2
+    avaliacao3 = criar_avaliacao(orgao_id, 3)
+    responder(cliente, avaliacao3, nivel3[:-1])
+    finalizar(cliente, avaliacao3)
+    assert classificacao_gravada(conn, orgao_id) == classificacao_completa(conn, orgao_id)
+    assert classificacao_gravada(conn, orgao_id)[0] == 2
+
+    # Resposta que completa o nível 3 em avaliação já finalizada
+    responder(cliente, avaliacao3, nivel3[-1:])
+    assert classificacao_gravada(conn, orgao_id) == classificacao_completa(conn, orgao_id)
+    assert classificacao_gravada(conn, orgao_id)[0] == 3
+
+    # Atividade de outro nível na avaliação do nível 3 não altera nada
+    responder(cliente, avaliacao3, nivel2[:1], institucionalizado=False)
+    assert classificacao_gravada(conn, orgao_id) == classificacao_completa(conn, orgao_id)
+
+    # Desfazer uma atividade do nível 2 derruba a certificação
+    cliente.post(f'/api/avaliacoes/{avaliacao2}/respostas', json={
+        'atividade_id': nivel2[0], 'instituido': True, 'institucionalizado': False
+    }, headers=ADMIN)
+    assert classificacao_gravada(conn, orgao_id) == classificacao_completa(conn, orgao_id)
+    assert classificacao_gravada(conn, orgao_id)[:2] == (1, 'inicial')
+
+
+def test_avaliacao_em_andamento_nao_conta(cliente, conn, criar_orgao, criar_avaliacao, atividades_do_nivel):
+    orgao_id = criar_orgao()
+    avaliacao_id = criar_avaliacao(orgao_id, 2)
+    responder(cliente, avaliacao_id, atividades_do_nivel(2))
+
+    assert classificacao_completa(conn, orgao_id)[:2] == (1, 'inicial')
+    row = conn.execute('SELECT nivel_maturidade FROM orgao_maturidade WHERE orgao_id = ?', (orgao_id,)).fetchone()
+    assert row is None or row[0] == 1
+
+
+def test_classificacao_em_lote(cliente, conn, criar_orgao, criar_avaliacao, atividades_do_nivel):
+    certificado = criar_orgao()
+    inicial = criar_orgao()
+    avaliacao_id = criar_avaliacao(certificado, 2)
+    responder(cliente, avaliacao_id, atividades_do_nivel(2))
+    finalizar(cliente, avaliacao_id)
+
+    resposta = cliente.post('/api/maturidade/lote', json={'orgao_ids': [certificado, inicial, 10 ** 9]},
+                            headers=ADMIN)
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert corpo['nao_encontrados'] == [10 ** 9]
+    niveis = {orgao['orgao_id']: orgao['nivel_maturidade'] for orgao in corpo['orgaos']}
+    assert niveis == {certificado: classificacao_completa(conn, certificado)[0],
+                      inicial: classificacao_completa(conn, inicial)[0]}
+    assert niveis[certificado] == 2
+
+    # Antes da finalização o órgão ainda não estava certificado
+    resposta = cliente.post('/api/maturidade/lote', json={
+        'orgao_ids': [certificado], 'data_referencia': '2000-01-01'
+    }, headers=ADMIN)
+    assert resposta.get_json()['orgaos'][0]['nivel_maturidade'] == 1
+
+    assert cliente.post('/api/maturidade/lote', json={'orgao_ids': ['x']}, headers=ADMIN).status_code == 400
+    assert cliente.post('/api/maturidade/lote', json={'orgao_ids': 'all'}).status_code == 403
+
+
+def test_classificacao_em_lote_nao_expoe_erro_interno(cliente, monkeypatch):
+    import main
+
+    def falhar(conn, orgao_ids=None):
+        raise RuntimeError('no such table: orgao_maturidade')
+
+    monkeypatch.setattr(main, 'obter_maturidades', falhar)
+    resposta = cliente.post('/api/maturidade/lote', json={'orgao_ids': 'all'}, headers=ADMIN)
+    assert resposta.status_code == 500
+    assert resposta.get_json() == {'success': False, 'message': 'Erro interno do servidor'}
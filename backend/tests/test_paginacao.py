@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Paginação por cursor (paginacao.py) e validação dos parâmetros nas rotas"""
+
+import base64
+import json
+
+import pytest
+
+from paginacao import ParametroInvalido, codificar_cursor, decodificar_cursor, ler_inteiro
+
+from conftest import ADMIN
+
+
+def cursor_de(valor):
+    return base64.urlsafe_b64encode(json.dumps(valor).encode('utf-8')).decode('ascii')
+
+
+@pytest.mark.parametrize('valores', [
+    ['Secretaria de Saúde', 12],
+    ['2024-01-31 10:00:00', 7],
+    [None, 1],
+    [1.5, 'ção'],
+])
+def test_cursor_ida_e_volta(valores):
+    assert decodificar_cursor(codificar_cursor(valores), len(valores)) == valores
+
+
+@pytest.mark.parametrize('cursor', [
+    'não é base64',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode('ascii'),
+    cursor_de('texto'),
+    cursor_de({'nome': 'a', 'id': 1}),
+    cursor_de(['a']),
+    cursor_de(['a', 1, 2]),
+    cursor_de([{'a': 1}, 2]),
+    cursor_de([[1], 2]),
+    cursor_de([True, 2]),
+])
+def test_cursor_malformado(cursor):
+    with pytest.raises(ParametroInvalido):
+        decodificar_cursor(cursor, 2)
+
+
+@pytest.mark.parametrize('valor', ['abc', '1.5', [1], {'a': 1}])
+def test_ler_inteiro_invalido(valor):
+    with pytest.raises(ParametroInvalido):
+        ler_inteiro({'id': valor}, 'id')
+
+
+def paginar(cliente, url, limite):
+    """Todas as páginas de url (que já tem filtros na query), em ordem"""
+    itens = []
+    cursor = None
+    while True:
+        pagina = cliente.get(f'{url}&limit={limite}' + (f'&cursor={cursor}' if cursor else ''),
+                             headers=ADMIN).get_json()
+        assert len(pagina['itens']) <= limite
+        itens.extend(pagina['itens'])
+        cursor = pagina['proximo_cursor']
+        if not cursor:
+            return itens
+
+
+def test_paginas_iguais_a_lista_completa(cliente, criar_orgao):
+    # Nomes repetidos: o desempate da ordem é pelo id
+    for nome in ('Pag B', 'pag a', 'Pag C', 'Pag B', 'PAG A', 'Pag D', 'Pag B'):
+        criar_orgao(nome=nome)
+
+    completa = cliente.get('/api/orgaos?nome=pag', headers=ADMIN).get_json()
+    assert len(completa) == 7
+    assert [o['id'] for o in paginar(cliente, '/api/orgaos?nome=pag', 3)] == [o['id'] for o in completa]
+
+
+def test_paginas_de_avaliacoes(cliente, criar_orgao, criar_avaliacao):
+    # Criadas no mesmo segundo: o desempate de data_criacao é pelo id
+    raiz = criar_orgao()
+    filho = criar_orgao(superior=raiz)
+    ids = [criar_avaliacao(raiz) for _ in range(4)] + [criar_avaliacao(filho) for _ in range(3)]
+
+    for url, esperados in [(f'/api/avaliacoes?orgao_id={raiz}', ids[:4]),
+                           (f'/api/avaliacoes?subarvore={raiz}', ids)]:
+        completa = cliente.get(url, headers=ADMIN).get_json()
+        assert [a['id'] for a in completa] == sorted(esperados, reverse=True)
+        assert [a['id'] for a in paginar(cliente, url, 2)] == [a['id'] for a in completa]
+
+
+def test_paginas_de_usuarios(cliente):
+    # COLLATE NOCASE só ignora maiúsculas em ASCII
+    for i, nome in enumerate(('Usuario Pag B', 'usuario pag a', 'Usuario Pag B', 'USUARIO PAG C', 'Usuario Pag A')):
+        resposta = cliente.post('/api/usuarios', json={
+            'email': f'usuario.pag{i}@cge.mt.gov.br', 'nome': nome, 'perfil_id': 4, 'senha': 'segredo'
+        }, headers=ADMIN)
+        assert resposta.status_code == 200, resposta.get_json()
+
+    url = '/api/usuarios?nome=usuario pag'
+    completa = cliente.get(url, headers=ADMIN).get_json()
+    assert len(completa) == 5
+    assert [u['id'] for u in paginar(cliente, url, 2)] == [u['id'] for u in completa]
+
+
+@pytest.mark.parametrize('rota', ['/api/orgaos', '/api/avaliacoes', '/api/usuarios'])
+@pytest.mark.parametrize('cursor', [
+    'lixo!',
+    cursor_de(['a']),
+    cursor_de([{'a': 1}, 2]),
+    cursor_de([[1], 2]),
+])
+def test_cursor_malformado_responde_400(cliente, rota, cursor):
+    resposta = cliente.get(f'{rota}?limit=2&cursor={cursor}', headers=ADMIN)
+    assert resposta.status_code == 400
+    assert resposta.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('query', ['limit=abc', 'limit=0', 'orgao_superior_id=x'])
+def test_parametros_invalidos_respondem_400(cliente, query):
+    assert cliente.get(f'/api/orgaos?{query}', headers=ADMIN).status_code == 400
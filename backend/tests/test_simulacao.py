@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Simulação de maturidade (simulacao.py): o resultado simulado deve ser a
+classificação que o órgão teria com as alterações, sem gravar nada.
+"""
+
+import pytest
+
+from conftest import ADMIN
+
+
+@pytest.fixture
+def orgao_quase_nivel2(cliente, criar_orgao, criar_avaliacao, atividades_do_nivel):
+    """Órgão com a avaliação do nível 2 finalizada e uma atividade sem institucionalização"""
+    orgao_id = criar_orgao()
+    avaliacao_id = criar_avaliacao(orgao_id, 2)
+    nivel2 = atividades_do_nivel(2)
+    resposta = cliente.post(f'/api/avaliacoes/{avaliacao_id}/respostas/lote', json={'respostas': [
+        {'atividade_id': a, 'instituido': True, 'institucionalizado': a != nivel2[-1]} for a in nivel2
+    ]}, headers=ADMIN)
+    assert resposta.status_code == 200
+    assert cliente.post(f'/api/avaliacoes/{avaliacao_id}/finalizar', headers=ADMIN).status_code == 200
+    return orgao_id, avaliacao_id, nivel2[-1]
+
+
+def simular(cliente, orgao_id, alteracoes):
+    return cliente.post(f'/api/orgaos/{orgao_id}/simulacao', json={'alteracoes': alteracoes}, headers=ADMIN)
+
+
+def test_simulacao_sem_alteracoes(cliente, orgao_quase_nivel2):
+    orgao_id, avaliacao_id, faltante = orgao_quase_nivel2
+
+    resultado = simular(cliente, orgao_id, []).get_json()
+    assert resultado['nivel_atual'] == resultado['nivel_simulado'] == 1
+    nivel2 = resultado['niveis'][0]
+    assert (nivel2['nivel'], nivel2['avaliacao_id'], nivel2['completo']) == (2, avaliacao_id, False)
+    assert nivel2['atividades_faltantes'] == [faltante]
+    assert resultado['para_atingir']['2']['atividades'] == [faltante]
+    assert resultado['para_atingir']['3']['niveis_sem_avaliacao'] == [3]
+
+
+def test_simulacao_igual_a_alteracao_real(cliente, conn, orgao_quase_nivel2):
+    orgao_id, avaliacao_id, faltante = orgao_quase_nivel2
+    respostas_antes = conn.execute('SELECT * FROM respostas WHERE avaliacao_id = ?', (avaliacao_id,)).fetchall()
+
+    alteracao = {'atividade_id': faltante, 'institucionalizado': True}
+    simulado = simular(cliente, orgao_id, [alteracao]).get_json()
+    assert (simulado['nivel_atual'], simulado['nivel_simulado']) == (1, 2)
+    assert simulado['niveis'][0]['simulado'] and simulado['niveis'][0]['completo']
+    assert '2' not in simulado['para_atingir']
+
+    # Nada foi gravado
+    assert conn.execute('SELECT * FROM respostas WHERE avaliacao_id = ?',
+                        (avaliacao_id,)).fetchall() == respostas_antes
+    assert simular(cliente, orgao_id, []).get_json()['nivel_atual'] == 1
+
+    # Aplicando a mesma alteração de verdade, a classificação é a simulada
+    cliente.post(f'/api/avaliacoes/{avaliacao_id}/respostas',
+                 json={'atividade_id': faltante, 'instituido': True, 'institucionalizado': True}, headers=ADMIN)
+    real = simular(cliente, orgao_id, []).get_json()
+    assert (real['nivel_atual'], real['status_atual']) == (simulado['nivel_simulado'], simulado['status_simulado'])
+
+
+def test_nivel_sem_avaliacao_finalizada(cliente, orgao_quase_nivel2, atividades_do_nivel):
+    orgao_id, _, faltante = orgao_quase_nivel2
+    nivel3 = atividades_do_nivel(3)
+
+    alteracoes = [{'atividade_id': faltante, 'institucionalizado': True}] + \
+                 [{'atividade_id': a, 'instituido': True, 'institucionalizado': True} for a in nivel3]
+    resultado = simular(cliente, orgao_id, alteracoes).get_json()
+    nivel3_simulado = resultado['niveis'][1]
+    assert nivel3_simulado['completo'] and not nivel3_simulado['avaliacao_finalizada']
+    assert nivel3_simulado['avaliacao_id'] is None
+    assert resultado['nivel_simulado'] == 3
+
+
+@pytest.mark.parametrize('alteracoes', [
+    'nao é lista',
+    [{'instituido': True}],
+    [{'atividade_id': 'nao-existe'}],
+    ['2.1.1'],
+])
+def test_alteracoes_invalidas(cliente, criar_orgao, alteracoes):
+    resposta = simular(cliente, criar_orgao(), alteracoes)
+    assert resposta.status_code == 400
+    assert resposta.get_json()['success'] is False
+
+
+def test_orgao_inexistente(cliente):
+    assert simular(cliente, 10 ** 9, []).status_code == 404
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tema compartilhado dos PDFs (tema_pdf.py): montado uma vez por processo e
+nunca alterado pelos renderizadores que o usam.
+"""
+
+import threading
+
+import tema_pdf
+from relatorio_orgao import carregar_dados_pdf_simples
+from relatorio_pdf import gerar_pdf_simples, montar_pdf_relatorio
+
+
+def test_tema_montado_uma_vez(monkeypatch):
+    monkeypatch.setattr(tema_pdf, '_tema', None)
+    montados = []
+    threads = [threading.Thread(target=lambda: montados.append(tema_pdf.tema_relatorio())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(montados) == 8
+    assert all(tema is montados[0] for tema in montados)
+    assert tema_pdf.aquecer_tema() is montados[0]
+
+
+def estado_dos_estilos(tema):
+    return {nome: dict(vars(estilo)) for nome, estilo in tema.estilos.byName.items()}
+
+
+def test_renderizadores_nao_alteram_o_tema(conn, criar_orgao):
+    tema = tema_pdf.tema_relatorio()
+    antes = estado_dos_estilos(tema)
+
+    orgao_id = criar_orgao()
+    dados = carregar_dados_pdf_simples(conn, orgao_id, {
+        'orgao_nome': 'Órgão', 'orgao_sigla': 'OT', 'usuario_nome': 'Teste', 'usuario_email': 'teste@cge.mt.gov.br'
+    })
+    primeiro = gerar_pdf_simples(dados).getvalue()
+    consolidado = montar_pdf_relatorio(0, 0, 0, []).getvalue()
+    segundo = gerar_pdf_simples(dados).getvalue()
+
+    assert primeiro.startswith(b'%PDF') and consolidado.startswith(b'%PDF')
+    assert len(primeiro) == len(segundo)
+    assert estado_dos_estilos(tema) == antes
@@ -1,6 +1,7 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
+import { exportarRelatorio } from '../utils/exportacao';
 import {
   Chart as ChartJS,
   CategoryScale,
@@ -77,30 +78,15 @@ const RelatorioIndividual = () => {
 
   const exportarRelatorioIndividual = async () => {
     try {
-      const apiUrl = `http://${window.location.hostname}:5000/api/relatorio-individual/exportar`;
-      const response = await fetch(apiUrl, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Email': user?.email || ''
-        },
-        body: JSON.stringify({ formato: 'pdf' })
-      });
-
-      if (response.ok) {
-        const blob = await response.blob();
-        const url = window.URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = `relatorio_${dados.orgao.sigla || 'orgao'}_${new Date().toISOString().split('T')[0]}.pdf`;
-        document.body.appendChild(a);
-        a.click();
-        window.URL.revokeObjectURL(url);
-        document.body.removeChild(a);
-      }
+      await exportarRelatorio(
+        '/api/relatorio-individual/exportar',
+        { formato: 'pdf' },
+        user?.email,
+        `relatorio_${dados.orgao.sigla || 'orgao'}_${new Date().toISOString().split('T')[0]}.pdf`
+      );
     } catch (error) {
       console.error('Erro ao exportar:', error);
-      alert('Erro ao exportar relatório');
+      alert(error.message || 'Erro ao exportar relatório');
     }
   };
 
@@ -2,6 +2,7 @@ import React, { useState, useEffect, useCallback } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
 import GraficosRelatorio from './GraficosRelatorio';
+import { exportarRelatorio } from '../utils/exportacao';
 
 const RelatoriosAdmin = () => {
   const navigate = useNavigate();
@@ -54,32 +55,17 @@ const RelatoriosAdmin = () => {
     carregarDados();
   }, [user, navigate]);
 
-  const exportarRelatorio = async (formato) => {
+  const exportarConsolidado = async (formato) => {
     try {
-      const apiUrl = `http://${window.location.hostname}:5000/api/admin/relatorios/exportar`;
-      const response = await fetch(apiUrl, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Email': user?.email || ''
-        },
-        body: JSON.stringify({ formato } )
-      });
-
-      if (response.ok) {
-        const blob = await response.blob();
-        const url = window.URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = `relatorio_consolidado.${formato}`;
-        document.body.appendChild(a);
-        a.click();
-        window.URL.revokeObjectURL(url);
-        document.body.removeChild(a);
-      }
+      await exportarRelatorio(
+        '/api/admin/relatorios/exportar',
+        { formato },
+        user?.email,
+        `relatorio_consolidado.${formato}`
+      );
     } catch (error) {
       console.error('Erro ao exportar:', error);
-      alert('Erro ao exportar relatório');
+      alert(error.message || 'Erro ao exportar relatório');
     }
   };
 
@@ -202,7 +188,7 @@ const RelatoriosAdmin = () => {
                     <p className="card-text">Relatório completo em formato PDF</p>
                     <button 
                       className="btn btn-danger"
-                      onClick={() => exportarRelatorio('pdf')}
+                      onClick={() => exportarConsolidado('pdf')}
                     >
                       <i className="bi bi-download me-1"></i>
                       Baixar PDF
@@ -219,7 +205,7 @@ const RelatoriosAdmin = () => {
                     <p className="card-text">Dados detalhados em planilha Excel</p>
                     <button 
                       className="btn btn-success"
-                      onClick={() => exportarRelatorio('xlsx')}
+                      onClick={() => exportarConsolidado('xlsx')}
                     >
                       <i className="bi bi-download me-1"></i>
                       Baixar Excel
@@ -236,7 +222,7 @@ const RelatoriosAdmin = () => {
                     <p className="card-text">Dados brutos em formato CSV</p>
                     <button 
                       className="btn btn-info"
-                      onClick={() => exportarRelatorio('csv')}
+                      onClick={() => exportarConsolidado('csv')}
                     >
                       <i className="bi bi-download me-1"></i>
                       Baixar CSV
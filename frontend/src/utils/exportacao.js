@@ -0,0 +1,82 @@
+// Exportação de relatórios em segundo plano.
+// O backend responde 202 com o job ({ exportacao, url_status }) quando recebe
+// { assincrono: true }; a situação é consultada em url_status até o arquivo
+// ficar pronto. Respostas 200 (ex.: Excel/CSV ou relatório já em cache) já
+// trazem o arquivo.
+
+const INTERVALO_CONSULTA_MS = 1000;
+const TEMPO_MAXIMO_MS = 5 * 60 * 1000;
+
+const baseApi = () => `http://${window.location.hostname}:5000`;
+
+const aguardar = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const salvarArquivo = (blob, nomeArquivo) => {
+  const url = window.URL.createObjectURL(blob);
+  const a = document.createElement('a');
+  a.href = url;
+  a.download = nomeArquivo;
+  document.body.appendChild(a);
+  a.click();
+  window.URL.revokeObjectURL(url);
+  document.body.removeChild(a);
+};
+
+const mensagemErro = async (response, padrao) => {
+  try {
+    const data = await response.json();
+    return data.message || padrao;
+  } catch {
+    return padrao;
+  }
+};
+
+const aguardarExportacao = async (urlStatus, headers) => {
+  const limite = Date.now() + TEMPO_MAXIMO_MS;
+
+  while (Date.now() < limite) {
+    const response = await fetch(`${baseApi()}${urlStatus}`, { headers });
+    if (!response.ok) {
+      throw new Error(await mensagemErro(response, 'Exportação não encontrada'));
+    }
+
+    const { exportacao } = await response.json();
+    if (exportacao.status === 'concluida') {
+      return exportacao;
+    }
+    if (exportacao.status === 'erro' || exportacao.status === 'expirada') {
+      throw new Error(exportacao.mensagem || 'Erro ao gerar o relatório');
+    }
+    await aguardar(INTERVALO_CONSULTA_MS);
+  }
+  throw new Error('Tempo esgotado aguardando o relatório');
+};
+
+// Pede a exportação, acompanha o job (se houver) e baixa o arquivo
+export const exportarRelatorio = async (caminho, corpo, userEmail, nomeArquivo) => {
+  const headers = { 'X-User-Email': userEmail || '' };
+
+  const response = await fetch(`${baseApi()}${caminho}`, {
+    method: 'POST',
+    headers: { ...headers, 'Content-Type': 'application/json' },
+    body: JSON.stringify({ ...corpo, assincrono: true })
+  });
+
+  if (!response.ok) {
+    throw new Error(await mensagemErro(response, 'Erro ao exportar relatório'));
+  }
+
+  if (response.status !== 202) {
+    salvarArquivo(await response.blob(), nomeArquivo);
+    return;
+  }
+
+  const { url_status: urlStatus } = await response.json();
+  const exportacao = await aguardarExportacao(urlStatus, headers);
+
+  const arquivo = await fetch(`${baseApi()}${exportacao.url_download}`, { headers });
+  if (!arquivo.ok) {
+    throw new Error(await mensagemErro(arquivo, 'Arquivo da exportação indisponível'));
+  }
+  salvarArquivo(await arquivo.blob(), nomeArquivo);
+};